@@ -0,0 +1,577 @@
+# -*- coding:utf-8 -*-
+"""Equivalent circuit model (ECM), with exact discrete-time RC updates.
+
+The cell is an open circuit voltage source, in series with an ohmic
+resistance, Rohm, and ECM_ORDER parallel RC branches (R_k, with the time
+constants tau_k = R_k*C_k), for the cell current I [A], positive on
+discharge:
+    SOC_dt = -I/(3600*Ah_cap)
+    v_k_dt = -v_k/tau_k + I/C_k
+    V = OCV(SOC) - Rohm*I - sum_k v_k
+The parameters are from the ECM maps vs. SOC and T (the ECM_PARAMS section
+of the model config, see Params.buildpars and batteqns.get_ecm_params), at
+the ambient temperature of the case.
+
+Over a time step, h, with I linear from I0 to I1, and the branch parameters
+at the mid-step SOC, the RC branches are updated exactly, with
+a_k = exp(-h/tau_k) and b_k = tau_k/h*(1 - a_k),
+    v_k(t + h) = a_k*v_k(t) + R_k*((b_k - a_k)*I0 + (1 - b_k)*I1)
+so the step size is not limited by the time constants. Under current
+control (and for piecewise-linear current profiles), each output interval is
+a single update, whatever its length, with only the error of the parameter
+variation over the step. Under voltage and power control, I1 is solved for
+at the end of each step, with I0 from the end of the last one. The output
+intervals that cross a cell voltage cut-off are cut back to the crossing.
+
+ECM
+    - the model class: the state update and the cell voltage
+
+Results_object
+    - class to hold the output model variables for each simulation step of
+      the test schedule
+
+Simulator
+    - the test schedule steps, with the input modes, output interval control
+      (see stepcontrol) and stop limits of the full_1d_fvm_ida Simulator
+"""
+import numpy
+import scipy.integrate
+
+import time
+
+import params
+from helper_modules import batteqns, solverstats, profiling, telemetry
+from helper_modules import stepcontrol
+from helper_modules.telemetry import logger
+
+# Max iterations and current tolerance [A] of the end of step current solve
+# (voltage and power control), and max iterations and time tolerance [s] of
+# the cut-off crossing
+SOLVE_MAX_ITERS = 20
+SOLVE_I_TOL = 1e-9
+CUTOFF_MAX_ITERS = 30
+CUTOFF_T_TOL = 1e-6
+
+
+class ECM():
+    """
+    Class for the ECM (see the module docstring), with the state vector
+    x = [SOC, v_1, ..., v_n], of the SOC and the RC branch voltages [V].
+    """
+
+    def __init__(self, p):
+        self.p = p
+        self.pars = self.p
+
+        self.n_rc = p.ecmOrder
+        self.Ah_cap = p.ecm_params['Ah_cap']
+        self.T = p.T_amb
+
+        # Model function call counters and timers (see solverstats), with
+        # the state updates counted as the res calls
+        self.stats = solverstats.new_model_stats()
+
+    def get_params(self, SOC):
+        """
+        OCV, Rohm, and the RC branch R, tau and C of the cell, at SOC (see
+        batteqns.get_ecm_params).
+        """
+        return batteqns.get_ecm_params(self.p.ecm_params, self.n_rc, SOC,
+                                       self.T)
+
+    def advance(self, x, h, I0, I1):
+        """
+        State vector after a time step h [s] from x, with the current linear
+        from I0 to I1 [A], and the cell voltage at the end of the step.
+        With h = 0, the voltage of x at I1.
+        """
+        t_start = time.time()
+
+        SOC1 = x[0] - 0.5 * (I0 + I1) * h / (3600. * self.Ah_cap)
+
+        # Branch parameters at the mid-step SOC, and OCV and Rohm at the end
+        OCV, Rohm, Res, Tau, Cap = self.get_params(
+            numpy.array([0.5 * (x[0] + SOC1), SOC1]))
+
+        if h > 0.0:
+            z = h / Tau[:, 0]
+            a = numpy.exp(-z)
+            b = -numpy.expm1(-z) / z
+        else:
+            a = b = numpy.ones(self.n_rc)
+
+        v1 = a * x[1:] + Res[:, 0] * ((b - a) * I0 + (1. - b) * I1)
+        V1 = OCV[1] - Rohm[1] * I1 - v1.sum()
+
+        solverstats.count_call(self.stats, 'res', t_start)
+
+        return numpy.concatenate([[SOC1], v1]), V1
+
+    def solve_current(self, x, h, I0, err_func, I_guess):
+        """
+        End of step current, I1, for which err_func(V1, I1) is zero, after a
+        time step h from x with the current linear from I0 (see advance), by
+        secant iterations from I_guess. Returns I1, the state vector and the
+        cell voltage at the end of the step.
+        """
+        I_a = I_guess
+        x_a, V_a = self.advance(x, h, I0, I_a)
+        f_a = err_func(V_a, I_a)
+
+        I_b = I_a + 1e-3 * max(1.0, abs(I_a))
+        for it in range(SOLVE_MAX_ITERS):
+            x_b, V_b = self.advance(x, h, I0, I_b)
+            f_b = err_func(V_b, I_b)
+            if f_b == f_a or abs(I_b - I_a) < SOLVE_I_TOL * (1. + abs(I_b)):
+                break
+            I_a, I_b, f_a = I_b, I_b - f_b * (I_b - I_a) / (f_b - f_a), f_b
+
+        return I_b, x_b, V_b
+
+
+class Results_object():
+    """
+    Model outputs for each step of the test schedule
+    """
+
+    def __init__(self, p):
+        """
+        Define the basic properties for the results
+        """
+        self.SOC = []
+        self.OCV = []
+        self.R_ohm = []
+        self.V_rc = []
+        self.T = []
+
+        self.Volt = []
+        self.Cur = []
+
+        self.step_time = []
+        self.step_time_mins = []
+        self.test_time = []
+        self.test_time_mins = []
+
+        self.step_capacity_Ah = []
+
+        # Solver stats of the step (see solverstats)
+        self.solver_stats = {}
+
+        # Reason the step stopped (e.g., 'time', 'Vmin', 'integration_failure'
+        # or a model variable limit)
+        self.stop_reason = None
+
+
+class Simulator():
+    """
+    Simulator for the ECM model, with the test schedule interface and the
+    input modes of the full_1d_fvm_ida Simulator. There is no time
+    integration solver, each output interval is an ECM update (see
+    ECM.advance).
+    """
+
+    def __init__(self, conf_data, bsp_dir):
+        """
+        Setup the params, model, and simulator objects for the ecm model.
+        """
+        self.bsp_dir = bsp_dir
+        self.confdat = conf_data
+        self.Pdat = {'RunInput': self.confdat}
+        self.V_init = 4.198  # [V]
+
+        # Phase profiler (see profiling) and progress telemetry, set by the
+        # Model
+        self.profiler = profiling.NullProfiler()
+        self.telemetry = telemetry.Telemetry()
+
+        # Solver stats of the present step (see solverstats)
+        self.step_stats = solverstats.new_stats()
+
+        self.buildpars()
+        self.buildmodel()
+        self.buildsim()
+
+    def buildpars(self,):
+        """
+        Build the model parameter object, with the ECM maps (see
+        Params.buildpars) and the initial SOC, from V_init.
+        """
+        self.p = params.Params()
+        self.p.buildpars(self.V_init, self.Pdat)
+
+        self.pars = self.p
+
+    def get_Tvec(self,):
+        self.Tvec = []
+
+    def buildmodel(self,):
+        """
+        Setup the ECM model, at the initial SOC, with the RC branches at
+        rest.
+        """
+        self.imp_mod = ECM(self.p)
+
+        self.x = numpy.concatenate([[self.p.SOC_0],
+                                    numpy.zeros(self.p.ecmOrder)])
+
+    def buildsim(self,):
+        """
+        Set the simulation time and the cell current to zero, for the first
+        step (there is no time integration solver to setup).
+        """
+        self.t = 0.0
+        self.I = 0.0
+
+    def get_input(self, inp_typ, inp_val, profile=None):
+        """
+        Setup the input variable for the model during the simulation based on
+        the test schedule (see full_1d_fvm_ida.Simulator.get_input), as the
+        cell current [A], voltage [V] or power [W].
+        """
+        self.inp_prof = None
+
+        if inp_typ == 'Rest':
+            self.inp = 0.0
+            self.pars.inp_bc = 'curr'
+            self.pars.rest = 1
+
+        elif inp_typ == 'Crate':
+            self.inp = -inp_val * self.confdat['MODEL']['RATE_NOM_CAP']
+            self.pars.inp_bc = 'curr'
+            self.pars.rest = 0
+
+        elif inp_typ == 'Current':
+            self.inp = -inp_val
+            self.pars.inp_bc = 'curr'
+            self.pars.rest = 0
+
+        elif inp_typ == 'Profile':
+            self.inp_prof = (profile[0], -inp_val * profile[1])
+            self.inp = self.inp_prof[1][0]
+            self.pars.inp_bc = 'curr'
+            self.pars.rest = 0
+
+        elif inp_typ == 'Voltage':
+            self.inp = inp_val
+            self.pars.inp_bc = 'volt'
+            self.pars.rest = 0
+
+        elif inp_typ == 'Power':
+            self.inp = -inp_val
+            self.pars.inp_bc = 'power'
+            self.pars.rest = 0
+
+        elif inp_typ == 'PowerProfile':
+            self.inp_prof = (profile[0], -inp_val * profile[1])
+            self.inp = self.inp_prof[1][0]
+            self.pars.inp_bc = 'power'
+            self.pars.rest = 0
+
+    def input_value(self, t, t_brk, right=1):
+        """
+        Input set point at the time t, for the control mode in pars.inp_bc.
+        For profile inputs (at the t_brk simulation times), this is the
+        value after (right) or before a step change of the profile at t.
+        """
+        if self.inp_prof is None:
+            return self.inp
+
+        vals = self.inp_prof[1]
+        i = numpy.searchsorted(t_brk, t, side='right' if right else 'left')
+        if i == 0:
+            return vals[0]
+        elif i == len(t_brk):
+            return vals[-1]
+
+        return vals[i - 1] + (vals[i] - vals[i - 1]) \
+            * (t - t_brk[i - 1]) / (t_brk[i] - t_brk[i - 1])
+
+    def advance(self, x, t, t1, I0, t_brk):
+        """
+        ECM update from x at t to t1, from the cell current I0, for the input
+        of the present step (see ECM.advance and ECM.solve_current). Returns
+        the state vector, the cell current and the voltage at t1. With
+        t1 = t, this is the step transition to the input at t.
+        """
+        imp_mod = self.imp_mod
+        inp_bc = self.pars.inp_bc
+        h = t1 - t
+
+        u1 = self.input_value(t1, t_brk, right=(h == 0.0))
+        if inp_bc == 'curr':
+            x1, V1 = imp_mod.advance(x, h, I0, u1)
+            return x1, u1, V1
+
+        if inp_bc == 'volt':
+            def err_func(V, I):
+                return V - u1
+        elif inp_bc == 'power':
+            def err_func(V, I):
+                return V * I - u1
+
+        I1, x1, V1 = imp_mod.solve_current(x, h, I0, err_func, I0)
+
+        return x1, I1, V1
+
+    def cutoff(self, x, t, t1, I0, t_brk, V_lim, V0, out):
+        """
+        Output interval from x at t, cut back from t1 to the crossing of the
+        cell voltage cut-off, V_lim, from V0 at t, and the update, out, to
+        t1 (see advance), by the Illinois method. Returns the end of the
+        interval, past the cut-off by up to CUTOFF_T_TOL, with its update.
+        """
+        t_in, t_out = t, t1
+        f_in, f_out = V0 - V_lim, out[2] - V_lim
+        side = 0
+        for it in range(CUTOFF_MAX_ITERS):
+            if t_out - t_in < CUTOFF_T_TOL:
+                break
+            t_c = t_out - f_out * (t_out - t_in) / (f_out - f_in)
+            t_c = min(max(t_c, t_in + 0.01 * (t_out - t_in)),
+                      t_out - 0.01 * (t_out - t_in))
+            out_c = self.advance(x, t, t_c, I0, t_brk)
+            f_c = out_c[2] - V_lim
+            if f_c * f_out > 0.0:
+                t_out, f_out, out = t_c, f_c, out_c
+                if side == 1:
+                    f_in *= 0.5
+                side = 1
+            else:
+                t_in, f_in = t_c, f_c
+                if side == -1:
+                    f_out *= 0.5
+                side = -1
+
+        return (t_out,) + out
+
+    def simulate(self, tfinal, present_step_name):
+        """
+        Run the present test schedule step, with one ECM update per output
+        interval.
+        """
+        imp_mod = self.imp_mod
+        p = self.p
+
+        # Solver stats for this step
+        self.step_stats = solverstats.new_stats()
+        stats = self.step_stats
+        imp_mod.stats = solverstats.new_model_stats()
+        t_wall0 = time.time()
+        self.profiler.start('integration', present_step_name)
+
+        # Applied input variable setup
+        t0 = self.t
+        if p.inp_bc == 'curr':
+            logger.info('I_app: %g [A]', self.inp)
+        elif p.inp_bc == 'volt':
+            logger.info('V_app: %g [V]', self.inp)
+        elif p.inp_bc == 'power':
+            logger.info('P_app: %g [W]', self.inp)
+
+        # Input profile breakpoints, in simulation time
+        t_brk = None
+        if self.inp_prof is not None:
+            t_brk = t0 + self.inp_prof[0]
+
+        # Step transition, to the cell current of the input at t0
+        t = t0
+        x, I0, V_cell = self.advance(self.x, t, t, self.I, t_brk)
+        stats['step_transitions'] += 1
+
+        # Sim out init
+        t_out = []
+        outs = []
+
+        it = 0
+        logger.debug('V_cell prior to time loop: %g', V_cell)
+
+        keep_simulating = 1
+        stop_reason = None
+
+        # Output interval control, with the cell voltage cut-off limits
+        # under current or power control
+        if p.rest and p.rest_fast:
+            dt_ctrl = stepcontrol.rest_controller(p, t, tfinal)
+        else:
+            dt_ctrl = stepcontrol.OutputStepController(
+                p.RunInput['TIMESTEPPING']['DV_TOL'], p.delta_t_max,
+                dt_init=p.dt_init, dt_min=p.dt_min)
+        dt_ctrl.start(V_cell)
+
+        while keep_simulating:
+            if p.inp_bc != 'volt':
+                V_lims = (p.volt_min, p.volt_max)
+            else:
+                V_lims = None
+            t_last = t
+            delta_t = dt_ctrl.propose(t, tfinal, V_lims)
+            t1 = t + delta_t
+
+            # Input profile breakpoint alignment
+            on_brk = 0
+            if t_brk is not None:
+                i_brk = numpy.searchsorted(t_brk, t + 1e-6, side='right')
+                if i_brk < len(t_brk) and t1 > t_brk[i_brk]:
+                    t1 = t_brk[i_brk]
+                    on_brk = 1
+
+            x1, I1, V1 = self.advance(x, t, t1, I0, t_brk)
+
+            # Cut back to the cell voltage cut-off, or to the CC to CV
+            # handover
+            if V_lims is not None and V_lims[0] < V_cell < V_lims[1] \
+                    and not (V_lims[0] < V1 < V_lims[1]):
+                V_lim = V_lims[0] if V1 <= V_lims[0] else V_lims[1]
+                t1, x1, I1, V1 = self.cutoff(x, t, t1, I0, t_brk, V_lim,
+                                             V_cell, (x1, I1, V1))
+                on_brk = 0
+
+            t, x, I0, V_cell = t1, x1, I1, V1
+
+            # Update the output variables
+            t_out.append(t)
+            out = self.output_vars(x, I0)
+            outs.append(out)
+            model_limit = self.limit_reason(x)
+
+            dt_ctrl.accept(t - t_last, V_cell)
+
+            self.telemetry.progress(t, tfinal, force=(it == 0),
+                                    Voltage=V_cell, Current=I0,
+                                    delta_t=delta_t)
+
+            # CC to CV handover at the cell voltage limits, for steps with
+            # voltage control on (e.g., CCCV charging)
+            if p.inp_bc == 'curr' and self.inp_prof is None:
+                V_hold = None
+                if p.volt_ctrl_chg and I0 < 0.0 and V_cell >= p.volt_max:
+                    V_hold = p.volt_max
+                elif p.volt_ctrl_dchg and I0 > 0.0 \
+                        and V_cell <= p.volt_min:
+                    V_hold = p.volt_min
+
+                if V_hold is not None:
+                    self.telemetry.note('cv_handover',
+                                        'CC to CV handover at %g [V]' % V_hold,
+                                        t=t, V_hold=V_hold)
+                    self.inp = V_hold
+                    p.inp_bc = 'volt'
+                    x, I0, V_cell = self.advance(x, t, t, I0, t_brk)
+                    stats['step_transitions'] += 1
+
+            # Check simulation stop limits
+            # Cell voltage (held at its set point under voltage control)
+            if p.inp_bc != 'volt' and V_cell <= p.volt_min:
+                stop_reason = 'Vmin'
+                keep_simulating = 0
+            elif p.inp_bc != 'volt' and V_cell >= p.volt_max:
+                stop_reason = 'Vmax'
+                keep_simulating = 0
+            # Model variable limits (see limit_reason)
+            elif model_limit is not None:
+                stop_reason = model_limit
+                keep_simulating = 0
+            # Sim time stop
+            elif t >= tfinal:
+                keep_simulating = 0
+                stop_reason = 'time'
+
+            # Transition to the input after a profile breakpoint
+            if keep_simulating and on_brk:
+                x, I0, V_cell = self.advance(x, t, t, I0, t_brk)
+
+            it += 1
+
+        self.telemetry.progress(t, tfinal, force=True, Voltage=V_cell,
+                                Current=I0, delta_t=delta_t)
+        self.telemetry.end_step(stop_reason, t=t, Voltage=V_cell)
+
+        self.profiler.stop('integration', present_step_name)
+        self.profiler.start('postprocess', present_step_name)
+
+        # Prepare the final output variables
+        mergExtr = {}
+        for key in outs[0].keys():
+            mergExtr[key] = numpy.array([out[key] for out in outs])
+
+        mergExtr['step_time'] = numpy.array(t_out) - t_out[0]
+        mergExtr['step_time_mins'] = mergExtr['step_time'] / 60.
+
+        mergExtr['test_time'] = numpy.array(t_out)
+        mergExtr['test_time_mins'] = mergExtr['test_time'] / 60.
+
+        mergExtr['step_capacity_Ah'] = scipy.integrate.cumtrapz(
+            mergExtr['Cur'], x=mergExtr['step_time'] / 3600., initial=0.0)
+
+        self.t_end_now = t
+        self.t = t
+        self.x = x
+        self.I = I0
+
+        solverstats.collect_model_stats(stats, imp_mod)
+        stats['wall_time'] = time.time() - t_wall0
+        stats['sim_time'] = t - t0
+        mergExtr['solver_stats'] = stats
+        mergExtr['stop_reason'] = stop_reason
+
+        # Assign the desired output variables to results holder object
+        self.assign_model_results(mergExtr, present_step_name)
+
+        self.profiler.stop('postprocess', present_step_name)
+
+    def output_vars(self, x, I):
+        """
+        Output variables of the state vector x, at the cell current I, at
+        each output time of the step.
+        """
+        OCV, Rohm, Res, Tau, Cap = self.imp_mod.get_params(x[0])
+
+        out = {}
+        out['Volt'] = OCV - Rohm * I - x[1:].sum()
+        out['Cur'] = I
+        out['SOC'] = x[0]
+        out['OCV'] = OCV
+        out['R_ohm'] = Rohm
+        out['V_rc'] = x[1:]
+        out['T'] = self.imp_mod.T
+
+        return out
+
+    def limit_reason(self, x):
+        """
+        Stop reason of the SOC limits, the range of the OCV map, for the
+        state vector x (None if within the limits).
+        """
+        if x[0] <= min(self.p.xs):
+            return 'SOC_min'
+        elif x[0] >= max(self.p.xs):
+            return 'SOC_max'
+
+        return None
+
+    # Helper functions for managing results data
+
+    def build_results_dict(self, steps, cycs):
+        """
+        Dict data structure for the simulation results.
+        Keys use the following form:'stepX_repeatY', where X and Y are the
+        step and cycle numbers, respectively.
+        """
+        self.results_out = dict([('step' + str(stp) + '_repeat' + str(cyc),
+                                  Results_object(self.pars))
+                                 for stp in range(steps)
+                                 for cyc in range(cycs)])
+
+    def assign_model_results(self, extras, present_run):
+        """
+        Assign the output variables of the step to the results dict.
+        """
+        self.assign_dict_to_class(extras, self.results_out[present_run])
+
+    def assign_dict_to_class(self, dict_obj, class_obj):
+        """
+        Take the dict values and assign to results class vars.
+        """
+        for key, val in dict_obj.iteritems():
+            if hasattr(class_obj, key):
+                setattr(class_obj, key, val)
@@ -26,14 +26,26 @@ simulator
 """
 import numpy
 import scipy.linalg
+import scipy.sparse
+import scipy.integrate
 from assimulo.solvers import IDA
 from assimulo.problem import Implicit_Problem
+from assimulo.solvers.sundials import IDAError
+from assimulo.exception import AssimuloException
 
 from copy import deepcopy
+import time
 
 # battsimpy specific modules
 import params
-from helper_modules import batteqns
+from helper_modules import batteqns, solverstats, profiling, telemetry
+from helper_modules import stepcontrol, fixedstep, reducedstates, fdjac
+from helper_modules import scaledstates, kernels
+from helper_modules.telemetry import logger
+
+# Solver failures of the time integration, classified and handled by the
+# time loop. Other exceptions are raised.
+SOLVER_ERRORS = (IDAError, AssimuloException, fixedstep.FixedStepError)
 
 
 class FULL_1D(Implicit_Problem):
@@ -48,6 +60,9 @@ class FULL_1D(Implicit_Problem):
         These two methods must be named "res" and "jac" to be noticed properly
         by Assimulo.
     """
+    # Values held by res from one call to the next (the surface Ds of the
+    # last call), restored by the finite difference Jacobian (see fdjac)
+    lagged_attrs = ['D_cs_a', 'D_cs_c']
 
     def __init__(self, p, y0, yd0):
         self.p = p
@@ -58,6 +73,22 @@ class FULL_1D(Implicit_Problem):
         self.T_amb = 30. + 273.15
         self.T = 30. + 273.15  # Cell temperature, [K]
 
+        # Model function call counters and timers (see solverstats)
+        self.stats = solverstats.new_model_stats()
+
+        # Residual hot loop kernels (KERNEL_BACKEND, see kernels)
+        self.kern = kernels.get_kernels(p.kernel_backend)
+
+        self.set_iapp(0.0)
+
+        # Particles of each electrode (one per node), and the volume fraction
+        # of the electrode of each
+        self.n_pa, self.n_pc = p.Na, p.Nc
+        self.w_pa, self.w_pc = p.vols_a / p.La, p.vols_c / p.Lc
+
+        # States of each particle of each electrode (see particle_states)
+        self.n_ra, self.n_rc = self.particle_states()
+
         self.phie_mats()
         self.phis_mats()
         self.cs_mats()
@@ -67,18 +98,18 @@ class FULL_1D(Implicit_Problem):
         self.ce_inds_r = numpy.reshape(self.ce_inds, [len(self.ce_inds), 1])
         self.ce_inds_c = numpy.reshape(self.ce_inds, [1, len(self.ce_inds)])
 
-        self.csa_inds = range(p.N, p.N + (p.Na * p.Nra))
+        self.csa_inds = range(p.N, p.N + (p.Na * self.n_ra))
         self.csa_inds_r = numpy.reshape(self.csa_inds, [len(self.csa_inds), 1])
         self.csa_inds_c = numpy.reshape(self.csa_inds, [1, len(self.csa_inds)])
 
-        self.csc_inds = range(p.N + (p.Na * p.Nra),
-                              p.N + (p.Na * p.Nra) + (p.Nc * p.Nrc))
+        self.csc_inds = range(p.N + (p.Na * self.n_ra),
+                              p.N + (p.Na * self.n_ra) + (p.Nc * self.n_rc))
         self.csc_inds_r = numpy.reshape(self.csc_inds, [len(self.csc_inds), 1])
         self.csc_inds_c = numpy.reshape(self.csc_inds, [1, len(self.csc_inds)])
 
-        self.T_ind = p.N + (p.Na * p.Nra) + (p.Nc * p.Nrc)
+        self.T_ind = p.N + (p.Na * self.n_ra) + (p.Nc * self.n_rc)
 
-        c_end = p.N + (p.Na * p.Nra) + (p.Nc * p.Nrc) + 1
+        c_end = self.T_ind + 1
 
         self.ja_inds = range(c_end, c_end + p.Na)
         self.ja_inds_r = numpy.reshape(self.ja_inds, [len(self.ja_inds), 1])
@@ -118,6 +149,8 @@ class FULL_1D(Implicit_Problem):
         self.pc_inds_r = numpy.reshape(self.pc_inds, [len(self.pc_inds), 1])
         self.pc_inds_c = numpy.reshape(self.pc_inds, [1, len(self.pc_inds)])
 
+        self.iapp_ind = c_end + p.Na + p.Nc + p.N + p.Na + p.Nc
+
         # second set for manual jac version
         c_end = 0
         self.ja_inds2 = range(c_end, c_end + p.Na)
@@ -161,22 +194,23 @@ class FULL_1D(Implicit_Problem):
         self.pc_inds_c2 = numpy.reshape(self.pc_inds2, [1, len(self.pc_inds2)])
 
         # Matrices for thermal calcs (gradient operators)
-        self.Ga, self.Gc, self.G = batteqns.grad_mat(
-            p.Na, p.x_m_a), batteqns.grad_mat(
-            p.Nc, p.x_m_c), batteqns.grad_mat(
-            p.N, p.x_m)
+        self.Ga = batteqns.tridiag_mat(batteqns.grad_diags(p.mesh_a))
+        self.Gc = batteqns.tridiag_mat(batteqns.grad_diags(p.mesh_c))
+        self.G = batteqns.tridiag_mat(batteqns.grad_diags(p.mesh))
+
+        # Particle surface concentrations of y0 (at zero flux)
+        csa_ss = self.C_cs_a.dot(y0[self.csa_inds])
+        csc_ss = self.C_cs_c.dot(y0[self.csc_inds])
 
         # Initialize the C arrays for the heat generation (these are useful for
         # the Jacobian)
         junkQ = self.calc_heat(y0,
                                numpy.zeros(p.Na),
                                numpy.zeros(p.Nc),
-                               p.uref_a(y0[self.csa_inds[:p.Na]] / p.csa_max),
-                               p.uref_c(y0[self.csc_inds[:p.Nc]] / p.csc_max))
+                               p.uref_a(csa_ss / p.csa_max),
+                               p.uref_c(csc_ss / p.csc_max))
 
         # Kinetic C array (also useful for the Jacobian)
-        csa_ss = y0[self.csa_inds[:p.Na]]
-        csc_ss = y0[self.csc_inds[:p.Nc]]
         ce = y0[self.ce_inds]
         T = y0[self.T_ind]
         self.C_ioa = (2.0
@@ -203,6 +237,13 @@ class FULL_1D(Implicit_Problem):
         """
         Implicit_Problem.__init__(self, y0=y0, yd0=yd0, name=name)
 
+    def particle_states(self):
+        """
+        Number of states of each particle of the anode and cathode: the
+        nodes of the radial meshes.
+        """
+        return self.p.Nra, self.p.Nrc
+
     def phie_mats(self,):
         """
         Electrolyte constant B_ce matrix
@@ -235,12 +276,12 @@ class FULL_1D(Implicit_Problem):
         """
         p = self.p
 
-        self.A_ps_a = batteqns.flux_mat_builder(
-            p.Na, p.x_m_a, numpy.ones_like(
-                p.vols_a), p.sig_a_eff)
-        self.A_ps_c = batteqns.flux_mat_builder(
-            p.Nc, p.x_m_c, numpy.ones_like(
-                p.vols_c), p.sig_c_eff)
+        self.A_ps_a_tri = batteqns.flux_diags(p.mesh_a, p.sig_a_eff,
+                                              per_vol=0)
+        self.A_ps_c_tri = batteqns.flux_diags(p.mesh_c, p.sig_c_eff,
+                                              per_vol=0)
+        self.A_ps_a = batteqns.tridiag_mat(self.A_ps_a_tri)
+        self.A_ps_c = batteqns.tridiag_mat(self.A_ps_c_tri)
 
         Baps = numpy.array(
             [asa * p.F * dxa for asa, dxa in zip(p.as_a, p.vols_a)], dtype='d')
@@ -255,6 +296,11 @@ class FULL_1D(Implicit_Problem):
         self.B2_ps_c = numpy.zeros(p.Nc, dtype='d')
         self.B2_ps_c[-1] = -1.
 
+        # LU factors of A_ps with the terminal node (phi_s_a[0], phi_s_c[-1])
+        # removed, for the reduced potential formulation (solve_potentials)
+        self.lu_ps_a = scipy.linalg.lu_factor(self.A_ps_a[1:, 1:])
+        self.lu_ps_c = scipy.linalg.lu_factor(self.A_ps_c[:-1, :-1])
+
     def cs_mats(self,):
         """
         Intiliaze the solid phase diffusion model matrices.
@@ -263,16 +309,21 @@ class FULL_1D(Implicit_Problem):
 
         # 1D spherical diffusion model
         # A_cs pre build
-        self.A_csa_single = batteqns.flux_mat_builder(
-            p.Nra, p.r_m_a, p.vols_ra_m, p.Dsa * (p.r_e_a**2))
-        self.A_csc_single = batteqns.flux_mat_builder(
-            p.Nrc, p.r_m_c, p.vols_rc_m, p.Dsc * (p.r_e_c**2))
-
-        # A_cs build up to the stacked full cs size (Nr and Nx)
-        b = [self.A_csa_single] * p.Na
-        self.A_cs_a = scipy.linalg.block_diag(*b)
-        b = [self.A_csc_single] * p.Nc
-        self.A_cs_c = scipy.linalg.block_diag(*b)
+        self.A_csa_single = batteqns.tridiag_mat(
+            batteqns.flux_diags(p.mesh_ra, p.Dsa * (p.r_e_a**2)))
+        self.A_csc_single = batteqns.tridiag_mat(
+            batteqns.flux_diags(p.mesh_rc, p.Dsc * (p.r_e_c**2)))
+
+        # A_cs build up to the stacked full cs size (Nr and Nx), as the
+        # diagonals of the block diagonal (tridiagonal) operator
+        self.A_cs_a_tri = self.kern.particle_flux_diags(
+            p.mesh_ra, self.n_pa,
+            numpy.tile(p.Dsa * (p.r_e_a**2), (self.n_pa, 1)))
+        self.A_cs_c_tri = self.kern.particle_flux_diags(
+            p.mesh_rc, self.n_pc,
+            numpy.tile(p.Dsc * (p.r_e_c**2), (self.n_pc, 1)))
+        self.A_cs_a = batteqns.tridiag_mat(self.A_cs_a_tri)
+        self.A_cs_c = batteqns.tridiag_mat(self.A_cs_c_tri)
 
         # B_cs and C_cs are constant (i.e., are not state-dependent)
         self.B_csa_single = numpy.array([0. for i in range(
@@ -280,9 +331,9 @@ class FULL_1D(Implicit_Problem):
         self.B_csc_single = numpy.array([0. for i in range(
             p.Nrc - 1)] + [-1. * p.r_e_c[-1]**2 / p.vols_rc_m[-1]], dtype='d')
 
-        b = [self.B_csa_single] * p.Na
+        b = [self.B_csa_single] * self.n_pa
         self.B_cs_a = scipy.linalg.block_diag(*b).T
-        b = [self.B_csc_single] * p.Nc
+        b = [self.B_csc_single] * self.n_pc
         self.B_cs_c = scipy.linalg.block_diag(*b).T
 
         # Particle surface concentration
@@ -306,16 +357,18 @@ class FULL_1D(Implicit_Problem):
                                             -self.b_n_c / self.c_n_c],
                                          dtype='d')
 
-        self.C_cs_a = scipy.linalg.block_diag(*[self.C_cs_a_single] * p.Na)
-        self.C_cs_c = scipy.linalg.block_diag(*[self.C_cs_c_single] * p.Nc)
+        self.C_cs_a = scipy.linalg.block_diag(
+            *[self.C_cs_a_single] * self.n_pa)
+        self.C_cs_c = scipy.linalg.block_diag(
+            *[self.C_cs_c_single] * self.n_pc)
 
         self.C_cs_a_avg = scipy.linalg.block_diag(
-            *[1. / ((1. / 3.) * p.Rp_a**3) * p.vols_ra_m] * p.Na)
+            *[1. / ((1. / 3.) * p.Rp_a**3) * p.vols_ra_m] * self.n_pa)
         self.C_cs_c_avg = scipy.linalg.block_diag(
-            *[1. / ((1. / 3.) * p.Rp_c**3) * p.vols_rc_m] * p.Nc)
+            *[1. / ((1. / 3.) * p.Rp_c**3) * p.vols_rc_m] * self.n_pc)
 
-        self.C_cs_a_mean = 1. / p.La * p.vols_a.dot(self.C_cs_a_avg)
-        self.C_cs_c_mean = 1. / p.Lc * p.vols_c.dot(self.C_cs_c_avg)
+        self.C_cs_a_mean = self.w_pa.dot(self.C_cs_a_avg)
+        self.C_cs_c_mean = self.w_pc.dot(self.C_cs_c_avg)
 
         # Particle core concentration
         h_na = p.r_e_a[0] - p.r_m_a[0]
@@ -334,19 +387,599 @@ class FULL_1D(Implicit_Problem):
                                      + [0. for i in range(p.Nrc - 2)],
                                      dtype='d')
 
-        self.C_cso_a = scipy.linalg.block_diag(*[C_cso_a_single] * p.Na)
-        self.C_cso_c = scipy.linalg.block_diag(*[C_cso_c_single] * p.Nc)
+        self.C_cso_a = scipy.linalg.block_diag(*[C_cso_a_single] * self.n_pa)
+        self.C_cso_c = scipy.linalg.block_diag(*[C_cso_c_single] * self.n_pc)
 
         # D_cs prelim values, note this is Ds(cs) dependent and therefore
         # requires updating for state dependent Ds
-        self.D_cs_a = -1.0 / (p.Dsa * self.c_n_a) * numpy.eye(p.Na)
-        self.D_cs_c = -1.0 / (p.Dsc * self.c_n_c) * numpy.eye(p.Nc)
-
+        self.D_cs_a = -1.0 / (p.Dsa * self.c_n_a) * numpy.eye(self.n_pa)
+        self.D_cs_c = -1.0 / (p.Dsc * self.c_n_c) * numpy.eye(self.n_pc)
+
+    # Input control
+    # The applied current density is an algebraic state of the model, set by
+    # the input control equation for the present control mode:
+    #   'curr'  : i_app = i_set(t)
+    #   'volt'  : V_cell = V_set
+    #   'power' : V_cell*i_app = p_set(t)
+    # where i_set and p_set are densities (i.e., per unit area, Ac).
     def set_iapp(self, I_app):
         """
         Calculate and assign the applied input current density.
         """
         self.i_app = I_app / self.Ac
+        self.ctrl_mode = 'curr'
+        self.ctrl_val = self.i_app
+        self.ctrl_prof = None
+
+    def set_iapp_profile(self, t_prof, I_prof):
+        """
+        Assign a time varying applied input current, linearly interpolated
+        between the (t_prof, I_prof) points, where t_prof is the simulation
+        time [s].
+        """
+        self.ctrl_mode = 'curr'
+        self.ctrl_prof = (numpy.array(t_prof, dtype='d'),
+                          numpy.array(I_prof, dtype='d') / self.Ac)
+        self.ctrl_val = self.ctrl_prof[1][0]
+
+    def set_vapp(self, V_app):
+        """
+        Assign a constant terminal voltage input, [V].
+        """
+        self.ctrl_mode = 'volt'
+        self.ctrl_val = V_app
+        self.ctrl_prof = None
+
+    def set_papp(self, P_app):
+        """
+        Assign a constant input power, [W], with the same sign convention as
+        the applied current.
+        """
+        self.ctrl_mode = 'power'
+        self.ctrl_val = P_app / self.Ac
+        self.ctrl_prof = None
+
+    def set_papp_profile(self, t_prof, P_prof):
+        """
+        Assign a time varying input power, linearly interpolated between the
+        (t_prof, P_prof) points, where t_prof is the simulation time [s].
+        """
+        self.ctrl_mode = 'power'
+        self.ctrl_prof = (numpy.array(t_prof, dtype='d'),
+                          numpy.array(P_prof, dtype='d') / self.Ac)
+        self.ctrl_val = self.ctrl_prof[1][0]
+
+    def get_ctrl(self, t):
+        """
+        Return the input control set point at time t.
+        """
+        if self.ctrl_prof is None:
+            return self.ctrl_val
+        else:
+            return numpy.interp(t, self.ctrl_prof[0], self.ctrl_prof[1])
+
+    def ctrl_res(self, t, y):
+        """
+        Residual of the input control equation.
+        """
+        i_app = y[self.iapp_ind]
+
+        if self.ctrl_mode == 'curr':
+            return i_app - self.get_ctrl(t)
+        elif self.ctrl_mode == 'volt':
+            return self.get_voltage(y) - self.get_ctrl(t)
+        elif self.ctrl_mode == 'power':
+            return self.get_voltage(y) * i_app - self.get_ctrl(t)
+
+    def ctrl_jac(self, y):
+        """
+        Derivatives of the input control equation with respect to the
+        terminal solid potentials and the applied current density.
+        Returns (d/dphi_s_a[0], d/dphi_s_c[-1], d/di_app).
+        """
+        i_app = y[self.iapp_ind]
+        dV_di = -(self.pars.Rfl + self.pars.Rtb) * self.pars.Ac
+
+        if self.ctrl_mode == 'curr':
+            return 0.0, 0.0, 1.0
+        elif self.ctrl_mode == 'volt':
+            return -1.0, 1.0, dV_di
+        elif self.ctrl_mode == 'power':
+            return -i_app, i_app, self.get_voltage(y) + i_app * dV_di
+
+    def consistent_init(self, t, y, yd, rtol=1e-8, atol=1e-12, max_iters=10):
+        """
+        Compute the consistent algebraic states, and differential state time
+        derivatives, at time t for the present applied current.
+
+        Also returns the max Butler-Volmer exponent, |0.5*F*eta/(R*T)|, of
+        the consistent states, as a measure of the stiffness of the reaction
+        kinetics (see bv_exponent_max).
+        The differential and algebraic states are those of algvar, and the
+        Newton iterations use the sparse Jacobian (jac_sparse).
+        """
+        algvar = numpy.array(self.algvar)
+        diff_inds = numpy.where(algvar == 1.0)[0]
+        alg_inds = numpy.where(algvar == 0.0)[0]
+
+        y, yd, converged = batteqns.consistent_alg_states(
+            self.res, self.jac_sparse, t, y, yd, alg_inds, diff_inds,
+            rtol=rtol, atol=atol, max_iters=max_iters)
+
+        return y, yd, converged, self.bv_exponent_max(y)
+
+    def bv_exponent_max(self, y):
+        """
+        Max Butler-Volmer exponent, |0.5*F*eta/(R*T)|, of the states y.
+        """
+        p = self.p
+
+        eta_a, eta_c = self.get_eta_uref(
+            y[self.csa_inds], y[self.csc_inds], y[self.ja_inds],
+            y[self.jc_inds], y[self.pa_inds], y[self.pc_inds],
+            y[self.pe_inds])[:2]
+
+        return 0.5 * p.F / (p.R_gas * y[self.T_ind]) \
+            * max(numpy.amax(abs(eta_a)), numpy.amax(abs(eta_c)))
+
+    def particle_blocks(self):
+        """
+        Solid diffusion blocks of each electrode, for the operator-splitting
+        solver (fixedstep.SplitStepSolver), as (cs_inds, j_inds, A_cs, B_cs)
+        tuples, where cs_dt = A_cs*cs + B_cs*j. A_cs is as of the last
+        residual evaluation (see update_cs_mats).
+        """
+        return [(self.csa_inds, self.ja_inds, self.A_cs_a, self.B_cs_a),
+                (self.csc_inds, self.jc_inds, self.A_cs_c, self.B_cs_c)]
+
+    def eliminated_inds(self):
+        """
+        States removed from the time integration in the reduced potential
+        formulation (see reducedstates): phi_e, and phi_s apart from the
+        terminal nodes, phi_s_a[0] and phi_s_c[-1]. The residuals of the same
+        indices are linear in these states, and are solved exactly by
+        solve_potentials. The A_ps matrices are singular (only the current
+        is set at the terminals), so the terminal phi_s are kept, and their
+        residuals hold the charge balance of each electrode.
+        """
+        return self.pe_inds + self.pa_inds[1:] + self.pc_inds[:-1]
+
+    def solve_potentials(self, y):
+        """
+        Set the eliminated_inds potentials of y, from the solution of the
+        phi_e and phi_s equations for the other states of y.
+        """
+        p = self.p
+
+        ce = y[self.ce_inds]
+        T = y[self.T_ind]
+        ja_rxn = y[self.ja_inds]
+        jc_rxn = y[self.jc_inds]
+        i_app = y[self.iapp_ind]
+
+        j = numpy.concatenate([ja_rxn, numpy.zeros(p.Ns), jc_rxn])
+
+        # E-lyte potential, A_pe is tridiagonal (and depends on ce and T)
+        A_pe_tri, B_pe_tri = self.pe_tris(ce, T)
+        ab = numpy.zeros((3, p.N))
+        ab[0, 1:] = A_pe_tri[2]
+        ab[1, :] = A_pe_tri[1]
+        ab[2, :-1] = A_pe_tri[0]
+        y[self.pe_inds] = scipy.linalg.solve_banded(
+            (1, 1), ab,
+            batteqns.tridiag_apply(B_pe_tri, ce) - self.B2_pe.dot(j))
+
+        # Solid potentials, from the terminal node values
+        pa0 = y[self.pa_inds[0]]
+        y[self.pa_inds[1:]] = scipy.linalg.lu_solve(
+            self.lu_ps_a,
+            (self.B_ps_a.dot(ja_rxn) + self.B2_ps_a * i_app)[1:]
+            - self.A_ps_a[1:, 0] * pa0)
+
+        pc1 = y[self.pc_inds[-1]]
+        y[self.pc_inds[:-1]] = scipy.linalg.lu_solve(
+            self.lu_ps_c,
+            (self.B_ps_c.dot(jc_rxn) - self.B2_ps_c * i_app)[:-1]
+            - self.A_ps_c[:-1, -1] * pc1)
+
+        return y
+
+    def state_blocks(self):
+        """
+        Name and indices of each physical variable of the state vector, e.g.,
+        for the Jacobian check (fdjac.check_jac).
+        """
+        return [('ce', self.ce_inds), ('csa', self.csa_inds),
+                ('csc', self.csc_inds), ('T', [self.T_ind]),
+                ('ja', self.ja_inds), ('jc', self.jc_inds),
+                ('pe', self.pe_inds), ('pa', self.pa_inds),
+                ('pc', self.pc_inds), ('iapp', [self.iapp_ind])]
+
+    def state_scales(self):
+        """
+        Typical magnitude of each state, from the parameters: the nominal
+        electrolyte and max solid concentrations, the ambient temperature,
+        1 V for the potentials, and the 1C current density, and the mean pore
+        wall fluxes of each electrode at 1C (RATE_NOM_CAP).
+        These scale the absolute tolerances (ATOL_SCALED_ON) and the states
+        of the scaled problem (STATE_SCALING_ON, see scaledstates).
+        """
+        p = self.p
+
+        i_1C = p.RunInput['MODEL']['RATE_NOM_CAP'] / p.Area
+
+        scales = numpy.ones(self.iapp_ind + 1)
+        scales[self.ce_inds] = p.ce_nom
+        scales[self.csa_inds] = p.csa_max
+        scales[self.csc_inds] = p.csc_max
+        scales[self.T_ind] = p.T_amb
+        scales[self.ja_inds] = i_1C / (p.F * p.as_a_mean * p.La)
+        scales[self.jc_inds] = i_1C / (p.F * p.as_c_mean * p.Lc)
+        scales[self.iapp_ind] = i_1C
+
+        return scales
+
+    def jac_pattern(self):
+        """
+        Sparsity pattern of the Jacobian (bool array), for the colored finite
+        difference Jacobian (see fdjac).
+        The state dependent transport operators (De, kappa and Ds) are
+        tridiagonal, the kinetics of each node couple its own particle
+        surface, elyte and solid states, and the heat generation depends on
+        all of the states. The input control row is for any control mode.
+        """
+        p = self.p
+
+        n = self.iapp_ind + 1
+        pattern = numpy.eye(n, dtype=bool)
+
+        def add(rows, cols, B):
+            pattern[numpy.ix_(rows, cols)] |= numpy.array(B) != 0.0
+
+        def tri(m):
+            return numpy.eye(m, k=-1) + numpy.eye(m) + numpy.eye(m, k=1)
+
+        T = [self.T_ind]
+        ce_a, ce_c = self.ce_inds[:p.Na], self.ce_inds[-p.Nc:]
+        pe_a, pe_c = self.pe_inds[:p.Na], self.pe_inds[-p.Nc:]
+
+        # E-lyte conc and potential
+        for rows, A in [(self.ce_inds, tri(p.N)), (self.pe_inds, tri(p.N))]:
+            add(rows, self.ce_inds, A)
+            add(rows, T, numpy.ones((p.N, 1)))
+        add(self.pe_inds, self.pe_inds, tri(p.N))
+        add(self.ce_inds, self.ja_inds, self.B_ce[:, :p.Na])
+        add(self.ce_inds, self.jc_inds, self.B_ce[:, -p.Nc:])
+        add(self.pe_inds, self.ja_inds, self.B2_pe[:, :p.Na])
+        add(self.pe_inds, self.jc_inds, self.B2_pe[:, -p.Nc:])
+
+        # Solid conc, with Ds at the surface of the surface conc
+        for cs, j, Nx, Nr, B_cs, C_cs in [
+                (self.csa_inds, self.ja_inds, p.Na, self.n_ra,
+                 self.B_cs_a, self.C_cs_a),
+                (self.csc_inds, self.jc_inds, p.Nc, self.n_rc,
+                 self.B_cs_c, self.C_cs_c)]:
+            add(cs, cs, scipy.linalg.block_diag(*[tri(Nr)] * Nx))
+            add(cs, cs, B_cs.dot(C_cs))
+            add(cs, j, B_cs)
+
+        # Kinetics
+        for j, cs, ce, pe, ps, Nx, C_cs in [
+                (self.ja_inds, self.csa_inds, ce_a, pe_a, self.pa_inds,
+                 p.Na, self.C_cs_a),
+                (self.jc_inds, self.csc_inds, ce_c, pe_c, self.pc_inds,
+                 p.Nc, self.C_cs_c)]:
+            add(j, cs, C_cs)
+            add(j, T, numpy.ones((Nx, 1)))
+            for cols in [ce, pe, ps]:
+                add(j, cols, numpy.eye(Nx))
+
+        # Solid potentials
+        add(self.pa_inds, self.pa_inds, self.A_ps_a)
+        add(self.pa_inds, self.ja_inds, self.B_ps_a)
+        add(self.pa_inds, [self.iapp_ind], self.B2_ps_a[:, numpy.newaxis])
+        add(self.pc_inds, self.pc_inds, self.A_ps_c)
+        add(self.pc_inds, self.jc_inds, self.B_ps_c)
+        add(self.pc_inds, [self.iapp_ind], self.B2_ps_c[:, numpy.newaxis])
+
+        # Thermal, and input control
+        pattern[self.T_ind, :] = True
+        add([self.iapp_ind], [self.pa_inds[0], self.pc_inds[-1]],
+            numpy.ones((1, 2)))
+
+        return pattern
+
+    def jacv(self, t, y, yd, res, v, c):
+        """
+        Jacobian-vector product, (dres/dy + c*dres/dyd)*v, for the Krylov
+        linear solvers (IDA SPGMR, and the fixedstep GMRES solver), with the
+        Jacobian of the model, as a sparse matrix (see jac_sparse). The
+        Jacobian of the last point is kept, as the products of a linear
+        solve are all at the same point. The res argument is not used.
+        """
+        last = getattr(self, 'jacv_last', None)
+        if last is None or last[0] != c or last[1] != t \
+                or not numpy.array_equal(last[2], y) \
+                or not numpy.array_equal(last[3], yd):
+            last = (c, t, numpy.array(y), numpy.array(yd),
+                    self.jac_sparse(c, t, y, yd))
+            self.jacv_last = last
+
+        return last[4].dot(v)
+
+    def jac_terms(self, c, t, y, yd, heat=1):
+        """
+        Analytical Jacobian of jac (with the transport and kinetic parameters
+        held fixed), assembled directly in sparse form, as:
+            - the (rows, cols, vals) of its entries, apart from the solid
+              diffusion blocks of the particles
+            - the diagonals of these blocks, c*I - A_cs, over the csa_inds
+              and csc_inds states (which follow each other), as for
+              batteqns.tridiag_mat
+        The blocks are:
+            - the tridiagonal elyte conc block, and the tridiagonal solid
+              diffusion block of each particle, with their j sources
+            - the thermal diagonal, and with heat, the (dense) heat
+              generation row (of the last calc_heat call, as in jac)
+            - the algebraic block: the kinetics diagonal, the tridiagonal
+              phi_e and phi_s blocks, and the coupling of these through j,
+              the terminal current and the input control
+            - the coupling of the algebraic states to the differential ones
+              (phi_e:ce, j:cs and j:T)
+        The constant entries are set up on the first call (see jac_consts).
+        """
+        p = self.p
+
+        ce = y[self.ce_inds]
+        T = y[self.T_ind]
+
+        eta_a, eta_c, Uref_a, Uref_c, csa_ss, csc_ss = self.get_eta_uref(
+            y[self.csa_inds], y[self.csc_inds], y[self.ja_inds],
+            y[self.jc_inds], y[self.pa_inds], y[self.pc_inds],
+            y[self.pe_inds])
+
+        # Kinetics, dj/deta, dj/dT and dUref/dcs_ss
+        b = 0.5 * p.F / (p.R_gas * T)
+        dj_a = numpy.diagonal(self.build_Bjac_mat(eta_a, self.C_ioa, b))
+        dj_c = numpy.diagonal(self.build_Bjac_mat(eta_c, self.C_ioc, b))
+        djT_a = self.build_BjT_mat(T, self.C_ioa, 0.5 * p.F / p.R_gas * eta_a)
+        djT_c = self.build_BjT_mat(T, self.C_ioc, 0.5 * p.F / p.R_gas * eta_c)
+        dU_a = p.duref_a(csa_ss / p.csa_max) / p.csa_max
+        dU_c = p.duref_c(csc_ss / p.csc_max) / p.csc_max
+
+        const, C_cs_coo = self.jac_consts()
+        rows, cols, vals = [const[0]], [const[1]], [const[2]]
+
+        def add(r_inds, c_inds, v):
+            rows.append(numpy.asarray(r_inds))
+            cols.append(numpy.asarray(c_inds))
+            vals.append(numpy.asarray(v, dtype='d'))
+
+        def add_tri(inds, tri):
+            inds = numpy.asarray(inds)
+            add(numpy.concatenate([inds[1:], inds, inds[:-1]]),
+                numpy.concatenate([inds[:-1], inds, inds[1:]]),
+                numpy.concatenate(tri))
+
+        # Differential blocks
+        lo, d, up = self.build_Ace_tri(ce, T)
+        add_tri(self.ce_inds, (-lo, c - d, -up))
+        add([self.T_ind], [self.T_ind], [c + p.h * p.Aconv / (p.rho * p.Cp)])
+
+        cs_tri = [numpy.concatenate([-self.A_cs_a_tri[0], [0.],
+                                     -self.A_cs_c_tri[0]]),
+                  c - numpy.concatenate([self.A_cs_a_tri[1],
+                                         self.A_cs_c_tri[1]]),
+                  numpy.concatenate([-self.A_cs_a_tri[2], [0.],
+                                     -self.A_cs_c_tri[2]])]
+
+        # Heat generation
+        if heat:
+            a = -1. / (p.rho * p.Cp)
+            dcss_dja = numpy.diagonal(self.D_cs_a)
+            dcss_djc = numpy.diagonal(self.D_cs_c)
+
+            T_row = numpy.zeros(self.iapp_ind + 1)
+            T_row[self.ja_inds] = a * (
+                self.C_q_ja + 2.0 * (self.C_q_na * (-1.0) * dU_a * dcss_dja))
+            T_row[self.jc_inds] = a * (
+                self.C_q_jc + 2.0 * (self.C_q_nc * (-1.0) * dU_c * dcss_djc))
+            T_row[self.pe_inds] = a * (
+                self.C_q_pe + numpy.concatenate(
+                    [self.C_q_na, numpy.zeros(p.Ns), self.C_q_nc]) * (-1.0))
+            T_row[self.pa_inds] = a * (self.C_q_pa + self.C_q_na * (1.0))
+            T_row[self.pc_inds] = a * (self.C_q_pc + self.C_q_nc * (1.0))
+            T_row[self.csa_inds] = a * numpy.outer(
+                2.0 * self.C_q_na * (-1.0) * dU_a,
+                self.C_cs_a_single).flatten()
+            T_row[self.csc_inds] = a * numpy.outer(
+                2.0 * self.C_q_nc * (-1.0) * dU_c,
+                self.C_cs_c_single).flatten()
+
+            T_cols = numpy.nonzero(T_row)[0]
+            add(self.T_ind * numpy.ones(len(T_cols), dtype=int), T_cols,
+                T_row[T_cols])
+
+        # Kinetics
+        for j, pe, ps, dj, djT, dU, D_cs, C_cs in [
+                (self.ja_inds, self.pe_a_inds, self.pa_inds,
+                 dj_a, djT_a, dU_a, self.D_cs_a, C_cs_coo[0]),
+                (self.jc_inds, self.pe_c_inds, self.pc_inds,
+                 dj_c, djT_c, dU_c, self.D_cs_c, C_cs_coo[1])]:
+            add(j, j, 1.0 + dj * dU * numpy.diagonal(D_cs))
+            add(j, ps, -dj)
+            add(j, pe, dj)
+            add(numpy.asarray(j)[C_cs[0]], C_cs[1],
+                (dj * dU)[C_cs[0]] * C_cs[2])
+            add(j, self.T_ind * numpy.ones(len(j), dtype=int), -djT)
+
+        # E-lyte potential
+        A_pe_tri, B_pe_tri = self.pe_tris(ce, T)
+        add_tri(self.pe_inds, A_pe_tri)
+        lo, d, up = B_pe_tri
+        add(numpy.concatenate([self.pe_inds[1:], self.pe_inds,
+                               self.pe_inds[:-1]]),
+            numpy.concatenate([self.ce_inds[:-1], self.ce_inds,
+                               self.ce_inds[1:]]),
+            -numpy.concatenate([lo, d, up]))
+
+        # Input control
+        add([self.iapp_ind] * 3,
+            [self.pa_inds[0], self.pc_inds[-1], self.iapp_ind],
+            self.ctrl_jac(y))
+
+        return (numpy.concatenate(rows), numpy.concatenate(cols),
+                numpy.concatenate(vals), cs_tri)
+
+    def jac_consts(self):
+        """
+        Constant entries of jac_terms, as (rows, cols, vals): the pore wall
+        flux sources of the elyte and particles, the j terms of phi_e, and
+        the phi_s blocks, with their j and current terms. Also, the entries
+        of the C_cs matrices (of the kinetics rows), as (rows, cols, vals),
+        with the rows of the electrode and the cols of the states.
+        These are set up on the first call.
+        """
+        consts = getattr(self, 'jac_consts_last', None)
+        if consts is not None:
+            return consts
+
+        p = self.p
+        rows, cols, vals = [], [], []
+
+        def add(r_inds, c_inds, B):
+            B = scipy.sparse.coo_matrix(B)
+            rows.append(numpy.asarray(r_inds)[B.row])
+            cols.append(numpy.asarray(c_inds)[B.col])
+            vals.append(B.data)
+
+        tri = batteqns.tridiag_mat
+
+        add(self.ce_inds, self.ja_inds, -self.B_ce[:, :p.Na])
+        add(self.ce_inds, self.jc_inds, -self.B_ce[:, -p.Nc:])
+        add(self.csa_inds, self.ja_inds, -self.B_cs_a)
+        add(self.csc_inds, self.jc_inds, -self.B_cs_c)
+
+        add(self.pe_inds, self.ja_inds, self.B2_pe[:, :p.Na])
+        add(self.pe_inds, self.jc_inds, self.B2_pe[:, -p.Nc:])
+
+        add(self.pa_inds, self.pa_inds, tri(self.A_ps_a_tri, sparse=1))
+        add(self.pa_inds, self.ja_inds, -self.B_ps_a)
+        add(self.pa_inds, [self.iapp_ind], -self.B2_ps_a[:, numpy.newaxis])
+        add(self.pc_inds, self.pc_inds, tri(self.A_ps_c_tri, sparse=1))
+        add(self.pc_inds, self.jc_inds, -self.B_ps_c)
+        add(self.pc_inds, [self.iapp_ind], self.B2_ps_c[:, numpy.newaxis])
+
+        C_cs_coo = []
+        for cs_inds, C_cs in [(self.csa_inds, self.C_cs_a),
+                              (self.csc_inds, self.C_cs_c)]:
+            C = scipy.sparse.coo_matrix(C_cs)
+            C_cs_coo.append((C.row, numpy.asarray(cs_inds)[C.col], C.data))
+
+        consts = ((numpy.concatenate(rows), numpy.concatenate(cols),
+                   numpy.concatenate(vals)), C_cs_coo)
+        self.jac_consts_last = consts
+
+        return consts
+
+    def jac_coo(self, c, t, y, yd):
+        """
+        Entries of the Jacobian, and the diagonals of its particle blocks, as
+        for jac_terms. In the EXACT_JAC_ON and FD_JAC_ON modes, the entries
+        are those of jac instead, with the particle blocks, and the
+        diagonals are None (jac counts the call in the solver stats).
+        """
+        if self.p.exact_jac or self.p.fd_jac:
+            J = scipy.sparse.coo_matrix(self.jac(c, t, y, yd))
+            return J.row, J.col, J.data, None
+
+        t_start = time.time()
+
+        terms = self.jac_terms(c, t, y, yd)
+
+        solverstats.count_call(self.stats, 'jac', t_start)
+        return terms
+
+    def jac_sparse(self, c, t, y, yd):
+        """
+        Jacobian of jac, as a sparse (CSC) matrix, without forming the dense
+        Jacobian (but in the EXACT_JAC_ON and FD_JAC_ON modes, see jac_coo).
+        """
+        return self.coo_mat(*self.jac_coo(c, t, y, yd))
+
+    def schur_blocks(self, c, t, y, yd):
+        """
+        Blocks of the Jacobian of jac_sparse, for the condensation of the
+        particle states (fixedstep.SchurLU), without forming the Jacobian.
+        With P the csa_inds and csc_inds states (which follow each other)
+        and R the rest of the states, in order, returns
+        (cs_tri, J_PR, J_RP, J_RR): the diagonals of the tridiagonal J_PP
+        (as for batteqns.tridiag_mat), and the other blocks as sparse (CSR)
+        matrices. In the EXACT_JAC_ON and FD_JAC_ON modes, J_PP is the
+        tridiagonal part of the particle block of jac.
+        """
+        rows, cols, vals, cs_tri = self.jac_coo(c, t, y, yd)
+
+        n = self.iapp_ind + 1
+        p0 = self.csa_inds[0]
+        n_p = len(self.csa_inds) + len(self.csc_inds)
+
+        in_r = (rows >= p0) & (rows < p0 + n_p)
+        in_c = (cols >= p0) & (cols < p0 + n_p)
+
+        # Positions of the states in P and R
+        r_pos = numpy.where(in_r, rows - p0, rows - n_p * (rows >= p0))
+        c_pos = numpy.where(in_c, cols - p0, cols - n_p * (cols >= p0))
+
+        if cs_tri is None:
+            cs_tri = [numpy.zeros(n_p - 1), numpy.zeros(n_p),
+                      numpy.zeros(n_p - 1)]
+        else:
+            cs_tri = [numpy.array(d, dtype='d') for d in cs_tri]
+
+        # Particle block entries, within its tridiagonal band
+        k = in_r & in_c
+        off = c_pos[k] - r_pos[k]
+        for i_diag, (offset, inds) in enumerate([(-1, c_pos[k]),
+                                                 (0, r_pos[k]),
+                                                 (1, r_pos[k])]):
+            sel = off == offset
+            numpy.add.at(cs_tri[i_diag], inds[sel], vals[k][sel])
+
+        def block(sel, shape):
+            return scipy.sparse.csr_matrix(
+                (vals[sel], (r_pos[sel], c_pos[sel])), shape=shape)
+
+        return (cs_tri,
+                block(in_r & ~in_c, (n_p, n - n_p)),
+                block(~in_r & in_c, (n - n_p, n_p)),
+                block(~in_r & ~in_c, (n - n_p, n - n_p)))
+
+    def prec_mat(self, c, t, y, yd):
+        """
+        Physics-block preconditioner of the Jacobian (sparse matrix), for the
+        Krylov linear solvers: the Jacobian of jac_terms, without the (dense)
+        heat generation row. The transport and kinetic parameters are held
+        fixed, as in jac, and it is assembled directly in sparse form.
+        """
+        return self.coo_mat(*self.jac_terms(c, t, y, yd, heat=0))
+
+    def coo_mat(self, rows, cols, vals, cs_tri):
+        """
+        Sparse (CSC) matrix of the Jacobian entries, with the diagonals of
+        the particle blocks, if not None (see jac_terms).
+        """
+        n = self.iapp_ind + 1
+
+        if cs_tri is not None:
+            cs = numpy.concatenate([self.csa_inds, self.csc_inds])
+            P = scipy.sparse.coo_matrix(batteqns.tridiag_mat(cs_tri,
+                                                             sparse=1))
+            rows = numpy.concatenate([rows, cs[P.row]])
+            cols = numpy.concatenate([cols, cs[P.col]])
+            vals = numpy.concatenate([vals, P.data])
+
+        return scipy.sparse.csc_matrix((vals, (rows, cols)), shape=(n, n))
 
     def update_cs_mats(self, csa, csc, csa_ss, csc_ss, csa_o, csc_o):
         """
@@ -361,61 +994,49 @@ class FULL_1D(Implicit_Problem):
         If, Ds(cs) is constant, then this only needs to be initialized and
         then may be left constat during the simulation.
         """
-        p = self.p
-
-        Acsa_list = [[] for i in range(p.Na)]
-        Acsc_list = [[] for i in range(p.Nc)]
-
-        Dsa_ss = [0. for i in range(p.Na)]
-        Dsc_ss = [0. for i in range(p.Nc)]
-
-        for ia in range(p.Na):
-
-            csa_m = csa[ia * p.Nra:(ia + 1) * p.Nra]
-            csa_e = numpy.array([csa_o[ia]]
-                                + [0.5 * (csa_m[i + 1] + csa_m[i])
-                                for i in range(p.Nra - 1)] + [csa_ss[ia]])
-            Ua_e = p.uref_a(csa_e / p.csa_max)
-            Dsa_e = p.Dsa_intp(Ua_e)
+        t_start = time.time()
 
-            Acsa_list[ia] = batteqns.flux_mat_builder(
-                p.Nra, p.r_m_a, p.vols_ra_m, Dsa_e * (p.r_e_a**2))
-
-            Dsa_ss[ia] = Dsa_e[-1]
-
-        for ic in range(p.Nc):
+        p = self.p
+        kern = self.kern
 
-            csc_m = csc[ic * p.Nrc:(ic + 1) * p.Nrc]
-            csc_e = numpy.array([csc_o[ic]]
-                                + [0.5 * (csc_m[i + 1] + csc_m[i])
-                                for i in range(p.Nrc - 1)] + [csc_ss[ic]])
-            Uc_e = p.uref_c(csc_e / p.csc_max)
-            Dsc_e = p.Dsc_intp(Uc_e)
+        # Edge concentrations (one row per particle), and the Ds of these,
+        # for all of the particles of each electrode at once
+        csa_e = kern.particle_edges(csa, csa_o, csa_ss, self.n_pa, p.Nra)
+        Dsa_e = p.Dsa_intp(p.uref_a(csa_e / p.csa_max))
 
-            Acsc_list[ic] = batteqns.flux_mat_builder(
-                p.Nrc, p.r_m_c, p.vols_rc_m, Dsc_e * (p.r_e_c**2))
+        csc_e = kern.particle_edges(csc, csc_o, csc_ss, self.n_pc, p.Nrc)
+        Dsc_e = p.Dsc_intp(p.uref_c(csc_e / p.csc_max))
 
-            Dsc_ss[ic] = Dsc_e[-1]
+        self.A_cs_a_tri = kern.particle_flux_diags(p.mesh_ra, self.n_pa,
+                                                   Dsa_e * (p.r_e_a**2))
+        self.A_cs_c_tri = kern.particle_flux_diags(p.mesh_rc, self.n_pc,
+                                                   Dsc_e * (p.r_e_c**2))
+        self.A_cs_a = batteqns.tridiag_mat(self.A_cs_a_tri)
+        self.A_cs_c = batteqns.tridiag_mat(self.A_cs_c_tri)
 
-        self.A_cs_a = scipy.linalg.block_diag(*Acsa_list)
-        self.A_cs_c = scipy.linalg.block_diag(*Acsc_list)
+        self.D_cs_a = numpy.diag(-1.0 / (Dsa_e[:, -1] * self.c_n_a))
+        self.D_cs_c = numpy.diag(-1.0 / (Dsc_e[:, -1] * self.c_n_c))
 
-        self.D_cs_a = numpy.diag(-1.0 / (numpy.array(Dsa_ss) * self.c_n_a))
-        self.D_cs_c = numpy.diag(-1.0 / (numpy.array(Dsc_ss) * self.c_n_c))
+        solverstats.count_call(self.stats, 'update_cs_mats', t_start)
 
     # Define c_e functions
-    def build_Ace_mat(self, c, T):
+    def build_Ace_tri(self, c, T):
         """
         FVM discretization of the concentration flux term for the elyte
-        diffusion equation.
+        diffusion equation, as the diagonals of the tridiagonal operator.
         """
         p = self.p
 
         D_eff = self.Diff_ce(c, T)
 
-        A = p.K_m.dot(batteqns.flux_mat_builder(p.N, p.x_m, p.vols, D_eff))
+        return batteqns.tridiag_scale(p.k_m,
+                                      self.kern.flux_diags(p.mesh, D_eff))
 
-        return A
+    def build_Ace_mat(self, c, T):
+        """
+        A_ce matrix (see build_Ace_tri).
+        """
+        return batteqns.tridiag_mat(self.build_Ace_tri(c, T))
 
     def Diff_ce(self, c, T, mid_on=0, eps_off=0):
         """
@@ -437,30 +1058,64 @@ class FULL_1D(Implicit_Problem):
             if isinstance(c, float):
                 D_out = D_mid
             else:
-                D_out = batteqns.mid_to_edge(D_mid, p.x_e)
+                D_out = self.kern.edge_interp(p.mesh, D_mid)
 
         return D_out
 
     # Define phi_e functions
-    def build_Ape_mat(self, c, T):
+    def build_Ape_tri(self, c, T):
         """
         FVM discretization of the potential flux term for the elyte potential
-        equation.
+        equation, as the diagonals of the tridiagonal operator.
         """
         p = self.p
 
         k_eff = self.kapp_ce(c, T)
 
-        A = batteqns.flux_mat_builder(p.N, p.x_m, p.vols, k_eff)
+        lo, d, up = self.kern.flux_diags(p.mesh, k_eff)
 
-        A[-1, -1] = 2 * A[-1, -1]  # BC update for phi_e = 0
+        d[-1] = 2 * d[-1]  # BC update for phi_e = 0
 
-        return A
+        return lo, d, up
 
-    def build_Bpe_mat(self, c, T):
+    def build_Ape_mat(self, c, T):
+        """
+        A_pe matrix (see build_Ape_tri).
+        """
+        return batteqns.tridiag_mat(self.build_Ape_tri(c, T))
+
+    def pe_tris(self, c, T):
+        """
+        A_pe and B_pe operators (diagonals) of the elyte potential equation,
+        for c and T. The operators of the last c and T are kept, as these
+        are used by res, jac and solve_potentials for the same states.
+        """
+        last = getattr(self, 'pe_mats_last', None)
+        if last is None or last[1] != T or not numpy.array_equal(last[0], c):
+            last = [numpy.array(c), T, self.build_Ape_tri(c, T),
+                    self.build_Bpe_tri(c, T), None]
+            self.pe_mats_last = last
+
+        return last[2], last[3]
+
+    def pe_mats(self, c, T):
+        """
+        A_pe and B_pe matrices of the elyte potential equation, for c and T
+        (see pe_tris).
+        """
+        A_pe_tri, B_pe_tri = self.pe_tris(c, T)
+
+        last = self.pe_mats_last
+        if last[4] is None:
+            last[4] = (batteqns.tridiag_mat(A_pe_tri),
+                       batteqns.tridiag_mat(B_pe_tri))
+
+        return last[4]
+
+    def build_Bpe_tri(self, c, T):
         """
         FVM discretization of the concentration flux term for the elyte
-        potential equation.
+        potential equation, as the diagonals of the tridiagonal operator.
         """
         p = self.p
 
@@ -468,12 +1123,15 @@ class FULL_1D(Implicit_Problem):
 
         k_eff = self.kapp_ce(c, T)
 
-        c_edge = batteqns.mid_to_edge(c, p.x_e)
+        c_edge = self.kern.edge_interp(p.mesh, c)
 
-        B1 = batteqns.flux_mat_builder(
-            p.N, p.x_m, p.vols, k_eff * gam / c_edge)
+        return self.kern.flux_diags(p.mesh, k_eff * gam / c_edge)
 
-        return B1
+    def build_Bpe_mat(self, c, T):
+        """
+        B_pe matrix (see build_Bpe_tri).
+        """
+        return batteqns.tridiag_mat(self.build_Bpe_tri(c, T))
 
     def kapp_ce(self, c, T, mid_on=0, eps_off=0):
         """
@@ -496,7 +1154,7 @@ class FULL_1D(Implicit_Problem):
             if isinstance(c, float):
                 k_out = k_mid
             else:
-                k_out = batteqns.mid_to_edge(k_mid, p.x_e)
+                k_out = self.kern.edge_interp(p.mesh, k_mid)
 
         return k_out
 
@@ -530,7 +1188,7 @@ class FULL_1D(Implicit_Problem):
         Vcell = pc[-1] - pa[0]
 
         return Vcell - (self.pars.Rfl + self.pars.Rtb) * \
-            (self.pars.Ac * self.i_app)
+            (self.pars.Ac * y[self.iapp_ind])
 
     def get_eta_uref(self, csa, csc, ja_rxn, jc_rxn, phi_s_a, phi_s_c, phi):
         """
@@ -551,8 +1209,10 @@ class FULL_1D(Implicit_Problem):
         # cathode equilibrium potential at surface of particles
         Uref_c = p.uref_c(csc_ss / p.csc_max)
 
-        eta_a = phi_s_a - phi[:p.Na] - Uref_a  # anode   overpotential
-        eta_c = phi_s_c - phi[-p.Nc:] - Uref_c  # cathode overpotential
+        # anode   overpotential
+        eta_a = self.kern.overpotential(phi_s_a, phi[:p.Na], Uref_a)
+        # cathode overpotential
+        eta_c = self.kern.overpotential(phi_s_c, phi[-p.Nc:], Uref_c)
 
         return eta_a, eta_c, Uref_a, Uref_c, csa_ss, csc_ss
 
@@ -590,6 +1250,8 @@ class FULL_1D(Implicit_Problem):
         Return the total, spatially integrated, heat source across the cell
         sandwich.
         """
+        t_start = time.time()
+
         p = self.p
         # Parse out the different physical variables
         ce = y[self.ce_inds]  # elyte conc
@@ -678,6 +1340,7 @@ class FULL_1D(Implicit_Problem):
         self.C_q_ja = C_ra * eta_a + C_ra * eta_conc_a
         self.C_q_jc = C_rc * eta_c + C_rc * eta_conc_c
 
+        solverstats.count_call(self.stats, 'calc_heat', t_start)
         return Q_tot
 
     # Define system equations
@@ -685,6 +1348,8 @@ class FULL_1D(Implicit_Problem):
         """
         Residual for the FULL_1D model.
         """
+        t_start = time.time()
+
         p = self.p
 
         # Parse out the states
@@ -713,11 +1378,13 @@ class FULL_1D(Implicit_Problem):
         T = y[self.T_ind]
         T_dt = yd[self.T_ind]
 
-        # Grab state dependent matrices
+        # Applied current density
+        i_app = y[self.iapp_ind]
+
+        # Grab state dependent operators (tridiagonal)
         # For E-lyte conc and potential (i.e., De(ce), kapp_e(ce))
-        A_ce = self.build_Ace_mat(ce, T)
-        A_pe = self.build_Ape_mat(ce, T)
-        B_pe = self.build_Bpe_mat(ce, T)
+        A_ce = self.build_Ace_tri(ce, T)
+        A_pe, B_pe = self.pe_tris(ce, T)
 
         # Compute extra variables
         # For the reaction kinetics
@@ -737,20 +1404,22 @@ class FULL_1D(Implicit_Problem):
 
         Q_out = p.h * p.Aconv * (T - self.T_amb)
 
-        ja = self.C_ioa * numpy.sinh(0.5 * p.F / (p.R_gas * T) * eta_a)
-        jc = self.C_ioc * numpy.sinh(0.5 * p.F / (p.R_gas * T) * eta_c)
+        ja = self.kern.butler_volmer(self.C_ioa, 0.5 * p.F / (p.R_gas * T),
+                                     eta_a)
+        jc = self.kern.butler_volmer(self.C_ioc, 0.5 * p.F / (p.R_gas * T),
+                                     eta_c)
 
         j = numpy.concatenate([ja_rxn, numpy.zeros(p.Ns), jc_rxn])
 
         # Compute the residuals
         # Time deriv components -- E-lyte conc
-        r1 = c_dots - (((A_ce.dot(ce)).flatten() +
+        r1 = c_dots - ((batteqns.tridiag_apply(A_ce, ce) +
                         (self.B_ce.dot(j)).flatten()))
         # Time deriv components -- Anode particle conc
-        r2 = csa_dt - (self.A_cs_a.dot(csa).flatten() +
+        r2 = csa_dt - (batteqns.tridiag_apply(self.A_cs_a_tri, csa) +
                        self.B_cs_a.dot(ja_rxn).flatten())
         # Time deriv components -- Cathode particle conc
-        r3 = csc_dt - (self.A_cs_c.dot(csc).flatten() +
+        r3 = csc_dt - (batteqns.tridiag_apply(self.A_cs_c_tri, csc) +
                        self.B_cs_c.dot(jc_rxn).flatten())
         # Time deriv components -- Single lump thermal ODE
         r4 = T_dt - 1. / (p.rho * p.Cp) * (Q_in - Q_out)
@@ -759,18 +1428,22 @@ class FULL_1D(Implicit_Problem):
         r5 = ja_rxn - ja
         r6 = jc_rxn - jc
         # Algebraic components -- E-lyte potential
-        r7 = A_pe.dot(phi).flatten() - B_pe.dot(ce).flatten() + \
-            self.B2_pe.dot(j).flatten()
+        r7 = batteqns.tridiag_apply(A_pe, phi) \
+            - batteqns.tridiag_apply(B_pe, ce) + self.B2_pe.dot(j).flatten()
         # Algebraic components -- Anode potential
-        r8 = self.A_ps_a.dot(phi_s_a).flatten(
-        ) - self.B_ps_a.dot(ja_rxn).flatten() - self.B2_ps_a * self.i_app
+        r8 = batteqns.tridiag_apply(self.A_ps_a_tri, phi_s_a) \
+            - self.B_ps_a.dot(ja_rxn).flatten() - self.B2_ps_a * i_app
         # Algebraic components -- Cathode potential
-        r9 = self.A_ps_c.dot(phi_s_c).flatten(
-        ) - self.B_ps_c.dot(jc_rxn).flatten() + self.B2_ps_c * self.i_app
+        r9 = batteqns.tridiag_apply(self.A_ps_c_tri, phi_s_c) \
+            - self.B_ps_c.dot(jc_rxn).flatten() + self.B2_ps_c * i_app
+        # Algebraic components -- Input control
+        r10 = self.ctrl_res(t, y)
 
         # Final residual
-        res_out = numpy.concatenate([r1, r2, r3, [r4], r5, r6, r7, r8, r9])
+        res_out = numpy.concatenate([r1, r2, r3, [r4], r5, r6, r7, r8, r9,
+                                     [r10]])
 
+        solverstats.count_call(self.stats, 'res', t_start)
         return res_out
 
     def jac(self, c, t, y, yd):
@@ -781,7 +1454,13 @@ class FULL_1D(Implicit_Problem):
         Assimulo, as the python interface to IDA. Improving the interface to
         IDA to enable the use of sparse matrices is a next step for performance
         enhancement.
+
+        By default, the transport and kinetic parameters (De, kappa, Ds and
+        the exchange current densities) are held fixed in the Jacobian. With
+        EXACT_JAC_ON, their state derivatives are added (see
+        jac_exact_terms).
         """
+        t_start = time.time()
 
         p = self.p
 
@@ -811,17 +1490,20 @@ class FULL_1D(Implicit_Problem):
         # Grab state dependent matrices
         # For E-lyte conc and potential (i.e., De(ce), kapp_e(ce))
         A_ce = self.build_Ace_mat(ce, T)
-        A_pe = self.build_Ape_mat(ce, T)
-        B_pe = self.build_Bpe_mat(ce, T)
+        A_pe, B_pe = self.pe_mats(ce, T)
 
         # Compute extra variables
         # For the reaction kinetics
         eta_a, eta_c, Uref_a, Uref_c, csa_ss, csc_ss = self.get_eta_uref(
             csa, csc, ja_rxn, jc_rxn, phi_s_a, phi_s_c, phi)
 
+        # Exchange current densities at y (else as of the last res call)
+        if p.exact_jac:
+            self.update_Cio(csa_ss, csc_ss, ce, T)
+
         # Build the Jac matrix
         # Self coupling
-        A_dots = numpy.diag([1 * c for i in range(p.num_diff_vars)])
+        A_dots = numpy.diag([1 * c for i in range(self.T_ind + 1)])
         j_c = A_dots - scipy.linalg.block_diag(A_ce,
                                                self.A_cs_a,
                                                self.A_cs_c,
@@ -843,8 +1525,15 @@ class FULL_1D(Implicit_Problem):
         dcss_dja = numpy.diagonal(self.D_cs_a)
         dcss_djc = numpy.diagonal(self.D_cs_c)
 
-        dU_csa_ss = (1.0 / p.csa_max) * p.duref_a(csa_ss / p.csa_max)
-        dU_csc_ss = (1.0 / p.csc_max) * p.duref_c(csc_ss / p.csc_max)
+        if p.exact_jac:
+            # Slope of the Uref interpolants, rather than the dUref data
+            dU_csa_ss = (1.0 / p.csa_max) * batteqns.interp1d_deriv(
+                p.uref_a, csa_ss / p.csa_max)
+            dU_csc_ss = (1.0 / p.csc_max) * batteqns.interp1d_deriv(
+                p.uref_c, csc_ss / p.csc_max)
+        else:
+            dU_csa_ss = (1.0 / p.csa_max) * p.duref_a(csa_ss / p.csa_max)
+            dU_csc_ss = (1.0 / p.csc_max) * p.duref_c(csc_ss / p.csc_max)
 
         DUDcsa_ss = numpy.diag(dU_csa_ss)
         DUDcsc_ss = numpy.diag(dU_csc_ss)
@@ -855,7 +1544,8 @@ class FULL_1D(Implicit_Problem):
             (Bjac_c.dot(-1.0 * DUDcsc_ss * 1.0)).dot(self.D_cs_c)
 
         j = scipy.linalg.block_diag(
-            j_c, A_ja, A_jc, A_pe, self.A_ps_a, self.A_ps_c)
+            j_c, A_ja, A_jc, A_pe, self.A_ps_a, self.A_ps_c,
+            numpy.zeros([p.num_ctrl_vars, p.num_ctrl_vars]))
 
         # Cross coupling
         # c_e:j coupling back in
@@ -921,10 +1611,163 @@ class FULL_1D(Implicit_Problem):
         j[numpy.ix_(self.pa_inds, self.ja_inds)] = -self.B_ps_a
         # phi_s_c:jc
         j[numpy.ix_(self.pc_inds, self.jc_inds)] = -self.B_ps_c
+
+        # phi_s:i_app
+        j[self.pa_inds, self.iapp_ind] = -self.B2_ps_a
+        j[self.pc_inds, self.iapp_ind] = self.B2_ps_c
+
+        # Input control
+        j[self.iapp_ind, [self.pa_inds[0], self.pc_inds[-1], self.iapp_ind]] \
+            = self.ctrl_jac(y)
         ###
 
+        if p.exact_jac:
+            self.jac_exact_terms(j, y, eta_a, eta_c, csa_ss, csc_ss)
+
+        solverstats.count_call(self.stats, 'jac', t_start)
         return j
 
+    def jac_exact_terms(self, j, y, eta_a, eta_c, csa_ss, csc_ss):
+        """
+        Add the state derivatives of the transport and kinetic parameters to
+        the Jacobian, j, for the exact Jacobian mode:
+            - De(ce, T) of A_ce, and kappa(ce, T) of A_pe and B_pe (with the
+              ce and T spline derivatives of the interpolants), and the
+              1/ce_edge of B_pe
+            - the exchange current densities, C_io(cs_ss, ce, T)
+            - Ds(cs) of the particle A_cs matrices, which are rebuilt at y
+        Also, the Uref slopes are those of the Uref interpolants (see jac).
+        The Ds at the particle surface, in the cs_ss relation (D_cs), is
+        held fixed, as it is lagged to the last residual call in res.
+        """
+        p = self.p
+
+        ce = y[self.ce_inds]
+        phi = y[self.pe_inds]
+        T = y[self.T_ind]
+
+        # --- E-lyte diffusivity, De(ce, T) --- #
+        D_mid = p.De_intp(ce, T, grid=False).flatten() * p.eps_eff
+        dD_dce = p.De_intp(ce, T, dx=1, grid=False).flatten() * p.eps_eff
+        dD_dT = p.De_intp(ce, T, dy=1, grid=False).flatten() * p.eps_eff
+
+        M_D = batteqns.mid_to_edge_deriv(D_mid, p.mesh)
+        KG_ce = p.K_m.dot(batteqns.flux_mat_deriv(p.mesh, ce)).dot(M_D)
+
+        j[numpy.ix_(self.ce_inds, self.ce_inds)] -= KG_ce * dD_dce
+        j[self.ce_inds, self.T_ind] -= KG_ce.dot(dD_dT)
+
+        # --- E-lyte conductivity, kappa(ce, T) --- #
+        k_mid = 1e-1 * p.ke_intp(ce, T, grid=False).flatten() * p.eps_eff
+        dk_dce = 1e-1 * p.ke_intp(ce, T, dx=1, grid=False).flatten() \
+            * p.eps_eff
+        dk_dT = 1e-1 * p.ke_intp(ce, T, dy=1, grid=False).flatten() \
+            * p.eps_eff
+
+        M_k = batteqns.mid_to_edge_deriv(k_mid, p.mesh)
+        k_edge = batteqns.edge_interp(p.mesh, k_mid)
+        dke_dce = M_k * dk_dce
+        dke_dT = M_k.dot(dk_dT)
+
+        # A_pe*phi, with the phi_e = 0 BC of build_Ape_mat
+        G_pe = batteqns.flux_mat_deriv(p.mesh, phi)
+        G_pe[-1, p.N - 1] -= phi[-1] * p.mesh.inv_vols[-1] / p.mesh.dx_m[-1]
+
+        # B_pe*ce, for the edge values gam*k_edge/ce_edge
+        gam = 2. * (1. - p.t_plus) * p.R_gas * T / p.F
+        c_edge = batteqns.edge_interp(p.mesh, ce)
+        P_B = k_edge * gam / c_edge
+        dPB_dce = gam * (dke_dce / c_edge[:, numpy.newaxis]
+                         - (k_edge / c_edge**2)[:, numpy.newaxis]
+                         * batteqns.mid_to_edge_deriv(ce, p.mesh))
+        dPB_dT = gam * dke_dT / c_edge + P_B / T
+        G_B = batteqns.flux_mat_deriv(p.mesh, ce)
+
+        j[numpy.ix_(self.pe_inds, self.ce_inds)] += \
+            G_pe.dot(dke_dce) - G_B.dot(dPB_dce)
+        j[self.pe_inds, self.T_ind] += G_pe.dot(dke_dT) - G_B.dot(dPB_dT)
+
+        # --- Exchange current densities, C_io(cs_ss, ce, T) --- #
+        for (j_inds, ce_cols, cs_inds, eta, C_io, io_interp, cs_ss, cs_max,
+             C_cs, D_cs) in [
+                (self.ja_inds, self.ce_inds[:p.Na], self.csa_inds, eta_a,
+                 self.C_ioa, p.ioa_interp, csa_ss, p.csa_max, self.C_cs_a,
+                 self.D_cs_a),
+                (self.jc_inds, self.ce_inds[-p.Nc:], self.csc_inds, eta_c,
+                 self.C_ioc, p.ioc_interp, csc_ss, p.csc_max, self.C_cs_c,
+                 self.D_cs_c)]:
+            ce_e = y[ce_cols]
+
+            th = cs_ss / cs_max
+            io = io_interp(th, T, grid=False).flatten()
+            dio_dth = io_interp(th, T, dx=1, grid=False).flatten()
+            dio_dT = io_interp(th, T, dy=1, grid=False).flatten()
+            sq_ce = numpy.sqrt(ce_e / p.ce_nom)
+            sq_th = numpy.sqrt((1. - th) * th)
+
+            dC_dth = 2. / p.F * sq_ce \
+                * (dio_dth * sq_th + io * (1. - 2. * th) / (2. * sq_th))
+            dC_dce = C_io / (2. * ce_e)
+            dC_dT = 2. / p.F * sq_ce * sq_th * dio_dT
+
+            # d(j_rxn - C_io*sinh(b*eta))/dC_io
+            dr_dC = -numpy.sinh(0.5 * p.F / (p.R_gas * T) * eta)
+
+            j[j_inds, ce_cols] += dr_dC * dC_dce
+            j[j_inds, self.T_ind] += dr_dC * dC_dT
+            j[numpy.ix_(j_inds, cs_inds)] += \
+                (dr_dC * dC_dth / cs_max)[:, numpy.newaxis] * C_cs
+            j[j_inds, j_inds] += dr_dC * dC_dth / cs_max * numpy.diagonal(D_cs)
+
+        self.jac_exact_Ds(j, y)
+
+    def jac_exact_Ds(self, j, y):
+        """
+        Add the Ds(cs) derivatives of the particle A_cs matrices, which are
+        rebuilt at y, to the Jacobian, j (see jac_exact_terms).
+        """
+        p = self.p
+
+        # --- Solid diffusivity, Ds(cs) --- #
+        # flux_diags only uses the inner radial edges, so the particle
+        # blocks stay tridiagonal. The flux through the inner edge f of each
+        # particle (between the nodes f-1 and f) is
+        #   k_f*(cs_f-1 - cs_f), k_f = Ds(cs_e,f)*r_e,f**2/dr_f
+        # with cs_e,f = (cs_f-1 + cs_f)/2.
+        for (cs_inds, A_cs, Nr, Np, mesh_r, r_e, cs_max, uref,
+             Ds_intp) in [
+                (self.csa_inds, self.A_cs_a, p.Nra, p.Na, p.mesh_ra,
+                 p.r_e_a, p.csa_max, p.uref_a, p.Dsa_intp),
+                (self.csc_inds, self.A_cs_c, p.Nrc, p.Nc, p.mesh_rc,
+                 p.r_e_c, p.csc_max, p.uref_c, p.Dsc_intp)]:
+
+            loc = numpy.arange(Np * Nr).reshape(Np, Nr)
+            inds = numpy.array(cs_inds)[loc]
+            cs = y[inds]
+
+            cs_e = 0.5 * (cs[:, 1:] + cs[:, :-1])
+            U_e = uref(cs_e / cs_max)
+            dr = mesh_r.dx_m
+            k = Ds_intp(U_e) * r_e[1:Nr]**2 / dr
+            # d(k_f*(cs_f-1 - cs_f))/dcs_f-1 = k_f + g_f, /dcs_f = -k_f + g_f
+            g = 0.5 * (cs[:, :-1] - cs[:, 1:]) * r_e[1:Nr]**2 / dr \
+                * batteqns.interp1d_deriv(Ds_intp, U_e) \
+                * batteqns.interp1d_deriv(uref, cs_e / cs_max) / cs_max
+
+            # Tridiagonals of d(A_cs*cs)/dcs, at y
+            dF_lo = (k + g) * mesh_r.inv_vols[1:]
+            dF_up = (k - g) * mesh_r.inv_vols[:-1]
+            dF_dg = numpy.zeros([Np, Nr])
+            dF_dg[:, 1:] += (g - k) * mesh_r.inv_vols[1:]
+            dF_dg[:, :-1] -= (k + g) * mesh_r.inv_vols[:-1]
+
+            # Replace the A_cs (of the last res call) in j
+            j[inds, inds] += A_cs[loc, loc] - dF_dg
+            j[inds[:, 1:], inds[:, :-1]] += \
+                A_cs[loc[:, 1:], loc[:, :-1]] - dF_lo
+            j[inds[:, :-1], inds[:, 1:]] += \
+                A_cs[loc[:, :-1], loc[:, 1:]] - dF_up
+
 
 class Results_object():
     """
@@ -980,6 +1823,13 @@ class Results_object():
 
         self.step_capacity_Ah = []
 
+        # Solver stats of the step (see solverstats)
+        self.solver_stats = {}
+
+        # Reason the step stopped (e.g., 'time', 'Vmin', 'integration_failure'
+        # or a model variable limit)
+        self.stop_reason = None
+
 
 class Simulator():
     """
@@ -988,6 +1838,12 @@ class Simulator():
     Run the simulation for the present test schedule step.
     Store the output results in the results_holder object.
     """
+    # Electrolyte concentration limits [mol/m^3] of the simulation
+    ce_lims = [1., 3990.]
+
+    # Model class, and the name of its Assimulo problem
+    model_class = FULL_1D
+    model_name = 'test'
 
     def __init__(self, conf_data, bsp_dir):
         """
@@ -999,6 +1855,14 @@ class Simulator():
         self.Pdat = {'RunInput': self.confdat}
         self.V_init = 4.198  # [V]
 
+        # Phase profiler (see profiling) and progress telemetry, set by the
+        # Model
+        self.profiler = profiling.NullProfiler()
+        self.telemetry = telemetry.Telemetry()
+
+        # Solver stats of the present step (see solverstats)
+        self.step_stats = solverstats.new_stats()
+
         self.buildpars()
         self.buildmodel()
         self.buildsim()
@@ -1027,18 +1891,21 @@ class Simulator():
         y0, yd0 = self.const_init_conds()
 
         # Create the model
-        imp_mod = FULL_1D(self.p, y0, yd0)
+        imp_mod = self.model_class(self.p, y0, yd0)
 
-        imp_mod.setup_model(y0, yd0, 'test')
+        imp_mod.setup_model(y0, yd0, self.model_name)
         imp_mod.p = self.p
         imp_mod.confdat = self.confdat
 
-        # Sets the options to the problem
-        imp_mod.algvar = [
-            1.0 for i in range(
-                self.p.num_diff_vars)] + [
-            0.0 for i in range(
-                self.p.num_algr_vars)]  # Set the algebraic components
+        # Sets the options to the problem, the differential states are those
+        # up to T
+        num_diff_vars = imp_mod.T_ind + 1
+        imp_mod.algvar = [1.0 for i in range(num_diff_vars)] + \
+            [0.0 for i in range(len(y0) - num_diff_vars)]
+
+        # Colored finite difference Jacobian, in place of the analytical one
+        if self.p.fd_jac:
+            imp_mod.jac = fdjac.ColoredJacobian(imp_mod)
 
         self.imp_mod = imp_mod
 
@@ -1046,12 +1913,49 @@ class Simulator():
         """
         Setup the assimulo IDA simulator.
         """
-        # Create an Assimulo implicit solver (IDA)
-        imp_sim = IDA(self.imp_mod)  # Create a IDA solver
+        # The full problem, with the scaled states and residuals (see
+        # scaledstates), and/or the reduced problem without the linear
+        # potential states (see reducedstates)
+        problem = self.imp_mod
+        if self.p.state_scaling:
+            scaled = scaledstates.ScaledProblem(
+                problem, self.imp_mod.state_scales())
+            problem = scaled
+        if self.p.reduced_potentials:
+            problem = reducedstates.ReducedProblem(problem)
+
+        # Create the time integration solver, an Assimulo implicit solver
+        # (IDA), or the fixed-step CN/BDF2 or operator-splitting solver (see
+        # fixedstep)
+        if self.p.time_step == 'IDA':
+            imp_sim = IDA(problem)  # Create a IDA solver
+            # Matrix-free Krylov linear solver, with the jacv of the model
+            if self.p.linear_solver == 'GMRES':
+                imp_sim.linear_solver = 'SPGMR'
+            # IDA takes the dense Jacobian, the condensation is only for the
+            # fixed-step solvers
+            elif self.p.linear_solver == 'SCHUR':
+                logger.warning('LINEAR_SOLVER=SCHUR is not used by IDA, '
+                               'using the dense direct solver')
+        elif self.p.time_step == 'SPLIT':
+            imp_sim = fixedstep.SplitStepSolver(problem,
+                                                h_max=self.p.fixed_step_dt)
+        else:
+            imp_sim = fixedstep.FixedStepSolver(
+                problem, method=self.p.time_step,
+                h_max=self.p.fixed_step_dt,
+                linear_solver=self.p.linear_solver)
+
+        # Full state vectors in and out of the reduced problem solver
+        if self.p.reduced_potentials:
+            imp_sim = reducedstates.ReducedSolver(imp_sim, problem)
+        # Physical state vectors in and out of the scaled problem solver
+        if self.p.state_scaling:
+            imp_sim = scaledstates.ScaledSolver(imp_sim, scaled)
 
         # Sets the paramters
         # 1e-4 #Default 1e-6
-        imp_sim.atol = self.p.RunInput['TIMESTEPPING']['SOLVER_TOL']
+        imp_sim.atol = self.solver_atol()
         # 1e-4 #Default 1e-6
         imp_sim.rtol = self.p.RunInput['TIMESTEPPING']['SOLVER_TOL']
         # Suppres the algebraic variables on the error test
@@ -1064,11 +1968,42 @@ class Simulator():
 
         self.imp_sim = imp_sim
 
-    def get_input(self, inp_typ, inp_val):
+    def solver_atol(self):
+        """
+        IDA atol, SOLVER_TOL, or SOLVER_TOL times the typical magnitude of
+        each state (state_scales of the model) with ATOL_SCALED_ON.
+        """
+        atol = self.p.RunInput['TIMESTEPPING']['SOLVER_TOL']
+        if self.p.atol_scaled:
+            atol = atol * self.imp_mod.state_scales()
+
+        return atol
+
+    def rest_atol(self):
+        """
+        IDA atol for the rest steps, with the atol of the algebraic states
+        relaxed by the rest_alg_atol_fac.
+        """
+        atol = self.solver_atol() * numpy.ones(len(self.imp_mod.algvar))
+        atol[numpy.array(self.imp_mod.algvar) == 0.0] \
+            *= self.p.rest_alg_atol_fac
+
+        return atol
+
+    def get_input(self, inp_typ, inp_val, profile=None):
         """
         Setup the input variable for the model during the simulation based on
         the test schedule.
+
+        The input control mode is set in pars.inp_bc, as 'curr' (current
+        density), 'volt' (terminal voltage) or 'power' (power density).
+
+        For the 'Profile' and 'PowerProfile' input types, profile is the
+        (time, value) tuple of the input profile, and inp_val is a scale factor
+        on the profile values.
         """
+        self.inp_prof = None
+
         if inp_typ == 'Rest':
             self.inp = 0.0
             self.pars.inp_bc = 'curr'
@@ -1085,6 +2020,30 @@ class Simulator():
             self.pars.inp_bc = 'curr'
             self.pars.rest = 0
 
+        elif inp_typ == 'Profile':
+            self.inp_prof = (profile[0],
+                             (-inp_val * profile[1]) / self.pars.Area)
+            self.inp = self.inp_prof[1][0]
+            self.pars.inp_bc = 'curr'
+            self.pars.rest = 0
+
+        elif inp_typ == 'Voltage':
+            self.inp = inp_val
+            self.pars.inp_bc = 'volt'
+            self.pars.rest = 0
+
+        elif inp_typ == 'Power':
+            self.inp = (-inp_val) / self.pars.Area
+            self.pars.inp_bc = 'power'
+            self.pars.rest = 0
+
+        elif inp_typ == 'PowerProfile':
+            self.inp_prof = (profile[0],
+                             (-inp_val * profile[1]) / self.pars.Area)
+            self.inp = self.inp_prof[1][0]
+            self.pars.inp_bc = 'power'
+            self.pars.rest = 0
+
     def simulate(self, tfinal, present_step_name):
         """
         Setup the IDA model and simulator and run the present test schedule
@@ -1095,288 +2054,412 @@ class Simulator():
         imp_sim = self.imp_sim
         p = self.p
 
-        # Applied current variable setup
-        i_app = self.inp
-        I_app = i_app * self.p.Ac
-        print 'I_app:', i_app * self.p.Ac, '[A]'
-        print 'i_app:', i_app, '[A/m^2]'
-
-        # Variable limits
-        ce_lims = [1., 3990.]  # Electrolyte concentration limits
+        # Solver stats for this step
+        self.step_stats = solverstats.new_stats()
+        stats = self.step_stats
+        imp_mod.stats = solverstats.new_model_stats()
+        t_wall0 = time.time()
+        self.profiler.start('integration', present_step_name)
+
+        # Applied input variable setup
+        t0 = imp_sim.t
+        if p.inp_bc == 'curr':
+            i_app = self.inp
+            I_app = i_app * self.p.Ac
+            logger.info('I_app: %g [A], i_app: %g [A/m^2]', I_app, i_app)
+        elif p.inp_bc == 'volt':
+            logger.info('V_app: %g [V]', self.inp)
+        elif p.inp_bc == 'power':
+            logger.info('P_app: %g [W]', self.inp * self.p.Ac)
 
         # Simulate
-        # Run two small time steps to ramp up the input current.
-        t01, t02 = 0.01 + imp_sim.t, 0.02 + imp_sim.t
-
-        imp_mod.set_iapp(I_app / 100.)
-        imp_sim.make_consistent('IDA_YA_YDP_INIT')
-        ta, ya, yda = imp_sim.simulate(t01, 2)
-
-        imp_mod.set_iapp(I_app / 10.)
-        imp_sim.make_consistent('IDA_YA_YDP_INIT')
-        tb, yb, ydb = imp_sim.simulate(t02, 2)
+        # Step transition
+        # The consistent states for the input of the new step are solved for
+        # directly. For current control, the input current is only ramped up
+        # over two small time steps if this is too stiff.
+        t_brk, seg = None, None
+        if self.inp_prof is not None:
+            # Input profile breakpoints, in simulation time. The profile is
+            # split into continuous segments at its step changes, which are
+            # applied one at a time.
+            t_brk = t0 + self.inp_prof[0]
+            prof_segs = numpy.split(numpy.arange(len(t_brk)),
+                                    numpy.where(numpy.diff(t_brk) == 0.0)[0]
+                                    + 1)
+            iseg = 0
+            seg = prof_segs[iseg]
+
+        self.set_model_input(t_brk, seg)
+
+        if not self.step_transition():
+            if p.inp_bc == 'curr' and self.inp_prof is None:
+                self.telemetry.note(
+                    'input_ramp',
+                    'Ramping up the input current for the step transition.')
+                stats['input_ramps'] += 1
+                t01, t02 = 0.01 + imp_sim.t, 0.02 + imp_sim.t
+
+                imp_mod.set_iapp(I_app / 100.)
+                solverstats.make_consistent(stats, imp_sim)
+                ta, ya, yda = solverstats.simulate(stats, imp_sim, t01, 2)
+
+                imp_mod.set_iapp(I_app / 10.)
+                solverstats.make_consistent(stats, imp_sim)
+                tb, yb, ydb = solverstats.simulate(stats, imp_sim, t02, 2)
+
+                self.set_model_input(t_brk, seg)
+            solverstats.make_consistent(stats, imp_sim)
+
+        V_cell = imp_mod.get_voltage(imp_sim.y)
 
         # Sim out init
-        ti = tb
-        t_out = []  # 0 for ts in time]
-        V_out = []  # 0 for ts in time]
-        y_out = []  # numpy.zeros([len(time), yb.shape[1]])
-        yd_out = []  # numpy.zeros([len(time), ydb.shape[1]])
-
-        I_out = []
+        t_out = []
+        y_out = []
+        yd_out = []
 
-        xa_bar = []
-        xc_bar = []
-        Ua_bar = []
-        Uc_bar = []
-
-        csa_avg_out = []
-        csc_avg_out = []
-        Ua_avg_out = []
-        Uc_avg_out = []
-
-        csa_ss_out = []
-        csc_ss_out = []
-        Ua_ss_out = []
-        Uc_ss_out = []
-
-        eta_a_out = []
-        eta_c_out = []
-        eta_full_x = []
-
-        j_full_x = []
-        Uss_full_x = []
-        css_full_x = []
-        phis_full_x = []
-
-        ke_out = []
-        De_out = []
+        # Output variables of each output time (see output_vars)
+        outs = []
 
         it = 0
-        V_cell = imp_mod.get_voltage(yb[-1, :].flatten())
-        ce_now = yb[-1, imp_mod.ce_inds].flatten()
-        print 'V_cell prior to time loop:', V_cell
+        logger.debug('V_cell prior to time loop: %g', V_cell)
 
-        imp_mod.set_iapp(I_app)
-        imp_sim.make_consistent('IDA_YA_YDP_INIT')
         keep_simulating = 1
-
-        dV_tol = self.p.RunInput['TIMESTEPPING']['DV_TOL']  # 0.02
-        delta_t = 0.1
-        refined_dt = 0
+        stop_reason = None
+
+        # Output interval control, with the cell voltage cut-off limits
+        # under current or power control. Rest steps use the rest control,
+        # with relaxed algebraic state tolerances.
+        if p.rest and p.rest_fast:
+            dt_ctrl = stepcontrol.rest_controller(p, imp_sim.t, tfinal)
+            imp_sim.atol = self.rest_atol()
+        else:
+            dt_ctrl = stepcontrol.OutputStepController(
+                p.RunInput['TIMESTEPPING']['DV_TOL'], p.delta_t_max,
+                dt_init=p.dt_init, dt_min=p.dt_min)
+            imp_sim.atol = self.solver_atol()
+        dt_ctrl.start(V_cell)
 
         while keep_simulating:
-            # delta_t update
-            if it > 1 and not refined_dt:
-                dV = abs(V_out[-1] - V_out[-2])
-                delta_t = dV_tol / dV * delta_t
-                if delta_t > self.p.delta_t_max:
-                    delta_t = self.p.delta_t_max
-
-            # Final delta_t alignment
-            if (imp_sim.t + delta_t) > tfinal:
-                delta_t = tfinal - imp_sim.t + .00001
-
-            try:
-                ti, yi, ydi = imp_sim.simulate(imp_sim.t + delta_t, 2)
-
-            except BaseException:
+            if p.inp_bc != 'volt':
+                V_lims = (p.volt_min, p.volt_max)
+            else:
+                V_lims = None
+            t_last = imp_sim.t
+            delta_t = dt_ctrl.propose(t_last, tfinal, V_lims)
+
+            # Input profile breakpoint alignment
+            if self.inp_prof is not None:
+                i_brk = numpy.searchsorted(t_brk, imp_sim.t + 1e-6,
+                                           side='right')
+                if i_brk < len(t_brk) and (imp_sim.t + delta_t) > t_brk[i_brk]:
+                    delta_t = t_brk[i_brk] - imp_sim.t
+
+            # Time integration over the output interval. For a recoverable
+            # solver failure, this is retried with a reduced delta_t.
+            while True:
                 try:
-                    delta_t = delta_t * .1
-                    if imp_sim.t > 0.8 * tfinal:
-                        refined_dt = 1
-                    ti, yi, ydi = imp_sim.simulate(imp_sim.t + delta_t, 3)
-                    print '*** ran with refined delta_t ***'
-
-                except BaseException:
-                    keep_simulating = 0
-                    print 'Sim stopped due time integration failure.'
+                    ti, yi, ydi = solverstats.simulate(stats, imp_sim,
+                                                       imp_sim.t + delta_t, 2)
+                    break
+
+                except SOLVER_ERRORS as err:
+                    fail_class = stepcontrol.classify_failure(err)
+                    stats['integration_failures'] += 1
+                    solverstats.count_failure(stats, fail_class)
+
+                    dt_retry = dt_ctrl.reject(delta_t, fail_class)
+                    if dt_retry is None:
+                        keep_simulating = 0
+                        stop_reason = 'integration_failure'
+                        self.telemetry.warning(
+                            'integration_failure',
+                            'Sim stopped due to time integration failure '
+                            '(%s): %s' % (fail_class, err),
+                            t=imp_sim.t, failure=fail_class)
+                        break
+
+                    delta_t = dt_retry
+                    stats['refined_dt_retries'] += 1
+                    self.telemetry.warning(
+                        'dt_refined',
+                        'Time integration failure (%s), retry with '
+                        'delta_t=%g' % (fail_class, delta_t),
+                        t=imp_sim.t, delta_t=delta_t, failure=fail_class)
 
             # Update the output variables
             t_out.append(imp_sim.t)
             y_out.append(imp_sim.y)
             yd_out.append(imp_sim.yd)
 
-            csa_now = imp_sim.y[imp_mod.csa_inds]  # yi[-1,imp_mod.csa_inds]
-            csc_now = imp_sim.y[imp_mod.csc_inds]  # yi[-1,imp_mod.csc_inds]
-
-            csa_avg_now = self.imp_mod.C_cs_a_avg.dot(csa_now)
-            csc_avg_now = self.imp_mod.C_cs_c_avg.dot(csc_now)
+            out = self.output_vars(imp_sim.y)
+            outs.append(out)
+            model_limit = self.limit_reason(imp_sim.y, out)
+
+            # Applied current density
+            imp_mod.i_app = imp_sim.y[imp_mod.iapp_ind]
+
+            V_cell = out['Volt']
+
+            if keep_simulating:
+                dt_ctrl.accept(imp_sim.t - t_last, V_cell)
+
+            self.telemetry.progress(imp_sim.t, tfinal, force=(it == 0),
+                                    Voltage=V_cell,
+                                    Current=imp_mod.i_app * self.pars.Ac,
+                                    delta_t=delta_t)
+
+            # CC to CV handover at the cell voltage limits, for steps with
+            # voltage control on (e.g., CCCV charging)
+            if p.inp_bc == 'curr' and self.inp_prof is None:
+                V_hold = None
+                if p.volt_ctrl_chg and imp_mod.i_app < 0.0 \
+                        and V_cell >= p.volt_max:
+                    V_hold = p.volt_max
+                elif p.volt_ctrl_dchg and imp_mod.i_app > 0.0 \
+                        and V_cell <= p.volt_min:
+                    V_hold = p.volt_min
+
+                if V_hold is not None:
+                    self.telemetry.note('cv_handover',
+                                        'CC to CV handover at %g [V]' % V_hold,
+                                        t=imp_sim.t, V_hold=V_hold)
+                    self.inp = V_hold
+                    p.inp_bc = 'volt'
+                    self.set_model_input()
+                    if not self.step_transition():
+                        solverstats.make_consistent(stats, imp_sim)
 
-            Ua_avg_now = p.uref_a(csa_avg_now / p.csa_max)
-            Uc_avg_now = p.uref_c(csc_avg_now / p.csc_max)
+            # Check simulation stop limits
+            # Cell voltage (held at its set point under voltage control)
+            if p.inp_bc != 'volt' and V_cell <= p.volt_min:
+                stop_reason = 'Vmin'
+                keep_simulating = 0
+            elif p.inp_bc != 'volt' and V_cell >= p.volt_max:
+                stop_reason = 'Vmax'
+                keep_simulating = 0
+            # Model variable limits (see limit_reason)
+            elif model_limit is not None:
+                stop_reason = model_limit
+                keep_simulating = 0
+            # Sim time stop
+            elif imp_sim.t >= tfinal:
+                keep_simulating = 0
+                stop_reason = 'time'
 
-            csa_avg_out.append(csa_avg_now)
-            csc_avg_out.append(csc_avg_now)
-            Ua_avg_out.append(Ua_avg_now)
-            Uc_avg_out.append(Uc_avg_now)
+            # Move to the next profile segment at a step change
+            if keep_simulating and self.inp_prof is not None:
+                if (iseg < len(prof_segs) - 1 and
+                        imp_sim.t > t_brk[prof_segs[iseg][-1]] - 1e-6):
+                    iseg += 1
+                    self.set_model_input(t_brk, prof_segs[iseg])
+                    solverstats.make_consistent(stats, imp_sim)
 
-            csa_mean = numpy.mean(imp_mod.C_cs_a_avg.dot(csa_now))
-            csc_mean = numpy.mean(imp_mod.C_cs_c_avg.dot(csc_now))
-            xa_mean = csa_mean / imp_mod.p.csa_max
-            xc_mean = csc_mean / imp_mod.p.csc_max
-            Uam = imp_mod.p.uref_a(xa_mean)
-            Ucm = imp_mod.p.uref_c(xc_mean)
+            it += 1
 
-            xa_bar.append(xa_mean)
-            xc_bar.append(xc_mean)
-            Ua_bar.append(Uam)
-            Uc_bar.append(Ucm)
+        self.telemetry.progress(imp_sim.t, tfinal, force=True,
+                                Voltage=V_cell,
+                                Current=imp_mod.i_app * self.pars.Ac,
+                                delta_t=delta_t)
+        self.telemetry.end_step(stop_reason, t=imp_sim.t, Voltage=V_cell)
 
-            V_cell = imp_mod.get_voltage(imp_sim.y)
+        self.profiler.stop('integration', present_step_name)
+        self.profiler.start('postprocess', present_step_name)
 
-            V_out.append(V_cell)
+        # Prepare the final output variables
+        states, mergExtr = self.step_results(numpy.array(y_out))
 
-            I_out.append(imp_mod.i_app * p.Ac)
+        for key in outs[0].keys():
+            mergExtr[key] = numpy.array([out[key] for out in outs])
 
-            ce_now = imp_sim.y[imp_mod.ce_inds]
+        mergExtr['step_time'] = numpy.array(t_out) - t_out[0]
+        mergExtr['step_time_mins'] = mergExtr['step_time'] / 60.
 
-            ja_now = imp_sim.y[imp_mod.ja_inds]
-            jc_now = imp_sim.y[imp_mod.jc_inds]
-            pa_now = imp_sim.y[imp_mod.pa_inds]
-            pc_now = imp_sim.y[imp_mod.pc_inds]
-            pe_now = imp_sim.y[imp_mod.pe_inds]
+        mergExtr['test_time'] = numpy.array(t_out)
+        mergExtr['test_time_mins'] = mergExtr['test_time'] / 60.
 
-            T_now = imp_sim.y[imp_mod.T_ind]
+        mergExtr['step_capacity_Ah'] = scipy.integrate.cumtrapz(
+            mergExtr['Cur'], x=mergExtr['step_time'] / 3600., initial=0.0)
 
-            eta_a, eta_c, Uref_a_ss, Uref_c_ss, csa_ss, csc_ss \
-                = imp_mod.get_eta_uref(csa_now, csc_now, ja_now, jc_now,
-                                       pa_now, pc_now, pe_now)
+        self.t_end_now = imp_sim.t
 
-            eta_a_out.append(eta_a)
-            eta_c_out.append(eta_c)
+        solverstats.collect_model_stats(stats, imp_mod)
+        stats['wall_time'] = time.time() - t_wall0
+        stats['sim_time'] = imp_sim.t - t0
+        mergExtr['solver_stats'] = stats
+        mergExtr['stop_reason'] = stop_reason
 
-            eta_full_x.append(numpy.concatenate(
-                [eta_a, numpy.zeros(imp_mod.p.Ns), eta_c]))
-            j_full_x.append(numpy.concatenate(
-                [ja_now, numpy.zeros(imp_mod.p.Ns), jc_now]))
-            Uss_full_x.append(numpy.concatenate(
-                [Uref_a_ss, numpy.zeros(imp_mod.p.Ns), Uref_c_ss]))
-            phis_full_x.append(numpy.concatenate(
-                [pa_now, numpy.zeros(imp_mod.p.Ns), pc_now]))
-            css_full_x.append(numpy.concatenate(
-                [csa_ss, numpy.zeros(imp_mod.p.Ns), csc_ss]))
+        # Assign the desired output variables to results holder object
+        self.assign_model_results(states, mergExtr, present_step_name)
 
-            csa_ss_out.append(csa_ss)
-            csc_ss_out.append(csc_ss)
+        self.profiler.stop('postprocess', present_step_name)
 
-            Ua_ss_now = p.uref_a(csa_ss / p.csa_max)
-            Uc_ss_now = p.uref_c(csc_ss / p.csc_max)
+    def output_vars(self, y):
+        """
+        Output variables of the state vector y, at each output time of the
+        step: the cell voltage and current, the particle average and surface
+        variables, the kinetics, the variables through the thickness of the
+        cell (the _fullx outputs, zero in the separator), and the elyte
+        transport properties.
+        """
+        imp_mod = self.imp_mod
+        p = self.p
 
-            Ua_ss_out.append(Ua_ss_now)
-            Uc_ss_out.append(Uc_ss_now)
+        csa = y[imp_mod.csa_inds]
+        csc = y[imp_mod.csc_inds]
+        ce = y[imp_mod.ce_inds]
+        ja = y[imp_mod.ja_inds]
+        jc = y[imp_mod.jc_inds]
+        pa = y[imp_mod.pa_inds]
+        pc = y[imp_mod.pc_inds]
+        T = y[imp_mod.T_ind]
+
+        out = {}
+        out['Volt'] = imp_mod.get_voltage(y)
+        out['Cur'] = y[imp_mod.iapp_ind] * p.Ac
+
+        out['csa_avg'] = imp_mod.C_cs_a_avg.dot(csa)
+        out['csc_avg'] = imp_mod.C_cs_c_avg.dot(csc)
+        out['Ua_avg'] = p.uref_a(out['csa_avg'] / p.csa_max)
+        out['Uc_avg'] = p.uref_c(out['csc_avg'] / p.csc_max)
+
+        eta_a, eta_c, Ua_ss, Uc_ss, csa_ss, csc_ss = imp_mod.get_eta_uref(
+            csa, csc, ja, jc, pa, pc, y[imp_mod.pe_inds])
+
+        out['eta_a'] = eta_a
+        out['eta_c'] = eta_c
+        out['csa_ss'] = csa_ss
+        out['csc_ss'] = csc_ss
+        out['Ua_ss'] = Ua_ss
+        out['Uc_ss'] = Uc_ss
+
+        sep = numpy.zeros(p.Ns)
+        out['eta_fullx'] = numpy.concatenate([eta_a, sep, eta_c])
+        out['j_fullx'] = numpy.concatenate([ja, sep, jc])
+        out['Uss_fullx'] = numpy.concatenate([Ua_ss, sep, Uc_ss])
+        out['phis_fullx'] = numpy.concatenate([pa, sep, pc])
+        out['css_fullx'] = numpy.concatenate([csa_ss, sep, csc_ss])
+
+        out['ke'] = imp_mod.kapp_ce(ce, T, mid_on=1, eps_off=1)
+        out['De'] = imp_mod.Diff_ce(ce, T, mid_on=1, eps_off=1)
+
+        return out
+
+    def limit_reason(self, y, out):
+        """
+        Stop reason of the model variable limits, for the state vector y and
+        its output_vars, out (None if within the limits): the elyte
+        concentration limits, and the electrode surface potential limits
+        (see ocp_limit_reason).
+        """
+        ce = y[self.imp_mod.ce_inds]
 
-            ke_mid = imp_mod.kapp_ce(ce_now, T_now, mid_on=1, eps_off=1)
-            De_mid = imp_mod.Diff_ce(ce_now, T_now, mid_on=1, eps_off=1)
+        if max(ce) >= max(self.ce_lims):
+            return 'ce_max'
+        elif min(ce) <= min(self.ce_lims):
+            return 'ce_min'
 
-            ke_out.append(ke_mid)
-            De_out.append(De_mid)
+        return self.ocp_limit_reason(out)
 
-            print 'time:', round(imp_sim.t, 3), \
-                  ' |  Voltage:', round(V_cell, 3), \
-                  ' |  Current:', round(imp_mod.i_app * self.pars.Ac, 3), \
-                  ' |  ' + str(round(imp_sim.t / tfinal * 100., 1)) \
-                  + '% complete  |  delta_t:', delta_t, \
-                  ' |  refined_dt:', refined_dt
+    def ocp_limit_reason(self, out):
+        """
+        Stop reason of the anode and cathode surface equilibrium potential
+        limits, for the output_vars, out (None if within the limits).
+        """
+        p = self.p
 
-            # Check simulation stop limits
-            # Cell voltage
-            if V_cell <= p.volt_min:
-                print '\n', 'Vmin stopped simulation.'
-                keep_simulating = 0
-            elif V_cell >= p.volt_max:
-                print '\n', 'Vmax stopped simulation.'
-                keep_simulating = 0
-            # E-lyte concentration saturation
-            elif max(ce_now) >= max(ce_lims):
-                print '\n', 'ce max stopped simulation.'
-                keep_simulating = 0
-            elif min(ce_now) <= min(ce_lims):
-                print '\n', 'ce min stopped simulation.'
-                keep_simulating = 0
-            # Sim time stop
-            elif imp_sim.t >= tfinal:
-                keep_simulating = 0
-            # Anode surface equilibrium potential
-            elif max(Ua_ss_now) >= p.an_volt_max:
-                keep_simulating = 0
-                print '\n', 'Ua_ss max stopped simulation.'
-            elif min(Ua_ss_now) <= p.an_volt_min:
-                keep_simulating = 0
-                print '\n', 'Ua_ss min stopped simulation.'
-            # Cathode surface equilibrium potential
-            elif max(Uc_ss_now) >= p.cat_volt_max:
-                keep_simulating = 0
-                print '\n', 'Uc_ss max stopped simulation.'
-            elif min(Uc_ss_now) <= p.cat_volt_min:
-                keep_simulating = 0
-                print '\n', 'Uc_ss min stopped simulation.'
+        if max(out['Ua_ss']) >= p.an_volt_max:
+            return 'Ua_ss_max'
+        elif min(out['Ua_ss']) <= p.an_volt_min:
+            return 'Ua_ss_min'
+        elif max(out['Uc_ss']) >= p.cat_volt_max:
+            return 'Uc_ss_max'
+        elif min(out['Uc_ss']) <= p.cat_volt_min:
+            return 'Uc_ss_min'
 
-            it += 1
+        return None
 
-        # Prepare the final output variables
-        y1 = numpy.array(y_out)
+    def step_results(self, y1):
+        """
+        Results of the state variables of the step, for the state vectors of
+        each output time (the rows of y1), as the states and extras (the
+        electrode potentials vs. the mid-separator elyte, Va and Vc) dicts.
+        """
+        imp_mod = self.imp_mod
+        p = self.p
 
         states = {}
-        states['c_s_a'] = y1[:, p.csa_inds]
-        states['c_s_c'] = y1[:, p.csc_inds]
-        states['c_e'] = y1[:, p.ce_inds]
-        states['T'] = y1[:, p.T_ind]
+        states['c_s_a'] = y1[:, imp_mod.csa_inds]
+        states['c_s_c'] = y1[:, imp_mod.csc_inds]
+        states['c_e'] = y1[:, imp_mod.ce_inds]
+        states['T'] = y1[:, imp_mod.T_ind]
 
-        states['phi_e'] = y1[:, p.pe_inds]
-        states['phi_s_a'] = y1[:, p.pa_inds]
-        states['phi_s_c'] = y1[:, p.pc_inds]
+        states['phi_e'] = y1[:, imp_mod.pe_inds]
+        states['phi_s_a'] = y1[:, imp_mod.pa_inds]
+        states['phi_s_c'] = y1[:, imp_mod.pc_inds]
 
-        states['ja'] = y1[:, p.ja_inds]
-        states['jc'] = y1[:, p.jc_inds]
+        states['ja'] = y1[:, imp_mod.ja_inds]
+        states['jc'] = y1[:, imp_mod.jc_inds]
 
         pa_cc = states['phi_s_a'][:, 0]
         pc_cc = states['phi_s_c'][:, -1]
         pe_midsep = states['phi_e'][:, int(p.Na + (p.Ns / 2.))]
 
-        Va = pa_cc - pe_midsep
-        Vc = pc_cc - pe_midsep
+        extras = {}
+        extras['Va'] = pa_cc - pe_midsep
+        extras['Vc'] = pc_cc - pe_midsep
 
-        mergExtr = {}
-        mergExtr['Volt'] = numpy.array(V_out)
-        mergExtr['Cur'] = numpy.array(I_out)
-        mergExtr['Va'] = Va
-        mergExtr['Vc'] = Vc
-        mergExtr['step_time'] = numpy.array(t_out) - t_out[0]
-        mergExtr['step_time_mins'] = mergExtr['step_time'] / 60.
+        return states, extras
 
-        mergExtr['test_time'] = numpy.array(t_out)
-        mergExtr['test_time_mins'] = mergExtr['test_time'] / 60.
-
-        mergExtr['step_capacity_Ah'] = scipy.integrate.cumtrapz(
-            mergExtr['Cur'], x=mergExtr['step_time'] / 3600., initial=0.0)
+    def step_transition(self):
+        """
+        Re-initialize the simulator with the consistent states for the present
+        applied current, solved for directly.
 
-        mergExtr['css_fullx'] = numpy.array(css_full_x)
-        mergExtr['Uss_fullx'] = numpy.array(Uss_full_x)
-        mergExtr['phis_fullx'] = numpy.array(phis_full_x)
-        mergExtr['eta_fullx'] = numpy.array(eta_full_x)
-        mergExtr['j_fullx'] = numpy.array(j_full_x)
+        Returns 0, and leaves the simulator as is, if the Newton iterations do
+        not converge or the reaction kinetics are too stiff (see
+        Params.trans_bv_max), in which case the input should be ramped up.
+        """
+        imp_sim = self.imp_sim
 
-        mergExtr['eta_a'] = numpy.array(eta_a_out)
-        mergExtr['eta_c'] = numpy.array(eta_c_out)
+        # Newton tolerance, well below that of the time integration
+        tol = 1e-3 * self.p.RunInput['TIMESTEPPING']['SOLVER_TOL']
 
-        mergExtr['csa_avg'] = numpy.array(csa_avg_out)
-        mergExtr['csc_avg'] = numpy.array(csc_avg_out)
-        mergExtr['csa_ss'] = numpy.array(csa_ss_out)
-        mergExtr['csc_ss'] = numpy.array(csc_ss_out)
+        y, yd, converged, bv_max = self.imp_mod.consistent_init(
+            imp_sim.t, imp_sim.y, imp_sim.yd, rtol=tol, atol=tol,
+            max_iters=self.p.trans_max_iters)
 
-        mergExtr['Ua_avg'] = numpy.array(Ua_avg_out)
-        mergExtr['Uc_avg'] = numpy.array(Uc_avg_out)
-        mergExtr['Ua_ss'] = numpy.array(Ua_ss_out)
-        mergExtr['Uc_ss'] = numpy.array(Uc_ss_out)
+        self.step_stats['step_transitions'] += 1
+        if not converged or bv_max > self.p.trans_bv_max:
+            self.step_stats['step_transition_fails'] += 1
+            return 0
 
-        mergExtr['ke'] = numpy.array(ke_out)
-        mergExtr['De'] = numpy.array(De_out)
+        imp_sim.re_init(imp_sim.t, y, yd)
 
-        self.t_end_now = imp_sim.t
+        return 1
 
-        # Assign the desired output variables to results holder object
-        self.assign_model_results(states, mergExtr, present_step_name)
+    def set_model_input(self, t_brk=None, seg=None):
+        """
+        Assign the input of the present step to the model, for the control
+        mode in pars.inp_bc.
+        For profile inputs, the seg points of the profile are assigned, at the
+        t_brk simulation times.
+        """
+        imp_mod = self.imp_mod
+        Ac = self.p.Ac
+
+        if self.inp_prof is not None:
+            if self.pars.inp_bc == 'curr':
+                imp_mod.set_iapp_profile(t_brk[seg],
+                                         self.inp_prof[1][seg] * Ac)
+            elif self.pars.inp_bc == 'power':
+                imp_mod.set_papp_profile(t_brk[seg],
+                                         self.inp_prof[1][seg] * Ac)
+        elif self.pars.inp_bc == 'curr':
+            imp_mod.set_iapp(self.inp * Ac)
+        elif self.pars.inp_bc == 'volt':
+            imp_mod.set_vapp(self.inp)
+        elif self.pars.inp_bc == 'power':
+            imp_mod.set_papp(self.inp * Ac)
 
     # Helper functions for managing results data
 
@@ -1388,7 +2471,7 @@ class Simulator():
         p.theta_n0*p.c_s_n_max
         """
         p = self.pars
-        y0 = numpy.zeros(p.num_diff_vars + p.num_algr_vars)
+        y0 = numpy.zeros(p.num_diff_vars + p.num_algr_vars + p.num_ctrl_vars)
 
         # x0
         y0[p.ce_inds] = p.ce_0 * numpy.ones(p.N, dtype='d')
@@ -1444,9 +2527,8 @@ class Simulator():
             elif (isinstance(v, float)):
                 mrgEx[k] = numpy.zeros(NT)
             else:
-                print type(extras[0][k])
-                print extras[0][k]
-                print k
+                logger.debug('merge_extras: %s %s %s', type(extras[0][k]),
+                             extras[0][k], k)
                 mrgEx[k] = numpy.zeros(NT)
 
             for i in range(NT):
@@ -1,15 +1,25 @@
 import numpy
 import scipy.linalg
 import math
+import sys
 
 from assimulo.solvers import IDA
 from assimulo.problem import Implicit_Problem
+from assimulo.solvers.sundials import IDAError
+from assimulo.exception import AssimuloException
 
 from copy import deepcopy
+import time
 
 # battsimpy modules
 import params
-from helper_modules import batteqns
+from helper_modules import batteqns, solverstats, profiling, telemetry
+from helper_modules import stepcontrol, fdjac, kernels
+from helper_modules.telemetry import logger
+
+# Solver failures of the time integration, classified and handled by the
+# time loop. Other exceptions are raised.
+SOLVER_ERRORS = (IDAError, AssimuloException)
 
 
 class Full_1D(Implicit_Problem):
@@ -30,6 +40,9 @@ class Full_1D(Implicit_Problem):
         These two methods must be named "res" and "jac" to be noticed properly
         by Assimulo.
     """
+    # Values held by res from one call to the next (the surface Ds of the
+    # last call), restored by the finite difference Jacobian (see fdjac)
+    lagged_attrs = ['D_cs_a', 'D_cs_c']
 
     def __init__(self, p, y0, yd0):
         self.p = p
@@ -40,6 +53,12 @@ class Full_1D(Implicit_Problem):
         self.T_amb = 30. + 273.15
         self.T = 30. + 273.15  # Cell temperature, [K]
 
+        # Model function call counters and timers (see solverstats)
+        self.stats = solverstats.new_model_stats()
+
+        # Residual hot loop kernels (KERNEL_BACKEND, see kernels)
+        self.kern = kernels.get_kernels(p.kernel_backend)
+
         self.phie_mats()
         self.phis_mats()
         self.cs_mats()
@@ -143,10 +162,9 @@ class Full_1D(Implicit_Problem):
         self.pc_inds_c2 = numpy.reshape(self.pc_inds2, [1, len(self.pc_inds2)])
 
         # Matrices for thermal calcs (gradient operators)
-        self.Ga, self.Gc, self.G = batteqns.grad_mat(
-            p.Na, p.x_m_a), batteqns.grad_mat(
-            p.Nc, p.x_m_c), batteqns.grad_mat(
-            p.N, p.x_m)
+        self.Ga = batteqns.tridiag_mat(batteqns.grad_diags(p.mesh_a))
+        self.Gc = batteqns.tridiag_mat(batteqns.grad_diags(p.mesh_c))
+        self.G = batteqns.tridiag_mat(batteqns.grad_diags(p.mesh))
 
         # Initialize the C arrays for the heat generation (these are useful for
         # the Jacobian)
@@ -223,12 +241,12 @@ class Full_1D(Implicit_Problem):
         """
         p = self.p
 
-        self.A_ps_a = batteqns.flux_mat_builder(
-            p.Na, p.x_m_a, numpy.ones_like(
-                p.vols_a), p.sig_a_eff)
-        self.A_ps_c = batteqns.flux_mat_builder(
-            p.Nc, p.x_m_c, numpy.ones_like(
-                p.vols_c), p.sig_c_eff)
+        self.A_ps_a_tri = batteqns.flux_diags(p.mesh_a, p.sig_a_eff,
+                                              per_vol=0)
+        self.A_ps_c_tri = batteqns.flux_diags(p.mesh_c, p.sig_c_eff,
+                                              per_vol=0)
+        self.A_ps_a = batteqns.tridiag_mat(self.A_ps_a_tri)
+        self.A_ps_c = batteqns.tridiag_mat(self.A_ps_c_tri)
 
         Baps = numpy.array(
             [asa * p.F * dxa for asa, dxa in zip(p.as_a, p.vols_a)], dtype='d')
@@ -251,16 +269,19 @@ class Full_1D(Implicit_Problem):
 
         # 1D spherical diffusion model
         # A_cs pre build
-        self.A_csa_single = batteqns.flux_mat_builder(
-            p.Nra, p.r_m_a, p.vols_ra_m, p.Dsa * (p.r_e_a**2))
-        self.A_csc_single = batteqns.flux_mat_builder(
-            p.Nrc, p.r_m_c, p.vols_rc_m, p.Dsc * (p.r_e_c**2))
-
-        # A_cs build up to the stacked full cs size (Nr and Nx)
-        b = [self.A_csa_single] * p.Na
-        self.A_cs_a = scipy.linalg.block_diag(*b)
-        b = [self.A_csc_single] * p.Nc
-        self.A_cs_c = scipy.linalg.block_diag(*b)
+        self.A_csa_single = batteqns.tridiag_mat(
+            batteqns.flux_diags(p.mesh_ra, p.Dsa * (p.r_e_a**2)))
+        self.A_csc_single = batteqns.tridiag_mat(
+            batteqns.flux_diags(p.mesh_rc, p.Dsc * (p.r_e_c**2)))
+
+        # A_cs build up to the stacked full cs size (Nr and Nx), as the
+        # diagonals of the block diagonal (tridiagonal) operator
+        self.A_cs_a_tri = self.kern.particle_flux_diags(
+            p.mesh_ra, p.Na, numpy.tile(p.Dsa * (p.r_e_a**2), (p.Na, 1)))
+        self.A_cs_c_tri = self.kern.particle_flux_diags(
+            p.mesh_rc, p.Nc, numpy.tile(p.Dsc * (p.r_e_c**2), (p.Nc, 1)))
+        self.A_cs_a = batteqns.tridiag_mat(self.A_cs_a_tri)
+        self.A_cs_c = batteqns.tridiag_mat(self.A_cs_c_tri)
 
         # B_cs and C_cs are constant (i.e., are not state-dependent)
         self.B_csa_single = numpy.array([0. for i in range(
@@ -330,12 +351,62 @@ class Full_1D(Implicit_Problem):
         self.D_cs_a = -1.0 / (p.Dsa * self.c_n_a) * numpy.eye(p.Na)
         self.D_cs_c = -1.0 / (p.Dsc * self.c_n_c) * numpy.eye(p.Nc)
 
+    def state_scales(self):
+        """
+        Typical magnitude of each state, from the parameters: the nominal
+        electrolyte and max solid concentrations, the ambient temperature,
+        1 V for the potentials, and the mean pore wall fluxes of each
+        electrode at 1C (RATE_NOM_CAP), for the absolute tolerances
+        (ATOL_SCALED_ON).
+        """
+        p = self.p
+
+        i_1C = p.RunInput['MODEL']['RATE_NOM_CAP'] / p.Area
+
+        scales = numpy.ones(len(self.y0))
+        scales[self.ce_inds] = p.ce_nom
+        scales[self.csa_inds] = p.csa_max
+        scales[self.csc_inds] = p.csc_max
+        scales[self.T_ind] = p.T_amb
+        scales[self.ja_inds] = i_1C / (p.F * p.as_a_mean * p.La)
+        scales[self.jc_inds] = i_1C / (p.F * p.as_c_mean * p.Lc)
+
+        return scales
+
     def set_iapp(self, i_app):
         """
         Calculate and assign the applied input current density.
         """
         self.i_app = i_app
 
+    def consistent_init(self, t, y, yd, rtol=1e-8, atol=1e-12, max_iters=10):
+        """
+        Compute the consistent algebraic states, and differential state time
+        derivatives, at time t for the present applied current.
+
+        Also returns the max Butler-Volmer exponent, |0.5*F*eta/(R*T)|, of
+        the consistent states, as a measure of the stiffness of the reaction
+        kinetics.
+        """
+        p = self.p
+
+        diff_inds = range(p.num_diff_vars)
+        alg_inds = range(p.num_diff_vars, p.num_diff_vars + p.num_algr_vars)
+
+        y, yd, converged = batteqns.consistent_alg_states(
+            self.res, self.jac, t, y, yd, alg_inds, diff_inds,
+            rtol=rtol, atol=atol, max_iters=max_iters)
+
+        eta_a, eta_c = self.get_eta_uref(
+            y[self.csa_inds], y[self.csc_inds], y[self.ja_inds],
+            y[self.jc_inds], y[self.pa_inds], y[self.pc_inds],
+            y[self.pe_inds])[:2]
+
+        bv_max = 0.5 * p.F / (p.R_gas * y[self.T_ind]) \
+            * max(numpy.amax(abs(eta_a)), numpy.amax(abs(eta_c)))
+
+        return y, yd, converged, bv_max
+
     def update_cs_mats(self, csa, csc, csa_ss, csc_ss, csa_o, csc_o, T):
         """
         FVM discretization of the concentration flux term for the solid
@@ -349,67 +420,51 @@ class Full_1D(Implicit_Problem):
         If, Ds(cs) is constant, then this only needs to be initialized and
         then may be left constat during the simulation.
         """
-        p = self.p
+        t_start = time.time()
 
-        Acsa_list = [[] for i in range(p.Na)]
-        Acsc_list = [[] for i in range(p.Nc)]
-
-        Dsa_ss = [0. for i in range(p.Na)]
-        Dsc_ss = [0. for i in range(p.Nc)]
-
-        for ia in range(p.Na):
-
-            csa_m = csa[ia * p.Nra:(ia + 1) * p.Nra]
-            csa_e = numpy.array(
-                [csa_o[ia]] + [0.5 * (csa_m[i + 1] + csa_m[i])
-                               for i in range(p.Nra - 1)] + [csa_ss[ia]])
-
-            Ua_e = p.uref_a(csa_e / p.csa_max)
-            Dsa_e = p.Dsa_intp(Ua_e) \
-                * math.exp(p.Ea_Dsa / p.R_gas * (1. / 298.15 - 1. / T))
-
-            Acsa_list[ia] = batteqns.flux_mat_builder(p.Nra, p.r_m_a,
-                                                      p.vols_ra_m,
-                                                      Dsa_e * (p.r_e_a**2))
-
-            Dsa_ss[ia] = Dsa_e[-1]
-
-        for ic in range(p.Nc):
-            csc_m = csc[ic * p.Nrc:(ic + 1) * p.Nrc]
-            csc_e = numpy.array(
-                [csc_o[ic]] + [0.5 * (csc_m[i + 1] + csc_m[i])
-                               for i in range(p.Nrc - 1)] + [csc_ss[ic]])
+        p = self.p
+        kern = self.kern
 
-            Uc_e = p.uref_c(csc_e / p.csc_max)
-            Dsc_e = p.Dsc_intp(Uc_e) * math.exp(p.Ea_Dsc
-                                                / p.R_gas
-                                                * (1. / 298.15 - 1. / T))
+        # Edge concentrations (one row per particle), and the Ds of these,
+        # for all of the particles of each electrode at once
+        csa_e = kern.particle_edges(csa, csa_o, csa_ss, p.Na, p.Nra)
+        Dsa_e = p.Dsa_intp(p.uref_a(csa_e / p.csa_max)) \
+            * math.exp(p.Ea_Dsa / p.R_gas * (1. / 298.15 - 1. / T))
 
-            Acsc_list[ic] = batteqns.flux_mat_builder(p.Nrc, p.r_m_c,
-                                                      p.vols_rc_m,
-                                                      Dsc_e * (p.r_e_c**2))
+        csc_e = kern.particle_edges(csc, csc_o, csc_ss, p.Nc, p.Nrc)
+        Dsc_e = p.Dsc_intp(p.uref_c(csc_e / p.csc_max)) \
+            * math.exp(p.Ea_Dsc / p.R_gas * (1. / 298.15 - 1. / T))
 
-            Dsc_ss[ic] = Dsc_e[-1]
+        self.A_cs_a_tri = kern.particle_flux_diags(p.mesh_ra, p.Na,
+                                                   Dsa_e * (p.r_e_a**2))
+        self.A_cs_c_tri = kern.particle_flux_diags(p.mesh_rc, p.Nc,
+                                                   Dsc_e * (p.r_e_c**2))
+        self.A_cs_a = batteqns.tridiag_mat(self.A_cs_a_tri)
+        self.A_cs_c = batteqns.tridiag_mat(self.A_cs_c_tri)
 
-        self.A_cs_a = scipy.linalg.block_diag(*Acsa_list)
-        self.A_cs_c = scipy.linalg.block_diag(*Acsc_list)
+        self.D_cs_a = numpy.diag(-1.0 / (Dsa_e[:, -1] * self.c_n_a))
+        self.D_cs_c = numpy.diag(-1.0 / (Dsc_e[:, -1] * self.c_n_c))
 
-        self.D_cs_a = numpy.diag(-1.0 / (numpy.array(Dsa_ss) * self.c_n_a))
-        self.D_cs_c = numpy.diag(-1.0 / (numpy.array(Dsc_ss) * self.c_n_c))
+        solverstats.count_call(self.stats, 'update_cs_mats', t_start)
 
     # Define c_e functions
-    def build_Ace_mat(self, c, T):
+    def build_Ace_tri(self, c, T):
         """
         FVM discretization of the concentration flux term for the elyte
-        diffusion equation.
+        diffusion equation, as the diagonals of the tridiagonal operator.
         """
         p = self.p
 
         D_eff = self.Diff_ce(c, T)
 
-        A = p.K_m.dot(batteqns.flux_mat_builder(p.N, p.x_m, p.vols, D_eff))
+        return batteqns.tridiag_scale(p.k_m,
+                                      self.kern.flux_diags(p.mesh, D_eff))
 
-        return A
+    def build_Ace_mat(self, c, T):
+        """
+        A_ce matrix (see build_Ace_tri).
+        """
+        return batteqns.tridiag_mat(self.build_Ace_tri(c, T))
 
     def Diff_ce(self, c, T, mid_on=0, eps_off=0):
         """
@@ -431,30 +486,36 @@ class Full_1D(Implicit_Problem):
             if isinstance(c, float):
                 D_out = D_mid
             else:
-                D_out = batteqns.mid_to_edge(D_mid, p.x_e)
+                D_out = self.kern.edge_interp(p.mesh, D_mid)
 
         return D_out
 
     # Define phi_e functions
-    def build_Ape_mat(self, c, T):
+    def build_Ape_tri(self, c, T):
         """
         FVM discretization of the potential flux term for the elyte potential
-        equation.
+        equation, as the diagonals of the tridiagonal operator.
         """
         p = self.p
 
         k_eff = self.kapp_ce(c, T)
 
-        A = batteqns.flux_mat_builder(p.N, p.x_m, p.vols, k_eff)
+        lo, d, up = self.kern.flux_diags(p.mesh, k_eff)
 
-        A[-1, -1] = 2 * A[-1, -1]  # BC update for phi_e = 0
+        d[-1] = 2 * d[-1]  # BC update for phi_e = 0
 
-        return A
+        return lo, d, up
 
-    def build_Bpe_mat(self, c, T):
+    def build_Ape_mat(self, c, T):
+        """
+        A_pe matrix (see build_Ape_tri).
+        """
+        return batteqns.tridiag_mat(self.build_Ape_tri(c, T))
+
+    def build_Bpe_tri(self, c, T):
         """
         FVM discretization of the concentration flux term for the elyte
-        potential equation.
+        potential equation, as the diagonals of the tridiagonal operator.
         """
         p = self.p
 
@@ -462,12 +523,15 @@ class Full_1D(Implicit_Problem):
 
         k_eff = self.kapp_ce(c, T)
 
-        c_edge = batteqns.mid_to_edge(c, p.x_e)
+        c_edge = self.kern.edge_interp(p.mesh, c)
 
-        B1 = batteqns.flux_mat_builder(
-            p.N, p.x_m, p.vols, k_eff * gam / c_edge)
+        return self.kern.flux_diags(p.mesh, k_eff * gam / c_edge)
 
-        return B1
+    def build_Bpe_mat(self, c, T):
+        """
+        B_pe matrix (see build_Bpe_tri).
+        """
+        return batteqns.tridiag_mat(self.build_Bpe_tri(c, T))
 
     def kapp_ce(self, c, T, mid_on=0, eps_off=0):
         """
@@ -490,7 +554,7 @@ class Full_1D(Implicit_Problem):
             if isinstance(c, float):
                 k_out = k_mid
             else:
-                k_out = batteqns.mid_to_edge(k_mid, p.x_e)
+                k_out = self.kern.edge_interp(p.mesh, k_mid)
 
         return k_out
 
@@ -541,8 +605,10 @@ class Full_1D(Implicit_Problem):
         Uref_a = p.uref_a(csa_ss / p.csa_max)  # anode   equilibrium potential
         Uref_c = p.uref_c(csc_ss / p.csc_max)  # cathode equilibrium potential
 
-        eta_a = phi_s_a - phi[:p.Na] - Uref_a  # anode   overpotential
-        eta_c = phi_s_c - phi[-p.Nc:] - Uref_c  # cathode overpotential
+        # anode   overpotential
+        eta_a = self.kern.overpotential(phi_s_a, phi[:p.Na], Uref_a)
+        # cathode overpotential
+        eta_c = self.kern.overpotential(phi_s_c, phi[-p.Nc:], Uref_c)
 
         return eta_a, eta_c, Uref_a, Uref_c, csa_ss, csc_ss
 
@@ -579,6 +645,8 @@ class Full_1D(Implicit_Problem):
         Return the total, spatially integrated, heat source across the cell
         sandwich.
         """
+        t_start = time.time()
+
         p = self.p
 
         ce = y[self.ce_inds]
@@ -667,12 +735,15 @@ class Full_1D(Implicit_Problem):
         self.C_q_ja = C_ra * eta_a + C_ra * eta_conc_a
         self.C_q_jc = C_rc * eta_c + C_rc * eta_conc_c
 
+        solverstats.count_call(self.stats, 'calc_heat', t_start)
         return Q_tot
 
     def res(self, t, y, yd):
         """
         Residual for the full 1d model.
         """
+        t_start = time.time()
+
         p = self.p
 
         # Parse out the states
@@ -701,11 +772,11 @@ class Full_1D(Implicit_Problem):
         T = y[self.T_ind]
         T_dt = yd[self.T_ind]
 
-        # Grab state dependent matrices
+        # Grab state dependent operators (tridiagonal)
         # For E-lyte conc and potential (i.e., De(ce), kapp_e(ce))
-        A_ce = self.build_Ace_mat(ce, T)
-        A_pe = self.build_Ape_mat(ce, T)
-        B_pe = self.build_Bpe_mat(ce, T)
+        A_ce = self.build_Ace_tri(ce, T)
+        A_pe = self.build_Ape_tri(ce, T)
+        B_pe = self.build_Bpe_tri(ce, T)
 
         # Compute extra variables
         # For the reaction kinetics
@@ -725,19 +796,21 @@ class Full_1D(Implicit_Problem):
 
         Q_out = p.h * p.Aconv * (T - self.T_amb)
 
-        ja = self.C_ioa * numpy.sinh(0.5 * p.F / (p.R_gas * T) * eta_a)
-        jc = self.C_ioc * numpy.sinh(0.5 * p.F / (p.R_gas * T) * eta_c)
+        ja = self.kern.butler_volmer(self.C_ioa, 0.5 * p.F / (p.R_gas * T),
+                                     eta_a)
+        jc = self.kern.butler_volmer(self.C_ioc, 0.5 * p.F / (p.R_gas * T),
+                                     eta_c)
 
         j = numpy.concatenate([ja_rxn, numpy.zeros(p.Ns), jc_rxn])
 
         # Compute the residuals
         # Time deriv components
-        r1 = c_dots - (((A_ce.dot(ce)).flatten()
+        r1 = c_dots - ((batteqns.tridiag_apply(A_ce, ce)
                         + (self.B_ce.dot(j)).flatten()))  # E-lyte conc
 
-        r2 = csa_dt - (self.A_cs_a.dot(csa).flatten()
+        r2 = csa_dt - (batteqns.tridiag_apply(self.A_cs_a_tri, csa)
                        + self.B_cs_a.dot(ja_rxn).flatten())  # Anode   conc
-        r3 = csc_dt - (self.A_cs_c.dot(csc).flatten()
+        r3 = csc_dt - (batteqns.tridiag_apply(self.A_cs_c_tri, csc)
                        + self.B_cs_c.dot(jc_rxn).flatten())  # Cathode conc
 
         r4 = T_dt - 1. / (p.rho * p.Cp) * (Q_in - Q_out)
@@ -747,26 +820,29 @@ class Full_1D(Implicit_Problem):
         r6 = jc_rxn - jc
 
         # Algebraic components -- E-lyte potential
-        r7 = A_pe.dot(phi).flatten() - B_pe.dot(ce).flatten() + \
-            self.B2_pe.dot(j).flatten()
+        r7 = batteqns.tridiag_apply(A_pe, phi) \
+            - batteqns.tridiag_apply(B_pe, ce) + self.B2_pe.dot(j).flatten()
 
         # Algebraic components -- Anode potential
-        r8 = self.A_ps_a.dot(phi_s_a).flatten() \
+        r8 = batteqns.tridiag_apply(self.A_ps_a_tri, phi_s_a) \
             - self.B_ps_a.dot(ja_rxn).flatten() \
             - self.B2_ps_a * self.i_app
         # Algebraic components -- Cathode potential
-        r9 = self.A_ps_c.dot(phi_s_c).flatten() \
+        r9 = batteqns.tridiag_apply(self.A_ps_c_tri, phi_s_c) \
             - self.B_ps_c.dot(jc_rxn).flatten() \
             + self.B2_ps_c * self.i_app
 
         res_out = numpy.concatenate([r1, r2, r3, [r4], r5, r6, r7, r8, r9])
 
+        solverstats.count_call(self.stats, 'res', t_start)
         return res_out
 
     def jac(self, c, t, y, yd):
         """
         Analytical Jacobian for the full 1d model residual.
         """
+        t_start = time.time()
+
         p = self.p
 
         # Setup
@@ -901,6 +977,7 @@ class Full_1D(Implicit_Problem):
         # phi_s_c: jc
         j[numpy.ix_(self.pc_inds, self.jc_inds)] = -self.B_ps_c
 
+        solverstats.count_call(self.stats, 'jac', t_start)
         return j
 
 
@@ -959,6 +1036,13 @@ class Results_object():
 
         self.step_capacity_Ah = []
 
+        # Solver stats of the step (see solverstats)
+        self.solver_stats = {}
+
+        # Reason the step stopped (e.g., 'time', 'Vmin', 'integration_failure'
+        # or a model variable limit)
+        self.stop_reason = None
+
 
 class Simulator():
     """
@@ -978,12 +1062,20 @@ class Simulator():
         self.Pdat = {'RunInput': self.confdat}
         self.V_init = 4.198  # [V]
 
+        # Phase profiler (see profiling) and progress telemetry, set by the
+        # Model
+        self.profiler = profiling.NullProfiler()
+        self.telemetry = telemetry.Telemetry()
+
+        # Solver stats of the present step (see solverstats), summed over the
+        # submodels
+        self.step_stats = solverstats.new_stats()
+
         self.Npar = conf_data['MODEL']['N_SUBMOD']
         self.Vtol = conf_data['DIST_SOLVING']['DIST_V_TOL']
         self.Kmag = conf_data['DIST_SOLVING']['K_DIST']
 
         self.buildpars()
-        print 'Calling Tvec from simulator.__init__()'
         self.get_Tvec()
 
         self.buildmodel()
@@ -1005,13 +1097,7 @@ class Simulator():
         except BaseException:
             self.Tvec = [298.15 for i in range(self.Npar)]
 
-        print '\n'
-        print '********************************'
-        print '********************************'
-        print 'In get_Tvec'
-        print self.Tvec
-        print '********************************'
-        print '********************************', '\n'
+        logger.debug('Tvec: %s', self.Tvec)
 
     def buildpars(self):
         """
@@ -1033,7 +1119,6 @@ class Simulator():
         y0 = [[] for i in range(self.Npar)]
         yd0 = [[] for i in range(self.Npar)]
 
-        print 'Tvec', self.Tvec
         for i, T in enumerate(self.Tvec):
             y0[i], yd0[i] = self.const_init_conds(T)
 
@@ -1052,6 +1137,11 @@ class Simulator():
                 0.0 for i in range(
                     self.p.num_algr_vars)]  # Set the algebraic components
 
+            # Colored finite difference Jacobian (with the sparsity pattern
+            # probed at the first call), in place of the analytical one
+            if self.p.fd_jac:
+                im.jac = fdjac.ColoredJacobian(im)
+
         self.imp_mod = imp_mod
 
     def buildsim(self,):
@@ -1064,7 +1154,7 @@ class Simulator():
         # Sets the paramters
         for isim in imp_sim:
             # 1e-4 #Default 1e-6
-            isim.atol = self.p.RunInput['TIMESTEPPING']['SOLVER_TOL']
+            isim.atol = self.solver_atol()
             # 1e-4 #Default 1e-6
             isim.rtol = self.p.RunInput['TIMESTEPPING']['SOLVER_TOL']
             # Suppres the algebraic variables on the error test
@@ -1077,11 +1167,44 @@ class Simulator():
 
         self.imp_sim = imp_sim
 
-    def get_input(self, inp_typ, inp_val):
+    def solver_atol(self):
+        """
+        IDA atol of each submodel, SOLVER_TOL, or SOLVER_TOL times the typical
+        magnitude of each state (state_scales) with ATOL_SCALED_ON.
+        """
+        atol = self.p.RunInput['TIMESTEPPING']['SOLVER_TOL']
+        if self.p.atol_scaled:
+            atol = atol * self.imp_mod[0].state_scales()
+
+        return atol
+
+    def rest_atol(self):
+        """
+        IDA atol of each submodel for the rest steps, with the atol of the
+        algebraic states relaxed by the rest_alg_atol_fac.
+        """
+        atol = self.solver_atol() * numpy.ones(len(self.imp_mod[0].algvar))
+        atol[numpy.array(self.imp_mod[0].algvar) == 0.0] \
+            *= self.p.rest_alg_atol_fac
+
+        return atol
+
+    def get_input(self, inp_typ, inp_val, profile=None):
         """
         Setup the input variable for the model during the simulation based on
         the test schedule.
+
+        Input profiles ('Profile', 'PowerProfile'), and voltage and power
+        control ('Voltage', 'Power') are not yet supported by the distributed
+        model.
         """
+        if inp_typ in ['Profile', 'PowerProfile']:
+            sys.exit("Input profiles are not supported by the distributed "
+                     "model.")
+        elif inp_typ in ['Voltage', 'Power']:
+            sys.exit("Voltage and power control are not supported by the "
+                     "distributed model.")
+
         if inp_typ == 'Rest':
             self.inp = 0.0
             self.pars.inp_bc = 'curr'
@@ -1098,6 +1221,32 @@ class Simulator():
             self.pars.inp_bc = 'curr'
             self.pars.rest = 0
 
+    def step_transition(self, isim, imod):
+        """
+        Re-initialize the simulator, isim, of a submodel, imod, with the
+        consistent states for its present applied current, solved for
+        directly.
+
+        Returns 0, and leaves the simulator as is, if the Newton iterations do
+        not converge or the reaction kinetics are too stiff (see
+        Params.trans_bv_max), in which case the input should be ramped up.
+        """
+        # Newton tolerance, well below that of the time integration
+        tol = 1e-3 * self.p.RunInput['TIMESTEPPING']['SOLVER_TOL']
+
+        y, yd, converged, bv_max = imod.consistent_init(
+            isim.t, isim.y, isim.yd, rtol=tol, atol=tol,
+            max_iters=self.p.trans_max_iters)
+
+        self.step_stats['step_transitions'] += 1
+        if not converged or bv_max > self.p.trans_bv_max:
+            self.step_stats['step_transition_fails'] += 1
+            return 0
+
+        isim.re_init(isim.t, y, yd)
+
+        return 1
+
     def simulate(self, tfinal, present_step_name):
         """
         Setup the IDA model and simulator and run the present test schedule
@@ -1107,14 +1256,23 @@ class Simulator():
         imp_sim = self.imp_sim
         p = self.p
 
-        print 'Init T vec from y0:', [isim.y[self.p.T_ind] for isim in imp_sim]
+        # Solver stats for this step
+        self.step_stats = solverstats.new_stats()
+        stats = self.step_stats
+        for imod in imp_mod:
+            imod.stats = solverstats.new_model_stats()
+        t_wall0 = time.time()
+        self.profiler.start('integration', present_step_name)
+        t0 = imp_sim[0].t
+
+        logger.debug('Init T vec from y0: %s',
+                     [isim.y[self.p.T_ind] for isim in imp_sim])
 
         i_app = self.inp
         I_app = i_app * self.p.Ac
         for isim, imod in zip(imp_sim, imp_mod):
             imod.set_iapp(i_app)
-        print 'I_app:', i_app * self.p.Ac, '[A]'
-        print 'i_app:', i_app, '[A/m^2]'
+        logger.info('I_app: %g [A], i_app: %g [A/m^2]', I_app, i_app)
 #        i_app = I_app/self.p.Ac
 
         # Variable limits
@@ -1242,20 +1400,31 @@ class Simulator():
             ke_out[i].append(ke_mid)
             De_out[i].append(De_mid)
 
-        # Run two small time steps to ramp up the input current
+        # Step transition
+        # The consistent states for the input of the new step are solved for
+        # directly, for each submodel.
+        trans_ok = [self.step_transition(isim, imod)
+                    for isim, imod in zip(imp_sim, imp_mod)]
+
+        tb = imp_sim[0].t
+
+        # Otherwise, run several small time steps to ramp up the input current
         # This appears to be particularly important if the exchange current
         # densities for either electrode is small (i.e., at low temperatures),
         # and therefore the reaction kinetics is quite stiff.
-        if i_app != 0.0:
+        if not all(trans_ok) and i_app != 0.0:
+            self.telemetry.note(
+                'input_ramp',
+                'Ramping up the input current for the step transition.')
+            stats['input_ramps'] += 1
             init_ts = numpy.linspace(0.01, 0.1, 8)
             ifact = numpy.linspace(0.01, 1, len(init_ts))**2
             for ift, dt0 in zip(ifact, numpy.gradient(init_ts)):
                 for isim, imod in zip(imp_sim, imp_mod):
                     imod.set_iapp(i_app * ift)
-                    isim.make_consistent('IDA_YA_YDP_INIT')
-                    tb, yb, ydb = isim.simulate(isim.t + dt0, 2)
-        else:
-            tb = imp_sim[0].t
+                    solverstats.make_consistent(stats, isim)
+                    tb, yb, ydb = solverstats.simulate(stats, isim,
+                                                       isim.t + dt0, 2)
 
         # Sim out init
         V_cell = [imod.get_voltage(imp_sim[i].y)
@@ -1265,39 +1434,44 @@ class Simulator():
         ti = tb
 
         it = 0
-        print 'V_cell prior to time loop:', V_cell
+        logger.debug('V_cell prior to time loop: %s', V_cell)
 
         # Setup the full input current now, and initialize consistent initial
         # conditions
-        for imod, isim in zip(imp_mod, imp_sim):
-            imod.set_iapp(i_app)
-            isim.make_consistent('IDA_YA_YDP_INIT')
+        if not all(trans_ok):
+            for imod, isim in zip(imp_mod, imp_sim):
+                imod.set_iapp(i_app)
+                solverstats.make_consistent(stats, isim)
 
         # control for the time simulation while loop
         keep_simulating = 1
-
-        # Simulation controls
-        dV_tol = self.p.RunInput['TIMESTEPPING']['DV_TOL']  # 0.02
-        if i_app == 0.0:
-            delta_t = self.p.delta_t_max
+        stop_reason = None
+
+        # Output interval control. Rest steps use the rest control, with
+        # relaxed algebraic state tolerances.
+        if p.rest and p.rest_fast:
+            dt_ctrl = stepcontrol.rest_controller(p, imp_sim[0].t, tfinal)
+            for isim in imp_sim:
+                isim.atol = self.rest_atol()
         else:
-            delta_t = 0.01
-        refined_dt = 0
+            if i_app == 0.0:
+                dt_init = p.delta_t_max
+            else:
+                dt_init = p.dt_init
+            dt_ctrl = stepcontrol.OutputStepController(
+                p.RunInput['TIMESTEPPING']['DV_TOL'], p.delta_t_max,
+                dt_init=dt_init, dt_min=p.dt_min)
+            for isim in imp_sim:
+                isim.atol = self.solver_atol()
+        dt_ctrl.start(V_cell[0])
 
         iapp_vec = numpy.array([i_app for imod in imp_mod])
 
         # Time sim loop
         while keep_simulating:
-            # delta_t update
-            if it > 1 and not refined_dt:
-                dV = abs(V_out[0][-1] - V_out[0][-2])
-                delta_t = dV_tol / dV * delta_t
-                if delta_t > self.p.delta_t_max:
-                    delta_t = self.p.delta_t_max
-
-            # Final delta_t alignment
-            if (imp_sim[0].t + delta_t) > tfinal:
-                delta_t = tfinal - imp_sim[0].t + .00001
+            t_last = imp_sim[0].t
+            delta_t = dt_ctrl.propose(t_last, tfinal,
+                                      (p.volt_min, p.volt_max))
 
             # Run time step for each submodel, and ensure consistent voltage
             # across each submodel
@@ -1312,23 +1486,38 @@ class Simulator():
 
 #            Verrlast = numpy.zeros(self.Npar)
             t_to_sim = deepcopy(imp_sim[0].t) + delta_t
-            while Vdiff > self.Vtol and isub < Nsub:
+            while Vdiff > self.Vtol and isub < Nsub and keep_simulating:
                 try:
                     for isim in imp_sim:
-                        ti, yi, ydi = isim.simulate(t_to_sim, 2)
-                except BaseException:
-                    try:
-                        delta_t = delta_t * 0.1
-                        if imp_sim[0].t > 0.8 * tfinal:
-                            refined_dt = 1
-
-                        for isim in imp_sim:
-                            ti, yi, ydi = isim.simulate(t_to_sim, 3)
-                        print '*** ran with refined delta_t ***'
-
-                    except BaseException:
+                        ti, yi, ydi = solverstats.simulate(stats, isim,
+                                                           t_to_sim, 2)
+                except SOLVER_ERRORS as err:
+                    # For a recoverable solver failure, the output interval
+                    # is retried with a reduced delta_t
+                    fail_class = stepcontrol.classify_failure(err)
+                    stats['integration_failures'] += 1
+                    solverstats.count_failure(stats, fail_class)
+
+                    dt_retry = dt_ctrl.reject(delta_t, fail_class)
+                    if dt_retry is None:
                         keep_simulating = 0
-                        print 'Sim stopped due time integration failure.'
+                        stop_reason = 'integration_failure'
+                        self.telemetry.warning(
+                            'integration_failure',
+                            'Sim stopped due to time integration failure '
+                            '(%s): %s' % (fail_class, err),
+                            t=imp_sim[0].t, failure=fail_class)
+                    else:
+                        delta_t = dt_retry
+                        t_to_sim = t_last + delta_t
+                        stats['refined_dt_retries'] += 1
+                        self.telemetry.warning(
+                            'dt_refined',
+                            'Time integration failure (%s), retry with '
+                            'delta_t=%g' % (fail_class, delta_t),
+                            t=imp_sim[0].t, delta_t=delta_t,
+                            failure=fail_class)
+                        continue
 
                 Vnow = [im.get_voltage(imp_sim[i].y)
                         for i, im in enumerate(imp_mod)]
@@ -1341,7 +1530,7 @@ class Simulator():
 
                 for i, imod in enumerate(imp_mod):
                     imod.set_iapp(iapp_vec[i])
-                    imp_sim[i].make_consistent('IDA_YA_YDP_INIT')
+                    solverstats.make_consistent(stats, imp_sim[i])
 
                 isub += 1
 
@@ -1429,48 +1618,59 @@ class Simulator():
                 ke_out[i].append(ke_mid)
                 De_out[i].append(De_mid)
 
-            print 'time:', round(imp_sim[0].t, 3), ' |  Voltage:', \
-                round(V_cell, 3), ' |  Current:', \
-                round(i_app * self.pars.Ac, 3), ' |  ' \
-                + str(round(imp_sim[0].t / tfinal * 100., 1)) \
-                + '% complete  |  delta_t:', round(delta_t, 3), \
-                ' |  refined_dt:', refined_dt, ' |  Vdiff:', Vdiff
+            if keep_simulating:
+                dt_ctrl.accept(imp_sim[0].t - t_last, V_out[0][-1])
+
+            self.telemetry.progress(imp_sim[0].t, tfinal, force=(it == 0),
+                                    Voltage=V_cell,
+                                    Current=i_app * self.pars.Ac,
+                                    delta_t=delta_t, Vdiff=Vdiff)
 
             # Check sim stop limits
             # Cell voltage
             if V_cell <= p.volt_min:
-                print '\n', 'Vmin stopped simulation.'
+                stop_reason = 'Vmin'
                 keep_simulating = 0
             elif V_cell >= p.volt_max:
-                print '\n', 'Vmax stopped simulation.'
+                stop_reason = 'Vmax'
                 keep_simulating = 0
             # E-lyte concentration saturation
             elif max(ce_now) >= max(ce_lims):
-                print '\n', 'ce max stopped simulation.'
+                stop_reason = 'ce_max'
                 keep_simulating = 0
             elif min(ce_now) <= min(ce_lims):
-                print '\n', 'ce min stopped simulation.'
+                stop_reason = 'ce_min'
                 keep_simulating = 0
             # Sim time stop
             elif imp_sim[0].t >= tfinal:
                 keep_simulating = 0
+                stop_reason = 'time'
             # Anode surface equilibrium potential
             elif max(Ua_ss_now) >= p.an_volt_max:
                 keep_simulating = 0
-                print '\n', 'Ua_ss max stopped simulation.'
+                stop_reason = 'Ua_ss_max'
             elif min(Ua_ss_now) <= p.an_volt_min:
                 keep_simulating = 0
-                print '\n', 'Ua_ss min stopped simulation.'
+                stop_reason = 'Ua_ss_min'
             # Cathode surface equilibrium potential
             elif max(Uc_ss_now) >= p.cat_volt_max:
                 keep_simulating = 0
-                print '\n', 'Uc_ss max stopped simulation.'
+                stop_reason = 'Uc_ss_max'
             elif min(Uc_ss_now) <= p.cat_volt_min:
                 keep_simulating = 0
-                print '\n', 'Uc_ss min stopped simulation.'
+                stop_reason = 'Uc_ss_min'
 
             it += 1
 
+        self.telemetry.progress(imp_sim[0].t, tfinal, force=True,
+                                Voltage=V_cell,
+                                Current=i_app * self.pars.Ac,
+                                delta_t=delta_t, Vdiff=Vdiff)
+        self.telemetry.end_step(stop_reason, t=imp_sim[0].t, Voltage=V_cell)
+
+        self.profiler.stop('integration', present_step_name)
+        self.profiler.start('postprocess', present_step_name)
+
         # Prepare the final output variables
         y1 = [numpy.array(y_outi) for y_outi in y_out]
 
@@ -1556,9 +1756,18 @@ class Simulator():
 
         self.t_end_now = imp_sim[0].t
 
+        for imod in imp_mod:
+            solverstats.collect_model_stats(stats, imod)
+        stats['wall_time'] = time.time() - t_wall0
+        stats['sim_time'] = imp_sim[0].t - t0
+        mergExtr['solver_stats'] = stats
+        mergExtr['stop_reason'] = stop_reason
+
         # Assign the desired output variables to results holder object
         self.assign_model_results(states, mergExtr, present_step_name)
 
+        self.profiler.stop('postprocess', present_step_name)
+
     def const_init_conds(self, T):
         """
         For the first step in a schedule, setup the initial conditions, where
@@ -0,0 +1,322 @@
+# -*- coding:utf-8 -*-
+"""Pseudo-2D model with Pade-approximated solid phase diffusion.
+
+The electrolyte, potential, kinetics and thermal equations are those of
+FULL_1D, but the radial diffusion in each particle is replaced by a
+low-order realization of its transfer function, from the pore wall flux, j,
+to the surface concentration, css. For a sphere of radius R, with
+z = R^2*s/Ds,
+    css(s) = cs_avg(s) + R/Ds*Kr(z)*j(s),  cs_avg(s) = -3/(R*s)*j(s)
+    Kr(z) = 1/(1 - sqrt(z)*coth(sqrt(z))) + 3/z
+where the integrator (cs_avg) is kept exact, and Kr is replaced by its
+[m/m] Pade approximant about z = 0 (m = PADE_ORDER), in partial fractions,
+    Kr(z) ~ d + sum_k r_k/(z - p_k)
+The poles, p_k, are real and negative, so each particle has 1 + m states,
+[cs_avg, c_1, ..., c_m], with
+    cs_avg_dt = -3/R*j
+    c_k_dt = p_k*Ds/R^2*c_k + r_k/R*j
+    css = cs_avg + sum_k c_k + R*d/Ds*j
+i.e., a diagonal A_cs, and the B_cs, C_cs and D_cs of FULL_1D. Ds is taken
+from the Ds tables at the surface concentration of each particle, less its
+flux term, cs_avg + sum_k c_k. Unlike the D_cs of FULL_1D, it is not lagged
+from the last residual evaluation, as the Pade D_cs term is large enough for
+the lag to stall the Newton iterations where Ds(cs) is steep.
+With a single Ds per particle, the model is exact for constant Ds, but not
+for a Ds that varies strongly through the particle. e.g., with the nmc Ds
+tables, a 1C discharge runs ~4% longer than that of the full model (and
+~7% shorter, with Ds at the particle average concentration instead), while
+pulses stay within a few mV.
+
+With PADE_ORDER = 2 (the default), the particles take 3 states, rather than
+NRA and NRC, and the response matches the full radial model up to
+frequencies well above those of typical drive cycles and pulses. m = 0 is
+the two-parameter polynomial (parabolic profile) approximation,
+css = cs_avg - R/(5*Ds)*j. Orders above 4 are ill-conditioned.
+
+PADE_1D
+    - the model class, derived from FULL_1D, with the same input control,
+      Jacobian and solver interfaces
+
+Simulator
+    - the FULL_1D simulator for PADE_1D, with the particle concentrations of
+      the results on the FULL_1D radial meshes (see particle_profiles)
+"""
+import numpy
+import scipy.linalg
+import scipy.interpolate
+import scipy.special
+
+from math import factorial
+import time
+
+# battsimpy specific modules
+import full_1d_fvm_ida
+from helper_modules import batteqns, solverstats
+
+
+def pade_coeffs(m):
+    """
+    Partial fraction coefficients of the [m/m] Pade approximant of Kr(z),
+    the non-integrating part of the particle transfer function (see the
+    module docstring). Returns the poles, p_k, residues, r_k, and the direct
+    term, d, with Kr(z) ~ d + sum_k r_k/(z - p_k).
+
+    The Taylor series of Kr is from the Bernoulli numbers, B_2n, with
+    sqrt(z)*coth(sqrt(z)) = sum_n b_n*z^n, b_n = 2^(2n)*B_2n/(2n)!, so that
+    1 - sqrt(z)*coth(sqrt(z)) = -z*S(z), and Kr(z) = 3/z - 1/(z*S(z)).
+    """
+    n = 2 * m + 1
+    B = scipy.special.bernoulli(2 * n + 2)
+    S = numpy.array([2.**(2 * k) * B[2 * k] / factorial(2 * k)
+                     for k in range(1, n + 2)])
+
+    # Series of 1/S, whose first term cancels the 3/z
+    T = numpy.zeros(n + 1)
+    T[0] = 1. / S[0]
+    for k in range(1, n + 1):
+        T[k] = -S[1:k + 1].dot(T[k - 1::-1]) / S[0]
+    a = -T[1:]
+
+    P, Q = scipy.interpolate.pade(a, m)
+
+    d = P.c[0] / Q.c[0]
+    poles = Q.r.real
+    if m:
+        res = ((P - d * Q)(poles) / Q.deriv()(poles)).real
+    else:
+        res = numpy.zeros(0)
+
+    return poles, res, d
+
+
+class PADE_1D(full_1d_fvm_ida.FULL_1D):
+    """
+    Class for the Pade-approximated solid diffusion P2D model (see the module
+    docstring). The state vector and the residual rows are as in FULL_1D,
+    with the 1 + PADE_ORDER states of each particle, [cs_avg, c_1, ...,
+    c_m], in place of the radial mesh nodes.
+    """
+    # Pade order of the particles, or None for the PADE_ORDER of the params
+    fixed_order = None
+
+    @classmethod
+    def pade_order(cls, p):
+        """
+        Pade order, m, of the particles of the model, for the params, p.
+        """
+        if cls.fixed_order is None:
+            return p.pade_order
+        return cls.fixed_order
+
+    def particle_states(self):
+        """
+        Number of states of each particle of the anode and cathode: the
+        average concentration, and the m Pade states.
+        """
+        self.m = self.pade_order(self.p)
+
+        return 1 + self.m, 1 + self.m
+
+    def cs_mats(self,):
+        """
+        Intiliaze the solid phase diffusion model matrices, for the Pade
+        realization of each particle (see the module docstring), with Ds at
+        Dsa and Dsc.
+        """
+        p = self.p
+
+        self.poles, self.res_k, self.d_k = pade_coeffs(self.m)
+
+        (self.B_csa_single, self.B_cs_a, self.C_cs_a_single, self.C_cs_a,
+         self.C_cs_a_avg) = self.pade_io_mats(p.Rp_a, self.n_pa)
+        (self.B_csc_single, self.B_cs_c, self.C_cs_c_single, self.C_cs_c,
+         self.C_cs_c_avg) = self.pade_io_mats(p.Rp_c, self.n_pc)
+
+        self.C_cs_a_mean = self.w_pa.dot(self.C_cs_a_avg)
+        self.C_cs_c_mean = self.w_pc.dot(self.C_cs_c_avg)
+
+        # No core concentration, for update_cs_mats, which does not use it
+        self.C_cso_a = self.C_cs_a_avg
+        self.C_cso_c = self.C_cs_c_avg
+
+        self.A_cs_a_tri, self.D_cs_a = self.pade_mats(
+            p.Dsa * numpy.ones(self.n_pa), p.Rp_a)
+        self.A_cs_c_tri, self.D_cs_c = self.pade_mats(
+            p.Dsc * numpy.ones(self.n_pc), p.Rp_c)
+        self.A_cs_a = batteqns.tridiag_mat(self.A_cs_a_tri)
+        self.A_cs_c = batteqns.tridiag_mat(self.A_cs_c_tri)
+
+    def pade_io_mats(self, Rp, n_p):
+        """
+        Constant matrices of the Pade realization of the n_p particles of an
+        electrode, of radius Rp: B_cs (of a single particle, and for all of
+        them), C_cs (single and all), and C_cs_avg.
+        """
+        m = self.m
+
+        B_single = numpy.array([-3. / Rp] + list(self.res_k / Rp), dtype='d')
+        C_single = numpy.ones(1 + m, dtype='d')
+        C_avg_single = numpy.array([1.] + [0. for i in range(m)], dtype='d')
+
+        return (B_single, scipy.linalg.block_diag(*[B_single] * n_p).T,
+                C_single, scipy.linalg.block_diag(*[C_single] * n_p),
+                scipy.linalg.block_diag(*[C_avg_single] * n_p))
+
+    def pade_mats(self, Ds, Rp):
+        """
+        A_cs operator (as its diagonals, see batteqns.tridiag_mat), and D_cs
+        matrix of the particles of an electrode, for the Ds of each particle
+        and the particle radius, Rp.
+        """
+        lam = numpy.hstack([numpy.zeros([len(Ds), 1]),
+                            numpy.outer(Ds / Rp**2, self.poles)]).flatten()
+        off = numpy.zeros(len(lam) - 1)
+
+        return (off, lam, off), numpy.diag(Rp * self.d_k / Ds)
+
+    def update_pade_mats(self, csa, csc):
+        """
+        Pade realization matrices of the particles (see pade_mats), for Ds at
+        the surface concentration of each particle, less its flux term,
+        C_cs*cs, of the states csa and csc.
+        """
+        t_start = time.time()
+
+        p = self.p
+
+        Dsa = p.Dsa_intp(p.uref_a(self.C_cs_a.dot(csa) / p.csa_max))
+        Dsc = p.Dsc_intp(p.uref_c(self.C_cs_c.dot(csc) / p.csc_max))
+
+        self.A_cs_a_tri, self.D_cs_a = self.pade_mats(Dsa, p.Rp_a)
+        self.A_cs_c_tri, self.D_cs_c = self.pade_mats(Dsc, p.Rp_c)
+        self.A_cs_a = batteqns.tridiag_mat(self.A_cs_a_tri)
+        self.A_cs_c = batteqns.tridiag_mat(self.A_cs_c_tri)
+
+        solverstats.count_call(self.stats, 'update_cs_mats', t_start)
+
+    def update_cs_mats(self, csa, csc, csa_ss, csc_ss, csa_o, csc_o):
+        """
+        The Pade matrices are updated by get_eta_uref, ahead of the surface
+        concentrations (see update_pade_mats).
+        """
+        pass
+
+    def get_eta_uref(self, csa, csc, ja_rxn, jc_rxn, phi_s_a, phi_s_c, phi):
+        """
+        Calcuate the reaction kinetics overpotential on the anode and cathode
+        (see FULL_1D.get_eta_uref), with the Pade matrices at csa and csc.
+        """
+        self.update_pade_mats(csa, csc)
+
+        return full_1d_fvm_ida.FULL_1D.get_eta_uref(
+            self, csa, csc, ja_rxn, jc_rxn, phi_s_a, phi_s_c, phi)
+
+    def jac_exact_Ds(self, j, y):
+        """
+        Add the Ds derivatives of the Pade realization to the Jacobian, j
+        (see FULL_1D.jac_exact_terms), where Ds is at u = C_cs*cs of each
+        particle (see update_pade_mats): those of the A_cs rates, and of the
+        D_cs*j term of the surface concentration, css, which scales the
+        d(css)/dcs of the kinetics and heat rows by 1 - D_cs*j*Ds'(u)/Ds(u).
+        """
+        p = self.p
+        m = self.m
+
+        # The rate of each Pade state, c_k, is p_k*Ds(u)/R^2*c_k
+        for (cs_inds, j_inds, D_cs, Np, Rp, cs_max, uref, Ds_intp) in [
+                (self.csa_inds, self.ja_inds, self.D_cs_a, p.Na, p.Rp_a,
+                 p.csa_max, p.uref_a, p.Dsa_intp),
+                (self.csc_inds, self.jc_inds, self.D_cs_c, p.Nc, p.Rp_c,
+                 p.csc_max, p.uref_c, p.Dsc_intp)]:
+
+            inds = numpy.array(cs_inds).reshape(Np, 1 + m)
+            j_inds = numpy.array(j_inds)
+            cs = y[inds]
+
+            u = cs.sum(axis=1)
+            U = uref(u / cs_max)
+            Ds = Ds_intp(U)
+            dDs = batteqns.interp1d_deriv(Ds_intp, U) \
+                * batteqns.interp1d_deriv(uref, u / cs_max) / cs_max
+
+            # d(p_k*Ds/R^2*c_k)/du, where du/dcs = 1
+            g = cs[:, 1:] * self.poles / Rp**2 * dDs[:, numpy.newaxis]
+            j[inds[:, 1:, numpy.newaxis], inds[:, numpy.newaxis, :]] -= \
+                g[:, :, numpy.newaxis]
+
+            # d(css)/du
+            s_ss = 1. - numpy.diagonal(D_cs) * y[j_inds] * dDs / Ds
+            j[j_inds[:, numpy.newaxis], inds] *= s_ss[:, numpy.newaxis]
+            j[self.T_ind, inds] *= s_ss[:, numpy.newaxis]
+
+
+class Simulator(full_1d_fvm_ida.Simulator):
+    """
+    Simulator for the PADE_1D model (see full_1d_fvm_ida.Simulator).
+    The results are in the FULL_1D layout, with the particle concentrations
+    on the radial meshes (see particle_profiles).
+    """
+    model_class = PADE_1D
+    model_name = 'pade_1d'
+
+    def const_init_conds(self):
+        """
+        Initial conditions for the first step in a schedule, with the
+        particles at the initial stoichiometries (the Pade states at zero),
+        see full_1d_fvm_ida.Simulator.const_init_conds.
+        """
+        p = self.pars
+        m = self.model_class.pade_order(p)
+
+        y0, yd0 = full_1d_fvm_ida.Simulator.const_init_conds(self)
+
+        csa = numpy.zeros([p.Na, 1 + m], dtype='d')
+        csc = numpy.zeros([p.Nc, 1 + m], dtype='d')
+        csa[:, 0] = p.theta_a0 * p.csa_max
+        csc[:, 0] = p.theta_c0 * p.csc_max
+
+        y0 = numpy.concatenate([y0[p.ce_inds], csa.flatten(), csc.flatten(),
+                                y0[p.T_ind:]])
+
+        return y0, numpy.zeros_like(y0)
+
+    def particle_profiles(self, cs_avg, cs_ss, r_m, Rp):
+        """
+        Concentrations on the radial mesh, r_m, of the particles of an
+        electrode, of radius Rp, for the average and surface concentrations
+        of each particle (the columns) at each output time (the rows), as
+        the parabolic profile
+            c(r) = cs_avg + 5/2*(css - cs_avg)*((r/R)^2 - 3/5)
+        """
+        shape = 2.5 * ((r_m / Rp)**2 - 0.6)
+
+        return (cs_avg[:, :, numpy.newaxis]
+                + (cs_ss - cs_avg)[:, :, numpy.newaxis] * shape).reshape(
+                    len(cs_avg), -1)
+
+    def step_results(self, y1):
+        """
+        Results of the state variables of the step (see
+        full_1d_fvm_ida.Simulator.step_results), with the particle
+        concentrations on the FULL_1D radial meshes.
+        """
+        imp_mod = self.imp_mod
+        p = self.p
+
+        states, extras = full_1d_fvm_ida.Simulator.step_results(self, y1)
+
+        cs_ss = [imp_mod.get_eta_uref(
+            y[imp_mod.csa_inds], y[imp_mod.csc_inds], y[imp_mod.ja_inds],
+            y[imp_mod.jc_inds], y[imp_mod.pa_inds], y[imp_mod.pc_inds],
+            y[imp_mod.pe_inds])[4:] for y in y1]
+
+        states['c_s_a'] = self.particle_profiles(
+            imp_mod.C_cs_a_avg.dot(y1[:, imp_mod.csa_inds].T).T,
+            numpy.array([csa_ss for csa_ss, csc_ss in cs_ss]),
+            p.r_m_a, p.Rp_a)
+        states['c_s_c'] = self.particle_profiles(
+            imp_mod.C_cs_c_avg.dot(y1[:, imp_mod.csc_inds].T).T,
+            numpy.array([csc_ss for csa_ss, csc_ss in cs_ss]),
+            p.r_m_c, p.Rp_c)
+
+        return states, extras
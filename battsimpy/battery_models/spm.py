@@ -0,0 +1,859 @@
+# -*- coding:utf-8 -*-
+"""Single Particle Models (SPM and SPMe), with a lumped thermal model.
+
+Each electrode is represented by a single particle, with the radial solid
+diffusion model of FULL_1D (the nonlinspace radial mesh, and Ds(cs) from the
+Ds tables), and Butler-Volmer kinetics at its surface. The electrolyte is
+taken as uniform, at its initial concentration (ce_0) and at zero potential,
+so the pore wall flux of each electrode is set directly by the applied
+current. With only the particle states, the SPM is much faster than the
+full Pseudo-2D model, for sweeps and long cycling at low to moderate rates,
+where the electrolyte polarization is small.
+
+The SPM with electrolyte (SPMe) adds the electrolyte concentration through
+the thickness of the cell, with the FULL_1D diffusion operator (A_ce, and
+De(ce, T)), for the uniform pore wall flux of each electrode. The elyte
+potential is not a state, but is integrated analytically from the ionic
+current and the conductivity, kappa(ce, T), and its electrode averages
+(with the solid phase ohmic drop) correct the kinetics and the voltage of
+the SPM. This holds to higher rates than the SPM, for a fraction of the
+cost of the full model.
+
+SPM, SPMe
+    - the model classes, derived from FULL_1D, with the same input control
+      (current, voltage and power), Jacobian and solver interfaces, so the
+      time integration options (TIME_STEP, LINEAR_SOLVER, STATE_SCALING_ON,
+      REDUCED_POTENTIALS_ON, FD_JAC_ON) are as for FULL_1D
+
+Simulator, SimulatorSPMe
+    - the FULL_1D simulator for the SPM and SPMe, with the results in the
+      FULL_1D layout (the particle variables are uniform in each electrode),
+      so that cases may be switched by the MODEL_TYPE
+"""
+import numpy
+import scipy.sparse
+
+import time
+
+# battsimpy specific modules
+import full_1d_fvm_ida
+from helper_modules import batteqns, solverstats, kernels
+
+
+def state_inds(p, n_ce=0):
+    """
+    State vector layout of the SPM, [csa, csc, T, ja, jc, pa, pc, i_app],
+    for the params p, after the n_ce elyte concentrations of the SPMe.
+    Returns the indices of each, with T_ind and iapp_ind as ints.
+    """
+    csa_inds = range(n_ce, n_ce + p.Nra)
+    csc_inds = range(n_ce + p.Nra, n_ce + p.Nra + p.Nrc)
+    T_ind = n_ce + p.Nra + p.Nrc
+    ja_inds = [T_ind + 1]
+    jc_inds = [T_ind + 2]
+    pa_inds = [T_ind + 3]
+    pc_inds = [T_ind + 4]
+    iapp_ind = T_ind + 5
+
+    return (csa_inds, csc_inds, T_ind, ja_inds, jc_inds, pa_inds, pc_inds,
+            iapp_ind)
+
+
+class SPM(full_1d_fvm_ida.FULL_1D):
+    """
+    Class for the Single Particle Model.
+
+    The residual rows are:
+        csa, csc : solid diffusion, cs_dt = A_cs*cs + B_cs*j
+        T        : lumped thermal ODE
+        ja, jc   : charge balance of each electrode, F*as*L*j = +/-i_app
+        pa, pc   : Butler-Volmer kinetics,
+                   j = C_io*sinh(b*(phi_s - phi_e - Uref))
+        i_app    : input control (see FULL_1D.ctrl_res)
+    with the elyte concentration and potential seen by each particle (the
+    ce and phi_e of the kinetics) from elyte_avg.
+
+    The elyte methods (elyte_avg, elyte_avg_jac, elyte_x, elyte_res and
+    elyte_jac) are those of the uniform elyte, and are overridden by the
+    SPMe.
+    """
+    # Elyte concentration states through the thickness of the cell (SPMe)
+    elyte_on = 0
+
+    def __init__(self, p, y0, yd0):
+        self.p = p
+        self.pars = self.p
+
+        self.Ac = p.Ac
+
+        self.T_amb = 30. + 273.15
+        self.T = 30. + 273.15  # Cell temperature, [K]
+
+        # Model function call counters and timers (see solverstats)
+        self.stats = solverstats.new_model_stats()
+
+        # Residual hot loop kernels (KERNEL_BACKEND, see kernels)
+        self.kern = kernels.get_kernels(p.kernel_backend)
+
+        self.set_iapp(0.0)
+
+        # A single particle for each electrode
+        self.n_pa, self.n_pc = 1, 1
+        self.w_pa, self.w_pc = numpy.ones(1), numpy.ones(1)
+
+        self.cs_mats()
+
+        # System indices
+        self.ce_inds = range(p.N * self.elyte_on)
+        (self.csa_inds, self.csc_inds, self.T_ind, self.ja_inds,
+         self.jc_inds, self.pa_inds, self.pc_inds,
+         self.iapp_ind) = state_inds(p, len(self.ce_inds))
+
+        # Current density of a unit pore wall flux in each electrode
+        self.aF_a = p.F * p.as_a_mean * p.La
+        self.aF_c = p.F * p.as_c_mean * p.Lc
+
+        # Kinetic C array (useful for the Jacobian)
+        self.update_Cio(y0[self.csa_inds[-1:]], y0[self.csc_inds[-1:]],
+                        p.ce_0 * numpy.ones(2), y0[self.T_ind])
+
+    def get_eta_uref(self, csa, csc, ja_rxn, jc_rxn, phi_s_a, phi_s_c, phi):
+        """
+        Calcuate the reaction kinetics overpotential on the anode and cathode
+        (see FULL_1D.get_eta_uref), for the elyte potential of each particle,
+        phi = [phi_a, phi_c] (see elyte_avg).
+        """
+        p = self.p
+
+        csa_ss = self.C_cs_a.dot(csa) + self.D_cs_a.dot(ja_rxn)
+        csc_ss = self.C_cs_c.dot(csc) + self.D_cs_c.dot(jc_rxn)
+
+        Uref_a = p.uref_a(csa_ss / p.csa_max)
+        Uref_c = p.uref_c(csc_ss / p.csc_max)
+
+        eta_a = self.kern.overpotential(phi_s_a, phi[:self.n_pa], Uref_a)
+        eta_c = self.kern.overpotential(phi_s_c, phi[-self.n_pc:], Uref_c)
+
+        return eta_a, eta_c, Uref_a, Uref_c, csa_ss, csc_ss
+
+    def bv_exponent_max(self, y):
+        """
+        Max Butler-Volmer exponent, |0.5*F*eta/(R*T)|, of the states y.
+        """
+        p = self.p
+
+        eta_a, eta_c = self.get_eta_uref(
+            y[self.csa_inds], y[self.csc_inds], y[self.ja_inds],
+            y[self.jc_inds], y[self.pa_inds], y[self.pc_inds],
+            self.elyte_avg(y)[1])[:2]
+
+        return 0.5 * p.F / (p.R_gas * y[self.T_ind]) \
+            * max(abs(eta_a[0]), abs(eta_c[0]))
+
+    def update_Cio(self, csa_ss, csc_ss, ce, T):
+        """
+        Update the exchange current density coefficients (see
+        FULL_1D.update_Cio), for the elyte concentration of each particle,
+        ce = [ce_a, ce_c] (see elyte_avg).
+        """
+        p = self.p
+
+        self.C_ioa = (2.0
+                      * p.ioa_interp(csa_ss / p.csa_max,
+                                     T, grid=False).flatten()
+                      / p.F
+                      * numpy.sqrt(ce[:self.n_pa] / p.ce_nom
+                                   * (1.0 - csa_ss / p.csa_max)
+                                   * (csa_ss / p.csa_max)))
+        self.C_ioc = (2.0
+                      * p.ioc_interp(csc_ss / p.csc_max,
+                                     T, grid=False).flatten()
+                      / p.F
+                      * numpy.sqrt(ce[-self.n_pc:] / p.ce_nom
+                                   * (1.0 - csc_ss / p.csc_max)
+                                   * (csc_ss / p.csc_max)))
+
+    def calc_heat(self, y, eta_a, eta_c, Uref_a, Uref_c):
+        """
+        Total heat source of the cell: the reaction kinetics heat, and the
+        heat of the particle concentration gradients (Uref at the particle
+        surface vs. at the particle average concentration), and the ohmic
+        heat of the elyte and solid potential drops of elyte_avg (none for
+        the uniform elyte).
+        """
+        t_start = time.time()
+
+        p = self.p
+
+        phi = self.elyte_avg(y)[1]
+
+        csa = y[self.csa_inds]
+        csc = y[self.csc_inds]
+        ja = y[self.ja_inds]
+        jc = y[self.jc_inds]
+
+        Uam = p.uref_a(self.C_cs_a_avg.dot(csa) / p.csa_max)
+        Ucm = p.uref_c(self.C_cs_c_avg.dot(csc) / p.csc_max)
+
+        Q_rxn = self.aF_a * ja.dot(eta_a) + self.aF_c * jc.dot(eta_c)
+        Q_conc = self.aF_a * ja.dot(Uref_a - Uam) \
+            + self.aF_c * jc.dot(Uref_c - Ucm)
+
+        Q_ohm = y[self.iapp_ind] * (phi[0] - phi[1])
+
+        solverstats.count_call(self.stats, 'calc_heat', t_start)
+        return Q_rxn + Q_conc + Q_ohm
+
+    def particle_avg_dU(self, y):
+        """
+        Slopes of the Uref of the particle average concentrations, with
+        respect to the concentrations, for the thermal Jacobian.
+        """
+        p = self.p
+
+        csa_avg = self.C_cs_a_avg.dot(y[self.csa_inds])
+        csc_avg = self.C_cs_c_avg.dot(y[self.csc_inds])
+
+        return p.uref_a(csa_avg / p.csa_max), \
+            p.uref_c(csc_avg / p.csc_max), \
+            p.duref_a(csa_avg / p.csa_max) / p.csa_max, \
+            p.duref_c(csc_avg / p.csc_max) / p.csc_max
+
+    def elyte_avg(self, y):
+        """
+        Elyte concentration and potential seen by the particle of each
+        electrode, as the [anode, cathode] arrays ce and phi: the uniform
+        ce_0, and the potential of zero.
+        """
+        return self.p.ce_0 * numpy.ones(2), numpy.zeros(2)
+
+    def elyte_avg_jac(self, y):
+        """
+        State derivatives of the elyte_avg potentials, as (cols, dphi_a,
+        dphi_c) for the state indices, cols, of each (none for the uniform
+        elyte).
+        """
+        return []
+
+    def elyte_x(self, y):
+        """
+        Elyte concentration and potential at each node of the cell.
+        """
+        p = self.p
+
+        return p.ce_0 * numpy.ones(p.N), numpy.zeros(p.N)
+
+    def elyte_res(self, y, yd):
+        """
+        Residuals of the elyte concentration states (none for the uniform
+        elyte).
+        """
+        return numpy.zeros(0)
+
+    def elyte_jac(self, j, c, y):
+        """
+        Add the rows of the elyte concentration states to the Jacobian, j
+        (none for the uniform elyte).
+        """
+        pass
+
+    def eliminated_inds(self):
+        """
+        States removed from the time integration in the reduced formulation
+        (see reducedstates): the pore wall fluxes, which are linear in the
+        applied current (the charge balance rows).
+        """
+        return self.ja_inds + self.jc_inds
+
+    def solve_potentials(self, y):
+        """
+        Set the eliminated_inds pore wall fluxes of y, from the charge balance
+        of each electrode for the applied current of y.
+        """
+        i_app = y[self.iapp_ind]
+
+        y[self.ja_inds] = i_app / self.aF_a
+        y[self.jc_inds] = -i_app / self.aF_c
+
+        return y
+
+    def state_blocks(self):
+        """
+        Name and indices of each physical variable of the state vector (with
+        the elyte concentration of the SPMe).
+        """
+        blocks = [('csa', self.csa_inds), ('csc', self.csc_inds),
+                  ('T', [self.T_ind]), ('ja', self.ja_inds),
+                  ('jc', self.jc_inds), ('pa', self.pa_inds),
+                  ('pc', self.pc_inds), ('iapp', [self.iapp_ind])]
+        if self.ce_inds:
+            blocks.insert(0, ('ce', self.ce_inds))
+
+        return blocks
+
+    def state_scales(self):
+        """
+        Typical magnitude of each state (see FULL_1D.state_scales).
+        """
+        p = self.p
+
+        i_1C = p.RunInput['MODEL']['RATE_NOM_CAP'] / p.Area
+
+        scales = numpy.ones(self.iapp_ind + 1)
+        scales[self.ce_inds] = p.ce_nom
+        scales[self.csa_inds] = p.csa_max
+        scales[self.csc_inds] = p.csc_max
+        scales[self.T_ind] = p.T_amb
+        scales[self.ja_inds] = i_1C / self.aF_a
+        scales[self.jc_inds] = i_1C / self.aF_c
+        scales[self.iapp_ind] = i_1C
+
+        return scales
+
+    def jac_pattern(self):
+        """
+        Sparsity pattern of the Jacobian (bool array), for the colored finite
+        difference Jacobian (see fdjac): the tridiagonal solid diffusion of
+        each particle, with Ds at the surface (of the surface conc) and the
+        pore wall flux source, the charge balance and kinetics of each
+        electrode, the heat generation row (dense, it depends on all of the
+        particle states) and the input control row.
+        """
+        n = self.iapp_ind + 1
+        pattern = numpy.eye(n, dtype=bool)
+
+        def add(rows, cols, B):
+            pattern[numpy.ix_(rows, cols)] |= numpy.array(B) != 0.0
+
+        for cs, jr, ps, B_cs, C_cs in [
+                (self.csa_inds, self.ja_inds, self.pa_inds, self.B_cs_a,
+                 self.C_cs_a),
+                (self.csc_inds, self.jc_inds, self.pc_inds, self.B_cs_c,
+                 self.C_cs_c)]:
+            # Solid conc
+            n_r = len(cs)
+            add(cs, cs, numpy.eye(n_r, k=-1) + numpy.eye(n_r)
+                + numpy.eye(n_r, k=1))
+            add(cs, cs, B_cs.dot(C_cs))
+            add(cs, jr, B_cs)
+
+            # Charge balance
+            add(jr, [self.iapp_ind], numpy.ones((1, 1)))
+
+            # Kinetics
+            add(ps, cs, C_cs)
+            add(ps, jr + [self.T_ind], numpy.ones((1, 2)))
+
+        # Thermal, and input control
+        pattern[self.T_ind, :] = True
+        add([self.iapp_ind], [self.pa_inds[0], self.pc_inds[-1]],
+            numpy.ones((1, 2)))
+
+        return pattern
+
+    def prec_mat(self, c, t, y, yd):
+        """
+        Preconditioner for the Krylov linear solvers, the (small) Jacobian
+        itself, as a sparse matrix.
+        """
+        return scipy.sparse.csc_matrix(self.jac(c, t, y, yd))
+
+    def jac_coo(self, c, t, y, yd):
+        """
+        Entries of the (small) Jacobian, those of jac (see FULL_1D.jac_coo).
+        """
+        J = scipy.sparse.coo_matrix(self.jac(c, t, y, yd))
+
+        return J.row, J.col, J.data, None
+
+    # Define system equations
+    def res(self, t, y, yd):
+        """
+        Residual for the SPM model.
+        """
+        t_start = time.time()
+
+        p = self.p
+
+        # Parse out the states
+        # Solid conc a:anode, c:cathode
+        csa = y[self.csa_inds]
+        csc = y[self.csc_inds]
+        csa_dt = yd[self.csa_inds]
+        csc_dt = yd[self.csc_inds]
+
+        # Reaction (Butler-Volmer Kinetics)
+        ja_rxn = y[self.ja_inds]
+        jc_rxn = y[self.jc_inds]
+
+        # Solid potential
+        phi_s_a = y[self.pa_inds]
+        phi_s_c = y[self.pc_inds]
+
+        # Thermal
+        T = y[self.T_ind]
+        T_dt = yd[self.T_ind]
+
+        # Applied current density
+        i_app = y[self.iapp_ind]
+
+        # Compute extra variables
+        # Elyte concentration and potential of each particle
+        ce, phi = self.elyte_avg(y)
+
+        # For the reaction kinetics
+        eta_a, eta_c, Uref_a, Uref_c, csa_ss, csc_ss = self.get_eta_uref(
+            csa, csc, ja_rxn, jc_rxn, phi_s_a, phi_s_c, phi)
+
+        # For Solid conc Ds
+        csa_o = self.C_cso_a.dot(csa)
+        csc_o = self.C_cso_c.dot(csc)
+
+        self.update_cs_mats(csa, csc, csa_ss, csc_ss, csa_o, csc_o)
+
+        # For kinetics, the io param is now conc dependent
+        self.update_Cio(csa_ss, csc_ss, ce, T)
+
+        Q_in = self.calc_heat(y, eta_a, eta_c, Uref_a, Uref_c)
+
+        Q_out = p.h * p.Aconv * (T - self.T_amb)
+
+        ja = self.kern.butler_volmer(self.C_ioa, 0.5 * p.F / (p.R_gas * T),
+                                     eta_a)
+        jc = self.kern.butler_volmer(self.C_ioc, 0.5 * p.F / (p.R_gas * T),
+                                     eta_c)
+
+        # Compute the residuals
+        # Time deriv components -- E-lyte conc (SPMe)
+        r0 = self.elyte_res(y, yd)
+        # Time deriv components -- Anode particle conc
+        r1 = csa_dt - (batteqns.tridiag_apply(self.A_cs_a_tri, csa) +
+                       self.B_cs_a.dot(ja_rxn))
+        # Time deriv components -- Cathode particle conc
+        r2 = csc_dt - (batteqns.tridiag_apply(self.A_cs_c_tri, csc) +
+                       self.B_cs_c.dot(jc_rxn))
+        # Time deriv components -- Single lump thermal ODE
+        r3 = T_dt - 1. / (p.rho * p.Cp) * (Q_in - Q_out)
+
+        # Algebraic components -- Charge balance of each electrode
+        r4 = self.aF_a * ja_rxn - i_app
+        r5 = self.aF_c * jc_rxn + i_app
+        # Algebraic components -- Butler-Volmer Kinetics
+        r6 = ja_rxn - ja
+        r7 = jc_rxn - jc
+        # Algebraic components -- Input control
+        r8 = self.ctrl_res(t, y)
+
+        # Final residual
+        res_out = numpy.concatenate([r0, r1, r2, [r3], r4, r5, r6, r7,
+                                     [r8]])
+
+        solverstats.count_call(self.stats, 'res', t_start)
+        return res_out
+
+    def jac(self, c, t, y, yd):
+        """
+        Analytical Jacobian for the SPM model (dense).
+
+        As for FULL_1D, Ds and the exchange current densities are held fixed
+        (as of the last res call).
+        """
+        t_start = time.time()
+
+        p = self.p
+
+        csa = y[self.csa_inds]
+        csc = y[self.csc_inds]
+        ja_rxn = y[self.ja_inds]
+        jc_rxn = y[self.jc_inds]
+        phi_s_a = y[self.pa_inds]
+        phi_s_c = y[self.pc_inds]
+        T = y[self.T_ind]
+        i_app = y[self.iapp_ind]
+
+        phi = self.elyte_avg(y)[1]
+
+        eta_a, eta_c, Uref_a, Uref_c, csa_ss, csc_ss = self.get_eta_uref(
+            csa, csc, ja_rxn, jc_rxn, phi_s_a, phi_s_c, phi)
+
+        # Kinetics, dj/deta, dj/dT and dUref/dcs_ss
+        b = 0.5 * p.F / (p.R_gas * T)
+        dj_a = numpy.diagonal(self.build_Bjac_mat(eta_a, self.C_ioa, b))
+        dj_c = numpy.diagonal(self.build_Bjac_mat(eta_c, self.C_ioc, b))
+        djT_a = self.build_BjT_mat(T, self.C_ioa, 0.5 * p.F / p.R_gas * eta_a)
+        djT_c = self.build_BjT_mat(T, self.C_ioc, 0.5 * p.F / p.R_gas * eta_c)
+        dU_a = p.duref_a(csa_ss / p.csa_max) / p.csa_max
+        dU_c = p.duref_c(csc_ss / p.csc_max) / p.csc_max
+
+        n = self.iapp_ind + 1
+        j = numpy.zeros((n, n))
+
+        # Solid conc
+        for cs, jr, A_cs, B_cs in [
+                (self.csa_inds, self.ja_inds, self.A_cs_a, self.B_cs_a),
+                (self.csc_inds, self.jc_inds, self.A_cs_c, self.B_cs_c)]:
+            j[numpy.ix_(cs, cs)] = c * numpy.eye(len(cs)) - A_cs
+            j[numpy.ix_(cs, jr)] = -B_cs
+
+        # Thermal, for the heat of each electrode, aF*j*(phi_s - phi - U_avg),
+        # and the ohmic heat, i_app*(phi_a - phi_c)
+        Uam, Ucm, dUm_a, dUm_c = self.particle_avg_dU(y)
+        C_T = -1. / (p.rho * p.Cp)
+
+        j[self.T_ind, self.T_ind] = c + p.h * p.Aconv / (p.rho * p.Cp)
+        j[self.T_ind, self.ja_inds] = C_T * self.aF_a \
+            * (phi_s_a - phi[0] - Uam)
+        j[self.T_ind, self.jc_inds] = C_T * self.aF_c \
+            * (phi_s_c - phi[1] - Ucm)
+        j[self.T_ind, self.pa_inds] = C_T * self.aF_a * ja_rxn
+        j[self.T_ind, self.pc_inds] = C_T * self.aF_c * jc_rxn
+        j[self.T_ind, self.csa_inds] = -C_T * self.aF_a * ja_rxn * dUm_a \
+            * self.C_cs_a_avg[0]
+        j[self.T_ind, self.csc_inds] = -C_T * self.aF_c * jc_rxn * dUm_c \
+            * self.C_cs_c_avg[0]
+        j[self.T_ind, self.iapp_ind] = C_T * (phi[0] - phi[1])
+
+        # Charge balance
+        j[self.ja_inds, self.ja_inds] = self.aF_a
+        j[self.ja_inds, self.iapp_ind] = -1.0
+        j[self.jc_inds, self.jc_inds] = self.aF_c
+        j[self.jc_inds, self.iapp_ind] = 1.0
+
+        # Kinetics
+        for row, jr, ps, cs, dj, djT, dU, D_cs, C_cs in [
+                (self.pa_inds, self.ja_inds, self.pa_inds, self.csa_inds,
+                 dj_a, djT_a, dU_a, self.D_cs_a, self.C_cs_a),
+                (self.pc_inds, self.jc_inds, self.pc_inds, self.csc_inds,
+                 dj_c, djT_c, dU_c, self.D_cs_c, self.C_cs_c)]:
+            j[row, jr] = 1.0 + dj * dU * numpy.diagonal(D_cs)
+            j[row, ps] = -dj
+            j[numpy.ix_(row, cs)] = (dj * dU)[:, numpy.newaxis] * C_cs
+            j[row, self.T_ind] = -djT
+
+        # Elyte potential of each particle (SPMe), through the kinetics and
+        # the heat
+        for cols, dphi_a, dphi_c in self.elyte_avg_jac(y):
+            j[self.pa_inds[0], cols] += dj_a[0] * dphi_a
+            j[self.pc_inds[0], cols] += dj_c[0] * dphi_c
+            j[self.T_ind, cols] += C_T * (
+                (i_app - self.aF_a * ja_rxn[0]) * dphi_a
+                - (i_app + self.aF_c * jc_rxn[0]) * dphi_c)
+
+        # E-lyte conc (SPMe)
+        self.elyte_jac(j, c, y)
+
+        # Input control
+        j[self.iapp_ind, [self.pa_inds[0], self.pc_inds[-1], self.iapp_ind]] \
+            = self.ctrl_jac(y)
+
+        solverstats.count_call(self.stats, 'jac', t_start)
+        return j
+
+
+class SPMe(SPM):
+    """
+    Class for the Single Particle Model with electrolyte.
+
+    The residual rows are those of the SPM, after the elyte concentration
+    rows (the ce of FULL_1D, with the pore wall flux of each electrode at
+    each of its nodes). The elyte potential, relative to the last node, is
+    integrated from
+        kappa*dphi_e/dx = -i_e + kappa*2*(1 - t_plus)*R*T/F*dln(ce)/dx
+    for the ionic current of the uniform pore wall fluxes, i_e (the linear
+    ramp across each electrode, discretized as the B2_pe source term of
+    FULL_1D), so
+        phi_e = i_app*r_e(ce, T) + 2*(1 - t_plus)*R*T/F*ln(ce/ce[-1])
+    Each particle sees the volume average ce and phi_e of its electrode. The
+    solid phase ohmic drop from the current collector to the electrode
+    average, i_app*L/(3*sig_eff), is added to the anode phi (and subtracted
+    from the cathode phi), so the phi_s states are those of the terminals,
+    as for FULL_1D.
+    """
+    elyte_on = 1
+
+    # The kinetics rows see a large part of the ce (through kappa, see
+    # jac_pattern), and are taken as dense for the FD Jacobian (see fdjac)
+    jac_dense_frac = 0.25
+
+    def __init__(self, p, y0, yd0):
+        SPM.__init__(self, p, y0, yd0)
+
+        # Elyte conc source term (the diagonal of B_ce)
+        self.phie_mats()
+        self.b_ce = numpy.diagonal(self.B_ce)
+
+        # Volume average of the nodes of each electrode, as a 2 x N array
+        self.W_x = numpy.zeros((2, p.N))
+        self.W_x[0, :p.Na] = p.vols_a / p.La
+        self.W_x[1, -p.Nc:] = p.vols_c / p.Lc
+
+        # Ionic current through the inner edges, per unit applied current
+        # density
+        i_x = numpy.concatenate([p.vols_a * p.as_a * p.F / self.aF_a,
+                                 numpy.zeros(p.Ns),
+                                 -p.vols_c * p.as_c * p.F / self.aF_c])
+        self.ie_edge = numpy.cumsum(i_x)[:-1]
+
+        # Solid phase ohmic resistance, current collector to electrode
+        # average
+        self.R_s = numpy.array([p.La / (3. * numpy.mean(p.sig_a_eff)),
+                                -p.Lc / (3. * numpy.mean(p.sig_c_eff))])
+
+    def phie_ohm(self, ce, T):
+        """
+        Ohmic elyte potential per unit applied current density, r_e, at each
+        node, for the conductivity at ce and T. The r_e of the last ce and T
+        is kept, as this is used by res and jac for the same states (as for
+        FULL_1D.pe_tris).
+        """
+        last = getattr(self, 'phie_ohm_last', None)
+        if last is None or last[1] != T or not numpy.array_equal(last[0], ce):
+            k_eff = self.kapp_ce(ce, T)
+            dphi = self.ie_edge * self.p.mesh.dx_m / k_eff[1:-1]
+            last = [numpy.array(ce), T,
+                    numpy.append(numpy.cumsum(dphi[::-1])[::-1], 0.0)]
+            self.phie_ohm_last = last
+
+        return last[2]
+
+    def elyte_x(self, y):
+        """
+        Elyte concentration and potential at each node of the cell.
+        """
+        p = self.p
+
+        ce = y[self.ce_inds]
+        T = y[self.T_ind]
+
+        gam = 2. * (1. - p.t_plus) * p.R_gas * T / p.F
+
+        phi_e = y[self.iapp_ind] * self.phie_ohm(ce, T) \
+            + gam * numpy.log(ce / ce[-1])
+
+        return ce, phi_e
+
+    def elyte_avg(self, y):
+        """
+        Elyte concentration and potential seen by the particle of each
+        electrode, as the [anode, cathode] arrays ce and phi: the electrode
+        averages, with the solid phase ohmic drop added to phi.
+        """
+        ce, phi_e = self.elyte_x(y)
+
+        return self.W_x.dot(ce), \
+            self.W_x.dot(phi_e) + y[self.iapp_ind] * self.R_s
+
+    def elyte_avg_jac(self, y):
+        """
+        State derivatives of the elyte_avg potentials, as (cols, dphi_a,
+        dphi_c) for the ce, T and i_app states (with kappa held fixed, as in
+        FULL_1D.jac).
+        """
+        p = self.p
+
+        ce = y[self.ce_inds]
+        T = y[self.T_ind]
+
+        gam = 2. * (1. - p.t_plus) * p.R_gas / p.F
+
+        d_ce = gam * T * self.W_x / ce
+        d_ce[:, -1] -= gam * T / ce[-1]
+        d_T = self.W_x.dot(gam * numpy.log(ce / ce[-1]))
+        d_i = self.W_x.dot(self.phie_ohm(ce, T)) + self.R_s
+
+        return [(self.ce_inds, d_ce[0], d_ce[1]),
+                ([self.T_ind], d_T[0], d_T[1]),
+                ([self.iapp_ind], d_i[0], d_i[1])]
+
+    def elyte_res(self, y, yd):
+        """
+        Residuals of the elyte concentration states (see FULL_1D.res).
+        """
+        p = self.p
+
+        ce = y[self.ce_inds]
+        T = y[self.T_ind]
+
+        j = numpy.concatenate([numpy.repeat(y[self.ja_inds], p.Na),
+                               numpy.zeros(p.Ns),
+                               numpy.repeat(y[self.jc_inds], p.Nc)])
+
+        A_ce = self.build_Ace_tri(ce, T)
+
+        return yd[self.ce_inds] - (batteqns.tridiag_apply(A_ce, ce)
+                                   + self.b_ce * j)
+
+    def jac_pattern(self):
+        """
+        Sparsity pattern of the Jacobian (see SPM.jac_pattern), with the
+        elyte concentration rows: the tridiagonal diffusion block, De(T),
+        and the pore wall flux source of the nodes of each electrode. The
+        kinetics of each particle see the ce from its electrode to the
+        cathode end (through kappa, in phie_ohm, and the reference ce[-1]),
+        T and the applied current.
+        """
+        p = self.p
+
+        pattern = SPM.jac_pattern(self)
+
+        ce = numpy.array(self.ce_inds)
+        pattern[ce, ce] = True
+        pattern[ce[1:], ce[:-1]] = True
+        pattern[ce[:-1], ce[1:]] = True
+        pattern[ce, self.T_ind] = True
+        pattern[ce[:p.Na], self.ja_inds[0]] = True
+        pattern[ce[-p.Nc:], self.jc_inds[0]] = True
+
+        for row, w in zip([self.pa_inds[0], self.pc_inds[0]], self.W_x):
+            pattern[row, ce[numpy.nonzero(w)[0][0]:]] = True
+            pattern[row, self.iapp_ind] = True
+
+        return pattern
+
+    def elyte_jac(self, j, c, y):
+        """
+        Add the rows of the elyte concentration states to the Jacobian, j
+        (with De held fixed, as in FULL_1D.jac).
+        """
+        p = self.p
+
+        A_ce = self.build_Ace_mat(y[self.ce_inds], y[self.T_ind])
+
+        j[numpy.ix_(self.ce_inds, self.ce_inds)] = c * numpy.eye(p.N) - A_ce
+        j[self.ce_inds[:p.Na], self.ja_inds[0]] = -self.b_ce[:p.Na]
+        j[self.ce_inds[-p.Nc:], self.jc_inds[0]] = -self.b_ce[-p.Nc:]
+
+
+class Simulator(full_1d_fvm_ida.Simulator):
+    """
+    Simulator for the SPM model (see full_1d_fvm_ida.Simulator).
+    The results are in the FULL_1D layout, with the particle, kinetics and
+    solid potential variables repeated at each node of an electrode, and the
+    elyte concentration and potential of elyte_x.
+    """
+    model_class = SPM
+    model_name = 'spm'
+
+    def const_init_conds(self):
+        """
+        Initial conditions for the first step in a schedule, with the
+        particles at the initial stoichiometries, and the elyte at ce_0 (see
+        full_1d_fvm_ida.Simulator.const_init_conds).
+        """
+        p = self.pars
+        n_ce = p.N * self.model_class.elyte_on
+        csa_inds, csc_inds, T_ind, ja_inds, jc_inds, pa_inds, pc_inds, \
+            iapp_ind = state_inds(p, n_ce)
+
+        y0 = numpy.zeros(iapp_ind + 1)
+
+        # x0
+        y0[:n_ce] = p.ce_0
+        y0[csa_inds] = p.theta_a0 * p.csa_max
+        y0[csc_inds] = p.theta_c0 * p.csc_max
+        y0[T_ind] = p.T_amb
+
+        # z0
+        y0[pa_inds] = p.uref_a(p.theta_a0 * numpy.ones(1, dtype='d'))
+        y0[pc_inds] = p.uref_c(p.theta_c0 * numpy.ones(1, dtype='d'))
+
+        return y0, numpy.zeros_like(y0)
+
+    def output_vars(self, y):
+        """
+        Output variables of the state vector y (see
+        full_1d_fvm_ida.Simulator.output_vars), with the particle variables
+        repeated at each node of an electrode.
+        """
+        imp_mod = self.imp_mod
+        p = self.p
+
+        csa = y[imp_mod.csa_inds]
+        csc = y[imp_mod.csc_inds]
+        ja = y[imp_mod.ja_inds]
+        jc = y[imp_mod.jc_inds]
+        pa = y[imp_mod.pa_inds]
+        pc = y[imp_mod.pc_inds]
+        T = y[imp_mod.T_ind]
+
+        eta_a, eta_c, Ua_ss, Uc_ss, csa_ss, csc_ss = imp_mod.get_eta_uref(
+            csa, csc, ja, jc, pa, pc, imp_mod.elyte_avg(y)[1])
+        csa_avg = imp_mod.C_cs_a_avg.dot(csa)
+        csc_avg = imp_mod.C_cs_c_avg.dot(csc)
+
+        out = {}
+        out['Volt'] = imp_mod.get_voltage(y)
+        out['Cur'] = y[imp_mod.iapp_ind] * p.Ac
+
+        for key, va, vc in [('cs%s_avg', csa_avg, csc_avg),
+                            ('U%s_avg', p.uref_a(csa_avg / p.csa_max),
+                             p.uref_c(csc_avg / p.csc_max)),
+                            ('eta_%s', eta_a, eta_c),
+                            ('cs%s_ss', csa_ss, csc_ss),
+                            ('U%s_ss', Ua_ss, Uc_ss)]:
+            out[key % 'a'] = numpy.repeat(va, p.Na)
+            out[key % 'c'] = numpy.repeat(vc, p.Nc)
+
+        sep = numpy.zeros(p.Ns)
+        for key, va, vc in [('eta_fullx', eta_a, eta_c), ('j_fullx', ja, jc),
+                            ('Uss_fullx', Ua_ss, Uc_ss),
+                            ('phis_fullx', pa, pc),
+                            ('css_fullx', csa_ss, csc_ss)]:
+            out[key] = numpy.concatenate([numpy.repeat(va, p.Na), sep,
+                                          numpy.repeat(vc, p.Nc)])
+
+        ce = imp_mod.elyte_x(y)[0]
+        out['ke'] = imp_mod.kapp_ce(ce, T, mid_on=1, eps_off=1)
+        out['De'] = imp_mod.Diff_ce(ce, T, mid_on=1, eps_off=1)
+
+        return out
+
+    def limit_reason(self, y, out):
+        """
+        Stop reason of the elyte concentration limits, for the SPMe, and of
+        the electrode surface potential limits (see
+        full_1d_fvm_ida.Simulator.limit_reason).
+        """
+        if self.imp_mod.ce_inds:
+            return full_1d_fvm_ida.Simulator.limit_reason(self, y, out)
+
+        return self.ocp_limit_reason(out)
+
+    def step_results(self, y1):
+        """
+        Results of the state variables of the step (see
+        full_1d_fvm_ida.Simulator.step_results), in the FULL_1D layout.
+        """
+        imp_mod = self.imp_mod
+        p = self.p
+
+        elyte = [imp_mod.elyte_x(y) for y in y1]
+
+        states = {}
+        states['c_s_a'] = numpy.tile(y1[:, imp_mod.csa_inds], (1, p.Na))
+        states['c_s_c'] = numpy.tile(y1[:, imp_mod.csc_inds], (1, p.Nc))
+        states['c_e'] = numpy.array([ce for ce, phi_e in elyte])
+        states['T'] = y1[:, imp_mod.T_ind]
+
+        states['phi_e'] = numpy.array([phi_e for ce, phi_e in elyte])
+        states['phi_s_a'] = numpy.tile(y1[:, imp_mod.pa_inds], (1, p.Na))
+        states['phi_s_c'] = numpy.tile(y1[:, imp_mod.pc_inds], (1, p.Nc))
+
+        states['ja'] = numpy.tile(y1[:, imp_mod.ja_inds], (1, p.Na))
+        states['jc'] = numpy.tile(y1[:, imp_mod.jc_inds], (1, p.Nc))
+
+        pe_midsep = states['phi_e'][:, int(p.Na + (p.Ns / 2.))]
+
+        extras = {}
+        extras['Va'] = y1[:, imp_mod.pa_inds[0]] - pe_midsep
+        extras['Vc'] = y1[:, imp_mod.pc_inds[0]] - pe_midsep
+
+        return states, extras
+
+
+class SimulatorSPMe(Simulator):
+    """
+    Simulator for the SPMe model (see Simulator).
+    """
+    model_class = SPMe
+    model_name = 'spme'
@@ -1,3 +1,12 @@
 import batteqns
 import confreader
 import schedreader
+import solverstats
+import profiling
+import telemetry
+import stepcontrol
+import fixedstep
+import reducedstates
+import fdjac
+import scaledstates
+import kernels
@@ -5,6 +5,8 @@ import numpy
 from copy import deepcopy
 from scipy.signal import filtfilt, butter
 import scipy.interpolate
+import scipy.sparse
+import scipy.sparse.linalg
 
 
 # New functions for full FVM based P2D model
@@ -39,6 +41,51 @@ def compute_deriv(func, x0):
     return J
 
 
+def consistent_alg_states(res, jac, t, y, yd, alg_inds, diff_inds,
+                          rtol=1e-8, atol=1e-12, max_iters=10):
+    """
+    Solve for consistent algebraic states of the semi-explicit DAE,
+    res(t, y, yd) = 0, with the differential states held fixed.
+
+    Newton iterations are carried out on the algebraic equations, using the
+    algebraic sub-block of the DAE Jacobian, jac(c, t, y, yd), which may be
+    dense or sparse (scipy.sparse, solved with a sparse LU). The time
+    derivatives of the differential states are then updated from their
+    residuals, which must be of the form, yd - f(y).
+
+    Returns the consistent y and yd, and a flag for Newton convergence.
+    """
+    y = numpy.array(y, dtype='d')
+    yd = numpy.array(yd, dtype='d')
+    alg_blk = numpy.ix_(alg_inds, alg_inds)
+
+    converged = 0
+    for it in range(max_iters):
+        r_alg = res(t, y, yd)[alg_inds]
+        J = jac(0.0, t, y, yd)
+        try:
+            if scipy.sparse.issparse(J):
+                J_alg = scipy.sparse.csr_matrix(J)[alg_inds][:, alg_inds]
+                dy_alg = scipy.sparse.linalg.splu(J_alg.tocsc()).solve(
+                    -r_alg)
+            else:
+                dy_alg = numpy.linalg.solve(J[alg_blk], -r_alg)
+        except (numpy.linalg.LinAlgError, RuntimeError):
+            break
+        if not numpy.all(numpy.isfinite(dy_alg)):
+            break
+
+        y[alg_inds] += dy_alg
+
+        if numpy.all(abs(dy_alg) <= rtol * abs(y[alg_inds]) + atol):
+            converged = 1
+            break
+
+    yd[diff_inds] -= res(t, y, yd)[diff_inds]
+
+    return y, yd, converged
+
+
 def right_side_coeffs(h_n, h_n1):
     """
     General 1D non-uniform mesh values for retrieving the boundary values.
@@ -186,88 +233,285 @@ def nonlinspace(Rf, k, N):
     return r
 
 
+class MeshMetrics():
+    """
+    Spacings of a 1D FVM mesh, with the cell mid-points x_m, the cell volumes
+    vols, and the cell edges x_e (optional, for the edge interpolation).
+    These are computed once (see Params), for the tridiagonal operators
+    below:
+        dx_m     : mid-point spacings, x_m[i+1] - x_m[i]
+        inv_vols : 1/vols
+        w_e      : edge interpolation weights of the inner edges
+        inv_dx_g : inverse spacings of the gradient operator (centered in
+                   the interior, one sided at the ends)
+    """
+    def __init__(self, x_m, vols, x_e=None):
+        self.N = len(x_m)
+        self.x_m = numpy.asarray(x_m, dtype='d')
+        self.vols = numpy.asarray(vols, dtype='d')
+
+        self.dx_m = self.x_m[1:] - self.x_m[:-1]
+        self.inv_vols = 1. / self.vols
+        self.ones = numpy.ones(self.N)
+
+        dx_g = numpy.empty(self.N)
+        dx_g[1:-1] = self.x_m[2:] - self.x_m[:-2]
+        dx_g[0] = self.dx_m[0]
+        dx_g[-1] = self.dx_m[-1]
+        self.inv_dx_g = 1. / dx_g
+
+        if x_e is not None:
+            self.x_e = numpy.asarray(x_e, dtype='d')
+            dx_e = self.x_e[1:] - self.x_e[:-1]
+            self.w_e = dx_e[:-1] / (dx_e[1:] + dx_e[:-1])
+
+
+# Tridiagonal operators, as the (lower, main, upper) diagonals, tri, of an
+# N x N matrix (the lower and upper diagonals are of length N-1).
+def flux_diags(mesh, P, per_vol=1):
+    """
+    Diagonals of the FVM flux matrix operator of flux_mat_builder, for the
+    edge values P (only the inner edges, 1 to N-1, are used). With
+    per_vol=0, the fluxes are not divided by the cell volumes.
+    P may also be a 2D array, with the edge values of several cells (e.g.,
+    the particles of an electrode) in its rows, for the diagonals of each
+    (see tridiag_block_diag).
+    """
+    inv_v = mesh.inv_vols if per_vol else mesh.ones
+    P_in = numpy.asarray(P, dtype='d')[..., 1:mesh.N]
+
+    lo = inv_v[1:] * P_in / mesh.dx_m
+    up = inv_v[:-1] * P_in / mesh.dx_m
+
+    d = numpy.zeros(P_in.shape[:-1] + (mesh.N,))
+    d[..., 1:] -= lo
+    d[..., :-1] -= up
+
+    return lo, d, up
+
+
+def grad_diags(mesh):
+    """
+    Diagonals of the gradient operator of grad_mat, on the mid-points of
+    mesh.
+    """
+    g = mesh.inv_dx_g
+
+    d = numpy.zeros(mesh.N)
+    d[0] = -g[0]
+    d[-1] = g[-1]
+
+    return -g[1:], d, g[:-1].copy()
+
+
+def tridiag_apply(tri, x):
+    """
+    Product of the tridiagonal operator tri and the vector x.
+    """
+    lo, d, up = tri
+
+    y = d * x
+    y[1:] += lo * x[:-1]
+    y[:-1] += up * x[1:]
+
+    return y
+
+
+def tridiag_scale(s, tri):
+    """
+    Tridiagonal operator tri with each row i scaled by s[i] (i.e.,
+    diag(s)*tri).
+    """
+    lo, d, up = tri
+
+    return s[1:] * lo, s * d, s[:-1] * up
+
+
+def tridiag_block_diag(tri):
+    """
+    Tridiagonal operator of the block diagonal of the operators in the rows
+    of tri (the 2D diagonals of flux_diags).
+    """
+    lo, d, up = tri
+    n_b, N = d.shape
+
+    lo_b = numpy.zeros((n_b, N))
+    lo_b[:, :-1] = lo
+    up_b = numpy.zeros((n_b, N))
+    up_b[:, :-1] = up
+
+    return lo_b.ravel()[:-1], d.ravel(), up_b.ravel()[:-1]
+
+
+def tridiag_mat(tri, sparse=0):
+    """
+    Matrix of the tridiagonal operator tri, as a dense array, or as a
+    scipy.sparse CSR matrix with sparse=1.
+    """
+    lo, d, up = tri
+    N = len(d)
+
+    if sparse:
+        return scipy.sparse.diags([lo, d, up], [-1, 0, 1], shape=(N, N),
+                                  format='csr')
+
+    A = numpy.zeros([N, N], dtype='d')
+    i = numpy.arange(N)
+    A[i, i] = d
+    A[i[1:], i[:-1]] = lo
+    A[i[:-1], i[1:]] = up
+
+    return A
+
+
+def edge_interp(mesh, var_mid):
+    """
+    Interpolate a cell mid-point based array to the edge-points of mesh (the
+    harmonic mean, weighted by the cell sizes, at the inner edges).
+    """
+    var_mid = numpy.asarray(var_mid, dtype='d')
+    a = var_mid[:-1]
+    b = var_mid[1:]
+    w = mesh.w_e
+
+    var_edge = numpy.empty(len(var_mid) + 1)
+    var_edge[0] = var_mid[0]
+    var_edge[1:-1] = a * b / (w * b + (1 - w) * a)
+    var_edge[-1] = var_mid[-1]
+
+    return var_edge
+
+
 def mid_to_edge(var_mid, x_e):
     """
     Interpolate a cell mid-point based array to the edge-points of the mesh.
     """
-    var_edge = numpy.array([var_mid[0]]
-                           + [var_mid[i]*var_mid[i+1]/(((x_e[i+1] - x_e[i])/((x_e[i+2] - x_e[i+1]) + (x_e[i+1] - x_e[i])))*var_mid[i+1] + (1 - ((x_e[i+1]-x_e[i])/((x_e[i+2]-x_e[i+1]) + (x_e[i+1] - x_e[i]))))*var_mid[i]) for i in range(len(var_mid) - 1)]
-                           + [var_mid[-1]])
+    x_e = numpy.asarray(x_e, dtype='d')
+    mesh = MeshMetrics(0.5 * (x_e[1:] + x_e[:-1]), x_e[1:] - x_e[:-1], x_e)
 
-    return var_edge
+    return edge_interp(mesh, var_mid)
 
 
-def flux_mat_builder(N, x_m, vols, P):
+def mid_to_edge_deriv(var_mid, mesh):
     """
-    Generate the basic matrix for the FVM flux matrix operator.
+    Derivative of edge_interp(mesh, var_mid) with respect to var_mid, as an
+    (N+1) x N matrix.
     """
-    A = numpy.zeros([N, N], dtype='d')
+    N = len(var_mid)
+    D = numpy.zeros([N + 1, N], dtype='d')
+    D[0, 0] = 1.
+    D[-1, -1] = 1.
 
-    for i in range(1, N-1):
-        A[i, i-1] = (1./vols[i]) * (P[i]) / (x_m[i] - x_m[i-1])
-        A[i, i] = -(1./vols[i]) * (P[i]) / (x_m[i] - x_m[i-1]) \
-            - (1./vols[i]) * (P[i+1]) / (x_m[i+1] - x_m[i])
-        A[i, i+1] = (1./vols[i]) * (P[i+1]) / (x_m[i+1] - x_m[i])
+    a = numpy.asarray(var_mid[:-1], dtype='d')
+    b = numpy.asarray(var_mid[1:], dtype='d')
+    w = mesh.w_e
+    den = w * b + (1. - w) * a
 
-    i = 0
-    A[0, 0] = -(1./vols[i]) * (P[i+1]) / (x_m[i+1] - x_m[i])
-    A[0, 1] = (1./vols[i]) * (P[i+1]) / (x_m[i+1] - x_m[i])
+    i = numpy.arange(N - 1)
+    D[i + 1, i] = w * b**2 / den**2
+    D[i + 1, i + 1] = (1. - w) * a**2 / den**2
 
-    i = N-1
-    A[i, i-1] = (1./vols[i]) * (P[i]) / (x_m[i] - x_m[i-1])
-    A[i, i] = -(1./vols[i]) * (P[i]) / (x_m[i] - x_m[i-1])
+    return D
 
-    return A
+
+def flux_mat_deriv(mesh, c):
+    """
+    Derivative of tridiag_apply(flux_diags(mesh, P), c) with respect to the
+    edge values P, as an N x (N+1) matrix. The flux term is linear in P,
+    and only the inner edges (1 to N-1) are used.
+    """
+    N = mesh.N
+    G = numpy.zeros([N, N + 1], dtype='d')
+
+    f = numpy.arange(1, N)
+    dc = (c[f - 1] - c[f]) / mesh.dx_m
+    G[f, f] = dc * mesh.inv_vols[1:]
+    G[f - 1, f] = -dc * mesh.inv_vols[:-1]
+
+    return G
+
+
+def interp1d_deriv(intp, x):
+    """
+    Derivative of a linear scipy interp1d interpolator, intp, at x (zero
+    outside of the data range, where the fill value is used).
+    """
+    xp, yp = intp.x, intp.y
+    i = numpy.clip(numpy.searchsorted(xp, x) - 1, 0, len(xp) - 2)
+    slope = (yp[i + 1] - yp[i]) / (xp[i + 1] - xp[i])
+
+    return numpy.where((x < xp[0]) | (x > xp[-1]), 0., slope)
+
+
+def flux_mat_builder(N, x_m, vols, P):
+    """
+    Generate the basic matrix for the FVM flux matrix operator.
+    """
+    return tridiag_mat(flux_diags(MeshMetrics(x_m[:N], vols[:N]), P))
 
 
 def grad_mat(N, x):
     """
     Generate a matrix that performs the centered difference gradient operator.
     """
-    G = numpy.zeros([N, N])
-    for i in range(1, N-1):
-        G[i, [i-1, i+1]] = [-1./(x[i+1]-x[i-1]), 1./(x[i+1]-x[i-1])]
+    x = numpy.asarray(x[:N], dtype='d')
 
-    # Edge boundary conditions
-    G[0, [0, 1]] = [-1./(x[1]-x[0]), 1./(x[1]-x[0])]
-    G[-1, [-2, -1]] = [-1./(x[-1]-x[-2]), 1./(x[-1]-x[-2])]
+    return tridiag_mat(grad_diags(MeshMetrics(x, numpy.ones(N))))
 
-    return G
+
+def ecm_map_values(par, soc, T):
+    """
+    Values of an ECM parameter map, par (an ecm_params entry, see
+    Params.buildpars), at the SOC points soc and the temperature T [K], with
+    the end values held outside of its SOC range.
+    """
+    soc = numpy.clip(soc, par['soc'][0], par['soc'][-1])
+
+    if par['dim'] == '1D':
+        return par['intp_func'](soc)
+    elif par['dim'] == '2D':
+        return par['intp_func'].ev(soc, T * numpy.ones_like(soc))
+
+
+def ecm_param_table(ecm_params, ecmOrder, T):
+    """
+    Table of the ECM parameters at the temperature T [K], on the union of
+    the SOC breakpoints of the maps. Returns the SOC points, and the table
+    rows [OCV, Rohm, Res_1, ..., Res_n, Tau_1, ..., Tau_n] (n = ecmOrder).
+    """
+    pars = [ecm_params['ocv'], ecm_params['res_ohm']] \
+        + ecm_params['res'][:ecmOrder] + ecm_params['tau'][:ecmOrder]
+
+    soc = numpy.unique(numpy.concatenate([par['soc'] for par in pars]))
+
+    return soc, numpy.array([ecm_map_values(par, soc, T) for par in pars])
 
 
 def get_ecm_params(ecm_params, ecmOrder, SOC, T):
     """
-    Return a list of resistances for the ECM RC branches
-    """
-    # OCV lookup
-    if ecm_params['ocv']['dim'] == '1D':
-        OCV = ecm_params['ocv']['intp_func'](SOC)
-    elif ecm_params['ocv']['dim'] == '2D':
-        OCV = ecm_params['ocv']['intp_func'](SOC, T*numpy.ones_like(SOC))
-
-    # Ohmic Resistance lookup
-    if ecm_params['res_ohm']['dim'] == '1D':
-        Rohm = ecm_params['res_ohm']['intp_func'](SOC)
-    elif ecm_params['res_ohm']['dim'] == '2D':
-        Rohm = ecm_params['res_ohm']['intp_func'](SOC, T*numpy.ones_like(SOC))
-
-    # Resistance lookup
-    Res = numpy.zeros(ecmOrder)
-    for i_rc in range(ecmOrder):
-        if ecm_params['res'][i_rc]['dim'] == '1D':
-            Res[i_rc] = ecm_params['res'][i_rc]['intp_func'](SOC)
-        elif ecm_params['res'][i_rc]['dim'] == '2D':
-            Res[i_rc] = ecm_params['res'][i_rc]['intp_func'](SOC, T)
-
-    # Time constant lookup
-    Tau = numpy.zeros(ecmOrder)
-    Cap = numpy.zeros(ecmOrder)
-    for i_rc in range(ecmOrder):
-        if ecm_params['tau'][i_rc]['dim'] == '1D':
-            Tau[i_rc] = ecm_params['tau'][i_rc]['intp_func'](SOC)
-        elif ecm_params['tau'][i_rc]['dim'] == '2D':
-            Tau[i_rc] = ecm_params['tau'][i_rc]['intp_func'](
-                SOC, T*numpy.ones_like(SOC))
-        Cap[i_rc] = Tau[i_rc]/Res[i_rc]
+    Return the OCV, ohmic resistance, and the resistances, time constants
+    and capacitances of the ECM RC branches, at SOC (a scalar or an array)
+    and T [K].
+
+    The maps are tabulated at T on their SOC breakpoints once (see
+    ecm_param_table, kept in ecm_params['table'] until T changes), and all
+    of the parameters are then interpolated linearly in SOC at once. For an
+    array SOC, the branch values are (ecmOrder, len(SOC)) arrays.
+    """
+    if ecm_params.get('table') is None or ecm_params['table'][0] != T:
+        ecm_params['table'] = (T,) + ecm_param_table(ecm_params, ecmOrder, T)
+    T_tab, soc, tab = ecm_params['table']
+
+    SOC = numpy.clip(SOC, soc[0], soc[-1])
+    i = numpy.clip(numpy.searchsorted(soc, SOC) - 1, 0, len(soc) - 2)
+    w = (SOC - soc[i]) / (soc[i + 1] - soc[i])
+
+    vals = tab[:, i] + w * (tab[:, i + 1] - tab[:, i])
+
+    OCV = vals[0]
+    Rohm = vals[1]
+    Res = vals[2:2 + ecmOrder]
+    Tau = vals[2 + ecmOrder:]
+    Cap = Tau / Res
 
     return OCV, Rohm, Res, Tau, Cap
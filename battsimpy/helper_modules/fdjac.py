@@ -0,0 +1,391 @@
+# -*- coding:utf-8 -*-
+"""Colored (sparse) finite difference Jacobian of the model residual.
+
+The Jacobian of the DAE residual, dF/dy + c*dF/dyd, is computed from one
+residual evaluation per group (color) of structurally orthogonal columns,
+i.e., columns without a nonzero in the same row, rather than one per state
+(batteqns.compute_deriv):
+    - the sparsity pattern is taken from the model (jac_pattern()), or is
+      probed once, by brute force, for models without one (probe_pattern,
+      at the states of the first call)
+    - the columns are colored greedily, largest column first
+      (color_columns)
+    - the states of each color are perturbed together, y + h, yd + c*h, and
+      the residual differences are spread back to the pattern entries
+
+Dense rows (e.g., the heat generation of a lumped thermal model, which
+depends on all of the states) would give each column its own color. These
+are left out of the coloring, and only their diagonal entry is computed,
+with the column of the diagonal given its own color. The other entries of
+the dense rows are zero, i.e., these couplings are lagged in the Newton
+iterations. A model may set the fraction of the states above which a row is
+dense (jac_dense_frac), e.g., for rows that couple to a large part of the
+states only weakly.
+
+The residual functions of the models hold some lagged values from one call
+to the next (e.g., the surface Ds of FULL_1D, in D_cs_a and D_cs_c). The
+attributes listed in the lagged_attrs of the model are restored before each
+residual evaluation, so all of the differences are at the same lagged
+values.
+
+ColoredJacobian
+    - callable as jac(c, t, y, yd), e.g., as the Jacobian of a model without
+      an analytical one (FD_JAC_ON)
+
+JacVec
+    - matrix-free Jacobian-vector products, e.g., for the Krylov linear
+      solvers of a model without an analytical Jacobian
+
+check_jac
+    - compares the analytical jac of a model to the colored (central
+      difference) Jacobian, and returns the largest relative error of each
+      state block (see log_check)
+"""
+import time
+
+import numpy
+import scipy.sparse
+
+import solverstats
+from telemetry import logger
+
+# Relative perturbation of the states, sqrt of the machine precision
+EPS = numpy.sqrt(numpy.finfo(float).eps)
+
+# Perturbation floor, for the states near zero
+Y_FLOOR = 1e-3
+
+# Rows with more nonzeros than this fraction of the states are dense
+DENSE_FRAC = 0.5
+
+
+def probe_pattern(res, t, y, yd, eps=1e-6, jitter=1e-3):
+    """
+    Sparsity pattern (n x n bool array) of the Jacobian of res(t, y, yd),
+    from one perturbation of each state (n residual evaluations). The time
+    derivative dependence is taken as the diagonal.
+    The pattern is probed at states jittered from y (by the relative
+    jitter), so that couplings which vanish at y (e.g., at rest, with zero
+    overpotentials and gradients) are found.
+    """
+    n = len(y)
+    rand = numpy.random.RandomState(0)
+    y_b = numpy.array(y, dtype='d')
+    y_b += jitter * numpy.maximum(abs(y_b), Y_FLOOR) * rand.uniform(-1., 1., n)
+    r0 = res(t, y_b, yd)
+
+    pattern = numpy.eye(n, dtype=bool)
+    y_p = y_b.copy()
+    for k in range(n):
+        h = eps * max(abs(y_b[k]), Y_FLOOR)
+        y_p[k] = y_b[k] + h
+        pattern[:, k] |= res(t, y_p, yd) != r0
+        y_p[k] = y_b[k]
+
+    return pattern
+
+
+def save_lagged(mod):
+    """
+    Present values of the lagged attributes (lagged_attrs) of the model
+    residual.
+    """
+    return [(name, getattr(mod, name))
+            for name in getattr(mod, 'lagged_attrs', [])]
+
+
+def restore_lagged(mod, lagged):
+    """
+    Restore the lagged attributes of the model (from save_lagged).
+    """
+    for name, val in lagged:
+        setattr(mod, name, val)
+
+
+def dense_rows(pattern, dense_frac=DENSE_FRAC):
+    """
+    Rows of the pattern with more than dense_frac*n nonzeros.
+    """
+    n = pattern.shape[1]
+    return numpy.nonzero(pattern.sum(axis=1) > dense_frac * n)[0]
+
+
+def color_columns(pattern, dense=()):
+    """
+    Greedy coloring of the columns of the sparsity pattern, such that the
+    columns of each color have no nonzero in the same row (apart from the
+    dense rows). The columns are colored in order of the number of
+    nonzeros, largest first, and the diagonal columns of the dense rows are
+    each given a color of their own.
+    Returns the color of each column, and the number of colors.
+    """
+    n = pattern.shape[1]
+
+    sparse_pat = numpy.array(pattern, dtype=bool)
+    sparse_pat[list(dense), :] = False
+    S_c = scipy.sparse.csc_matrix(sparse_pat)
+    S_r = scipy.sparse.csr_matrix(sparse_pat)
+
+    colors = -numpy.ones(n, dtype=int)
+    order = numpy.argsort(-numpy.diff(S_c.indptr), kind='mergesort')
+    own = set(dense)
+    for k in order:
+        if k in own:
+            continue
+        rows = S_c.indices[S_c.indptr[k]:S_c.indptr[k + 1]]
+        nbrs = numpy.concatenate(
+            [S_r.indices[S_r.indptr[i]:S_r.indptr[i + 1]] for i in rows]
+            + [numpy.zeros(0, dtype=int)])
+        used = set(colors[nbrs])
+        color = 0
+        while color in used:
+            color += 1
+        colors[k] = color
+
+    num_colors = colors.max() + 1
+    for k in sorted(own):
+        colors[k] = num_colors
+        num_colors += 1
+
+    return colors, num_colors
+
+
+class ColoredJacobian():
+    """
+    Colored finite difference Jacobian of the model mod (with a res(t, y, yd)
+    method). The sparsity pattern is mod.jac_pattern(), if mod has one, else
+    it is probed at the states of the first call (probe_pattern). The dense
+    row fraction is mod.jac_dense_frac, if mod has one, else DENSE_FRAC.
+    """
+    def __init__(self, mod, pattern=None, dense_frac=None):
+        self.mod = mod
+        if dense_frac is None:
+            dense_frac = getattr(mod, 'jac_dense_frac', DENSE_FRAC)
+        self.dense_frac = dense_frac
+
+        self.colors = None
+        if pattern is None and hasattr(mod, 'jac_pattern'):
+            pattern = mod.jac_pattern()
+        if pattern is not None:
+            self.set_pattern(pattern)
+
+    def set_pattern(self, pattern):
+        """
+        Set the sparsity pattern, and color its columns.
+        """
+        self.pattern = numpy.array(pattern, dtype=bool)
+
+        self.dense = dense_rows(self.pattern, self.dense_frac)
+        self.colors, self.num_colors = color_columns(self.pattern,
+                                                     self.dense)
+
+        # Pattern entries that are spread back from the color differences,
+        # i.e., all but the off-diagonal entries of the dense rows
+        sparse_pat = self.pattern.copy()
+        sparse_pat[self.dense, :] = False
+        sparse_pat[self.dense, self.dense] = True
+        self.rows, self.cols = numpy.nonzero(sparse_pat)
+
+        logger.debug('Colored FD Jacobian: %d states, %d colors, '
+                     '%d dense rows' % (len(self.colors), self.num_colors,
+                                        len(self.dense)))
+
+    def probe(self, t, y, yd):
+        """
+        Probe the sparsity pattern of the model at (t, y, yd).
+        """
+        lagged = save_lagged(self.mod)
+
+        def res(t, y, yd):
+            restore_lagged(self.mod, lagged)
+            return self.mod.res(t, y, yd)
+
+        pattern = probe_pattern(res, t, y, yd)
+        restore_lagged(self.mod, lagged)
+
+        return pattern
+
+    def steps(self, y):
+        """
+        Perturbation of each state.
+        """
+        return EPS * numpy.maximum(abs(y), Y_FLOOR)
+
+    def compressed(self, c, t, y, yd, central=False):
+        """
+        Residual differences along the perturbation of each color, as an
+        (n x num_colors) array, divided by 1 (forward) or 2 (central)
+        perturbations. The model is left at the residual of (t, y, yd), with
+        the lagged values of the call.
+        """
+        y = numpy.array(y, dtype='d')
+        yd = numpy.array(yd, dtype='d')
+        h = self.steps(y)
+
+        if self.colors is None:
+            self.set_pattern(self.probe(t, y, yd))
+
+        lagged = save_lagged(self.mod)
+
+        diffs = numpy.zeros((len(y), self.num_colors))
+        for color in range(self.num_colors):
+            d = numpy.where(self.colors == color, h, 0.0)
+
+            restore_lagged(self.mod, lagged)
+            diffs[:, color] = self.mod.res(t, y + d, yd + c * d)
+            if central:
+                restore_lagged(self.mod, lagged)
+                diffs[:, color] -= self.mod.res(t, y - d, yd - c * d)
+                diffs[:, color] *= 0.5
+
+        # The base residual last, so the model is left at (t, y, yd), with
+        # the lagged values as before
+        restore_lagged(self.mod, lagged)
+        r0 = self.mod.res(t, y, yd)
+        restore_lagged(self.mod, lagged)
+        if not central:
+            diffs -= r0[:, numpy.newaxis]
+
+        return diffs, h
+
+    def expand(self, diffs, h):
+        """
+        Jacobian (dense array) of the color differences.
+        """
+        n = len(h)
+        J = numpy.zeros((n, n))
+        J[self.rows, self.cols] = \
+            diffs[self.rows, self.colors[self.cols]] / h[self.cols]
+
+        return J
+
+    def __call__(self, c, t, y, yd):
+        """
+        Jacobian, dF/dy + c*dF/dyd, at (t, y, yd).
+        """
+        t_start = time.time()
+
+        J = self.expand(*self.compressed(c, t, y, yd))
+
+        if hasattr(self.mod, 'stats'):
+            solverstats.count_call(self.mod.stats, 'jac', t_start)
+        return J
+
+
+class JacVec():
+    """
+    Finite difference Jacobian-vector products of the model mod, for the
+    Krylov linear solvers, J*v = (res(t, y + s*v, yd + c*s*v) - res(t, y,
+    yd))/s, with s such that no state is perturbed by more than its
+    ColoredJacobian step.
+    The base residual is evaluated (at the lagged values of the call) once
+    for each point (c, t, y, yd), and reused for the following products at
+    the same point, i.e., over the iterations of a linear solve.
+    """
+    def __init__(self, mod):
+        self.mod = mod
+        self.point = None
+
+    def at_point(self, c, t, y, yd):
+        """
+        Lagged values and base residual of the point (c, t, y, yd).
+        """
+        pt = self.point
+        if pt is None or pt[0] != c or pt[1] != t \
+                or not numpy.array_equal(pt[2], y) \
+                or not numpy.array_equal(pt[3], yd):
+            lagged = save_lagged(self.mod)
+            r0 = self.mod.res(t, y, yd)
+            restore_lagged(self.mod, lagged)
+            pt = (c, t, numpy.array(y), numpy.array(yd), lagged, r0)
+            self.point = pt
+
+        return pt[4], pt[5]
+
+    def __call__(self, c, t, y, yd, v):
+        """
+        Product of the Jacobian, dF/dy + c*dF/dyd, at (t, y, yd), and v.
+        """
+        y = numpy.asarray(y, dtype='d')
+        yd = numpy.asarray(yd, dtype='d')
+        v = numpy.asarray(v, dtype='d')
+
+        v_max = numpy.amax(abs(v) / numpy.maximum(abs(y), Y_FLOOR))
+        if v_max == 0.0:
+            return numpy.zeros(len(v))
+
+        lagged, r0 = self.at_point(c, t, y, yd)
+
+        s = EPS / v_max
+        restore_lagged(self.mod, lagged)
+        r = self.mod.res(t, y + s * v, yd + (c * s) * v)
+        restore_lagged(self.mod, lagged)
+
+        return (r - r0) / s
+
+
+def check_jac(mod, t, y, yd, c=1.0, fd_jac=None, blocks=None):
+    """
+    Compare the analytical Jacobian of mod, mod.jac(c, t, y, yd), to the
+    colored central difference Jacobian, fd_jac (a ColoredJacobian of mod).
+
+    The errors are relative to the largest finite difference entry of each
+    row. The dense rows are compared along the perturbation of each color
+    (i.e., their sum over each color), rather than by entry. The entries of
+    the analytical Jacobian outside of the pattern are compared to zero.
+
+    Returns a list of (row block, max error, column block of the max error)
+    for the state blocks, a list of (name, inds) (mod.state_blocks() by
+    default). The column block is 'dense' for a dense row.
+    """
+    if fd_jac is None:
+        fd_jac = ColoredJacobian(mod)
+    if blocks is None:
+        blocks = mod.state_blocks()
+
+    diffs, h = fd_jac.compressed(c, t, y, yd, central=True)
+    J_fd = fd_jac.expand(diffs, h)
+    J = numpy.array(mod.jac(c, t, y, yd))
+
+    scale = abs(J_fd).max(axis=1)
+    scale[scale == 0.0] = 1.0
+    err = abs(J - J_fd) / scale[:, numpy.newaxis]
+
+    # Dense rows, along the color perturbations
+    dense = fd_jac.dense
+    err[dense, :] = 0.0
+    if len(dense):
+        D = numpy.zeros((len(h), fd_jac.num_colors))
+        D[numpy.arange(len(h)), fd_jac.colors] = h
+        err_d = abs(J[dense, :].dot(D) - diffs[dense, :])
+        err_d /= numpy.maximum(abs(diffs[dense, :]).max(axis=1),
+                               1e-300)[:, numpy.newaxis]
+
+    block_of = numpy.zeros(len(h), dtype=int)
+    for ib, (name, inds) in enumerate(blocks):
+        block_of[inds] = ib
+
+    report = []
+    for name, inds in blocks:
+        err_b = err[inds, :]
+        k = numpy.argmax(err_b.max(axis=0))
+        max_err, col_block = err_b[:, k].max(), blocks[block_of[k]][0]
+
+        for ir, i in enumerate(dense):
+            if i in inds and err_d[ir].max() > max_err:
+                max_err, col_block = err_d[ir].max(), 'dense'
+
+        report.append((name, float(max_err), col_block))
+
+    return report
+
+
+def log_check(report, title=''):
+    """
+    Log a check_jac report, at the info level.
+    """
+    lines = ['Jacobian check ' + title,
+             '%-8s %12s   %s' % ('rows', 'max rel err', 'at cols')]
+    for name, max_err, col_block in report:
+        lines.append('%-8s %12.3e   %s' % (name, max_err, col_block))
+    logger.info('\n'.join(lines))
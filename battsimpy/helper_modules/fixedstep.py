@@ -0,0 +1,701 @@
+# -*- coding:utf-8 -*-
+"""Fixed-step implicit time integration of the DAE models.
+
+An alternative engine to the Assimulo IDA solver (TIME_STEP in the
+TIMESTEPPING conf section), for models of the form res(t, y, yd) = 0 with an
+analytical Jacobian, jac(c, t, y, yd) = dres/dy + c*dres/dyd, e.g., FULL_1D.
+The differential residuals must be of the form yd - f(y), and the algebraic
+residuals (algvar == 0) must not depend on yd.
+
+The methods are:
+    CN   : Crank-Nicolson (trapezoidal rule) for the differential states,
+           with the algebraic equations solved at the end of each step
+    BDF2 : variable-step, second order backward differentiation formula,
+           started with a backward Euler step after each (re)initialization
+    SPLIT: operator-splitting backward Euler (SplitStepSolver), with the
+           solid diffusion of all particles solved as a batch of tridiagonal
+           systems, apart from the Newton solve of the rest of the states
+
+Each step is solved with a modified Newton method. The Jacobian is factorized
+as a sparse matrix (scipy.sparse.linalg.splu), and the factorization is
+reused over the Newton iterations and the following steps, until the Newton
+convergence slows down or the step size changes too much (as done in IDA).
+With the 'SCHUR' linear solver (CN/BDF2 only, see SchurLU), the solid
+diffusion states are condensed out of the Newton linear systems, and only the
+Schur complement on the rest of the states is factorized. The blocks of the
+Jacobian are taken from the model in sparse form (schur_blocks), so the full
+Jacobian is not formed. IDA does not use this option.
+With the 'GMRES' linear solver (see KrylovSolver), the Newton linear systems
+are solved by preconditioned GMRES, with the Jacobian-vector products of the
+model (jacv), and only the physics-block preconditioner of the model
+(prec_mat) is factorized, and reused as the Jacobian factorization above.
+As the GMRES solves are inexact, the Newton iterates are then only accepted
+once the residual is within the tolerance as well.
+No local error control is used: each simulate() interval is split into equal
+steps of at most h_max (one step per interval if h_max is None), so the
+output interval control of the Simulator, or h_max, sets the accuracy.
+
+FixedStepSolver provides the parts of the Assimulo IDA interface used by the
+Simulators (t, y, yd, atol, rtol, statistics, simulate, make_consistent and
+re_init), so either engine may be used by the same time loop. The failures
+are raised as FixedStepError, with an IDA return flag (see
+stepcontrol.IDA_FLAGS).
+"""
+import math
+
+import numpy
+import scipy.linalg
+import scipy.sparse
+import scipy.sparse.linalg
+
+import batteqns
+
+METHODS = ['CN', 'BDF2']
+LINEAR_SOLVERS = ['LU', 'SCHUR', 'GMRES']
+
+# Newton convergence test, on the weighted RMS norm of the Newton update
+NEWTON_TOL = 0.1
+MAX_NEWTON_ITERS = 4
+# Convergence rate above which the Newton iterations are stopped as diverging,
+# and above which the Jacobian is refactorized for the next step
+DIVERGE_RATE = 0.9
+SLOW_RATE = 0.5
+
+# Range of the ratio of the present to the factorized c (the dres/dyd
+# coefficient), over which the factorization is reused
+CJ_RATIO_LIMS = (0.6, 1.67)
+
+# Step halvings of a failed step, before the failure is raised
+MAX_STEP_HALVINGS = 4
+
+# GMRES relative tolerance (of the Newton residual), restart length and max
+# iterations
+KRYLOV_TOL = 0.05
+KRYLOV_RESTART = 20
+KRYLOV_MAX_ITERS = 40
+
+
+class FixedStepError(Exception):
+    """
+    Failure of the fixed-step time integration, with the IDA return flag,
+    value, at the time t.
+    """
+    def __init__(self, value, t=0.0):
+        self.value = value
+        self.t = t
+
+    def __str__(self):
+        return 'Fixed step time integration failure (flag %d) at t=%g' \
+            % (self.value, self.t)
+
+
+class FixedStepSolver():
+    """
+    Fixed-step Crank-Nicolson/BDF2 solver of the problem (an Assimulo
+    Implicit_Problem, with res, jac, algvar and the initial t0, y0, yd0).
+
+    method        : 'CN' or 'BDF2'
+    h_max         : max time step [s] (None for one step per simulate()
+                    interval)
+    linear_solver : 'LU' (sparse LU of the full Jacobian), 'SCHUR' (static
+                    condensation of the solid diffusion states, see SchurLU)
+                    or 'GMRES' (preconditioned Krylov solves, see
+                    KrylovSolver)
+    """
+    def __init__(self, problem, method='BDF2', h_max=None, linear_solver='LU'):
+        self.problem = problem
+
+        self.method = method.upper()
+        if self.method not in METHODS:
+            raise ValueError('Unknown fixed step method: ' + method)
+        self.h_max = h_max
+
+        self.linear_solver = linear_solver.upper()
+        if self.linear_solver not in LINEAR_SOLVERS:
+            raise ValueError('Unknown linear solver: ' + linear_solver)
+        if self.linear_solver == 'SCHUR':
+            if not hasattr(problem, 'schur_blocks'):
+                raise ValueError('The SCHUR linear solver requires a model '
+                                 'with schur_blocks.')
+            self.schur = SchurLU(problem.particle_blocks())
+        elif self.linear_solver == 'GMRES':
+            self.krylov = KrylovSolver(problem)
+
+        self.atol = 1e-6
+        self.rtol = 1e-6
+
+        # Assimulo IDA options, not used here
+        self.suppress_alg = True
+        self.display_progress = False
+        self.verbosity = 50
+        self.report_continuously = True
+        self.time_limit = 0.
+
+        self.statistics = {'nsteps': 0, 'nfcns': 0, 'njacs': 0,
+                           'nniters': 0, 'nnfails': 0, 'nerrfails': 0,
+                           'nliters': 0, 'npevals': 0}
+
+        self.alg = numpy.array(problem.algvar) == 0.0
+
+        # States solved for by the Newton iterations (None for all)
+        self.solve_inds = None
+
+        self.lu = None
+        self.re_init(getattr(problem, 't0', 0.0), problem.y0, problem.yd0)
+
+    def re_init(self, t0, y0, yd0):
+        """
+        Re-initialize the solver at t0, with the states y0 and yd0.
+        """
+        self.t = t0
+        self.y = numpy.array(y0, dtype='d')
+        self.yd = numpy.array(yd0, dtype='d')
+
+        # BDF2 history
+        self.y_prev = None
+        self.h_prev = None
+
+        self.lu = None
+
+    def make_consistent(self, flag='IDA_YA_YDP_INIT'):
+        """
+        Compute the consistent algebraic states and differential state time
+        derivatives, with the differential states held fixed (only the
+        'IDA_YA_YDP_INIT' option of IDA).
+        """
+        tol = 1e-3 * min(numpy.amin(self.atol), self.rtol)
+        diff_inds = numpy.where(~self.alg)[0]
+        alg_inds = numpy.where(self.alg)[0]
+
+        y, yd, converged = batteqns.consistent_alg_states(
+            self.problem.res, self.jac_func(), self.t, self.y, self.yd,
+            alg_inds, diff_inds, rtol=tol, atol=tol)
+        if not converged:
+            raise FixedStepError(-12, self.t)
+
+        self.re_init(self.t, y, yd)
+
+    def jac_func(self):
+        """
+        Jacobian function of the problem: the sparse jac_sparse, if the
+        problem has it, so the dense Jacobian is not formed, else jac.
+        """
+        return getattr(self.problem, 'jac_sparse', self.problem.jac)
+
+    def simulate(self, tfinal, ncp=0):
+        """
+        Integrate to tfinal. Returns the time, y and yd of each step, from the
+        present time.
+        """
+        for key in self.statistics:
+            self.statistics[key] = 0
+
+        t_out, y_out, yd_out = [self.t], [self.y], [self.yd]
+
+        n_steps = 1
+        if self.h_max is not None:
+            n_steps = max(int(math.ceil((tfinal - self.t) / self.h_max
+                                        - 1e-9)), 1)
+        h = (tfinal - self.t) / n_steps
+
+        n_halve = 0
+        while self.t < tfinal:
+            if tfinal - self.t <= h * (1.0 + 1e-9):
+                h = tfinal - self.t
+                t1 = tfinal
+            else:
+                t1 = self.t + h
+
+            if self.step(t1, h):
+                t_out.append(self.t)
+                y_out.append(self.y)
+                yd_out.append(self.yd)
+            else:
+                n_halve += 1
+                if n_halve > MAX_STEP_HALVINGS:
+                    raise FixedStepError(-4, self.t)
+                h = 0.5 * h
+
+        return t_out, numpy.array(y_out), numpy.array(yd_out)
+
+    def coeffs(self, h):
+        """
+        Coefficients of yd = c*y + b at the end of a step of h, for the
+        present method and history.
+        """
+        if self.method == 'CN':
+            c = 2.0 / h
+            b = -c * self.y - self.yd
+        elif self.y_prev is None:
+            # Backward Euler start of BDF2
+            c = 1.0 / h
+            b = -c * self.y
+        else:
+            w = h / self.h_prev
+            c = (1.0 + 2.0 * w) / ((1.0 + w) * h)
+            b = (-(1.0 + w) * self.y + w**2 / (1.0 + w) * self.y_prev) / h
+
+        return c, b
+
+    def factorize(self, c, t, y, yd):
+        """
+        Sparse LU factorization of the Jacobian, jac(c, t, y, yd), or of its
+        block of the solve_inds states (of its blocks, schur_blocks, for
+        SCHUR, and of the preconditioner, for GMRES).
+        """
+        if self.linear_solver == 'GMRES':
+            try:
+                self.lu = self.krylov.factorize(c, t, y, yd)
+            except (RuntimeError, numpy.linalg.LinAlgError):
+                self.lu = None
+                raise FixedStepError(-6, t)
+            self.statistics['npevals'] += 1
+            self.c_lu = c
+            self.slow = 0
+            return
+
+        J = self.jac_block(c, t, y, yd)
+        self.statistics['njacs'] += 1
+        try:
+            if self.linear_solver == 'SCHUR':
+                self.lu = self.schur.factorize(J)
+            else:
+                self.lu = scipy.sparse.linalg.splu(
+                    scipy.sparse.csc_matrix(J))
+        except (RuntimeError, numpy.linalg.LinAlgError):
+            self.lu = None
+            raise FixedStepError(-6, t)
+        self.c_lu = c
+        self.slow = 0
+
+    def jac_block(self, c, t, y, yd):
+        """
+        Jacobian at (c, t, y, yd) of the states solved for: the blocks of
+        schur_blocks for SCHUR, else the sparse jac_sparse of the model (or
+        jac, for a model without it), or its block of the solve_inds
+        states.
+        """
+        if self.linear_solver == 'SCHUR':
+            return self.problem.schur_blocks(c, t, y, yd)
+
+        J = self.jac_func()(c, t, y, yd)
+        if self.solve_inds is not None:
+            J = J[self.solve_inds][:, self.solve_inds]
+
+        return J
+
+    def step(self, t1, h):
+        """
+        Take a step of h to t1. Returns 0, and leaves the solver as is, if the
+        Newton iterations do not converge.
+        """
+        c, b = self.coeffs(h)
+
+        y = self.solve(t1, self.y + h * self.yd, c, b)
+        if y is None:
+            return 0
+
+        self.accept(t1, h, y, c * y + b)
+
+        return 1
+
+    def accept(self, t1, h, y, yd):
+        """
+        Accept the step of h to t1, with the states y and yd.
+        """
+        # Backward difference for the algebraic state derivatives, which are
+        # not used by the residuals (and would ring with CN)
+        yd[self.alg] = (y[self.alg] - self.y[self.alg]) / h
+
+        self.y_prev, self.h_prev = self.y, h
+        self.t, self.y, self.yd = t1, y, yd
+        self.statistics['nsteps'] += 1
+
+    def solve(self, t1, y_pred, c, b):
+        """
+        Solve for y at t1, with yd = c*y + b, from the predicted y_pred.
+        The factorization is reused, if still valid, else (or if the Newton
+        iterations do not converge with it) refactorized. Returns None if the
+        Newton iterations do not converge.
+        """
+        fresh = 0
+        while True:
+            if self.lu is None or self.slow or fresh or not (
+                    CJ_RATIO_LIMS[0] < c / self.c_lu < CJ_RATIO_LIMS[1]):
+                self.factorize(c, t1, y_pred, c * y_pred + b)
+                fresh = 1
+
+            y = self.newton(t1, y_pred, c, b)
+            if y is not None:
+                return y
+
+            self.statistics['nnfails'] += 1
+            if fresh:
+                return None
+            fresh = 1
+
+    def newton(self, t1, y, c, b):
+        """
+        Modified Newton iterations for y at t1, with yd = c*y + b, and the
+        present factorization. Only the solve_inds states are updated, if
+        set. Returns None if these do not converge.
+        The iterations converge on the norm of the Newton update, and for the
+        (inexact) GMRES solves, on the norm of the preconditioned residual of
+        the converged iterate as well.
+        """
+        inds = self.solve_inds
+        if inds is None:
+            inds = slice(None)
+        y = numpy.array(y, dtype='d')
+
+        # Step length damping for a factorization at a different c (the
+        # Krylov solves are with the Jacobian at the present c)
+        damp = 2.0 / (1.0 + c / self.c_lu)
+        krylov = self.linear_solver == 'GMRES'
+        if krylov:
+            damp = 1.0
+
+        atol = self.atol
+        if not numpy.isscalar(atol):
+            atol = numpy.asarray(atol)[inds]
+
+        norm_last = None
+        converged = 0
+        for it in range(MAX_NEWTON_ITERS + 1):
+            if it == MAX_NEWTON_ITERS and not converged:
+                return None
+
+            r = self.problem.res(t1, y, c * y + b)[inds]
+            self.statistics['nfcns'] += 1
+            if not numpy.all(numpy.isfinite(r)):
+                return None
+
+            # The Krylov solves are inexact, so a converged iterate is only
+            # accepted if its residual is within the tolerance as well, as
+            # the Newton update of the preconditioner
+            if converged:
+                if self.wnorm(self.lu.prec_solve(r), y[inds], atol) \
+                        < NEWTON_TOL:
+                    return y
+                if it == MAX_NEWTON_ITERS:
+                    return None
+                converged = 0
+
+            if krylov:
+                self.lu.set_point(c, t1, y, c * y + b)
+                dy = self.lu.solve(r)
+                self.statistics['nliters'] += self.lu.iters
+                if dy is None:
+                    return None
+                dy = -dy
+            else:
+                dy = -damp * self.lu.solve(r)
+            self.statistics['nniters'] += 1
+            y[inds] += dy
+
+            norm = self.wnorm(dy, y[inds], atol)
+
+            if norm_last is not None:
+                rate = norm / norm_last
+                if rate > DIVERGE_RATE:
+                    return None
+                self.slow = rate > SLOW_RATE
+                converged = rate / (1.0 - rate) * norm < NEWTON_TOL
+            converged = converged or norm < NEWTON_TOL
+            if converged and not krylov:
+                return y
+
+            norm_last = norm
+
+        return None
+
+    def wnorm(self, dy, y, atol):
+        """
+        Weighted RMS norm of the update dy of the states y, for the
+        tolerances (with atol of the same states).
+        """
+        wt = atol + self.rtol * abs(y)
+
+        return numpy.sqrt(numpy.mean((dy / wt)**2))
+
+
+class SchurLU():
+    """
+    Static condensation of the solid diffusion states in the Newton linear
+    systems, J*dy = r, for the solid diffusion blocks of the model
+    (particle_blocks(), as (cs_inds, j_inds, A_cs, B_cs) for each electrode).
+
+    With P the particle (cs) states and R the rest of the states:
+        J = [J_PP  J_PR]
+            [J_RP  J_RR]
+    J_PP is block diagonal, with one tridiagonal block per particle, and each
+    particle couples to R only through the pore wall flux, j, of its node
+    (J_PR). factorize() takes these blocks from the model (schur_blocks(),
+    see FULL_1D), without forming J, forms X = J_PP^-1*J_PR with one banded
+    solve over all particles, since the columns of X do not overlap, and
+    factorizes the Schur complement, S = J_RR - J_RP*X, which is of the size
+    of R only. solve() then takes two banded solves and one solve with S:
+        w    = J_PP^-1*r_P
+        dy_R = S^-1*(r_R - J_RP*w)
+        dy_P = w - X*dy_R
+    """
+    def __init__(self, blocks):
+        cs_list, jcol_list = [], []
+        for cs_inds, j_inds, A_cs, B_cs in blocks:
+            n_r = len(cs_inds) // len(j_inds)
+            owner = numpy.arange(len(cs_inds)) // n_r
+
+            # Particles must not couple to each other, or to the j of
+            # another node
+            bnd = numpy.arange(n_r, len(cs_inds), n_r)
+            if numpy.any(numpy.triu(A_cs, 2)) or \
+                    numpy.any(numpy.tril(A_cs, -2)) or \
+                    numpy.any(A_cs[bnd - 1, bnd]) or \
+                    numpy.any(A_cs[bnd, bnd - 1]) or \
+                    numpy.any(B_cs * (owner[:, None]
+                                      != numpy.arange(len(j_inds)))):
+                raise ValueError('Schur condensation requires tridiagonal '
+                                 'and independent particle diffusion '
+                                 'blocks.')
+
+            cs_list.append(numpy.asarray(cs_inds))
+            jcol_list.append(numpy.asarray(j_inds)[owner])
+
+        self.cs_inds = numpy.concatenate(cs_list)
+        self.j_cols = numpy.concatenate(jcol_list)
+
+        self.n = None
+
+    def setup(self, n):
+        """
+        Index sets of the R states, for a system of size n.
+        """
+        self.n = n
+        self.rest_inds = numpy.setdiff1d(numpy.arange(n), self.cs_inds)
+        # Position of the j of each particle state in R
+        self.j_pos = numpy.searchsorted(self.rest_inds, self.j_cols)
+
+    def factorize(self, blocks):
+        """
+        Factorize the Jacobian of the blocks (cs_tri, J_PR, J_RP, J_RR), the
+        diagonals of J_PP and the sparse other blocks (see
+        FULL_1D.schur_blocks). Returns self, as the solver.
+        """
+        cs_tri, J_PR, J_RP, J_RR = blocks
+        n_p = len(self.cs_inds)
+        if self.n != n_p + J_RR.shape[0]:
+            self.setup(n_p + J_RR.shape[0])
+
+        # Banded form of J_PP
+        self.ab = numpy.zeros((3, n_p))
+        self.ab[0, 1:] = cs_tri[2]
+        self.ab[1, :] = cs_tri[1]
+        self.ab[2, :-1] = cs_tri[0]
+
+        J_Pj = numpy.asarray(scipy.sparse.csr_matrix(J_PR)[
+            numpy.arange(n_p), self.j_pos]).ravel()
+        z = scipy.linalg.solve_banded((1, 1), self.ab, J_Pj)
+        self.X = scipy.sparse.csr_matrix(
+            (z, (numpy.arange(n_p), self.j_pos)), shape=(n_p, J_RR.shape[0]))
+        self.J_RP = scipy.sparse.csr_matrix(J_RP)
+
+        S = scipy.sparse.csc_matrix(J_RR) - (self.J_RP * self.X).tocsc()
+        self.lu_S = scipy.sparse.linalg.splu(S)
+
+        return self
+
+    def solve(self, r):
+        """
+        Solve J*dy = r with the condensed factorization.
+        """
+        P, R = self.cs_inds, self.rest_inds
+
+        w = scipy.linalg.solve_banded((1, 1), self.ab, r[P])
+        dy = numpy.empty(len(r))
+        dy[R] = self.lu_S.solve(r[R] - self.J_RP.dot(w))
+        dy[P] = w - self.X.dot(dy[R])
+
+        return dy
+
+
+class KrylovSolver():
+    """
+    Preconditioned GMRES solves of the Newton linear systems, J*dy = r, for
+    a problem with the methods:
+        jacv(t, y, yd, res, v, c): product of the Jacobian at (c, t, y, yd)
+                                   and v (as for the Assimulo IDA SPGMR
+                                   solver), e.g., with the sparse analytical
+                                   Jacobian of FULL_1D
+        prec_mat(c, t, y, yd)    : a sparse approximation of the Jacobian,
+                                   e.g., of its block structure
+    The products are always with the Jacobian at the present Newton iterate
+    (set_point), while the sparse LU factorization of the preconditioner
+    (factorize) is reused over many Newton iterations and steps, as the
+    factorization of the Jacobian of the direct solvers.
+    """
+    def __init__(self, problem):
+        if not (hasattr(problem, 'jacv') and hasattr(problem, 'prec_mat')):
+            raise ValueError('The GMRES linear solver requires a model with '
+                             'jacv and prec_mat.')
+        self.problem = problem
+        self.point = None
+        self.iters = 0
+
+    def factorize(self, c, t, y, yd):
+        """
+        Factorize the preconditioner at (c, t, y, yd). Returns self, as the
+        solver.
+        """
+        P = scipy.sparse.csc_matrix(self.problem.prec_mat(c, t, y, yd))
+        self.lu_P = scipy.sparse.linalg.splu(P)
+        n = P.shape[0]
+        self.M = scipy.sparse.linalg.LinearOperator(
+            (n, n), matvec=self.lu_P.solve, dtype='d')
+
+        return self
+
+    def prec_solve(self, r):
+        """
+        Solve P*dy = r with the preconditioner factorization.
+        """
+        return self.lu_P.solve(r)
+
+    def set_point(self, c, t, y, yd):
+        """
+        Point of the Jacobian of the products.
+        """
+        self.point = (c, t, numpy.array(y), numpy.array(yd))
+
+    def solve(self, r):
+        """
+        Solve J*dy = r, to the relative tolerance KRYLOV_TOL. Returns None if
+        GMRES does not converge.
+        """
+        c, t, y, yd = self.point
+        n = len(r)
+        J = scipy.sparse.linalg.LinearOperator(
+            (n, n), matvec=lambda v: self.problem.jacv(t, y, yd, None, v, c),
+            dtype='d')
+
+        self.iters = 0
+
+        def count(rk):
+            self.iters += 1
+
+        dy, info = scipy.sparse.linalg.gmres(
+            J, r, tol=KRYLOV_TOL, atol=0.0, restart=KRYLOV_RESTART,
+            maxiter=KRYLOV_MAX_ITERS, M=self.M, callback=count)
+        if info != 0 or not numpy.all(numpy.isfinite(dy)):
+            return None
+
+        return dy
+
+
+class SplitStepSolver(FixedStepSolver):
+    """
+    Operator-splitting, backward Euler solver, for models with solid
+    diffusion blocks (problem.particle_blocks(), see FULL_1D).
+
+    Each step is split into:
+        1) the particle diffusion, cs' = A_cs*cs + B_cs*j, with the pore wall
+           flux, j, of the start of the step. The particles of an electrode
+           are a block diagonal set of independent tridiagonal systems, which
+           are solved all at once, as one banded system.
+        2) a Newton solve of the rest of the states (electrolyte, potentials,
+           kinetics, temperature and input control), with the particle states
+           held fixed. Only this (much smaller) block of the Jacobian is
+           assembled, in sparse form (schur_blocks of the model), and
+           factorized.
+        3) a correction of the particle diffusion, with j of the end of the
+           step, so the particle states are consistent with the new fluxes.
+    Steps 2) and 3) are repeated up to split_iters times, until the particle
+    correction is within the tolerances.
+
+    h_max       : max time step [s] (None for one step per simulate()
+                  interval)
+    split_iters : max number of the 2)-3) iterations
+    """
+    def __init__(self, problem, h_max=None, split_iters=2):
+        FixedStepSolver.__init__(self, problem, method='BDF2', h_max=h_max)
+        self.method = 'SPLIT'
+        self.split_iters = split_iters
+
+        cs_inds = numpy.concatenate(
+            [blk[0] for blk in problem.particle_blocks()])
+        self.solve_inds = numpy.setdiff1d(numpy.arange(len(self.y)),
+                                          cs_inds)
+
+        for blk in problem.particle_blocks():
+            A_cs = blk[2]
+            if numpy.any(numpy.triu(A_cs, 2)) or \
+                    numpy.any(numpy.tril(A_cs, -2)):
+                raise ValueError('Operator splitting requires tridiagonal '
+                                 'particle diffusion matrices.')
+
+    def jac_block(self, c, t, y, yd):
+        """
+        Block of the Jacobian of the non-particle (solve_inds) states, J_RR
+        of schur_blocks, without forming the Jacobian (or the block of jac,
+        for a model without schur_blocks).
+        """
+        if hasattr(self.problem, 'schur_blocks'):
+            return self.problem.schur_blocks(c, t, y, yd)[3]
+
+        return FixedStepSolver.jac_block(self, c, t, y, yd)
+
+    def coeffs(self, h):
+        """
+        Backward Euler coefficients of yd = c*y + b.
+        """
+        return 1.0 / h, -self.y / h
+
+    def particle_step(self, h, y):
+        """
+        Backward Euler particle diffusion states after a step of h from the
+        present states, with the pore wall fluxes of y. Sets these in y.
+        """
+        for cs_inds, j_inds, A_cs, B_cs in self.problem.particle_blocks():
+            # Banded form of I - h*A_cs
+            ab = numpy.zeros((3, len(cs_inds)))
+            ab[0, 1:] = -h * numpy.diagonal(A_cs, 1)
+            ab[1, :] = 1.0 - h * numpy.diagonal(A_cs)
+            ab[2, :-1] = -h * numpy.diagonal(A_cs, -1)
+
+            rhs = self.y[cs_inds] + h * B_cs.dot(y[j_inds])
+            y[cs_inds] = scipy.linalg.solve_banded((1, 1), ab, rhs)
+
+        return y
+
+    def step(self, t1, h):
+        """
+        Take a split step of h to t1. Returns 0, and leaves the solver as is,
+        if the Newton iterations do not converge.
+        """
+        c, b = self.coeffs(h)
+
+        # 1) Particle predictor, with the present fluxes
+        y = self.particle_step(h, self.y + h * self.yd)
+
+        cs_inds = numpy.setdiff1d(numpy.arange(len(y)), self.solve_inds)
+        atol = self.atol
+        if not numpy.isscalar(atol):
+            atol = numpy.asarray(atol)[cs_inds]
+
+        for it in range(self.split_iters):
+            # 2) Rest of the states, with the particle states held
+            y = self.solve(t1, y, c, b)
+            if y is None:
+                return 0
+
+            # 3) Particle correction, with the new fluxes
+            cs_last = y[cs_inds]
+            y = self.particle_step(h, y)
+
+            wt = atol + self.rtol * abs(y[cs_inds])
+            if numpy.sqrt(numpy.mean(((y[cs_inds] - cs_last) / wt)**2)) \
+                    < NEWTON_TOL:
+                break
+
+        self.accept(t1, h, y, c * y + b)
+
+        return 1
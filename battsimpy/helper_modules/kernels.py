@@ -0,0 +1,270 @@
+# -*- coding:utf-8 -*-
+"""Kernel backends of the model residual hot loops.
+
+The residual of the FULL_1D models spends most of its time in a few small
+loops: the FVM flux operators (batteqns.flux_diags) and the edge
+interpolation (batteqns.edge_interp) of the electrolyte, the per-particle
+loop of update_cs_mats (the edge concentrations and flux operator of each
+particle), and the Butler-Volmer kinetics. These are taken from one of two
+backends, selected by KERNEL_BACKEND (MODEL conf section, strings):
+    numpy : the reference implementations (batteqns, and NumPy array
+            expressions), the default
+    numba : the same kernels as explicit loops, compiled just-in-time with
+            numba.njit on their first call. The particle kernels handle all
+            of the particles of an electrode at once. If numba is not
+            installed, the numpy backend is used instead (with a warning).
+The numba kernels are the same expressions, in the same order, as the
+reference, so results agree to round-off (see check_kernels, and the
+benchmarks 'check' suite). The loop forms are also checked un-compiled
+(LoopKernels), so they are covered where numba is not installed.
+
+The flux operators are tridiagonal, and are returned as their (lower, main,
+upper) diagonals (see batteqns.tridiag_apply and tridiag_mat), on the mesh
+metrics (batteqns.MeshMetrics) of Params.
+
+Kernels (the methods of NumpyKernels, LoopKernels and NumbaKernels):
+    flux_diags(mesh, P, per_vol=1)
+    edge_interp(mesh, var_mid)
+    particle_edges(cs, cs_o, cs_ss, n_p, N)
+        - edge concentrations of each of the n_p particles of N shells, as
+          an n_p x (N+1) array: cs_o at the center, the mean of the
+          neighbouring shells inside, and cs_ss at the surface
+    particle_flux_diags(mesh, n_p, P)
+        - diagonals of the block diagonal flux operator of the n_p particles
+          of the radial mesh, with the edge values of the particles in the
+          rows of P
+    overpotential(phi_s, phi_e, Uref)
+    butler_volmer(C_io, b, eta)
+        - C_io*sinh(b*eta)
+"""
+import numpy
+
+import batteqns
+from telemetry import logger
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKENDS = ['numpy', 'numba']
+
+
+# Loop forms of the kernels, compiled by NumbaKernels. These follow the
+# expressions of the reference implementations term for term.
+def _flux_diags(inv_v, dx_m, P):
+    N = len(inv_v)
+    lo = numpy.empty(N - 1)
+    up = numpy.empty(N - 1)
+    d = numpy.zeros(N)
+    for i in range(N - 1):
+        lo[i] = inv_v[i + 1] * P[i + 1] / dx_m[i]
+        up[i] = inv_v[i] * P[i + 1] / dx_m[i]
+        d[i + 1] = d[i + 1] - lo[i]
+        d[i] = d[i] - up[i]
+
+    return lo, d, up
+
+
+def _edge_interp(w_e, var_mid):
+    n = len(var_mid)
+    var_edge = numpy.empty(n + 1)
+    var_edge[0] = var_mid[0]
+    for i in range(n - 1):
+        a = var_mid[i]
+        b = var_mid[i + 1]
+        var_edge[i + 1] = a * b / (w_e[i] * b + (1 - w_e[i]) * a)
+    var_edge[n] = var_mid[n - 1]
+
+    return var_edge
+
+
+def _particle_edges(cs, cs_o, cs_ss, n_p, N):
+    cs_e = numpy.empty((n_p, N + 1))
+    for k in range(n_p):
+        cs_e[k, 0] = cs_o[k]
+        for i in range(N - 1):
+            cs_e[k, i + 1] = 0.5 * (cs[k * N + i + 1] + cs[k * N + i])
+        cs_e[k, N] = cs_ss[k]
+
+    return cs_e
+
+
+def _particle_flux_diags(n_p, inv_v, dx_m, P):
+    N = len(inv_v)
+    lo = numpy.zeros(n_p * N - 1)
+    up = numpy.zeros(n_p * N - 1)
+    d = numpy.zeros(n_p * N)
+    for k in range(n_p):
+        o = k * N
+        for i in range(N - 1):
+            lo[o + i] = inv_v[i + 1] * P[k, i + 1] / dx_m[i]
+            up[o + i] = inv_v[i] * P[k, i + 1] / dx_m[i]
+            d[o + i + 1] = d[o + i + 1] - lo[o + i]
+            d[o + i] = d[o + i] - up[o + i]
+
+    return lo, d, up
+
+
+def _overpotential(phi_s, phi_e, Uref):
+    eta = numpy.empty(len(phi_s))
+    for i in range(len(phi_s)):
+        eta[i] = phi_s[i] - phi_e[i] - Uref[i]
+
+    return eta
+
+
+def _butler_volmer(C_io, b, eta):
+    j = numpy.empty(len(eta))
+    for i in range(len(eta)):
+        j[i] = C_io[i] * numpy.sinh(b * eta[i])
+
+    return j
+
+
+class NumpyKernels():
+    """
+    Reference (NumPy) kernels.
+    """
+    name = 'numpy'
+
+    def flux_diags(self, mesh, P, per_vol=1):
+        return batteqns.flux_diags(mesh, P, per_vol)
+
+    def edge_interp(self, mesh, var_mid):
+        return batteqns.edge_interp(mesh, var_mid)
+
+    def particle_edges(self, cs, cs_o, cs_ss, n_p, N):
+        cs_m = numpy.reshape(cs, (n_p, N))
+        return numpy.hstack([numpy.reshape(cs_o, (n_p, 1)),
+                             0.5 * (cs_m[:, 1:] + cs_m[:, :-1]),
+                             numpy.reshape(cs_ss, (n_p, 1))])
+
+    def particle_flux_diags(self, mesh, n_p, P):
+        return batteqns.tridiag_block_diag(batteqns.flux_diags(mesh, P))
+
+    def overpotential(self, phi_s, phi_e, Uref):
+        return phi_s - phi_e - Uref
+
+    def butler_volmer(self, C_io, b, eta):
+        return C_io * numpy.sinh(b * eta)
+
+
+class LoopKernels(NumpyKernels):
+    """
+    Loop form kernels, not compiled (the kernels of NumbaKernels, run by the
+    Python interpreter). These are slow, and are only used to check the loop
+    forms against the reference kernels where numba is not installed.
+    """
+    name = 'loops'
+
+    def __init__(self):
+        self.set_loops(lambda func: func)
+
+    def set_loops(self, jit):
+        """
+        Set the loop form kernel functions, as compiled by jit.
+        """
+        self.flux_diags_loop = jit(_flux_diags)
+        self.edge_interp_loop = jit(_edge_interp)
+        self.particle_edges_loop = jit(_particle_edges)
+        self.particle_flux_diags_loop = jit(_particle_flux_diags)
+        self.overpotential_loop = jit(_overpotential)
+        self.butler_volmer_loop = jit(_butler_volmer)
+
+    def flux_diags(self, mesh, P, per_vol=1):
+        inv_v = mesh.inv_vols if per_vol else mesh.ones
+        return self.flux_diags_loop(inv_v, mesh.dx_m,
+                                    numpy.asarray(P, dtype='d'))
+
+    def edge_interp(self, mesh, var_mid):
+        return self.edge_interp_loop(mesh.w_e,
+                                     numpy.asarray(var_mid, dtype='d'))
+
+    def particle_edges(self, cs, cs_o, cs_ss, n_p, N):
+        return self.particle_edges_loop(
+            numpy.asarray(cs, dtype='d'), numpy.asarray(cs_o, dtype='d'),
+            numpy.asarray(cs_ss, dtype='d'), int(n_p), int(N))
+
+    def particle_flux_diags(self, mesh, n_p, P):
+        return self.particle_flux_diags_loop(int(n_p), mesh.inv_vols,
+                                             mesh.dx_m,
+                                             numpy.asarray(P, dtype='d'))
+
+    def overpotential(self, phi_s, phi_e, Uref):
+        return self.overpotential_loop(numpy.asarray(phi_s, dtype='d'),
+                                       numpy.asarray(phi_e, dtype='d'),
+                                       numpy.asarray(Uref, dtype='d'))
+
+    def butler_volmer(self, C_io, b, eta):
+        return self.butler_volmer_loop(numpy.asarray(C_io, dtype='d'),
+                                       float(b),
+                                       numpy.asarray(eta, dtype='d'))
+
+
+class NumbaKernels(LoopKernels):
+    """
+    JIT-compiled (numba) kernels, the loop form kernels of LoopKernels
+    compiled with numba.njit.
+    """
+    name = 'numba'
+
+    def __init__(self):
+        self.set_loops(numba.njit(cache=True))
+
+
+def get_kernels(backend='numpy'):
+    """
+    Kernels of the backend ('numpy' or 'numba'). The numpy kernels are
+    returned for 'numba' if numba is not installed.
+    """
+    backend = backend.lower()
+    if backend not in BACKENDS:
+        raise ValueError('Unknown kernel backend: ' + backend)
+
+    if backend == 'numba':
+        if numba is not None:
+            return NumbaKernels()
+        logger.warning('numba is not installed, using the numpy kernels')
+
+    return NumpyKernels()
+
+
+def check_kernels(kern, n=40, n_p=8, seed=0):
+    """
+    Compare the kernels of kern to the reference (numpy) kernels, on random
+    inputs (n points, n_p particles). Returns a list of (kernel name, max
+    relative difference).
+    """
+    ref = NumpyKernels()
+    rs = numpy.random.RandomState(seed)
+
+    x_e = numpy.cumsum(rs.uniform(0.5, 1.5, n + 1))
+    mesh = batteqns.MeshMetrics(0.5 * (x_e[1:] + x_e[:-1]),
+                                x_e[1:] - x_e[:-1], x_e)
+    P = rs.uniform(0.5, 2.0, n + 1)
+    P_p = rs.uniform(0.5, 2.0, (n_p, n + 1))
+    cs = rs.uniform(0.1, 1.0, n_p * n)
+    cs_os = rs.uniform(0.1, 1.0, (2, n_p))
+    v = rs.uniform(0.1, 1.0, (3, n))
+
+    cases = [
+        ('flux_diags', lambda k: k.flux_diags(mesh, P)),
+        ('flux_diags_per_vol_off', lambda k: k.flux_diags(mesh, P, 0)),
+        ('edge_interp', lambda k: k.edge_interp(mesh, v[0])),
+        ('particle_edges',
+         lambda k: k.particle_edges(cs, cs_os[0], cs_os[1], n_p, n)),
+        ('particle_flux_diags',
+         lambda k: k.particle_flux_diags(mesh, n_p, P_p)),
+        ('overpotential', lambda k: k.overpotential(v[0], v[1], v[2])),
+        ('butler_volmer', lambda k: k.butler_volmer(v[0], 20.0, v[1] - 0.5)),
+    ]
+
+    report = []
+    for name, func in cases:
+        a = numpy.hstack(func(kern))
+        b = numpy.hstack(func(ref))
+        err = numpy.amax(abs(a - b)) / max(numpy.amax(abs(b)), 1e-300)
+        report.append((name, err))
+
+    return report
@@ -0,0 +1,241 @@
+# -*- coding:utf-8 -*-
+"""Profiling of the simulation phases.
+
+The wall clock time and memory use are recorded for each phase of a
+simulation, i.e.,
+    config      : config file parsing (confreader.Reader)
+    model_setup : Simulator construction (params, model and solver)
+    buildpars   : Params.buildpars, for each case
+    build       : model and solver construction, for each case
+    integration : time integration of each schedule step
+    postprocess : results post-processing of each schedule step
+    save        : saveresults
+
+The model and simulator classes call start()/stop() around each phase.
+NullProfiler is used when profiling is off.
+
+Optionally, cProfile stats (<out_dir>/case<N>.prof, may be viewed with
+pstats or snakeviz) and tracemalloc snapshots (<out_dir>/case<N>.tracemalloc)
+are saved for each case. tracemalloc is only used if available (Python 3.4+,
+or the pytracemalloc package for Python 2).
+"""
+import os
+import sys
+import time
+import json
+import cProfile
+
+from telemetry import logger
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+MB = 1024.**2
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of the process so far [MB].
+    """
+    if resource is None:
+        return float('nan')
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on OS X, and kB on Linux
+    if sys.platform == 'darwin':
+        return maxrss / MB
+    else:
+        return maxrss / 1024.
+
+
+def rss_mb():
+    """
+    Present resident memory of the process [MB], where available.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / MB
+    except (IOError, OSError, ValueError, IndexError):
+        return float('nan')
+
+
+class NullProfiler():
+    """
+    Profiler that does nothing, used when profiling is off.
+    """
+    def start(self, phase, step=''):
+        pass
+
+    def stop(self, phase, step=''):
+        pass
+
+    def start_case(self, case_ind):
+        pass
+
+    def stop_case(self, case_ind):
+        pass
+
+
+class PhaseProfiler():
+    """
+    Record the wall clock time and memory use of each simulation phase.
+
+    out_dir       : directory for the cProfile stats, tracemalloc snapshots
+                    and the phase report (save())
+    cprofile_on   : save the cProfile stats of each case
+    tracemalloc_on: trace the memory allocations, and save a snapshot at the
+                    end of each case
+    """
+    def __init__(self, out_dir=None, cprofile_on=0, tracemalloc_on=0):
+        self.out_dir = out_dir
+        self.cprofile_on = cprofile_on
+        self.tracemalloc_on = tracemalloc_on and tracemalloc is not None
+
+        if tracemalloc_on and tracemalloc is None:
+            logger.warning('tracemalloc is not available, memory allocations '
+                           'will not be traced.')
+
+        if self.tracemalloc_on and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        self.records = []
+        self.running = {}
+        self.case_ind = None
+        self.cprof = None
+
+    def start(self, phase, step=''):
+        """
+        Start timing the phase (of the schedule step, if given).
+        """
+        if self.tracemalloc_on and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+        self.running[(phase, step)] = (time.time(), peak_rss_mb())
+
+    def stop(self, phase, step=''):
+        """
+        Stop timing the phase, and record its wall time and memory use.
+        """
+        t_start, peak_start = self.running.pop((phase, step))
+        peak_end = peak_rss_mb()
+
+        rec = {'phase': phase,
+               'step': step,
+               'case': self.case_ind,
+               'wall_time': time.time() - t_start,
+               'rss_mb': rss_mb(),
+               'peak_rss_mb': peak_end,
+               'peak_rss_increase_mb': peak_end - peak_start}
+        if self.tracemalloc_on:
+            rec['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / MB
+
+        self.records.append(rec)
+
+    def start_case(self, case_ind):
+        """
+        Start a case, and its cProfile profiler.
+        """
+        self.case_ind = case_ind
+        if self.cprofile_on:
+            self.cprof = cProfile.Profile()
+            self.cprof.enable()
+
+    def stop_case(self, case_ind):
+        """
+        Stop a case, and save its cProfile stats and tracemalloc snapshot.
+        """
+        if self.cprof is not None:
+            self.cprof.disable()
+            self.cprof.dump_stats(self.case_path(case_ind, '.prof'))
+            self.cprof = None
+
+        if self.tracemalloc_on:
+            tracemalloc.take_snapshot().dump(
+                self.case_path(case_ind, '.tracemalloc'))
+
+        self.case_ind = None
+
+    def case_path(self, case_ind, ext):
+        """
+        File path for the profiling output of a case.
+        """
+        if not os.path.isdir(self.out_dir):
+            os.makedirs(self.out_dir)
+
+        return os.path.join(self.out_dir, 'case' + str(case_ind) + ext)
+
+    def summary(self):
+        """
+        Total wall time, number of calls and peak memory of each phase.
+        Returns a list of (phase, summary dict) tuples, in order of first
+        occurrence.
+        """
+        phases = []
+        summ = {}
+        for rec in self.records:
+            if rec['phase'] not in summ:
+                phases.append(rec['phase'])
+                summ[rec['phase']] = {'calls': 0, 'wall_time': 0.0,
+                                      'peak_rss_mb': 0.0,
+                                      'traced_peak_mb': 0.0}
+            s = summ[rec['phase']]
+            s['calls'] += 1
+            s['wall_time'] += rec['wall_time']
+            s['peak_rss_mb'] = max(s['peak_rss_mb'], rec['peak_rss_mb'])
+            s['traced_peak_mb'] = max(s['traced_peak_mb'],
+                                      rec.get('traced_peak_mb', 0.0))
+
+        return [(phase, summ[phase]) for phase in phases]
+
+    def report(self):
+        """
+        Print the time and memory use of each phase.
+        """
+        print '==================='
+        print 'Profile by phase'
+        print '==================='
+        print '%-14s %8s %12s %14s %16s' % ('phase', 'calls', 'wall [s]',
+                                            'peak RSS [MB]',
+                                            'traced peak [MB]')
+        for phase, s in self.summary():
+            if self.tracemalloc_on:
+                traced = '%16.1f' % s['traced_peak_mb']
+            else:
+                traced = '%16s' % '-'
+            print '%-14s %8d %12.3f %14.1f %s' % (
+                phase, s['calls'], s['wall_time'], s['peak_rss_mb'], traced)
+        print ''
+
+        steps = [rec for rec in self.records if rec['step']]
+        if steps:
+            print '%-6s %-22s %-12s %12s %14s' % ('case', 'step', 'phase',
+                                                 'wall [s]',
+                                                 'peak RSS [MB]')
+            for rec in steps:
+                print '%-6s %-22s %-12s %12.3f %14.1f' % (
+                    rec['case'], rec['step'], rec['phase'],
+                    rec['wall_time'], rec['peak_rss_mb'])
+            print ''
+
+    def save(self, filename='phases.json'):
+        """
+        Save the phase records to a JSON file in out_dir.
+        """
+        if not os.path.isdir(self.out_dir):
+            os.makedirs(self.out_dir)
+
+        filepath = os.path.join(self.out_dir, filename)
+        with open(filepath, 'w') as f:
+            json.dump({'records': self.records,
+                       'summary': dict(self.summary())},
+                      f, indent=2, sort_keys=True)
+
+        return filepath
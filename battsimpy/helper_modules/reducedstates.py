@@ -0,0 +1,251 @@
+# -*- coding:utf-8 -*-
+"""Reduced DAE formulation, with linear algebraic states eliminated.
+
+Some algebraic states of the models are the solution of linear equations for
+the given other states, e.g., the electrolyte and solid phase potentials of
+FULL_1D. These may be removed from the time integration: the solver only
+sees the remaining states, and the eliminated states are solved for from
+their (linear) equations at each residual evaluation, and recovered for the
+outputs.
+
+ReducedProblem
+    - the reduced Assimulo implicit problem, for a model with the methods:
+        eliminated_inds()  : indices of the eliminated states, where the
+                             residuals of the same indices are linear in
+                             these, with a tridiagonal Jacobian block
+        solve_potentials(y): sets the eliminated states of y, from their
+                             equations, for the other states of y
+    - the Jacobian of the reduced problem is the Schur complement of the
+      eliminated block of the model Jacobian (exact for the linear
+      eliminated equations), also formed from the sparse Jacobian of the
+      model (jac_sparse, for the fixed-step solvers), and from its sparse
+      blocks (schur_blocks, for fixedstep.SchurLU)
+
+ReducedSolver
+    - wraps the time integration solver (IDA or fixedstep) of the reduced
+      problem, with the full state vectors in and out (t, y, yd, atol,
+      simulate, re_init, make_consistent), so the Simulator time loop and
+      results are as for the full problem.
+"""
+import numpy
+import scipy.linalg
+import scipy.sparse
+from assimulo.problem import Implicit_Problem
+
+
+class ReducedProblem(Implicit_Problem):
+    """
+    Reduced implicit problem of the model mod (an Assimulo Implicit_Problem,
+    with eliminated_inds() and solve_potentials(), see above).
+    """
+    def __init__(self, mod):
+        self.mod = mod
+
+        n = len(mod.y0)
+        self.n = n
+        self.elim_inds = numpy.array(mod.eliminated_inds())
+        self.keep_inds = numpy.setdiff1d(numpy.arange(n), self.elim_inds)
+
+        Implicit_Problem.__init__(self, y0=self.reduce(mod.y0),
+                                  yd0=self.reduce(mod.yd0),
+                                  name=getattr(mod, 'name', 'model'))
+        self.algvar = list(numpy.array(mod.algvar)[self.keep_inds])
+
+    def reduce(self, y):
+        """
+        Reduced state vector of the full state vector y.
+        """
+        return numpy.array(y, dtype='d')[self.keep_inds]
+
+    def expand(self, y_r, yd_r=None):
+        """
+        Full state vectors, y and yd, of the reduced y_r and yd_r, with the
+        eliminated states solved for (and zero time derivatives of these).
+        """
+        y = numpy.zeros(self.n)
+        y[self.keep_inds] = y_r
+        y = self.mod.solve_potentials(y)
+
+        yd = numpy.zeros(self.n)
+        if yd_r is not None:
+            yd[self.keep_inds] = yd_r
+
+        return y, yd
+
+    def res(self, t, y_r, yd_r):
+        """
+        Residual of the reduced problem.
+        """
+        y, yd = self.expand(y_r, yd_r)
+
+        return self.mod.res(t, y, yd)[self.keep_inds]
+
+    def jac(self, c, t, y_r, yd_r):
+        """
+        Jacobian of the reduced problem, J_KK - J_KE*J_EE^-1*J_EK, for the
+        kept (K) and eliminated (E) states.
+        """
+        y, yd = self.expand(y_r, yd_r)
+        J = self.mod.jac(c, t, y, yd)
+
+        E, K = self.elim_inds, self.keep_inds
+
+        # Banded form of J_EE
+        ab = numpy.zeros((3, len(E)))
+        ab[0, 1:] = J[E[:-1], E[1:]]
+        ab[1, :] = J[E, E]
+        ab[2, :-1] = J[E[1:], E[:-1]]
+
+        X = scipy.linalg.solve_banded((1, 1), ab, J[numpy.ix_(E, K)])
+
+        return J[numpy.ix_(K, K)] - J[numpy.ix_(K, E)].dot(X)
+
+    def jac_sparse(self, c, t, y_r, yd_r):
+        """
+        Jacobian of the reduced problem, as for jac, as a sparse (CSC)
+        matrix, from the sparse Jacobian of the model (see
+        FULL_1D.jac_sparse), without forming the dense Jacobian.
+        """
+        y, yd = self.expand(y_r, yd_r)
+
+        return self.condense(self.mod.jac_sparse(c, t, y, yd),
+                             self.elim_inds, self.keep_inds)
+
+    def condense(self, J, E, K):
+        """
+        Schur complement, J_KK - J_KE*J_EE^-1*J_EK, of the sparse matrix J,
+        for the E states, with a tridiagonal J_EE. Only the columns of J_EK
+        with entries are solved for, and only the rows of J_KE with entries
+        are updated. Returns a sparse (CSC) matrix.
+        """
+        J = scipy.sparse.csr_matrix(J)
+        J_E, J_K = J[E], J[K]
+
+        # Banded form of J_EE
+        J_EE = J_E[:, E]
+        ab = numpy.zeros((3, len(E)))
+        ab[0, 1:] = J_EE.diagonal(1)
+        ab[1, :] = J_EE.diagonal()
+        ab[2, :-1] = J_EE.diagonal(-1)
+
+        J_EK = J_E[:, K].tocsc()
+        cols = numpy.nonzero(numpy.diff(J_EK.indptr))[0]
+        X = scipy.linalg.solve_banded((1, 1), ab, J_EK[:, cols].toarray())
+
+        J_KE = J_K[:, E]
+        rows = numpy.nonzero(numpy.diff(J_KE.indptr))[0]
+        Z = scipy.sparse.coo_matrix(J_KE[rows].dot(X))
+
+        return (J_K[:, K] - scipy.sparse.csr_matrix(
+            (Z.data, (rows[Z.row], cols[Z.col])),
+            shape=(len(K), len(K)))).tocsc()
+
+    def schur_blocks(self, c, t, y_r, yd_r):
+        """
+        Blocks of the reduced Jacobian, for the condensation of the particle
+        states (see FULL_1D.schur_blocks), without forming the Jacobian. The
+        eliminated states are not coupled to the particle states, so only
+        J_RR is condensed.
+        """
+        y, yd = self.expand(y_r, yd_r)
+        cs_tri, J_PR, J_RP, J_RR = self.mod.schur_blocks(c, t, y, yd)
+
+        # Positions of the eliminated and kept states in R
+        P = numpy.concatenate([blk[0] for blk in self.mod.particle_blocks()])
+        in_E = numpy.in1d(numpy.setdiff1d(numpy.arange(self.n), P),
+                          self.elim_inds)
+        E, K = numpy.where(in_E)[0], numpy.where(~in_E)[0]
+
+        return (cs_tri, scipy.sparse.csc_matrix(J_PR)[:, K].tocsr(),
+                J_RP[K], self.condense(J_RR, E, K).tocsr())
+
+    def particle_blocks(self):
+        """
+        Solid diffusion blocks of the model (see FULL_1D.particle_blocks),
+        with the reduced state indices. The pore wall fluxes of the blocks
+        must not be eliminated.
+        """
+        blocks = self.mod.particle_blocks()
+        if numpy.any(numpy.in1d(numpy.concatenate([blk[1] for blk in blocks]),
+                                self.elim_inds)):
+            raise ValueError('The particle blocks require the pore wall '
+                             'fluxes to be kept in the reduced problem.')
+
+        return [(numpy.searchsorted(self.keep_inds, cs_inds),
+                 numpy.searchsorted(self.keep_inds, j_inds), A_cs, B_cs)
+                for cs_inds, j_inds, A_cs, B_cs in blocks]
+
+
+class ReducedSolver():
+    """
+    Time integration solver of a ReducedProblem, problem, with the full
+    state vectors in and out. The other solver attributes and options are
+    those of the wrapped solver.
+    """
+    def __init__(self, solver, problem):
+        self.__dict__['solver'] = solver
+        self.__dict__['problem'] = problem
+
+        # Last expanded (y_r, yd_r, y, yd), as y and yd are read many times
+        # per output by the time loop
+        self.__dict__['last'] = None
+
+    def __getattr__(self, name):
+        if name == 'y':
+            return self.expand_present()[0]
+        elif name == 'yd':
+            return self.expand_present()[1]
+
+        return getattr(self.solver, name)
+
+    def expand_present(self):
+        """
+        Full y and yd of the present states of the solver.
+        """
+        y_r, yd_r = self.solver.y, self.solver.yd
+        last = self.last
+        if last is None or not numpy.array_equal(last[0], y_r) \
+                or not numpy.array_equal(last[1], yd_r):
+            y, yd = self.problem.expand(y_r, yd_r)
+            last = (numpy.array(y_r), numpy.array(yd_r), y, yd)
+            self.__dict__['last'] = last
+
+        return last[2].copy(), last[3].copy()
+
+    def __setattr__(self, name, val):
+        # Full length atol vectors to the reduced states
+        if name == 'atol' and not numpy.isscalar(val) \
+                and len(val) == self.problem.n:
+            val = self.problem.reduce(val)
+
+        setattr(self.solver, name, val)
+
+    def re_init(self, t0, y0, yd0):
+        """
+        Re-initialize the solver at t0, with the full states y0 and yd0.
+        """
+        self.solver.re_init(t0, self.problem.reduce(y0),
+                            self.problem.reduce(yd0))
+
+    def make_consistent(self, flag='IDA_YA_YDP_INIT'):
+        """
+        Consistent initialization of the reduced problem.
+        """
+        return self.solver.make_consistent(flag)
+
+    def simulate(self, tfinal, ncp=0):
+        """
+        Integrate to tfinal. Returns the time, and the full y and yd, of each
+        output of the solver.
+        """
+        t_out, y_r, yd_r = self.solver.simulate(tfinal, ncp)
+
+        y_out, yd_out = [], []
+        for yi, ydi in zip(y_r, yd_r):
+            y, yd = self.problem.expand(yi, ydi)
+            y_out.append(y)
+            yd_out.append(yd)
+        self.__dict__['last'] = (numpy.array(y_r[-1]), numpy.array(yd_r[-1]),
+                                 y_out[-1], yd_out[-1])
+
+        return t_out, numpy.array(y_out), numpy.array(yd_out)
@@ -0,0 +1,223 @@
+# -*- coding:utf-8 -*-
+"""Scaled DAE formulation, with the states and residuals of order one.
+
+The states of the models span many orders of magnitude, e.g., for FULL_1D,
+the concentrations (1e3-5e4 mol/m^3), the potentials (~1 V), the pore wall
+fluxes (~1e-5 mol/m^2/s) and the temperature (~300 K). The time integration
+solver may instead see the scaled states, y/y_scale, with y_scale the
+typical magnitude of each state (state_scales() of the model), and the
+scaled residuals, res/r_scale:
+    - the differential residuals (yd - f(y)) are scaled as their states, so
+      these remain of the yd - f(y) form
+    - the algebraic residuals are scaled by the largest entry of their row
+      of the Jacobian, in the scaled states, at the initial states
+The solution is the same, and the results are in the physical units, but the
+Newton iterations and linear solves are better conditioned.
+
+ScaledProblem
+    - the scaled Assimulo implicit problem of a model, with the Jacobian
+      (jac, jac_sparse, jacv, prec_mat and schur_blocks) and the model
+      structure used
+      by the other solvers (particle_blocks, eliminated_inds and
+      solve_potentials) in the scaled states, so it may be reduced (see
+      reducedstates) as the model
+
+ScaledSolver
+    - wraps the time integration solver of the scaled problem (or of its
+      reduced problem), with the physical state vectors and atol in and out
+      (t, y, yd, atol, simulate, re_init, make_consistent), so the Simulator
+      time loop and results are as for the model.
+"""
+import numpy
+import scipy.sparse
+from assimulo.problem import Implicit_Problem
+
+
+class ScaledProblem(Implicit_Problem):
+    """
+    Scaled implicit problem of the model mod (an Assimulo Implicit_Problem),
+    with the typical magnitude of each state, y_scale.
+    """
+    def __init__(self, mod, y_scale):
+        self.mod = mod
+        self.y_scale = numpy.array(y_scale, dtype='d')
+
+        Implicit_Problem.__init__(self, y0=self.scale(mod.y0),
+                                  yd0=self.scale(mod.yd0),
+                                  name=getattr(mod, 'name', 'model'))
+        self.algvar = list(mod.algvar)
+
+        self.r_scale = self.res_scales()
+
+    def scale(self, y):
+        """
+        Scaled state vector of the physical state vector y.
+        """
+        return numpy.array(y, dtype='d') / self.y_scale
+
+    def unscale(self, y_s):
+        """
+        Physical state vector of the scaled state vector y_s.
+        """
+        return numpy.asarray(y_s, dtype='d') * self.y_scale
+
+    def res_scales(self):
+        """
+        Residual scales: the state scales for the differential residuals, and
+        the largest entry of the (scaled state) Jacobian row, at the initial
+        states, for the algebraic residuals.
+        """
+        J = numpy.asarray(self.mod.jac(0.0, getattr(self.mod, 't0', 0.0),
+                                       self.mod.y0, self.mod.yd0))
+        row_max = numpy.amax(abs(J) * self.y_scale, axis=1)
+        row_max[row_max == 0.0] = 1.0
+
+        alg = numpy.array(self.algvar) == 0.0
+
+        return numpy.where(alg, row_max, self.y_scale)
+
+    def res(self, t, y_s, yd_s):
+        """
+        Residual of the scaled problem.
+        """
+        return self.mod.res(t, self.unscale(y_s), self.unscale(yd_s)) \
+            / self.r_scale
+
+    def jac(self, c, t, y_s, yd_s):
+        """
+        Jacobian of the scaled problem, R^-1*J*S, for the residual and state
+        scales, R and S.
+        """
+        J = self.mod.jac(c, t, self.unscale(y_s), self.unscale(yd_s))
+
+        return numpy.asarray(J) * self.y_scale / self.r_scale[:, numpy.newaxis]
+
+    def jacv(self, t, y_s, yd_s, res, v, c):
+        """
+        Product of the scaled Jacobian and v (see FULL_1D.jacv).
+        """
+        return self.mod.jacv(t, self.unscale(y_s), self.unscale(yd_s), None,
+                             self.unscale(v), c) / self.r_scale
+
+    def prec_mat(self, c, t, y_s, yd_s):
+        """
+        Scaled preconditioner, R^-1*P*S (see FULL_1D.prec_mat).
+        """
+        P = self.mod.prec_mat(c, t, self.unscale(y_s), self.unscale(yd_s))
+
+        return scipy.sparse.diags(1.0 / self.r_scale).dot(
+            scipy.sparse.csc_matrix(P)).dot(scipy.sparse.diags(self.y_scale))
+
+    def jac_sparse(self, c, t, y_s, yd_s):
+        """
+        Scaled Jacobian, R^-1*J*S, as a sparse (CSC) matrix (see
+        FULL_1D.jac_sparse).
+        """
+        J = self.mod.jac_sparse(c, t, self.unscale(y_s), self.unscale(yd_s))
+
+        return scipy.sparse.diags(1.0 / self.r_scale).dot(
+            scipy.sparse.csc_matrix(J)).dot(
+                scipy.sparse.diags(self.y_scale)).tocsc()
+
+    def schur_blocks(self, c, t, y_s, yd_s):
+        """
+        Blocks of the scaled Jacobian, for the condensation of the particle
+        states (see FULL_1D.schur_blocks).
+        """
+        cs_tri, J_PR, J_RP, J_RR = self.mod.schur_blocks(
+            c, t, self.unscale(y_s), self.unscale(yd_s))
+
+        in_P = numpy.zeros(len(self.y_scale), dtype=bool)
+        in_P[numpy.concatenate(
+            [blk[0] for blk in self.mod.particle_blocks()])] = True
+        s_P, s_R = self.y_scale[in_P], self.y_scale[~in_P]
+        r_P, r_R = self.r_scale[in_P], self.r_scale[~in_P]
+
+        def scale(r, B, s):
+            return scipy.sparse.diags(1.0 / r).dot(B).dot(
+                scipy.sparse.diags(s)).tocsr()
+
+        lo, d, up = cs_tri
+        cs_tri = [lo * s_P[:-1] / r_P[1:], d * s_P / r_P,
+                  up * s_P[1:] / r_P[:-1]]
+
+        return (cs_tri, scale(r_P, J_PR, s_R), scale(r_R, J_RP, s_P),
+                scale(r_R, J_RR, s_R))
+
+    def particle_blocks(self):
+        """
+        Solid diffusion blocks of the model (see FULL_1D.particle_blocks), of
+        the scaled states and residuals.
+        """
+        blocks = []
+        for cs_inds, j_inds, A_cs, B_cs in self.mod.particle_blocks():
+            s_cs = self.y_scale[cs_inds]
+            r_cs = self.r_scale[cs_inds][:, numpy.newaxis]
+            blocks.append((cs_inds, j_inds, A_cs * s_cs / r_cs,
+                           B_cs * self.y_scale[j_inds] / r_cs))
+
+        return blocks
+
+    def eliminated_inds(self):
+        """
+        Indices of the linear algebraic states (see reducedstates).
+        """
+        return self.mod.eliminated_inds()
+
+    def solve_potentials(self, y_s):
+        """
+        Scaled states, y_s, with the eliminated states solved for (see
+        reducedstates).
+        """
+        return self.scale(self.mod.solve_potentials(self.unscale(y_s)))
+
+
+class ScaledSolver():
+    """
+    Time integration solver of a ScaledProblem, problem, with the physical
+    state vectors and atol in and out. The other solver attributes and
+    options are those of the wrapped solver.
+    """
+    def __init__(self, solver, problem):
+        self.__dict__['solver'] = solver
+        self.__dict__['problem'] = problem
+
+    def __getattr__(self, name):
+        if name == 'y':
+            return self.problem.unscale(self.solver.y)
+        elif name == 'yd':
+            return self.problem.unscale(self.solver.yd)
+        elif name == 'atol':
+            # Scaled atol (vector) to the physical states
+            return self.problem.unscale(self.solver.atol)
+
+        return getattr(self.solver, name)
+
+    def __setattr__(self, name, val):
+        # Physical atol (scalar or vector) to the scaled states
+        if name == 'atol':
+            val = val / self.problem.y_scale
+
+        setattr(self.solver, name, val)
+
+    def re_init(self, t0, y0, yd0):
+        """
+        Re-initialize the solver at t0, with the physical states y0 and yd0.
+        """
+        self.solver.re_init(t0, self.problem.scale(y0),
+                            self.problem.scale(yd0))
+
+    def make_consistent(self, flag='IDA_YA_YDP_INIT'):
+        """
+        Consistent initialization of the scaled problem.
+        """
+        return self.solver.make_consistent(flag)
+
+    def simulate(self, tfinal, ncp=0):
+        """
+        Integrate to tfinal. Returns the time, and the physical y and yd, of
+        each output of the solver.
+        """
+        t_out, y_s, yd_s = self.solver.simulate(tfinal, ncp)
+
+        return t_out, self.problem.unscale(y_s), self.problem.unscale(yd_s)
@@ -5,40 +5,244 @@ The test schedule file is a .csv formatted file containing a header of
 important test variables, and rows of values for each header key.
 Each row consists of the step of the test to be carried out.
 
+The schedule is read into a numpy structured array, with one field per header
+key. e.g.,
+    dat = readsched(filepath)
+    dat['StepName'][2] -> name of the third step
+    dat[2]             -> the full third row
+
+Before a case is simulated the schedule is compiled (compile_sched) into a
+table of the quantities the simulator actually uses for each step (scaled
+input value, step duration, output interval, cut-off limits), along with the
+Repeat expansion of the schedule.
+
+Besides the 'Rest', 'Crate' and 'Current' input types, a step may hold a
+constant terminal 'Voltage' ([V]) or 'Power' ([W], negative for discharge,
+as for 'Current'). A constant current step with VoltControlOn_chg (or
+VoltControlOn_cdhg) set to 1 is handed over to a constant voltage hold at
+VoltMax (or VoltMin) when the limit is reached, i.e., CCCV charging.
+
+Input profiles (e.g., drive cycles) are used with the 'Profile' (current,
+[A]) and 'PowerProfile' (power, [W]) input types. The optional ProfileFile
+column of the schedule gives the profile file name, relative to the schedule
+file's directory, and the InputValue of the step is used as a scale factor on
+the profile values. A profile file has two columns without a header: time [s]
+(from the start of the step) and the input value. Repeated time values may be
+used for step changes in the input.
+
 Example test schedule files:
 battsimpy_path/data/ScheduleFiles/*.csv
 """
+import os
+import sys
 import csv
+import numpy
+
+from telemetry import logger
+
+# Columns that are not read as floats
+STR_KEYS = ['StepName', 'InputType', 'ProfileFile']
+INT_KEYS = ['StepNumber', 'VoltControlOn']
+
+# Input types that are defined by a profile file
+PROFILE_TYPES = ['Profile', 'PowerProfile']
+
+# Input types that are not scaled with the rate of the case
+UNSCALED_TYPES = PROFILE_TYPES + ['Voltage', 'Power']
+
+# Compiled step table layout (see compile_sched)
+STEP_DTYPE = [('name', 'S64'),
+              ('inp_type', 'S16'),
+              ('profile', 'S256'),
+              ('inp_val', 'f8'),
+              ('ifac', 'f8'),
+              ('duration', 'f8'),
+              ('dt_max', 'f8'),
+              ('volt_max', 'f8'),
+              ('volt_min', 'f8'),
+              ('an_volt_max', 'f8'),
+              ('an_volt_min', 'f8'),
+              ('cat_volt_max', 'f8'),
+              ('cat_volt_min', 'f8'),
+              ('volt_ctrl_chg', 'i8'),
+              ('volt_ctrl_dchg', 'i8')]
+
+
+def sched_dtype(akey):
+    """
+    Return the numpy dtype used for a schedule file header key.
+    """
+    if akey == 'ProfileFile':
+        return 'S256'
+    elif akey in STR_KEYS:
+        return 'S64'
+    elif any([akey.startswith(ikey) for ikey in INT_KEYS]):
+        return 'i8'
+    else:
+        return 'f8'
 
 
 def readsched(filepath):
     """
     Execute on reading in and parsing the schedule file
+
+    Returns a numpy structured array, with a field for each header key.
     """
-    print 'Schedule file path:', filepath
+    logger.info('Schedule file path: %s', filepath)
     try:
         with open(filepath, 'rb') as csvfile:
             reader = csv.reader(csvfile)
-            # minus 1 to remove header line count
-            nSteps = sum(1 for line in open(filepath)) - 1
-
-            for irow, row in enumerate(reader):
-                if irow == 0:
-                    # Header
-                    header = row
-                    dat = dict([(row[akey], range(nSteps))
-                               for akey in range(len(row))])
-                else:
-                    for ikey, akey in enumerate(header):
-                        if (akey == 'StepNumber') or (akey == 'VoltControlOn'):
-                            dat[akey][irow-1] = int(float(row[ikey]))
-                        elif (akey == 'StepName') or (akey == 'InputType'):
-                            dat[akey][irow-1] = row[ikey]
-                        else:
-                            dat[akey][irow-1] = float(row[ikey])
-
-        dat['numSteps'] = nSteps
-    except:
-        print "Error reading schedule file."
+            header = [akey.strip() for akey in next(reader)]
+            rows = [row for row in reader if ''.join(row).strip()]
+
+        # Short rows (e.g., without the trailing ProfileFile of a non-profile
+        # step) are padded with empty values
+        if any([len(row) > len(header) for row in rows]):
+            raise ValueError('Schedule row longer than the header.')
+        rows = [row + [''] * (len(header) - len(row)) for row in rows]
+
+        # Convert whole columns at once, rather than value by value.
+        # Numbers are read as floats first, as the integer columns are not
+        # always written as integers (e.g., 1.0).
+        cols = numpy.array(rows, dtype='S256').reshape(len(rows),
+                                                       len(header))
+
+        dat = numpy.zeros(len(rows),
+                          dtype=[(akey, sched_dtype(akey)) for akey in header])
+        for ikey, akey in enumerate(header):
+            if akey in STR_KEYS:
+                dat[akey] = numpy.char.strip(cols[:, ikey])
+            else:
+                dat[akey] = cols[:, ikey].astype('f8')
+    except (IOError, ValueError):
+        sys.exit("Error reading schedule file.")
 
     return dat
+
+
+def readprofile(filepath):
+    """
+    Read an input profile file.
+
+    Returns the time [s] and input value arrays, with the time shifted to
+    start at zero.
+    """
+    logger.info('Profile file path: %s', filepath)
+    try:
+        prof = numpy.loadtxt(filepath, delimiter=',', dtype='d', ndmin=2)
+    except (IOError, ValueError):
+        sys.exit("Error reading profile file.")
+
+    t_prof = prof[:, 0] - prof[0, 0]
+    if numpy.any(numpy.diff(t_prof) < 0.0):
+        sys.exit("Profile time values must be non-decreasing.")
+
+    return t_prof, prof[:, 1]
+
+
+def readprofiles(dat, sched_dir):
+    """
+    Read all of the input profiles used in the schedule.
+
+    Returns a dict of (time, value) array tuples, keyed with the ProfileFile
+    names used in the schedule.
+    """
+    profiles = {}
+    if 'ProfileFile' in dat.dtype.names:
+        for fname in numpy.unique(dat['ProfileFile']):
+            if fname:
+                profiles[fname] = readprofile(os.path.join(sched_dir, fname))
+
+    return profiles
+
+
+def compile_sched(dat, rate, rate_test=0, profiles=None):
+    """
+    Compile the schedule for a single case.
+
+    dat       : schedule structured array from readsched()
+    rate      : input rate (or current) of the present case
+    rate_test : 1 for a 'Rate' style study, where the step durations and
+                output intervals are scaled with the input rate.
+    profiles  : input profiles from readprofiles(). Profile steps with a
+                StepDuration_sec <= 0 are run for the length of the profile
+                (a ValueError is raised if their profile is not given).
+
+    The input of each non-rest, current or C-rate step is scaled by
+    Ifac = rate/InputValue.
+    For a 'Rate' style study the step duration and output interval are scaled
+    by 1/|Ifac| as well, such that a full discharge sweep is simulated at
+    each rate. The first step of the schedule is always run as written.
+
+    If the last row of the schedule is named 'Repeat', its StepDuration_sec
+    value gives the number of times the preceding steps are cycled through.
+
+    Returns a dict with:
+        'steps'     : compiled step table (STEP_DTYPE structured array)
+        'num_steps' : number of steps in one cycle of the schedule
+        'num_cycs'  : number of cycles through the schedule
+        'run_step'  : step index for each run, in the order of execution
+        'run_cyc'   : cycle index for each run, in the order of execution
+    """
+    if dat['StepName'][-1] == 'Repeat':
+        num_cycs = int(dat['StepDuration_sec'][-1])
+        body = dat[:-1]
+    else:
+        num_cycs = 1
+        body = dat
+
+    num_steps = len(body)
+
+    # Input scaling
+    inp_val = body['InputValue']
+    is_rest = ((numpy.char.find(body['StepName'], 'rest') >= 0)
+               | (numpy.char.find(body['StepName'], 'Rest') >= 0))
+    is_prof = numpy.in1d(body['InputType'], PROFILE_TYPES)
+    is_unscaled = numpy.in1d(body['InputType'], UNSCALED_TYPES)
+    scaled = (~is_rest) & (~is_unscaled) & (inp_val != 0.0)
+    scaled[0] = False
+
+    ifac = numpy.ones(num_steps, dtype='d')
+    ifac[scaled] = rate / inp_val[scaled]
+
+    # Time scaling
+    if rate_test:
+        tfac = 1. / numpy.abs(ifac)
+    else:
+        tfac = numpy.ones(num_steps, dtype='d')
+
+    steps = numpy.zeros(num_steps, dtype=STEP_DTYPE)
+    steps['name'] = body['StepName']
+    steps['inp_type'] = body['InputType']
+    if 'ProfileFile' in body.dtype.names:
+        steps['profile'] = body['ProfileFile']
+    steps['inp_val'] = inp_val * ifac
+    steps['ifac'] = ifac
+    steps['duration'] = body['StepDuration_sec'] * tfac
+    steps['dt_max'] = body['dt'] * tfac
+    steps['volt_max'] = body['VoltMax']
+    steps['volt_min'] = body['VoltMin']
+    steps['an_volt_max'] = body['AnodeMax']
+    steps['an_volt_min'] = body['AnodeMin']
+    steps['cat_volt_max'] = body['CathodeMax']
+    steps['cat_volt_min'] = body['CathodeMin']
+    if 'VoltControlOn_chg' in body.dtype.names:
+        steps['volt_ctrl_chg'] = body['VoltControlOn_chg']
+    if 'VoltControlOn_cdhg' in body.dtype.names:
+        steps['volt_ctrl_dchg'] = body['VoltControlOn_cdhg']
+
+    for istp in numpy.where(is_prof & (steps['duration'] <= 0.0))[0]:
+        prof_file = steps['profile'][istp]
+        if profiles is None or prof_file not in profiles:
+            raise ValueError('Profile step %s has no duration, and its '
+                             'profile (%s) is not loaded.'
+                             % (steps['name'][istp], prof_file))
+        steps['duration'][istp] = profiles[prof_file][0][-1]
+
+    sched = {'steps': steps,
+             'num_steps': num_steps,
+             'num_cycs': num_cycs,
+             'run_step': numpy.tile(numpy.arange(num_steps), num_cycs),
+             'run_cyc': numpy.repeat(numpy.arange(num_cycs), num_steps)}
+
+    return sched
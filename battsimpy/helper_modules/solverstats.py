@@ -0,0 +1,200 @@
+# -*- coding:utf-8 -*-
+"""Solver statistics for the simulations.
+
+The counters and timers are collected for each step of the test schedule, and
+stored in the solver_stats dict of the Results_object of that step. These may
+be summed up over a case (summarize), to compare the solver cost of the cases
+of a study (e.g., cold temperatures or high C-rates).
+
+The stats keys are:
+    <func>_calls, <func>_time
+        Number of calls and total time [s] of the model functions, for
+        func in MODEL_FUNCS. The update_cs_mats and calc_heat times are
+        included in the res time, as these are called from res.
+    IDA_KEYS values
+        IDA solver statistics, i.e., steps, residual and Jacobian evaluations,
+        Newton iterations, and the Newton convergence and error test failures,
+        and the Krylov iterations and preconditioner evaluations (GMRES).
+    SIM_KEYS
+        Simulator events, e.g., make_consistent calls and the refined delta_t
+        retries after a time integration failure.
+    fail_<class>
+        Number of time integration failures of each class (see
+        stepcontrol.classify_failure), where these occurred.
+    wall_time, sim_time
+        Wall clock time [s] and simulated time [s] of the step.
+"""
+import time
+
+from telemetry import logger
+
+# Model functions that are counted and timed
+MODEL_FUNCS = ['res', 'jac', 'update_cs_mats', 'calc_heat']
+
+# Assimulo IDA statistics keys, and the stats key that each is stored as
+IDA_KEYS = {'nsteps': 'ida_steps',
+            'nfcns': 'ida_res_evals',
+            'njacs': 'ida_jac_evals',
+            'nniters': 'newton_iters',
+            'nnfails': 'newton_conv_fails',
+            'nerrfails': 'error_test_fails',
+            'nliters': 'linear_iters',
+            'npevals': 'prec_evals'}
+
+# Simulator event counters
+SIM_KEYS = ['make_consistent_calls',
+            'step_transitions',
+            'step_transition_fails',
+            'input_ramps',
+            'refined_dt_retries',
+            'integration_failures']
+
+# Order of the logged summary
+PRINT_KEYS = (['wall_time', 'sim_time']
+              + sorted(IDA_KEYS.values())
+              + [func + '_calls' for func in MODEL_FUNCS]
+              + [func + '_time' for func in MODEL_FUNCS]
+              + SIM_KEYS)
+
+
+def new_model_stats():
+    """
+    Counters and timers of the model functions, kept by the model class.
+    """
+    stats = {}
+    for func in MODEL_FUNCS:
+        stats[func + '_calls'] = 0
+        stats[func + '_time'] = 0.0
+
+    return stats
+
+
+def new_stats():
+    """
+    Zeroed stats for a step of the test schedule.
+    """
+    stats = new_model_stats()
+    for key in IDA_KEYS.values():
+        stats[key] = 0
+    for key in SIM_KEYS:
+        stats[key] = 0
+    stats['wall_time'] = 0.0
+    stats['sim_time'] = 0.0
+
+    return stats
+
+
+def add_stats(stats, new):
+    """
+    Add the values of the new stats dict to stats.
+    """
+    for key, val in new.iteritems():
+        stats[key] = stats.get(key, 0) + val
+
+
+def collect_model_stats(stats, imod):
+    """
+    Add the model function stats of imod to stats, and reset those of imod.
+    """
+    add_stats(stats, imod.stats)
+    imod.stats = new_model_stats()
+
+
+def add_ida_stats(stats, isim):
+    """
+    Add the IDA statistics of the last isim.simulate() call to stats.
+    Assimulo resets the statistics at the start of each simulate() call.
+    """
+    ida_stats = getattr(isim, 'statistics', None)
+    if ida_stats is None:
+        return
+
+    for ida_key, key in IDA_KEYS.iteritems():
+        try:
+            stats[key] += int(ida_stats[ida_key])
+        except (KeyError, TypeError):
+            pass
+
+
+def simulate(stats, isim, tfinal, ncp):
+    """
+    Run isim.simulate(tfinal, ncp), and add the IDA statistics to stats, also
+    for a failed time integration.
+    """
+    try:
+        return isim.simulate(tfinal, ncp)
+    finally:
+        add_ida_stats(stats, isim)
+
+
+def make_consistent(stats, isim, flag='IDA_YA_YDP_INIT'):
+    """
+    Run isim.make_consistent(flag), counted in stats.
+    """
+    stats['make_consistent_calls'] += 1
+    return isim.make_consistent(flag)
+
+
+def count_failure(stats, fail_class):
+    """
+    Count a time integration failure of fail_class (see
+    stepcontrol.classify_failure) in stats, as fail_<fail_class>.
+    """
+    key = 'fail_' + fail_class
+    stats[key] = stats.get(key, 0) + 1
+
+
+def summarize(results_out):
+    """
+    Sum the stats of each step of a case, from the results dict of the case
+    (Simulator.results_out).
+    """
+    summary = new_stats()
+    for res_step in results_out.values():
+        add_stats(summary, getattr(res_step, 'solver_stats', {}))
+
+    return summary
+
+
+def log_stats(stats, title=''):
+    """
+    Log a stats dict, at the info level.
+    """
+    lines = ['Solver stats ' + title]
+    fail_keys = sorted([key for key in stats if key.startswith('fail_')])
+    for key in PRINT_KEYS + fail_keys:
+        if isinstance(stats[key], float):
+            lines.append('%-24s %12.4g' % (key, stats[key]))
+        else:
+            lines.append('%-24s %12d' % (key, stats[key]))
+    logger.info('\n'.join(lines))
+
+
+def log_case_table(cases, stats_list):
+    """
+    Log the main solver stats of each case of a study side by side, i.e.,
+    (T, rate, V_init, dT) case tuples and their summarize() stats.
+    """
+    keys = ['wall_time', 'ida_steps', 'newton_iters', 'res_calls',
+            'jac_calls', 'error_test_fails', 'newton_conv_fails',
+            'refined_dt_retries']
+
+    lines = ['%-32s' % 'case' + ''.join(['%20s' % key for key in keys])]
+    for case, stats in zip(cases, stats_list):
+        row = '%-32s' % str(tuple([round(val, 3) for val in case]))
+        for key in keys:
+            if isinstance(stats[key], float):
+                row += '%20.4g' % stats[key]
+            else:
+                row += '%20d' % stats[key]
+        lines.append(row)
+    logger.info('\n'.join(lines))
+
+
+def count_call(stats, func, t_start):
+    """
+    Count a call of the func model function in stats, which was started at
+    t_start (time.time()).
+    """
+    stats[func + '_calls'] += 1
+    stats[func + '_time'] += time.time() - t_start
@@ -0,0 +1,207 @@
+# -*- coding:utf-8 -*-
+"""Output interval control for the simulator time loops.
+
+The time loops of the Simulator classes integrate from one output time to the
+next with IDA, which controls its own internal step size. The output
+interval, delta_t, sets the resolution of the outputs, and the overhead of
+the loop (the IDA restarts, the output post-processing and the stop limit
+checks at each output time).
+
+OutputStepController sizes delta_t such that the cell voltage changes by
+about DV_TOL over each output interval, with:
+    - PI smoothing of the voltage change ratio between output intervals
+    - bounded growth and shrink ratios of delta_t between output intervals
+    - a delta_t limit from the voltage slope, to land just past an upcoming
+      cell voltage cut-off, rather than creep up to it in small steps
+    - alignment to the end of the step, without a sliver of an interval left
+    - a reduced delta_t for the retry after a recoverable solver failure
+
+For rest steps (zero applied current), the Simulators may use a rest
+controller (rest_controller(), with REST_FAST_ON): the output interval is not
+limited to the dt_max of the step, but to MAX_REST_STEP [s], it may grow by
+up to REST_GROW_MAX times per output as the cell relaxes, and once the
+relaxation rate |dV/dt| is below REST_DVDT_MIN, it goes straight to
+MAX_REST_STEP (or the rest of the step).
+
+The solver failures are classified with classify_failure(), from the IDA
+return flag of the IDAError (see the SUNDIALS IDA docs).
+"""
+import math
+
+# delta_t growth and shrink ratio bounds between accepted output intervals
+GROW_MAX = 2.0
+SHRINK_MIN = 0.2
+
+# PI controller gains, on the ratio of the voltage change to DV_TOL
+K_I = 0.7
+K_P = 0.4
+
+# Floor of the voltage change ratio (e.g., rest or voltage control)
+ERR_MIN = 1e-3
+
+# delta_t reduction, and the max number of retries, after a solver failure
+FAIL_SHRINK = 0.25
+MAX_RETRIES = 4
+
+# delta_t to an estimated voltage cut-off, as a fraction of the time to it
+LIMIT_OVERSHOOT = 1.05
+
+# Overshoot of the final output interval, so the step ends at t >= tfinal
+END_PAD = 1e-5
+
+# IDA return flags
+IDA_FLAGS = {-1: 'too_much_work',
+             -2: 'too_much_accuracy',
+             -3: 'error_test',
+             -4: 'convergence',
+             -5: 'linear_init',
+             -6: 'linear_setup',
+             -7: 'linear_solve',
+             -8: 'residual',
+             -9: 'repeated_residual',
+             -10: 'root_function',
+             -11: 'constraint',
+             -12: 'first_residual',
+             -13: 'line_search',
+             -14: 'no_recovery',
+             -20: 'memory',
+             -22: 'illegal_input'}
+
+# Failures that may pass with a smaller delta_t
+RETRY_FAILURES = set(['too_much_work', 'error_test', 'convergence',
+                      'linear_setup', 'linear_solve', 'residual',
+                      'repeated_residual', 'first_residual', 'line_search',
+                      'no_recovery'])
+
+
+def classify_failure(err):
+    """
+    Class of a solver failure, from the IDAError return flag, or
+    'time_limit' for an exceeded solver time limit.
+    """
+    if err.__class__.__name__ == 'TimeLimitExceeded':
+        return 'time_limit'
+
+    flag = getattr(err, 'value', None)
+    if isinstance(flag, int):
+        return IDA_FLAGS.get(flag, 'ida_flag' + str(flag))
+    else:
+        return 'solver_error'
+
+
+class OutputStepController():
+    """
+    Output interval control for one step of the test schedule.
+
+    dV_tol      : target cell voltage change over an output interval [V]
+    dt_max      : max output interval [s]
+    dt_init     : first output interval [s]
+    dt_min      : min output interval [s], also the floor of the failure
+                  retries
+    max_retries : max number of consecutive retries after solver failures
+    grow_max    : max delta_t growth ratio between output intervals
+    dVdt_min    : |dV/dt| [V/s] below which the output interval is dt_max, or
+                  the rest of the step (None to not use)
+    """
+    def __init__(self, dV_tol, dt_max, dt_init=0.1, dt_min=1e-4,
+                 max_retries=MAX_RETRIES, grow_max=GROW_MAX, dVdt_min=None):
+        self.dV_tol = dV_tol
+        self.dt_max = dt_max
+        self.dt_min = min(dt_min, dt_max)
+        self.max_retries = max_retries
+        self.grow_max = grow_max
+        self.dVdt_min = dVdt_min
+
+        self.dt = min(max(dt_init, self.dt_min), self.dt_max)
+
+        self.V_last = None
+        self.dVdt = 0.0
+        self.err_last = None
+        self.n_fail = 0
+
+    def start(self, V):
+        """
+        Set the cell voltage at the start of the step.
+        """
+        self.V_last = V
+
+    def propose(self, t, t_end, V_lims=None):
+        """
+        Output interval from t, for the step ending at t_end.
+        V_lims is the (min, max) cell voltage cut-off, if used.
+        """
+        dt = self.dt
+
+        # Relaxed cell, at the max output interval
+        if self.dVdt_min is not None and self.err_last is not None \
+                and abs(self.dVdt) < self.dVdt_min:
+            dt = self.dt_max
+
+        # Time to the cut-off, at the present voltage slope
+        if V_lims is not None and self.V_last is not None:
+            t_hit = None
+            if self.dVdt < 0.0:
+                t_hit = (self.V_last - V_lims[0]) / -self.dVdt
+            elif self.dVdt > 0.0:
+                t_hit = (V_lims[1] - self.V_last) / self.dVdt
+            if t_hit is not None and t_hit > 0.0:
+                dt = min(dt, max(LIMIT_OVERSHOOT * t_hit, self.dt_min))
+
+        # Step end, split evenly over the last two intervals
+        t_left = t_end - t
+        n_left = math.ceil(t_left / dt)
+        if n_left <= 1:
+            dt = t_left + END_PAD
+        elif n_left == 2:
+            dt = 0.5 * t_left
+
+        return dt
+
+    def accept(self, dt, V):
+        """
+        Update delta_t after an output interval of dt, ending at the cell
+        voltage V.
+        """
+        dV = V - self.V_last
+        self.dVdt = dV / dt
+        self.V_last = V
+        self.n_fail = 0
+
+        # Voltage change ratio at the unconstrained delta_t
+        err = max(abs(dV) / self.dV_tol * self.dt / dt, ERR_MIN)
+
+        ratio = err ** -K_I
+        if self.err_last is not None:
+            ratio *= (self.err_last / err) ** K_P
+        ratio = min(max(ratio, SHRINK_MIN), self.grow_max)
+
+        self.dt = min(max(self.dt * ratio, self.dt_min), self.dt_max)
+        self.err_last = err
+
+    def reject(self, dt, fail_class):
+        """
+        Reduced output interval for a retry after a solver failure of
+        fail_class over dt, or None if the failure is not to be retried.
+        """
+        self.n_fail += 1
+        if fail_class not in RETRY_FAILURES \
+                or self.n_fail > self.max_retries or dt <= self.dt_min:
+            return None
+
+        self.dt = max(dt * FAIL_SHRINK, self.dt_min)
+        self.err_last = None
+
+        return self.dt
+
+
+def rest_controller(p, t0, tfinal):
+    """
+    Output interval controller for a rest step from t0 to tfinal, with the
+    rest controls of the Params object p.
+    """
+    return OutputStepController(p.RunInput['TIMESTEPPING']['DV_TOL'],
+                                max(min(tfinal - t0, p.max_rest_step),
+                                    p.dt_min),
+                                dt_init=p.dt_init, dt_min=p.dt_min,
+                                grow_max=p.rest_grow_max,
+                                dVdt_min=p.rest_dvdt_min)
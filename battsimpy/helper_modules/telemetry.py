@@ -0,0 +1,168 @@
+# -*- coding:utf-8 -*-
+"""Simulation progress telemetry.
+
+The simulation progress is reported through two outputs:
+    1) Leveled logging, with the 'battsimpy' logger.
+        The logger has no output by default (e.g., for batch runs or runs in
+        a process pool), and the calling script sets up the output, e.g.,
+            telemetry.setup_logging('INFO')
+        as done in testdriver.py.
+    2) An optional JSON-lines event stream.
+        One JSON object per line, with the event name, the wall clock time,
+        the case and schedule step, and the event data. The events are:
+            case_start, case_end
+            step_start, step_end (with the cut-off reason)
+            progress (simulation time, % complete, voltage, current, delta_t)
+            input_ramp, cv_handover, dt_refined, integration_failure
+
+The progress of the time integration (one status line per output time) is
+rate limited to one report per progress_interval seconds of wall time. The
+first and last output of each step are always reported.
+"""
+import sys
+import json
+import time
+import logging
+
+logger = logging.getLogger('battsimpy')
+
+logger.addHandler(logging.NullHandler())
+
+# Cut-off reasons for the end of a step
+STOP_REASONS = ['time', 'Vmin', 'Vmax', 'ce_max', 'ce_min', 'Ua_ss_max',
+                'Ua_ss_min', 'Uc_ss_max', 'Uc_ss_min', 'integration_failure']
+
+
+def setup_logging(level='INFO', stream=None):
+    """
+    Log the battsimpy messages at level and above to stream (default stdout).
+    """
+    handler = logging.StreamHandler(stream if stream is not None
+                                    else sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(getattr(logging, level.upper()))
+
+
+class Telemetry():
+    """
+    Progress reporting of the simulation.
+
+    event_path        : file path for the JSON-lines event stream (None for
+                        no event stream)
+    progress_interval : minimum wall time between the progress reports [s]
+                        (0 to report every output time)
+    """
+    def __init__(self, event_path=None, progress_interval=1.0):
+        self.progress_interval = progress_interval
+        self.t_last = -float('inf')
+        self.t_sim_last = None
+        self.t0 = 0.0
+
+        self.case = None
+        self.step = None
+
+        if event_path is not None:
+            self.stream = open(event_path, 'a')
+        else:
+            self.stream = None
+
+    def close(self):
+        """
+        Close the event stream.
+        """
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def event(self, event_name, **data):
+        """
+        Write an event to the event stream.
+        """
+        if self.stream is None:
+            return
+
+        rec = {'event': event_name,
+               'wall_time': time.time(),
+               'case': self.case,
+               'step': self.step}
+        for key, val in data.iteritems():
+            # numpy scalars to python types
+            rec[key] = val.item() if hasattr(val, 'item') else val
+
+        self.stream.write(json.dumps(rec) + '\n')
+        self.stream.flush()
+
+    def start_case(self, case_ind, case):
+        """
+        Report the start of a case, i.e., (T, rate, V_init, dT).
+        """
+        self.case = case_ind
+        logger.info('Case %d: T=%s [C], rate=%s, V_init=%s [V], dT=%s [K]',
+                    case_ind, *case)
+        self.event('case_start', conditions=list(case))
+
+    def end_case(self, case_ind):
+        """
+        Report the end of a case.
+        """
+        self.event('case_end')
+        self.case = None
+
+    def start_step(self, step_name, t0=0.0, **data):
+        """
+        Report the start of a schedule step, at the simulation time t0.
+        """
+        self.step = step_name
+        self.t0 = t0
+        self.t_last = -float('inf')
+        self.t_sim_last = None
+        logger.info('Step %s: %s', step_name,
+                    ', '.join(['%s=%s' % (k, data[k]) for k in sorted(data)]))
+        self.event('step_start', **data)
+
+    def end_step(self, reason, **data):
+        """
+        Report the end of a schedule step, and the cut-off reason.
+        """
+        if reason != 'time':
+            logger.info('%s stopped simulation.', reason)
+        self.event('step_end', reason=reason, **data)
+        self.step = None
+
+    def progress(self, t, tfinal, force=False, **data):
+        """
+        Report the progress of the time integration, at most once per
+        progress_interval, unless force is set.
+        """
+        if self.stream is None and not logger.isEnabledFor(logging.INFO):
+            return
+
+        t_wall = time.time()
+        if t == self.t_sim_last or (
+                not force and t_wall - self.t_last < self.progress_interval):
+            return
+        self.t_last = t_wall
+        self.t_sim_last = t
+
+        pct = (t - self.t0) / (tfinal - self.t0) * 100.
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('time: %.3f  |  %.1f%% complete  |  %s', t, pct,
+                        '  |  '.join(['%s: %.4g' % (k, data[k])
+                                      for k in sorted(data)]))
+        self.event('progress', t=t, pct_complete=pct, **data)
+
+    def warning(self, event_name, msg, **data):
+        """
+        Report an event of the time integration to be noted, e.g., a refined
+        time step.
+        """
+        logger.warning(msg)
+        self.event(event_name, **data)
+
+    def note(self, event_name, msg, **data):
+        """
+        Report an event of the time integration, at the info level.
+        """
+        logger.info(msg)
+        self.event(event_name, **data)
@@ -22,6 +22,8 @@ Methods:
     simulate()
         Simlate all of the cases.
         Calls the sim_single_case() method.
+        The solver stats of each case are summed up in stats_holder (see
+        solverstats).
         TODO:
             Provide the ability to simulate as many cases in parallel as
             possible.
@@ -35,9 +37,9 @@ Methods:
         Plotting methods tailored to the results for certain simlations.
 """
 
+import os
 import sys
 import numpy
-from copy import deepcopy
 import itertools
 from matplotlib import pyplot as plt
 import matplotlib as mpl
@@ -46,6 +48,10 @@ import pickle
 # battsimpy specific modules
 from helper_modules import confreader
 from helper_modules import schedreader
+from helper_modules import solverstats
+from helper_modules import profiling
+from helper_modules import telemetry
+from helper_modules.telemetry import logger
 
 # Plot setup
 plt.style.use('classic')
@@ -65,13 +71,33 @@ class Model():
     The results are saved.
     The results may be re-loaded and plotted.
     """
-    def __init__(self, mod_conf_path, sim_conf_path, bsp_path):
+    def __init__(self, mod_conf_path, sim_conf_path, bsp_path,
+                 conf_overrides=None, profiler=None, telem=None):
         """
         Initialize the model class
+
+        conf_overrides is an optional dict of config inputs that take priority
+        over those in the config files, using the same
+        {HEADER: {KEY: value}} layout, e.g., {'MESH': {'NA': 20}}.
+
+        profiler is an optional profiling.PhaseProfiler, to record the time
+        and memory use of each phase of the simulation.
+
+        telem is an optional telemetry.Telemetry, for the progress reporting
+        (e.g., a JSON-lines event stream, or the progress rate limit).
         """
         self.mod_conf_path = mod_conf_path
         self.sim_conf_path = sim_conf_path
         self.bsp_path = bsp_path
+        self.conf_overrides = conf_overrides
+
+        if profiler is None:
+            profiler = profiling.NullProfiler()
+        self.profiler = profiler
+
+        if telem is None:
+            telem = telemetry.Telemetry()
+        self.telemetry = telem
 
         self.buildmodel()
 
@@ -82,8 +108,10 @@ class Model():
         Initialize the specified model.
         """
         # Parse the model and simulation config files.
+        self.profiler.start('config')
         mcd = confreader.Reader(self.mod_conf_path)
         scd = confreader.Reader(self.sim_conf_path)
+        self.profiler.stop('config')
 
         # Merge the model and simulation config inputs.
         conf_data = mcd.conf_data.copy()
@@ -95,24 +123,31 @@ class Model():
             for k2 in scd.conf_data[k1].keys():
                 conf_data[k1][k2] = scd.conf_data[k1][k2]
 
+        # Apply any config input overrides
+        if self.conf_overrides is not None:
+            for k1 in self.conf_overrides.keys():
+                if k1 not in conf_data.keys():
+                    conf_data[k1] = {}
+                for k2 in self.conf_overrides[k1].keys():
+                    conf_data[k1][k2] = self.conf_overrides[k1][k2]
+
         # Get the model type that was specified in the conf file.
         model_type = conf_data['MODEL']['MODEL_TYPE']
         self.model_type = model_type
 
         # Initialize the specified model.
+        self.profiler.start('model_setup')
         if 'ecm' in model_type:
-            print "Not provided in this version yet."
-            sys.exit()
-#            from battery_models import ecm
-#            self.model = ecm.Ecm(conf_data)
-#            self.model.buildpars()  # This creates self.model.pars
+            from battery_models import ecm
+            self.model = ecm.Simulator(conf_data, self.bsp_path)
 
         elif 'spm' == model_type:
-            print "Not provided in this version yet."
-            sys.exit()
-#            from battery_models import spm
-#            self.model = spm.Spm(conf_data)
-#            self.model.buildpars()
+            from battery_models import spm
+            self.model = spm.Simulator(conf_data, self.bsp_path)
+
+        elif 'spme' == model_type:
+            from battery_models import spm
+            self.model = spm.SimulatorSPMe(conf_data, self.bsp_path)
 
         elif 'spm_dist' == model_type:
             print "Not provided in this version yet."
@@ -122,11 +157,12 @@ class Model():
 #            self.model.buildpars()
 
         elif 'pade_1d' == model_type:
-            print "Not provided in this version yet."
-            sys.exit()
-#            import pade_1d
-#            self.model = pade_1d.Pade_1D(conf_data)
-#            self.model.buildpars()
+            from battery_models import pade_1d
+            self.model = pade_1d.Simulator(conf_data, self.bsp_path)
+
+        elif 'poly_1d' == model_type:
+            from battery_models import poly_1d
+            self.model = poly_1d.Simulator(conf_data, self.bsp_path)
 
         elif 'full_1d_fvm_ida' == model_type:
             from battery_models import full_1d_fvm_ida
@@ -139,11 +175,19 @@ class Model():
 
         else:
             sys.exit("MODEL_TYPE not recognized!")
+        self.profiler.stop('model_setup')
+
+        self.model.profiler = self.profiler
+        self.model.telemetry = self.telemetry
 
         # Read in test schedule data
+        self.profiler.start('config')
         self.sched_path = conf_data['FILEPATHS']['INPUT_DATA_ROOT'] \
             + conf_data['FILEPATHS']['SCHED_PATH']
         self.sched_dat = schedreader.readsched(self.sched_path)
+        self.sched_profiles = schedreader.readprofiles(
+            self.sched_dat, os.path.dirname(self.sched_path))
+        self.profiler.stop('config')
 
         # Build the simulation case set object
         self.buildcase()
@@ -179,8 +223,10 @@ class Model():
                 DOD, and this is the main differentiating factor between a
                 DCR and Rate simulation.
 
-            TODO:
-                Constant power, dynamic power profiles, constant voltage
+            Dynamic current and power profiles (e.g., drive cycles) are set
+            up in the test schedule file (see schedreader).
+            Constant voltage and constant power steps, and CCCV steps, are
+            also set up in the test schedule file.
         """
         p = self.model.pars
 
@@ -238,16 +284,29 @@ class Model():
         Simulate the model for the given schedule file
         """
         self.results_holder = [object for case in self.cases]
+        self.stats_holder = [{} for case in self.cases]
 
         # Run all cases sequentially.
         for iCase, case in enumerate(self.cases):
             # Run a single case.
+            self.profiler.start_case(iCase)
+            self.telemetry.start_case(iCase, case)
             self.results_holder[iCase] = self.sim_single_case(iCase)
+            self.telemetry.end_case(iCase)
+            self.profiler.stop_case(iCase)
+
+            # Solver cost summary of the case
+            self.stats_holder[iCase] = solverstats.summarize(
+                self.results_holder[iCase])
+            solverstats.log_stats(self.stats_holder[iCase],
+                                  'for case: ' + str(case))
 
             # Iteratively save the results, in case the simualtion crashes
             # along the way.
             self.saveresults()
 
+        solverstats.log_case_table(self.cases, self.stats_holder)
+
         # TODO:
             # Provide the ability to run cases in parallel.
 
@@ -257,137 +316,84 @@ class Model():
         config file.
         """
         # Setup the initial conditions for this case.
-        num_cycs = 1
         case = self.cases[case_ind]
 
-        print '###########'
-        print 'case:', case
-        print '###########', '\n'
-
         T = case[0] + 273.15  # [K]
         dT = case[3]
 
         self.model.V_init = case[2]
+        self.profiler.start('buildpars')
         self.model.buildpars()
+        self.profiler.stop('buildpars')
 
-        print 'T, dT:', T, dT
+        logger.debug('T, dT: %g, %g', T, dT)
         self.model.pars.T_amb = T
         self.model.pars.T_avg = T
         self.model.pars.T_dT = dT
         self.model.get_Tvec()
 
+        self.profiler.start('build')
         self.model.buildmodel()
         self.model.buildsim()
+        self.profiler.stop('build')
 
-        print 'Tvec:', self.model.Tvec
+        logger.debug('Tvec: %s', self.model.Tvec)
 
-        schd, p = self.sched_dat, self.model.pars
+        p = self.model.pars
 
-        self.model.schd = schd
+        # Compile the schedule for this case (input scaling, step limits and
+        # Repeat expansion)
+        sched = schedreader.compile_sched(
+            self.sched_dat, case[1],
+            rate_test='Rate' in self.model.confdat['SIMULATION']['TEST_TYPE'],
+            profiles=self.sched_profiles)
+        steps = sched['steps']
 
-        print 'V_init: '+str(self.model.V_init)+'V'
+        self.model.schd = sched
 
-        if schd['StepName'][-1] == 'Repeat':
-            num_cycs = schd['StepDuration_sec'][-1]
-            num_steps = len(schd['StepNumber']) - 1
-        else:
-            num_cycs = 1
-            num_steps = len(schd['StepNumber'])
+        logger.debug('V_init: %g [V]', self.model.V_init)
 
         # Build the model results dictionary object
-        self.model.build_results_dict(num_steps, num_cycs)
+        self.model.build_results_dict(sched['num_steps'], sched['num_cycs'])
         self.model.t_end_now = 0.0
 
         # Loop through the test schedule
-        pres_step, pres_cyc = 0, 0
-        while pres_cyc < num_cycs:
+        # A DCR test may change the rate for several cases, but want to keep
+        # the same pulse time for each of those rates, hence Ifac is not
+        # necessarily 1, but the time scaling always will be. But, for a Rate
+        # style study, we want full discharge sweeps at each rate, therefore,
+        # the step time must increase, if the rate decreases (e.g., 1C
+        # discharge for ~3600sec, or 0.1C discharge for 36000sec).
+        # This scaling is included in the compiled step table.
+        for pres_step, pres_cyc in zip(sched['run_step'], sched['run_cyc']):
             run_name = 'step'+str(pres_step) + '_repeat'+str(pres_cyc)
             # e.g., step0_repeat0 -> first step and first cycle through the
             # schedule
-
-            p.volt_max = schd['VoltMax'][pres_step]
-            p.volt_min = schd['VoltMin'][pres_step]
-            p.an_volt_max = schd['AnodeMax'][pres_step]
-            p.an_volt_min = schd['AnodeMin'][pres_step]
-            p.cat_volt_max = schd['CathodeMax'][pres_step]
-            p.cat_volt_min = schd['CathodeMin'][pres_step]
-            p.delta_t_max = schd['dt'][pres_step]
-            p.volt_lim_on = 0
-
-            print '$$$$$$$$$$$$$$$$$$$'
-            print 'Vcutoff:', p.volt_min
-            print '$$$$$$$$$$$$$$$$$$$'
-
-            # Handle the first step in the schedule slightly differently
-            if pres_step == 0:
-                self.model.get_input(schd['InputType'][pres_step],
-                                     schd['InputValue'][pres_step])
-
-                t_end_last = 0.0
-                tfinal = schd['StepDuration_sec'][pres_step]
-
-                self.model.simulate(tfinal, run_name)
-
-                tend = deepcopy(self.model.t_end_now + t_end_last)
-
-            # All other steps
-            else:
-                # Get model input voltage or current from the schedule file
-                if ('rest' in schd['StepName'][pres_step]
-                        or 'Rest' in schd['StepName'][pres_step]):
-                    Ifac = 1.0
-                else:
-                    Ifac = case[1]/schd['InputValue'][pres_step]
-
-                print 'Step Name:', schd['StepName'][pres_step]
-                print 'Ifac:', Ifac
-
-                self.model.get_input(schd['InputType'][pres_step],
-                                     schd['InputValue'][pres_step]*Ifac)
-                if 'Rate' in self.model.confdat['SIMULATION']['TEST_TYPE']:
-                    tfinal = schd['StepDuration_sec'][pres_step]/Ifac \
-                        + self.model.t_end_now
-                    p.delta_t_max = schd['dt'][pres_step]/Ifac
-                else:
-                    tfinal = schd['StepDuration_sec'][pres_step] \
-                        + self.model.t_end_now
-
-                print 'dt max:', p.delta_t_max
-
-                # Setup the time and input arrays for the model
-                # These are dealt with differently for the 'DCR' or 'Rate'
-                # style schedules.
-
-                # A DCR test may change the rate for several cases, but
-                # want to keep the same pulse time for each of those
-                # rates, hence Ifac is not necessarily 1, but tfac always
-                # will be. But, for a Rate style study, we want full
-                # discharge sweeps at each rate, therefore, the time
-                # step must increase, if the rate decreases
-                # (e.g., 1C discharge for ~3600sec, or 0.1C discharge for
-                # 36000sec).
-                t_end_last = tend
-
-                # no longer in the initial rest mode (only for pres_step = 0)
-#                init_rest_on = 0
-
-                # Execute this next simulation step
-                self.model.simulate(tfinal, run_name)
-
-                # Check if we are charging or discharging
-                # Negative input current -> charging, (+ -> dchg)
-#                charging_on = step_inp[-1]<0
-
-#                inp_last = deepcopy(self.model.inp)
-                tend = deepcopy(self.model.t_end_now + t_end_last)
-#                step_old = deepcopy(pres_step)
-#                cyc_old = deepcopy(pres_cyc)
-#                last_run_name = deepcopy(run_name)
-
-            pres_step += 1
-
-            if pres_step == num_steps:
-                pres_cyc += 1
+            step = steps[pres_step]
+
+            p.volt_max = step['volt_max']
+            p.volt_min = step['volt_min']
+            p.an_volt_max = step['an_volt_max']
+            p.an_volt_min = step['an_volt_min']
+            p.cat_volt_max = step['cat_volt_max']
+            p.cat_volt_min = step['cat_volt_min']
+            p.delta_t_max = step['dt_max']
+            p.volt_ctrl_chg = step['volt_ctrl_chg']
+            p.volt_ctrl_dchg = step['volt_ctrl_dchg']
+
+            self.telemetry.start_step(run_name, t0=self.model.t_end_now,
+                                      name=step['name'],
+                                      ifac=step['ifac'],
+                                      dt_max=p.delta_t_max,
+                                      Vcutoff=p.volt_min)
+
+            # Get model input voltage or current from the schedule file
+            self.model.get_input(step['inp_type'], step['inp_val'],
+                                 self.sched_profiles.get(step['profile']))
+
+            # Execute this next simulation step
+            tfinal = step['duration'] + self.model.t_end_now
+            self.model.simulate(tfinal, run_name)
 
         return self.model.results_out
 
@@ -411,7 +417,9 @@ class Model():
         filepath = self.model.confdat['FILEPATHS']['OUTPUT_ROOT'] \
             + self.model.confdat['FILEPATHS']['DATE'] + '/' + filename
 
+        self.profiler.start('save')
         pickle.dump(self.results_holder, open(filepath, "wb"), protocol=2)
+        self.profiler.stop('save')
 
     def loadresults(self):
         """
@@ -8,6 +8,7 @@ import scipy.interpolate
 # battsimpy specific modules
 from helper_modules import confreader
 from helper_modules import batteqns
+from helper_modules.telemetry import logger
 
 
 class Params():
@@ -113,6 +114,9 @@ class Params():
                                   + self.Nrc * self.Nc + 1)
             self.num_algr_vars = (self.Na
                                   + self.Nc + self.N + self.Na + self.Nc)
+            # Input control variable (the applied current density), for
+            # current, voltage and power control in the FULL_1D model
+            self.num_ctrl_vars = 1
 
             # Material properties
             self.get_matl_properties(fname_root + 'matl_prop.txt')
@@ -174,6 +178,18 @@ class Params():
             self.vols_a = self.vols[:Na]
             self.vols_c = self.vols[-Nc:]
 
+            # Mesh metrics (spacings, inverse volumes and edge weights), for
+            # the FVM operators of batteqns
+            self.mesh = batteqns.MeshMetrics(self.x_m, self.vols, self.x_e)
+            self.mesh_a = batteqns.MeshMetrics(self.x_m_a, self.vols_a,
+                                               self.x_e_a)
+            self.mesh_c = batteqns.MeshMetrics(self.x_m_c, self.vols_c,
+                                               self.x_e_c)
+            self.mesh_ra = batteqns.MeshMetrics(self.r_m_a, self.vols_ra_m,
+                                                self.r_e_a)
+            self.mesh_rc = batteqns.MeshMetrics(self.r_m_c, self.vols_rc_m,
+                                                self.r_e_c)
+
             self.as_a_mean = 1. / self.La * \
                 sum([asa*v for asa, v in zip(self.as_a, self.vols[:self.Na])])
             self.as_c_mean = 1. / self.Lc * \
@@ -209,8 +225,8 @@ class Params():
 #                       + RunInput['ELECTROLYTE']['FCA_FN']
 
             # Interpolators for De, ke
-            print "RunInput['ELECTROLYTE']['DE_FACTOR']", \
-                  RunInput['ELECTROLYTE']['DE_FACTOR']
+            logger.debug("RunInput['ELECTROLYTE']['DE_FACTOR'] %g",
+                         RunInput['ELECTROLYTE']['DE_FACTOR'])
             self.De_intp, ce_lims_De = batteqns.build_interp_2d(
                 De_fn, scalar=RunInput['ELECTROLYTE']['DE_FACTOR'])
             self.ke_intp, ce_lims_ke = batteqns.build_interp_2d(
@@ -408,6 +424,8 @@ class Params():
             self.pc_inds_c = numpy.reshape(
                 self.pc_inds, [1, len(self.pc_inds)])
 
+            self.iapp_ind = self.num_diff_vars + self.num_algr_vars
+
             # second set for manual jac version
             c_end = 0
             self.ja_inds2 = range(c_end, c_end + self.Na)
@@ -492,6 +510,7 @@ class Params():
                     self.ecm_params['ocv']['dim'], d, D1, D2, d1, d2 = par_out
                 self.OCP = d[:, 0]
             self.xs = d1
+            self.ecm_params['ocv']['soc'] = d1
 
             # Ohmic Resistance data
             self.res_ohm_fn = fname_root + 'ecm/res/' + \
@@ -504,6 +523,7 @@ class Params():
                 self.ecm_params['res_ohm']['intp_func'], \
                     self.ecm_params['res_ohm']['dim'], d, D1, D2, \
                     d1, d2 = par_out
+            self.ecm_params['res_ohm']['soc'] = d1
 
             # Loop through for all RC elements
             self.res_fn = [fname_root + 'ecm/res/' +
@@ -517,11 +537,15 @@ class Params():
                 par_out = self.gen_param_interp_function(self.res_fn[i_rc])
                 self.ecm_params['res'][i_rc]['intp_func'] = par_out[0]
                 self.ecm_params['res'][i_rc]['dim'] = par_out[1]
+                self.ecm_params['res'][i_rc]['soc'] = \
+                    par_out[3] if par_out[1] == '1D' else par_out[5]
 
                 # Time constant (tau) data
                 par_out = self.gen_param_interp_function(self.tau_fn[i_rc])
                 self.ecm_params['tau'][i_rc]['intp_func'] = par_out[0]
                 self.ecm_params['tau'][i_rc]['dim'] = par_out[1]
+                self.ecm_params['tau'][i_rc]['soc'] = \
+                    par_out[3] if par_out[1] == '1D' else par_out[5]
 
             # Cell capacity
             self.ecm_params['Ah_cap'] = RunInput['ECM_PARAMS']['ECM_OCV_CAP']
@@ -537,8 +561,87 @@ class Params():
 #        self.C_kmm_dist = 1e-3
         self.n_submod = RunInput['MODEL']['N_SUBMOD']
 
-        # --- Crank-Nicholson Control --- #
+        # --- Kernel backend --- #
+        # Backend of the residual hot loop kernels, 'numpy' (reference), or
+        # 'numba' (JIT-compiled, numpy if numba is not installed), see
+        # kernels
+        self.kernel_backend = RunInput['MODEL'].get('KERNEL_BACKEND', 'numpy')
+
+        # --- Pade solid diffusion --- #
+        # Order of the Pade approximant of the particle diffusion transfer
+        # function of the pade_1d model (1 + PADE_ORDER states per particle)
+        self.pade_order = int(RunInput['MODEL'].get('PADE_ORDER', 2))
+
+        # --- Rest step control --- #
+        # With REST_FAST_ON, rest steps (zero applied current) are run with a
+        # rest output interval control (see stepcontrol.rest_controller),
+        # rather than the dt of the step: the output interval may grow by up
+        # to REST_GROW_MAX times per output, up to MAX_REST_STEP [s], and
+        # goes straight to MAX_REST_STEP once |dV/dt| [V/s] is below
+        # REST_DVDT_MIN. The IDA atol of the algebraic states is relaxed by
+        # REST_ALG_ATOL_FACTOR.
         self.max_rest_step = RunInput['TIMESTEPPING']['MAX_REST_STEP']
+        self.rest_fast = RunInput['TIMESTEPPING'].get('REST_FAST_ON', 0)
+        self.rest_grow_max = RunInput['TIMESTEPPING'].get('REST_GROW_MAX',
+                                                          3.0)
+        self.rest_dvdt_min = RunInput['TIMESTEPPING'].get('REST_DVDT_MIN',
+                                                          1e-6)
+        self.rest_alg_atol_fac = RunInput['TIMESTEPPING'].get(
+            'REST_ALG_ATOL_FACTOR', 10.0)
+
+        # --- Step transition control --- #
+        # Max Butler-Volmer exponent, |0.5*F*eta/(R*T)|, for a direct
+        # transition to the input of a new schedule step. Above this, the
+        # input is ramped up over a few small time steps.
+        self.trans_bv_max = RunInput['TIMESTEPPING'].get(
+            'TRANSITION_BV_MAX', 8.0)
+        self.trans_max_iters = int(RunInput['TIMESTEPPING'].get(
+            'TRANSITION_MAX_ITERS', 10))
+
+        # --- Output interval control --- #
+        # First and min output interval, delta_t [s], of each step. The max
+        # is the dt_max of the schedule step (delta_t_max).
+        self.dt_init = RunInput['TIMESTEPPING'].get('DT_INIT', 0.1)
+        self.dt_min = RunInput['TIMESTEPPING'].get('DT_MIN', 1e-4)
+
+        # --- Time integration engine --- #
+        # 'IDA' (Assimulo), or the fixed-step 'CN', 'BDF2' or 'SPLIT'
+        # (operator-splitting) solver (see fixedstep), with a max time step of
+        # FIXED_STEP_DT [s] (one step per output interval if not set)
+        self.time_step = RunInput['TIMESTEPPING'].get('TIME_STEP', 'IDA')
+        self.fixed_step_dt = RunInput['TIMESTEPPING'].get('FIXED_STEP_DT')
+        # Newton linear solver of the CN and BDF2 solvers, 'LU' (full
+        # Jacobian), 'SCHUR' (solid diffusion states condensed out, see
+        # fixedstep.SchurLU), or 'GMRES' (matrix-free, with the physics-block
+        # preconditioner, see fixedstep.KrylovSolver; SPGMR for IDA)
+        self.linear_solver = RunInput['TIMESTEPPING'].get('LINEAR_SOLVER',
+                                                          'LU')
+
+        # --- Tolerance and state scaling --- #
+        # With ATOL_SCALED_ON, the IDA atol of each state is SOLVER_TOL times
+        # its typical magnitude (state_scales of the model), rather than
+        # SOLVER_TOL for all. With STATE_SCALING_ON (FULL_1D), the solver
+        # integrates the states and residuals scaled to order one (see
+        # scaledstates), with the results in the physical units.
+        self.atol_scaled = RunInput['TIMESTEPPING'].get('ATOL_SCALED_ON', 0)
+        self.state_scaling = RunInput['TIMESTEPPING'].get(
+            'STATE_SCALING_ON', 0)
+
+        # --- Reduced potential formulation --- #
+        # With REDUCED_POTENTIALS_ON, phi_e and phi_s (apart from the terminal
+        # nodes) are removed from the time integration, and solved for from
+        # their linear equations (see reducedstates)
+        self.reduced_potentials = RunInput['TIMESTEPPING'].get(
+            'REDUCED_POTENTIALS_ON', 0)
+
+        # --- Jacobian --- #
+        # With EXACT_JAC_ON, the state derivatives of De, kappa, Ds and the
+        # exchange current densities are included in the FULL_1D Jacobian
+        # (else these are held fixed)
+        self.exact_jac = RunInput['TIMESTEPPING'].get('EXACT_JAC_ON', 0)
+        # With FD_JAC_ON, the colored finite difference Jacobian (see fdjac)
+        # is used in place of the analytical Jacobian
+        self.fd_jac = RunInput['TIMESTEPPING'].get('FD_JAC_ON', 0)
 
     def gen_param_interp_function(self, fpath, x_scale=1.0, y_scale=1.0,
                                   z_scale=1.0):
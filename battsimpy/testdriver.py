@@ -7,23 +7,49 @@ Example:
     $ python testdriver.py /path/to/battsimpy/
       model_nmc_fvmP2D.conf sim_DCR.conf
 
+With --profile, the wall clock time and peak memory of each phase of the
+simulation are reported (see helper_modules/profiling.py). The cProfile stats
+(--cprofile) and tracemalloc snapshots (--tracemalloc) of each case may also
+be saved, to the --profile_dir directory (default: the results directory).
+
+The simulation progress is logged at the --log_level level (default INFO),
+with at most one progress line per --progress_interval seconds. A JSON-lines
+stream of the simulation events may be written to the --events file.
 """
 import argparse
 
 # battsimpy specific modules
 import model
+from helper_modules import profiling
+from helper_modules import telemetry
 
 
-def main(bsp_path, mod_file, sim_file):
+def main(bsp_path, mod_file, sim_file, profile_on=0, cprofile_on=0,
+         tracemalloc_on=0, profile_dir=None, log_level='INFO',
+         event_path=None, progress_interval=1.0):
     """
     Import the arguments and run the simulation case that has been setup.
     """
+    telemetry.setup_logging(log_level)
+    telem = telemetry.Telemetry(event_path, progress_interval)
+
     print 'battsimpy path setting  :', bsp_path
     print 'Model file setting      :', mod_file
     print 'Simulation file setting :', sim_file
 
+    if profile_on or cprofile_on or tracemalloc_on:
+        profiler = profiling.PhaseProfiler(profile_dir, cprofile_on,
+                                           tracemalloc_on)
+    else:
+        profiler = None
+
     # Build the model and perform simulation
-    full_1d = model.Model(mod_file, sim_file, bsp_path)
+    full_1d = model.Model(mod_file, sim_file, bsp_path, profiler=profiler,
+                          telem=telem)
+
+    if profiler is not None and profile_dir is None:
+        profiler.out_dir = full_1d.model.confdat['FILEPATHS']['OUTPUT_ROOT'] \
+            + full_1d.model.confdat['FILEPATHS']['DATE'] + '/profile/'
 
     # Run simultion
     print 'Running simulation...\n'
@@ -31,6 +57,11 @@ def main(bsp_path, mod_file, sim_file):
     print 'Finished simulation.\n'
     full_1d.saveresults()
     print 'Saved the simulation results.'
+    telem.close()
+
+    if profiler is not None:
+        profiler.report()
+        print 'Saved the profile data to:', profiler.save()
 
 
 if __name__ == '__main__':
@@ -41,6 +72,22 @@ if __name__ == '__main__':
                         help="Assign model using provided config file.")
     parser.add_argument("sim_file",
                         help="Run simulation using provided config file.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Report the time and memory use of each phase.")
+    parser.add_argument("--cprofile", action="store_true",
+                        help="Save the cProfile stats of each case.")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="Save a tracemalloc snapshot of each case.")
+    parser.add_argument("--profile_dir", default=None,
+                        help="Directory for the profiling output.")
+    parser.add_argument("--log_level", default="INFO",
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Level of the logged simulation messages.")
+    parser.add_argument("--events", default=None,
+                        help="File for the JSON-lines simulation events.")
+    parser.add_argument("--progress_interval", type=float, default=1.0,
+                        help="Minimum wall time [s] between the progress "
+                        "reports (0 for every output time).")
 
     args = parser.parse_args()
 
@@ -48,4 +95,6 @@ if __name__ == '__main__':
     mod_file = bsp_path + 'config_files/' + args.mod_file
     sim_file = bsp_path + 'config_files/' + args.sim_file
 
-    main(bsp_path, mod_file, sim_file)
+    main(bsp_path, mod_file, sim_file, args.profile, args.cprofile,
+         args.tracemalloc, args.profile_dir, args.log_level, args.events,
+         args.progress_interval)
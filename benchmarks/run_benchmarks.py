@@ -0,0 +1,722 @@
+# -*- coding: utf-8 -*-
+"""Benchmark suite for battsimpy.
+
+Three sets of benchmarks are run, at several mesh sizes:
+    1) kernels
+        The FULL_1D model functions that are called for each solver
+        iteration (res, jac and its exact and colored finite difference
+        variants, update_cs_mats, calc_heat, update_Cio, the
+        material property interpolants, a sparse LU solve of the
+        Jacobian, the flux operator and edge interpolation kernels of the
+        model kernel backend, see helper_modules/kernels, and the product
+        of a tridiagonal operator) are timed in isolation, with timeit.
+    2) check
+        The analytical Jacobian is checked against the colored finite
+        difference Jacobian (see helper_modules/fdjac), in both the
+        EXACT_JAC_ON modes. The largest relative error of each state block
+        is reported, and the exact Jacobian must be within JAC_CHECK_TOL
+        (else the script exits with status 1). The loop form kernels (see
+        helper_modules/kernels) are also checked against the reference
+        kernels, to KERNEL_CHECK_TOL, un-compiled, and compiled with numba
+        if it is installed. Once for all of the sizes, the BDF2 HPPC test is
+        run on the large mesh with the sparse LU and the GMRES linear
+        solvers, and the voltage of these must agree to GMRES_CHECK_TOL.
+    3) e2e
+        Full simulations are run end to end: a 1C constant current
+        discharge, an HPPC pulse test and a distributed model
+        (full_1d_fvm_ida_dist) constant current discharge. The HPPC test is
+        also run with the exact Jacobian (EXACT_JAC_ON), and with the
+        colored finite difference Jacobian (FD_JAC_ON), to compare the
+        Newton iterations and wall time of the Jacobian modes. The BDF2
+        constant current discharge and HPPC test are also run with the GMRES
+        linear solver, to compare the Krylov and direct Newton solves (the
+        HPPC cases are those of the GMRES check), and the 1C discharge
+        with the numba kernel backend (KERNEL_BACKEND). The 1C discharge and
+        the HPPC test are also run with the reduced order models (spm, spme
+        with the electrolyte, pade_1d and poly_1d), and the voltage of each is
+        compared to that of the full_1d_fvm_ida case (see ACCURACY_REFS),
+        as the max and RMS error, and the difference of the final time (if
+        both stopped for the same reason, else the comparison is flagged).
+        The stop reason of each step is recorded for each case.
+        Both are also run with the ecm model, for its wall time only, as its
+        maps are not fitted to the physical model.
+
+The configs and schedules used are bundled in benchmarks/config_files and
+benchmarks/schedules. The mesh sizes are set in
+benchmarks/config_files/model_<size>.conf.
+
+The results are written to a JSON file, along with the hardware and software
+info of the machine, such that speed-ups and regressions may be tracked over
+time.
+
+Example:
+    $ python run_benchmarks.py --sizes small medium --out bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+import numpy
+import scipy
+import scipy.sparse
+import scipy.sparse.linalg
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'battsimpy'))
+
+# battsimpy specific modules
+import model
+from helper_modules import batteqns, fdjac, kernels
+
+SIZES = ['small', 'medium', 'large']
+
+# Max relative error of each state block for the exact Jacobian check
+JAC_CHECK_TOL = 1e-5
+# Max relative difference of the compiled kernels to the reference kernels
+KERNEL_CHECK_TOL = 1e-12
+# GMRES check: the LU and GMRES cases of the BDF2 HPPC test, on the mesh
+# size GMRES_CHECK_SIZE, and the max voltage difference of these [V]
+GMRES_CHECK_CASES = ('hppc_bdf2', 'hppc_bdf2_gmres')
+GMRES_CHECK_SIZE = 'large'
+GMRES_CHECK_TOL = 1e-3
+
+# ECM config inputs (the example ECM maps of the model data, which are not
+# fitted to the physical models)
+ECM_CONF = {'MODEL': {'MODEL_TYPE': 'ecm'},
+            'ECM_PARAMS': {'ECM_ORDER': 2,
+                           'OCV_FNAME': 'ocv.csv',
+                           'RES_OHMIC_FNAME': 'res_ohm.csv',
+                           'RES_RC_FNAMES': ['res_0.csv', 'res_1.csv'],
+                           'TAU_RC_FNAMES': ['tau_0.csv', 'tau_1.csv'],
+                           'ECM_OCV_CAP': 2.2}}
+
+# End to end cases: case name -> (sim config file, schedule file, extra
+# config overrides)
+E2E_CASES = {
+    'cc_discharge': ('sim_bench_CC.conf', 'Schedule_bench_CC.csv', {}),
+    'hppc': ('sim_bench_HPPC.conf', 'Schedule_bench_HPPC.csv', {}),
+    'hppc_exact_jac': ('sim_bench_HPPC.conf', 'Schedule_bench_HPPC.csv',
+                       {'TIMESTEPPING': {'EXACT_JAC_ON': 1}}),
+    'hppc_fd_jac': ('sim_bench_HPPC.conf', 'Schedule_bench_HPPC.csv',
+                    {'TIMESTEPPING': {'FD_JAC_ON': 1}}),
+    'cc_discharge_bdf2': ('sim_bench_CC.conf', 'Schedule_bench_CC.csv',
+                          {'TIMESTEPPING': {'TIME_STEP': 'BDF2'}}),
+    'cc_discharge_numba': ('sim_bench_CC.conf', 'Schedule_bench_CC.csv',
+                           {'MODEL': {'KERNEL_BACKEND': 'numba'}}),
+    'cc_discharge_bdf2_gmres': ('sim_bench_CC.conf', 'Schedule_bench_CC.csv',
+                                {'TIMESTEPPING': {'TIME_STEP': 'BDF2',
+                                                  'LINEAR_SOLVER': 'GMRES'}}),
+    'hppc_bdf2': ('sim_bench_HPPC.conf', 'Schedule_bench_HPPC.csv',
+                  {'TIMESTEPPING': {'TIME_STEP': 'BDF2'}}),
+    'hppc_bdf2_gmres': ('sim_bench_HPPC.conf', 'Schedule_bench_HPPC.csv',
+                        {'TIMESTEPPING': {'TIME_STEP': 'BDF2',
+                                          'LINEAR_SOLVER': 'GMRES'}}),
+    'cc_discharge_spm': ('sim_bench_CC.conf', 'Schedule_bench_CC.csv',
+                         {'MODEL': {'MODEL_TYPE': 'spm'}}),
+    'hppc_spm': ('sim_bench_HPPC.conf', 'Schedule_bench_HPPC.csv',
+                 {'MODEL': {'MODEL_TYPE': 'spm'}}),
+    'cc_discharge_spme': ('sim_bench_CC.conf', 'Schedule_bench_CC.csv',
+                          {'MODEL': {'MODEL_TYPE': 'spme'}}),
+    'hppc_spme': ('sim_bench_HPPC.conf', 'Schedule_bench_HPPC.csv',
+                  {'MODEL': {'MODEL_TYPE': 'spme'}}),
+    'cc_discharge_pade': ('sim_bench_CC.conf', 'Schedule_bench_CC.csv',
+                          {'MODEL': {'MODEL_TYPE': 'pade_1d'}}),
+    'hppc_pade': ('sim_bench_HPPC.conf', 'Schedule_bench_HPPC.csv',
+                  {'MODEL': {'MODEL_TYPE': 'pade_1d'}}),
+    'cc_discharge_poly': ('sim_bench_CC.conf', 'Schedule_bench_CC.csv',
+                          {'MODEL': {'MODEL_TYPE': 'poly_1d'}}),
+    'hppc_poly': ('sim_bench_HPPC.conf', 'Schedule_bench_HPPC.csv',
+                  {'MODEL': {'MODEL_TYPE': 'poly_1d'}}),
+    'cc_discharge_ecm': ('sim_bench_CC.conf', 'Schedule_bench_CC.csv',
+                         ECM_CONF),
+    'hppc_ecm': ('sim_bench_HPPC.conf', 'Schedule_bench_HPPC.csv', ECM_CONF),
+    'dist_cc_discharge': ('sim_bench_dist.conf', 'Schedule_bench_dist.csv',
+                          {'MODEL': {'MODEL_TYPE': 'full_1d_fvm_ida_dist',
+                                     'N_SUBMOD': 3}}),
+}
+
+# Stop reasons of the runs that did not finish, for which the accuracy
+# comparison is marked as failed
+UNFINISHED_STOPS = ['integration_failure']
+
+# Reduced order model cases, and the full_1d_fvm_ida case of each, for the
+# accuracy report
+ACCURACY_REFS = {
+    'cc_discharge_spm': 'cc_discharge',
+    'hppc_spm': 'hppc',
+    'cc_discharge_spme': 'cc_discharge',
+    'hppc_spme': 'hppc',
+    'cc_discharge_pade': 'cc_discharge',
+    'hppc_pade': 'hppc',
+    'cc_discharge_poly': 'cc_discharge',
+    'hppc_poly': 'hppc',
+}
+
+
+class Quiet():
+    """
+    Context manager to suppress the (verbose) simulation printouts.
+    """
+    def __init__(self, on=True):
+        self.on = on
+
+    def __enter__(self):
+        if self.on:
+            sys.stdout.flush()
+            self.stdout_fd = os.dup(1)
+            self.devnull = open(os.devnull, 'w')
+            os.dup2(self.devnull.fileno(), 1)
+            self.stdout = sys.stdout
+            sys.stdout = self.devnull
+
+    def __exit__(self, *args):
+        if self.on:
+            sys.stdout.flush()
+            os.dup2(self.stdout_fd, 1)
+            os.close(self.stdout_fd)
+            sys.stdout = self.stdout
+            self.devnull.close()
+
+
+def read_proc_file(path, key):
+    """
+    Return the value of the first "key : value" line of a /proc file.
+    """
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                if line.startswith(key):
+                    return line.split(':', 1)[1].strip()
+    except IOError:
+        pass
+    return None
+
+
+def hardware_info():
+    """
+    Hardware and software info of the machine the benchmarks are run on.
+    """
+    try:
+        import multiprocessing
+        cpu_count = multiprocessing.cpu_count()
+    except NotImplementedError:
+        cpu_count = None
+
+    try:
+        blas_libs = numpy.__config__.blas_opt_info.get('libraries', [])
+    except AttributeError:
+        blas_libs = []
+
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR,
+            stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    try:
+        import assimulo
+        assimulo_version = getattr(assimulo, '__version__', 'unknown')
+    except ImportError:
+        assimulo_version = None
+
+    info = {'timestamp': datetime.datetime.now().isoformat(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': (read_proc_file('/proc/cpuinfo', 'model name')
+                          or platform.processor()),
+            'cpu_count': cpu_count,
+            'memory': read_proc_file('/proc/meminfo', 'MemTotal'),
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'scipy': scipy.__version__,
+            'assimulo': assimulo_version,
+            'blas': blas_libs,
+            'git_commit': commit}
+
+    return info
+
+
+def conf_paths(size, sim_file):
+    """
+    Full paths to the model and sim config files of the benchmark.
+    """
+    mod_conf = os.path.join(BENCH_DIR, 'config_files',
+                            'model_' + size + '.conf')
+    sim_conf = os.path.join(BENCH_DIR, 'config_files', sim_file)
+
+    return mod_conf, sim_conf
+
+
+def conf_overrides(sched_file, output_root, extra=None):
+    """
+    Config overrides pointing the model at the repo data, the bundled
+    schedules and a temporary output directory.
+    """
+    data_root = os.path.join(REPO_DIR, 'model_parameters') + '/'
+    sched_path = os.path.relpath(
+        os.path.join(BENCH_DIR, 'schedules', sched_file), data_root)
+
+    overrides = {'FILEPATHS': {'INPUT_DATA_ROOT': data_root,
+                               'SCHED_PATH': sched_path,
+                               'OUTPUT_ROOT': output_root + '/',
+                               'DATE': 'bench'}}
+    if extra:
+        for k1 in extra.keys():
+            overrides.setdefault(k1, {}).update(extra[k1])
+
+    return overrides
+
+
+def time_func(func, repeat, min_time=0.2):
+    """
+    Time func with timeit, with the number of calls per repeat calibrated
+    such that each repeat takes at least min_time [s].
+    Returns the min, median and mean time per call [s].
+    """
+    timer = timeit.Timer(func)
+
+    number = 1
+    while True:
+        t = timer.timeit(number)
+        if t >= min_time or number >= 10**6:
+            break
+        number *= 10
+
+    times = numpy.array(timer.repeat(repeat=repeat, number=number)) / number
+
+    return {'number': number,
+            'repeat': repeat,
+            'min': float(numpy.amin(times)),
+            'median': float(numpy.median(times)),
+            'mean': float(numpy.mean(times))}
+
+
+def load_model(size, output_root, quiet, extra=None):
+    """
+    FULL_1D Simulator (or that of the extra config overrides, e.g., the
+    MODEL_TYPE) of the size mesh, at the start of a 1C discharge.
+    """
+    mod_conf, sim_conf = conf_paths(size, 'sim_bench_CC.conf')
+    overrides = conf_overrides('Schedule_bench_CC.csv', output_root, extra)
+
+    with Quiet(quiet):
+        bsp = model.Model(mod_conf, sim_conf, REPO_DIR + '/',
+                          conf_overrides=overrides)
+        sim = bsp.model
+
+        # Load the model with a 1C discharge, such that the kinetics and
+        # transport are not at the trivial rest state.
+        sim.get_input('Crate', -1.0)
+        sim.set_model_input()
+        if not sim.step_transition():
+            sim.imp_sim.make_consistent('IDA_YA_YDP_INIT')
+
+    return sim
+
+
+def bench_kernels(size, output_root, repeat, quiet):
+    """
+    Time the FULL_1D model functions at the 1C discharge state.
+    """
+    sim = load_model(size, output_root, quiet)
+
+    imp_mod = sim.imp_mod
+    p = sim.p
+    t = sim.imp_sim.t
+    y = numpy.array(sim.imp_sim.y)
+    yd = numpy.array(sim.imp_sim.yd)
+
+    csa = y[imp_mod.csa_inds]
+    csc = y[imp_mod.csc_inds]
+    ce = y[imp_mod.ce_inds]
+    T = y[imp_mod.T_ind]
+    eta_a, eta_c, Uref_a, Uref_c, csa_ss, csc_ss = imp_mod.get_eta_uref(
+        csa, csc, y[imp_mod.ja_inds], y[imp_mod.jc_inds],
+        y[imp_mod.pa_inds], y[imp_mod.pc_inds], y[imp_mod.pe_inds])
+    csa_o = (imp_mod.C_cso_a.dot(csa)).flatten()
+    csc_o = (imp_mod.C_cso_c.dot(csc)).flatten()
+    xa = csa_ss / p.csa_max
+    xc = csc_ss / p.csc_max
+
+    jac = scipy.sparse.csc_matrix(imp_mod.jac(10., t, y, yd))
+    res = imp_mod.res(t, y, yd)
+
+    def jac_exact():
+        p.exact_jac = 1
+        try:
+            return imp_mod.jac(10., t, y, yd)
+        finally:
+            p.exact_jac = 0
+
+    jac_fd = fdjac.ColoredJacobian(imp_mod)
+
+    kern = imp_mod.kern
+    P_a = numpy.tile(p.r_e_a**2, (p.Na, 1))
+    A_ce_tri = imp_mod.build_Ace_tri(ce, T)
+
+    funcs = {
+        'res': lambda: imp_mod.res(t, y, yd),
+        'jac': lambda: imp_mod.jac(10., t, y, yd),
+        'jac_exact': jac_exact,
+        'jac_fd_colored': lambda: jac_fd(10., t, y, yd),
+        'update_cs_mats': lambda: imp_mod.update_cs_mats(
+            csa, csc, csa_ss, csc_ss, csa_o, csc_o),
+        'calc_heat': lambda: imp_mod.calc_heat(y, eta_a, eta_c,
+                                               Uref_a, Uref_c),
+        'update_Cio': lambda: imp_mod.update_Cio(csa_ss, csc_ss, ce, T),
+        'get_eta_uref': lambda: imp_mod.get_eta_uref(
+            csa, csc, y[imp_mod.ja_inds], y[imp_mod.jc_inds],
+            y[imp_mod.pa_inds], y[imp_mod.pc_inds], y[imp_mod.pe_inds]),
+        'uref_interp': lambda: (p.uref_a(xa), p.uref_c(xc),
+                                p.duref_a(xa), p.duref_c(xc)),
+        'Diff_ce': lambda: imp_mod.Diff_ce(ce, T),
+        'kapp_ce': lambda: imp_mod.kapp_ce(ce, T),
+        'jac_lu_solve': lambda: scipy.sparse.linalg.splu(jac).solve(res),
+        'kern_edge_interp': lambda: kern.edge_interp(p.mesh, ce),
+        'kern_flux_diags': lambda: kern.flux_diags(p.mesh, p.x_e),
+        'kern_particle_flux_diags': lambda: kern.particle_flux_diags(
+            p.mesh_ra, p.Na, P_a),
+        'tridiag_apply': lambda: batteqns.tridiag_apply(A_ce_tri, ce),
+    }
+
+    out = {'num_states': len(y),
+           'jac_nnz': int(jac.nnz),
+           'jac_fd_colors': int(jac_fd.num_colors),
+           'kernel_backend': kern.name,
+           'times': {}}
+    for name in sorted(funcs.keys()):
+        out['times'][name] = time_func(funcs[name], repeat)
+        print '  %-24s %12.3e s' % (name, out['times'][name]['min'])
+
+    return out
+
+
+def check_jacs(size, output_root, quiet):
+    """
+    Check the FULL_1D Jacobian, in both EXACT_JAC_ON modes, against the
+    colored finite difference Jacobian (fdjac.check_jac) at the 1C
+    discharge state. The exact Jacobian fails the check if the error of a
+    state block is above JAC_CHECK_TOL.
+    """
+    sim = load_model(size, output_root, quiet)
+
+    imp_mod = sim.imp_mod
+    p = sim.p
+    t = sim.imp_sim.t
+    y = numpy.array(sim.imp_sim.y)
+    yd = numpy.array(sim.imp_sim.yd)
+
+    jac_fd = fdjac.ColoredJacobian(imp_mod)
+
+    out = {'num_states': len(y),
+           'num_colors': int(jac_fd.num_colors),
+           'dense_rows': len(jac_fd.dense),
+           'failed': []}
+    for name, exact in [('jac', 0), ('jac_exact', 1)]:
+        p.exact_jac = exact
+        try:
+            imp_mod.res(t, y, yd)
+            t0 = timeit.default_timer()
+            report = fdjac.check_jac(imp_mod, t, y, yd, c=10.,
+                                     fd_jac=jac_fd)
+            out[name + '_check_time'] = timeit.default_timer() - t0
+        finally:
+            p.exact_jac = 0
+
+        out[name] = {}
+        print '  %s (%d states, %d colors):' % (name, len(y),
+                                                 jac_fd.num_colors)
+        for block, max_err, col_block in report:
+            out[name][block] = {'max_rel_err': max_err,
+                                'at_cols': col_block}
+            flag = ''
+            if exact and max_err > JAC_CHECK_TOL:
+                out['failed'].append(block)
+                flag = '  FAIL'
+            print '    %-6s %10.3e  %-6s%s' % (block, max_err, col_block,
+                                               flag)
+
+    # Loop form kernels, un-compiled, and compiled (if numba is installed),
+    # against the reference kernels
+    kerns = [kernels.LoopKernels()]
+    if kernels.numba is not None:
+        kerns.append(kernels.get_kernels('numba'))
+
+    out['kernels'] = {}
+    for kern in kerns:
+        out['kernels'][kern.name] = {}
+        print '  kernels (%s):' % kern.name
+        for name, max_err in kernels.check_kernels(kern):
+            out['kernels'][kern.name][name] = max_err
+            flag = ''
+            if max_err > KERNEL_CHECK_TOL:
+                out['failed'].append(kern.name + ':' + name)
+                flag = '  FAIL'
+            print '    %-24s %10.3e%s' % (name, max_err, flag)
+
+    return out
+
+
+def check_gmres(output_root, quiet):
+    """
+    Compare the BDF2 HPPC test with the GMRES linear solver to that with the
+    sparse LU (GMRES_CHECK_CASES), on the GMRES_CHECK_SIZE mesh. The GMRES
+    case fails the check if the voltage differs by more than
+    GMRES_CHECK_TOL, or if the cases stopped for different reasons.
+    """
+    size = GMRES_CHECK_SIZE
+    out = {'size': size, 'failed': []}
+    traces = []
+    for case in GMRES_CHECK_CASES:
+        out[case], trace = bench_e2e(case, size, output_root, 1, quiet)
+        traces.append(trace)
+
+    trace_lu, trace_kr = traces
+    err = []
+    for step in sorted(set(trace_lu) & set(trace_kr)):
+        t, V = trace_kr[step]
+        t_ref, V_ref = trace_lu[step]
+        on = (t >= t_ref[0]) & (t <= t_ref[-1])
+        err.append(V[on] - numpy.interp(t[on], t_ref, V_ref))
+    err = numpy.concatenate(err)
+
+    out['max_volt_diff'] = float(numpy.amax(abs(err)))
+    out['speedup'] = out[GMRES_CHECK_CASES[0]]['min'] \
+        / out[GMRES_CHECK_CASES[1]]['min']
+
+    stops = [out[case]['stop_reason'] for case in GMRES_CHECK_CASES]
+    flag = ''
+    if out['max_volt_diff'] > GMRES_CHECK_TOL or stops[0] != stops[1]:
+        out['failed'].append('gmres')
+        flag = '  FAIL'
+    print '  GMRES vs. LU, %s mesh: max %7.3f mV, speed-up %.2f%s' % (
+        size, 1e3 * out['max_volt_diff'], out['speedup'], flag)
+
+    return out
+
+
+def bench_e2e(case, size, output_root, repeat, quiet):
+    """
+    Run a full simulation case end to end. Returns the summary, and the
+    voltage trace of each step, as run name -> (test_time, Volt) arrays.
+    """
+    sim_file, sched_file, extra = E2E_CASES[case]
+    mod_conf, sim_conf = conf_paths(size, sim_file)
+    overrides = conf_overrides(sched_file, output_root, extra)
+
+    walls = []
+    for irep in range(repeat):
+        with Quiet(quiet):
+            bsp = model.Model(mod_conf, sim_conf, REPO_DIR + '/',
+                              conf_overrides=overrides)
+            t0 = timeit.default_timer()
+            bsp.simulate()
+            walls.append(timeit.default_timer() - t0)
+
+    # Output summary of the (last) simulation, with the stop reason of each
+    # step (as '<case index>/<run name>'), and of the final step
+    num_out = 0
+    t_final = 0.0
+    V_final = None
+    stop_final = None
+    stop_reasons = {}
+    trace = {}
+    for ires, results in enumerate(bsp.results_holder):
+        for run_name in sorted(results.keys()):
+            res_step = results[run_name]
+            if hasattr(res_step, 'test_time') and len(res_step.test_time):
+                trace[(ires, run_name)] = (
+                    numpy.array(res_step.test_time, dtype='d').flatten(),
+                    numpy.array(res_step.Volt, dtype='d').flatten())
+                stop_reasons['%d/%s' % (ires, run_name)] = \
+                    res_step.stop_reason
+                num_out += len(res_step.test_time)
+                if res_step.test_time[-1] >= t_final:
+                    t_final = float(res_step.test_time[-1])
+                    V_final = float(numpy.array(res_step.Volt).flatten()[-1])
+                    stop_final = res_step.stop_reason
+
+    out = {'repeat': repeat,
+           'min': min(walls),
+           'median': float(numpy.median(walls)),
+           'mean': float(numpy.mean(walls)),
+           'num_output_points': num_out,
+           'final_time': t_final,
+           'final_voltage': V_final,
+           'stop_reason': stop_final,
+           'stop_reasons': stop_reasons,
+           'solver_stats': bsp.stats_holder}
+
+    print '  %-24s %10.3f s  (%d outputs, t_end=%.1f s, %s)' % (
+        case, out['min'], num_out, t_final, stop_final)
+
+    return out, trace
+
+
+def accuracy_report(traces, e2e):
+    """
+    Voltage error of the reduced order model cases (ACCURACY_REFS) against
+    their full_1d_fvm_ida case, for each mesh size where both were run
+    (traces, (case, size) -> the voltage traces of bench_e2e, and e2e, the
+    end to end results). The error is taken at the output times of the
+    reduced case, within the time range of the same step of the full case
+    (i.e., over the time span of both), as the max and RMS [V], and is
+    reported with the stop reasons of both cases.
+    The comparison is marked as failed if either case did not finish, e.g.,
+    a reference run that stopped on an integration failure, short of the
+    cut-off (UNFINISHED_STOPS). The difference of the final times [s] is
+    only reported if both cases stopped for the same reason (e.g., 'Vmin'),
+    and neither failed. Otherwise, it is None and the comparison is flagged.
+    """
+    out = {}
+    for case in sorted(ACCURACY_REFS):
+        ref = ACCURACY_REFS[case]
+        for size in SIZES:
+            if (case, size) not in traces or (ref, size) not in traces:
+                continue
+            trace, trace_ref = traces[(case, size)], traces[(ref, size)]
+            stop = e2e[case][size]['stop_reason']
+            stop_ref = e2e[ref][size]['stop_reason']
+
+            err = []
+            for step in sorted(set(trace) & set(trace_ref)):
+                t, V = trace[step]
+                t_ref, V_ref = trace_ref[step]
+                on = (t >= t_ref[0]) & (t <= t_ref[-1])
+                err.append(V[on] - numpy.interp(t[on], t_ref, V_ref))
+            err = numpy.concatenate(err)
+
+            failed = stop in UNFINISHED_STOPS or stop_ref in UNFINISHED_STOPS
+            if stop == stop_ref and not failed:
+                t_end = max(t[-1] for t, V in trace.values())
+                t_end_ref = max(t[-1] for t, V in trace_ref.values())
+                t_end_diff = float(t_end - t_end_ref)
+                t_end_str = 't_end %+.1f s' % t_end_diff
+            else:
+                t_end_diff = None
+                t_end_str = 'FLAG: t_end not compared'
+
+            out.setdefault(case, {})[size] = {
+                'reference': ref,
+                'max_volt_err': float(numpy.amax(abs(err))),
+                'rms_volt_err': float(numpy.sqrt(numpy.mean(err**2))),
+                'final_time_diff': t_end_diff,
+                'stop_reason': stop,
+                'reference_stop_reason': stop_ref,
+                'flagged': t_end_diff is None,
+                'failed': failed}
+
+            print '  %-24s %-8s max %7.2f mV, rms %7.2f mV, stop %s ' \
+                '(ref. %s), %s%s' % (
+                    case, size, 1e3 * numpy.amax(abs(err)),
+                    1e3 * numpy.sqrt(numpy.mean(err**2)), stop, stop_ref,
+                    t_end_str, ', FAILED' if failed else '')
+
+    return out
+
+
+def main(sizes, suite, repeat, e2e_repeat, cases, out_file, verbose):
+    """
+    Run the benchmarks and write the results to out_file.
+    """
+    output_root = tempfile.mkdtemp(prefix='battsimpy_bench_')
+    os.mkdir(os.path.join(output_root, 'bench'))
+
+    results = {'hardware': hardware_info(),
+               'kernels': {},
+               'jac_check': {},
+               'gmres_check': {},
+               'end_to_end': {},
+               'accuracy': {}}
+    traces = {}
+
+    try:
+        for size in sizes:
+            if suite in ['kernels', 'all']:
+                print 'Kernels, ' + size + ' mesh:'
+                results['kernels'][size] = bench_kernels(
+                    size, output_root, repeat, not verbose)
+
+            if suite in ['check', 'all']:
+                print 'Jacobian check, ' + size + ' mesh:'
+                results['jac_check'][size] = check_jacs(
+                    size, output_root, not verbose)
+
+            if suite in ['e2e', 'all']:
+                print 'End to end, ' + size + ' mesh:'
+                for case in cases:
+                    results['end_to_end'].setdefault(case, {})[size], \
+                        traces[(case, size)] = bench_e2e(
+                            case, size, output_root, e2e_repeat, not verbose)
+
+        if suite in ['check', 'all']:
+            print 'GMRES check:'
+            results['gmres_check'] = check_gmres(output_root, not verbose)
+    finally:
+        shutil.rmtree(output_root, ignore_errors=True)
+
+    if suite in ['e2e', 'all'] and any(
+            case in cases and ACCURACY_REFS[case] in cases
+            for case in ACCURACY_REFS):
+        print 'Accuracy vs. full_1d_fvm_ida:'
+        results['accuracy'] = accuracy_report(traces,
+                                              results['end_to_end'])
+
+    with open(out_file, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print 'Wrote benchmark results to:', out_file
+
+    failed = [size for size in results['jac_check']
+              if results['jac_check'][size]['failed']]
+    if failed:
+        print 'Jacobian check failed for the mesh sizes:', failed
+    if results['gmres_check'].get('failed'):
+        print 'GMRES check failed, on the %s mesh' % GMRES_CHECK_SIZE
+        failed.append('gmres')
+    acc_failed = ['%s/%s' % (case, size)
+                  for case in sorted(results['accuracy'])
+                  for size in sorted(results['accuracy'][case])
+                  if results['accuracy'][case][size]['failed']]
+    if acc_failed:
+        print 'Accuracy comparison failed (unfinished runs):', acc_failed
+        failed += acc_failed
+
+    return not failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", nargs='+', choices=SIZES,
+                        default=['small', 'medium'],
+                        help="Mesh sizes to run.")
+    parser.add_argument("--suite",
+                        choices=['kernels', 'check', 'e2e', 'all'],
+                        default='all',
+                        help="Benchmark set to run.")
+    parser.add_argument("--cases", nargs='+',
+                        choices=sorted(E2E_CASES.keys()),
+                        default=sorted(E2E_CASES.keys()),
+                        help="End to end cases to run.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Number of timeit repeats for the kernels.")
+    parser.add_argument("--e2e-repeat", type=int, default=1,
+                        help="Number of runs for each end to end case.")
+    parser.add_argument("--out", default="benchmark_results.json",
+                        help="JSON output file.")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Show the simulation printouts.")
+
+    args = parser.parse_args()
+
+    ok = main(args.sizes, args.suite, args.repeat, args.e2e_repeat,
+              args.cases, args.out, args.verbose)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,177 @@
+# -*- coding:utf-8 -*-
+"""Tests of the tridiagonal FVM operators of batteqns.
+
+The operators (flux_diags, grad_diags, edge_interp, tridiag_block_diag, and
+the dense builders on top of them) are compared with the loop
+implementations that they replaced, on uniform and non-uniform meshes.
+
+Run with:
+    python -m unittest discover -s tests -p 'test_*.py'
+"""
+import os
+import sys
+import unittest
+
+import numpy
+import scipy.linalg
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'battsimpy', 'helper_modules'))
+
+import batteqns
+
+
+# Reference (loop) implementations of the original batteqns builders
+def ref_mid_to_edge(var_mid, x_e):
+    var_edge = [var_mid[0]]
+    for i in range(len(var_mid) - 1):
+        w = (x_e[i + 1] - x_e[i]) / ((x_e[i + 2] - x_e[i + 1])
+                                     + (x_e[i + 1] - x_e[i]))
+        var_edge.append(var_mid[i] * var_mid[i + 1]
+                        / (w * var_mid[i + 1] + (1 - w) * var_mid[i]))
+    var_edge.append(var_mid[-1])
+
+    return numpy.array(var_edge)
+
+
+def ref_flux_mat_builder(N, x_m, vols, P):
+    A = numpy.zeros([N, N], dtype='d')
+
+    for i in range(1, N - 1):
+        A[i, i - 1] = (1. / vols[i]) * (P[i]) / (x_m[i] - x_m[i - 1])
+        A[i, i] = -(1. / vols[i]) * (P[i]) / (x_m[i] - x_m[i - 1]) \
+            - (1. / vols[i]) * (P[i + 1]) / (x_m[i + 1] - x_m[i])
+        A[i, i + 1] = (1. / vols[i]) * (P[i + 1]) / (x_m[i + 1] - x_m[i])
+
+    i = 0
+    A[0, 0] = -(1. / vols[i]) * (P[i + 1]) / (x_m[i + 1] - x_m[i])
+    A[0, 1] = (1. / vols[i]) * (P[i + 1]) / (x_m[i + 1] - x_m[i])
+
+    i = N - 1
+    A[i, i - 1] = (1. / vols[i]) * (P[i]) / (x_m[i] - x_m[i - 1])
+    A[i, i] = -(1. / vols[i]) * (P[i]) / (x_m[i] - x_m[i - 1])
+
+    return A
+
+
+def ref_grad_mat(N, x):
+    G = numpy.zeros([N, N])
+    for i in range(1, N - 1):
+        G[i, [i - 1, i + 1]] = [-1. / (x[i + 1] - x[i - 1]),
+                                1. / (x[i + 1] - x[i - 1])]
+
+    G[0, [0, 1]] = [-1. / (x[1] - x[0]), 1. / (x[1] - x[0])]
+    G[-1, [-2, -1]] = [-1. / (x[-1] - x[-2]), 1. / (x[-1] - x[-2])]
+
+    return G
+
+
+def meshes(N=12, seed=0):
+    """
+    Cell edges of a uniform, a geometric (batteqns.nonlinspace, as for the
+    particle radial meshes) and a random non-uniform mesh of N cells.
+    """
+    rs = numpy.random.RandomState(seed)
+
+    return [('uniform', numpy.linspace(0., 1e-4, N + 1)),
+            ('nonlinspace', numpy.sort(batteqns.nonlinspace(5e-6, 0.85,
+                                                            N + 1))),
+            ('random', numpy.cumsum(numpy.r_[0., rs.uniform(0.2, 3., N)]))]
+
+
+def metrics(x_e):
+    """
+    Mid-points, volumes and MeshMetrics of the mesh of the cell edges x_e.
+    """
+    x_m = 0.5 * (x_e[1:] + x_e[:-1])
+    vols = x_e[1:] - x_e[:-1]
+
+    return x_m, vols, batteqns.MeshMetrics(x_m, vols, x_e)
+
+
+class TestTridiagOperators(unittest.TestCase):
+
+    def assertClose(self, a, b, rtol=1e-12):
+        scale = max(numpy.amax(abs(b)), 1e-300)
+        self.assertTrue(numpy.amax(abs(a - b)) <= rtol * scale,
+                        'max rel diff %g' % (numpy.amax(abs(a - b)) / scale))
+
+    def test_flux_mat_builder(self):
+        rs = numpy.random.RandomState(1)
+        for name, x_e in meshes():
+            N = len(x_e) - 1
+            x_m, vols, mesh = metrics(x_e)
+            P = rs.uniform(0.5, 2., N + 1)
+
+            self.assertClose(batteqns.flux_mat_builder(N, x_m, vols, P),
+                             ref_flux_mat_builder(N, x_m, vols, P))
+
+            # Without the volume scaling
+            self.assertClose(
+                batteqns.tridiag_mat(batteqns.flux_diags(mesh, P, 0)),
+                ref_flux_mat_builder(N, x_m, numpy.ones(N), P))
+
+    def test_flux_diags_2d(self):
+        # Several particles, with the edge values of each in the rows of P
+        rs = numpy.random.RandomState(2)
+        n_p = 5
+        for name, x_e in meshes():
+            N = len(x_e) - 1
+            x_m, vols, mesh = metrics(x_e)
+            P = rs.uniform(0.5, 2., (n_p, N + 1))
+
+            A = batteqns.tridiag_mat(
+                batteqns.tridiag_block_diag(batteqns.flux_diags(mesh, P)))
+            A_ref = scipy.linalg.block_diag(
+                *[ref_flux_mat_builder(N, x_m, vols, P[k])
+                  for k in range(n_p)])
+
+            self.assertClose(A, A_ref)
+
+            # Sparse form, and the matrix-free product
+            A_sp = batteqns.tridiag_mat(
+                batteqns.tridiag_block_diag(batteqns.flux_diags(mesh, P)),
+                sparse=1)
+            self.assertClose(A_sp.toarray(), A_ref)
+
+            x = rs.uniform(size=n_p * N)
+            self.assertClose(batteqns.tridiag_apply(
+                batteqns.tridiag_block_diag(batteqns.flux_diags(mesh, P)), x),
+                A_ref.dot(x))
+
+    def test_grad_mat(self):
+        for name, x_e in meshes():
+            N = len(x_e) - 1
+            x_m = 0.5 * (x_e[1:] + x_e[:-1])
+
+            self.assertClose(batteqns.grad_mat(N, x_m), ref_grad_mat(N, x_m))
+
+    def test_mid_to_edge(self):
+        rs = numpy.random.RandomState(3)
+        for name, x_e in meshes():
+            N = len(x_e) - 1
+            x_m, vols, mesh = metrics(x_e)
+            c = rs.uniform(500., 2000., N)
+
+            ref = ref_mid_to_edge(c, x_e)
+            self.assertClose(batteqns.mid_to_edge(c, x_e), ref)
+            self.assertClose(batteqns.edge_interp(mesh, c), ref)
+
+    def test_tridiag_apply_scale(self):
+        rs = numpy.random.RandomState(4)
+        for name, x_e in meshes():
+            N = len(x_e) - 1
+            x_m, vols, mesh = metrics(x_e)
+            tri = batteqns.flux_diags(mesh, rs.uniform(0.5, 2., N + 1))
+            A = batteqns.tridiag_mat(tri)
+            x = rs.uniform(size=N)
+            s = rs.uniform(size=N)
+
+            self.assertClose(batteqns.tridiag_apply(tri, x), A.dot(x))
+            self.assertClose(
+                batteqns.tridiag_mat(batteqns.tridiag_scale(s, tri)),
+                numpy.diag(s).dot(A))
+
+
+if __name__ == '__main__':
+    unittest.main()
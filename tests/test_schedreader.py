@@ -0,0 +1,133 @@
+# -*- coding:utf-8 -*-
+"""Tests of the test schedule reader and compiler (schedreader).
+
+Run with:
+    python -m unittest discover -s tests -p 'test_*.py'
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'battsimpy', 'helper_modules'))
+
+import schedreader
+
+HEADER = ('StepNumber,StepName,InputType,InputValue,StepDuration_sec,dt,'
+          'StepTemp_C,VoltControlOn_chg,VoltControlOn_cdhg,VoltMax,VoltMin,'
+          'CathodeMax,CathodeMin,AnodeMax,AnodeMin,ProfileFile')
+
+# Rows without the trailing ProfileFile field are padded by readsched
+SCHED = [
+    '1,Rest0,Rest,0,10,1,25,0,0,4.2,3.0,4.35,2.8,1.1,0.001',
+    '2,CC_discharge,Crate,-1,3600,60,25,0,0,4.2,3.0,4.35,2.8,1.1,0.001',
+    '3,Rest1,Rest,0,600,10,25,0,0,4.2,3.0,4.35,2.8,1.1,0.001',
+    '4,CC_charge,Crate,0.5,7200,60,25,1,0,4.2,3.0,4.35,2.8,1.1,0.001',
+    '5,CV_hold,Voltage,4.1,100,1,25,0,0,4.2,3.0,4.35,2.8,1.1,0.001',
+    '6,Drive,Profile,2.0,0,1,25,0,0,4.2,3.0,4.35,2.8,1.1,0.001,drive.csv',
+    '7,Repeat,Rest,0,3,1,25,0,0,4.2,3.0,4.35,2.8,1.1,0.001',
+]
+
+
+class TestCompileSched(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.tmp_dir, 'sched.csv'), 'w') as f:
+            f.write('\n'.join([HEADER] + SCHED) + '\n')
+        with open(os.path.join(self.tmp_dir, 'drive.csv'), 'w') as f:
+            f.write('5.0,1.0\n10.0,-1.0\n10.0,0.5\n65.0,0.5\n')
+
+        self.dat = schedreader.readsched(
+            os.path.join(self.tmp_dir, 'sched.csv'))
+        self.profiles = schedreader.readprofiles(self.dat, self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_readsched(self):
+        self.assertEqual(len(self.dat), len(SCHED))
+        self.assertEqual(list(self.dat['ProfileFile']),
+                         ['', '', '', '', '', 'drive.csv', ''])
+        self.assertEqual(self.dat['VoltControlOn_chg'].dtype, numpy.int64)
+
+        t_prof, v_prof = self.profiles['drive.csv']
+        self.assertTrue(numpy.allclose(t_prof, [0., 5., 5., 60.]))
+        self.assertTrue(numpy.allclose(v_prof, [1., -1., 0.5, 0.5]))
+
+    def test_repeat(self):
+        sched = schedreader.compile_sched(self.dat, -2.0,
+                                          profiles=self.profiles)
+
+        # The Repeat row is not a step, its duration is the number of cycles
+        self.assertEqual(sched['num_steps'], 6)
+        self.assertEqual(sched['num_cycs'], 3)
+        self.assertEqual(list(sched['steps']['name']),
+                         ['Rest0', 'CC_discharge', 'Rest1', 'CC_charge',
+                          'CV_hold', 'Drive'])
+        self.assertEqual(list(sched['run_step']), range(6) * 3)
+        self.assertEqual(list(sched['run_cyc']),
+                         [0] * 6 + [1] * 6 + [2] * 6)
+
+    def test_no_repeat(self):
+        sched = schedreader.compile_sched(self.dat[:3], -2.0)
+
+        self.assertEqual(sched['num_steps'], 3)
+        self.assertEqual(sched['num_cycs'], 1)
+        self.assertEqual(list(sched['run_step']), [0, 1, 2])
+
+    def test_profile_duration(self):
+        # The Drive step (duration 0) runs for the length of its profile
+        steps = schedreader.compile_sched(self.dat, -2.0,
+                                          profiles=self.profiles)['steps']
+        self.assertEqual(steps['duration'][-1], 60.)
+
+        # which cannot be set without the profiles
+        self.assertRaises(ValueError, schedreader.compile_sched, self.dat,
+                          -2.0)
+        self.assertRaises(ValueError, schedreader.compile_sched, self.dat,
+                          -2.0, profiles={})
+
+    def test_input_scaling(self):
+        steps = schedreader.compile_sched(self.dat, -2.0,
+                                          profiles=self.profiles)['steps']
+
+        # The current and C-rate steps are scaled to the rate of the case,
+        # the rest, voltage and profile steps are not
+        self.assertTrue(numpy.allclose(steps['ifac'],
+                                       [1., 2., 1., -4., 1., 1.]))
+        self.assertTrue(numpy.allclose(steps['inp_val'],
+                                       [0., -2., 0., -2., 4.1, 2.0]))
+
+        # The step times are not scaled
+        self.assertTrue(numpy.allclose(steps['duration'],
+                                       [10., 3600., 600., 7200., 100., 60.]))
+        self.assertTrue(numpy.allclose(steps['dt_max'],
+                                       [1., 60., 10., 60., 1., 1.]))
+        self.assertEqual(list(steps['volt_ctrl_chg']), [0, 0, 0, 1, 0, 0])
+
+    def test_rate_test_time_scaling(self):
+        steps = schedreader.compile_sched(self.dat, -2.0, rate_test=1,
+                                          profiles=self.profiles)['steps']
+
+        # The durations and output intervals are scaled by 1/|Ifac|
+        self.assertTrue(numpy.allclose(steps['duration'],
+                                       [10., 1800., 600., 1800., 100., 60.]))
+        self.assertTrue(numpy.allclose(steps['dt_max'],
+                                       [1., 30., 10., 15., 1., 1.]))
+
+    def test_first_step_unscaled(self):
+        # The first step is always run as written
+        steps = schedreader.compile_sched(self.dat[1:], -2.0,
+                                          profiles=self.profiles)['steps']
+
+        self.assertEqual(steps['ifac'][0], 1.)
+        self.assertEqual(steps['inp_val'][0], -1.)
+
+
+if __name__ == '__main__':
+    unittest.main()
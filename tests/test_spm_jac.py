@@ -0,0 +1,89 @@
+# -*- coding:utf-8 -*-
+"""Tests of the Jacobian sparsity pattern of the single particle models (spm
+and spme), and of their analytical Jacobian against the colored finite
+difference Jacobian (fdjac) of the pattern.
+
+Run with:
+    python -m unittest discover -s tests -p 'test_*.py'
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'benchmarks'))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'battsimpy',
+                                'helper_modules'))
+
+import fdjac
+import run_benchmarks
+
+# Largest relative error of the Jacobian blocks of the FD comparison
+JAC_TOL = 1e-4
+
+# The kinetics rows (pa, pc) hold the exchange current densities (and, for
+# spme, kappa) fixed, as FULL_1D.jac, so are not compared
+KINETICS_BLOCKS = ['pa', 'pc']
+
+
+class TestSPMJac(unittest.TestCase):
+
+    model_type = 'spm'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.out_dir = tempfile.mkdtemp()
+        sim = run_benchmarks.load_model(
+            'small', cls.out_dir, True,
+            {'MODEL': {'MODEL_TYPE': cls.model_type}})
+
+        cls.mod = sim.imp_mod
+        cls.t = sim.imp_sim.t
+        cls.y = numpy.array(sim.imp_sim.y)
+        cls.yd = numpy.array(sim.imp_sim.yd)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.out_dir)
+
+    def test_pattern_covers_jac(self):
+        pattern = self.mod.jac_pattern()
+        J = numpy.array(self.mod.jac(1.0, self.t, self.y, self.yd))
+
+        self.assertEqual(pattern.shape, J.shape)
+        self.assertFalse(((J != 0.0) & ~pattern).any())
+
+    def test_pattern_covers_probe(self):
+        pattern = self.mod.jac_pattern()
+        probed = fdjac.ColoredJacobian(self.mod).probe(self.t, self.y,
+                                                       self.yd)
+
+        self.assertFalse((probed & ~pattern).any())
+
+    def test_pattern_is_sparse(self):
+        fd_jac = fdjac.ColoredJacobian(self.mod)
+
+        self.assertLess(fd_jac.num_colors, len(self.y) / 2)
+
+    def test_fd_jac(self):
+        report = fdjac.check_jac(self.mod, self.t, self.y, self.yd)
+
+        self.assertEqual([name for name, err, col in report],
+                         [name for name, inds in self.mod.state_blocks()])
+        for name, err, col in report:
+            if name not in KINETICS_BLOCKS:
+                self.assertLess(err, JAC_TOL, msg='%s: %g (%s)' % (name, err,
+                                                                   col))
+
+
+class TestSPMeJac(TestSPMJac):
+
+    model_type = 'spme'
+
+
+if __name__ == '__main__':
+    unittest.main()